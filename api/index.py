@@ -1,9 +1,17 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, make_response
 import os
+import sys
 from dotenv import load_dotenv
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
 import math
+import threading
+import time
+import h3
+
+# Modules shared with the backend service. response_cache is stdlib only;
+# zones_store (numpy) is imported on first use by the zones_db backend.
+BACKEND_API_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'api')
+sys.path.insert(0, BACKEND_API_DIR)
+from response_cache import CellCache, cell_etag, file_stamp
 
 # Load environment variables
 load_dotenv()
@@ -11,25 +19,127 @@ load_dotenv()
 app = Flask(__name__)
 
 # MongoDB connection
-# Vercel uses MONGODB_URI
+# Vercel uses MONGODB_URI. pymongo (with dnspython) is imported on first use,
+# so cold starts that never reach MongoDB (health, zones.db) skip it.
+#   ping        connect and ping on the first request that needs the database (default)
+#   background  connect and ping on a thread; requests never wait for it and get
+#               the fallback answer until the ping succeeds
 MONGO_URI = os.getenv('MONGODB_URI')
+MONGO_CONNECT = os.getenv('MONGO_CONNECT', 'ping')
+# Seconds before a failed connection is attempted again
+MONGO_RETRY_S = float(os.getenv('MONGO_RETRY_S', '30'))
 mongo_client = None
 db = None
+# idle | connecting | connected | failed
+mongo_state = 'idle'
+mongo_failed_at = 0.0
+mongo_lock = threading.Lock()
+
+def connect_mongo():
+    """Create the client (once; it is reused across warm invocations) and ping it"""
+    global mongo_client, db, mongo_state, mongo_failed_at
+    try:
+        if mongo_client is None:
+            from pymongo import MongoClient
+            mongo_client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
+        # Test connection
+        mongo_client.admin.command('ping')
+        db = mongo_client.get_database('astr') # Explicitly select 'astr' database
+        mongo_state = 'connected'
+    except Exception as e:
+        print(f"MongoDB connection failed: {e}")
+        mongo_state = 'failed'
+        mongo_failed_at = time.monotonic()
+
+def can_connect():
+    """Nothing connected or connecting, and any failed attempt is old enough to retry"""
+    return mongo_state == 'idle' or (
+        mongo_state == 'failed' and time.monotonic() - mongo_failed_at >= MONGO_RETRY_S)
+
+def start_connect():
+    """Connect on a thread; returns at once"""
+    global mongo_state
+    with mongo_lock:
+        if not can_connect():
+            return
+        mongo_state = 'connecting'
+    threading.Thread(target=connect_mongo, name='mongo-connect', daemon=True).start()
 
 def get_db():
-    """Initialize MongoDB connection lazily"""
-    global mongo_client, db
-    if mongo_client is None and MONGO_URI:
+    """Initialize MongoDB connection lazily; None when not configured or not connected"""
+    if db is not None or not MONGO_URI:
+        return db
+    if MONGO_CONNECT == 'background':
+        start_connect()
+        return None
+    with mongo_lock:
+        if db is None and can_connect():
+            connect_mongo()
+    return db
+
+# Storage backend: 'mongo' ($near over point documents) or 'zones_db' (memory-mapped zones.db)
+LP_BACKEND = os.getenv('LP_BACKEND', 'mongo')
+ZONES_DB_PATH = os.getenv('ZONES_DB_PATH', os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'assets', 'db', 'zones.db'))
+zones_store = None
+
+def get_zones_store():
+    """Open zones.db lazily; None when the file is not deployed"""
+    global zones_store
+    if zones_store is None and os.path.exists(ZONES_DB_PATH):
         try:
-            mongo_client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
-            # Test connection
-            mongo_client.admin.command('ping')
-            db = mongo_client.get_database('astr') # Explicitly select 'astr' database
-            return db
-        except (ConnectionFailure, Exception) as e:
-            print(f"MongoDB connection failed: {e}")
+            # Imported here so the mongo backend never loads numpy
+            from zones_store import ZonesStore
+            zones_store = ZonesStore(ZONES_DB_PATH)
+        except (ImportError, OSError, ValueError) as e:
+            print(f"Failed to open zones.db: {e}")
             return None
-    return db
+    return zones_store
+
+# Map zones.db at import so pre-forked workers share it
+if LP_BACKEND == 'zones_db':
+    get_zones_store()
+
+# Bundled coarse dataset (scripts/lite_zones.py) answering while MongoDB connects
+LITE_DB_PATH = os.getenv('LITE_DB_PATH', os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'assets', 'db', 'zones_lite.db'))
+lite_zones = None
+
+def get_lite_zones():
+    """Load zones_lite.db lazily; None when the file is not deployed"""
+    global lite_zones
+    if lite_zones is None:
+        if not os.path.exists(LITE_DB_PATH):
+            return None
+        try:
+            # Imported here so requests that MongoDB answers never load numpy
+            from zones_store import LiteZones
+            lite_zones = LiteZones(LITE_DB_PATH)
+        except (ImportError, OSError, ValueError) as e:
+            print(f"Failed to open zones_lite.db: {e}")
+            return None
+    return lite_zones
+
+# Per-cell light pollution results (same cache, ETag and lifetime as the backend service)
+H3_RESOLUTION = 8
+LP_CACHE_SIZE = int(os.getenv('LP_CACHE_SIZE', '50000'))
+LP_CACHE_TTL = int(os.getenv('LP_CACHE_TTL', '86400'))
+LP_MAX_AGE = 3600
+# Optional release tag of the deployed data; defaults to a stamp of zones.db
+DATASET_VERSION = os.getenv('DATASET_VERSION')
+lp_cache = CellCache(LP_CACHE_SIZE, LP_CACHE_TTL)
+
+def dataset_version():
+    """Cache and ETag namespace of the backend that answers lookups"""
+    if LP_BACKEND == 'zones_db' and get_zones_store() is not None:
+        return f"zones_db:{DATASET_VERSION or file_stamp(ZONES_DB_PATH)}"
+    return f"mongo:{DATASET_VERSION or 'default'}"
+
+def cacheable(response, etag):
+    """Strong per-cell ETag plus shared (CDN) caching"""
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'public, max-age={LP_MAX_AGE}'
+    return response
 
 def calculate_bortle_class(mpsas):
     """
@@ -48,8 +158,9 @@ def calculate_bortle_class(mpsas):
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    """Health check endpoint"""
-    db = get_db()
+    """Health check endpoint; reports the last known database state and never waits on it"""
+    if MONGO_URI and LP_BACKEND != 'zones_db':
+        start_connect()
     db_status = "connected" if db is not None else "disconnected"
     
     # Debug info (safe to expose in health check for now)
@@ -59,6 +170,7 @@ def health_check():
         "status": "healthy",
         "service": "Astr Backend API",
         "database": db_status,
+        "database_state": mongo_state,
         "env_var": env_check
     }), 200
 
@@ -68,6 +180,8 @@ def get_light_pollution():
     Get light pollution data for given coordinates
     Query params: lat (latitude), lon (longitude)
     Returns: MPSAS value and Bortle class
+    Results are cached per res-8 H3 cell; If-None-Match with the cell's
+    ETag returns 304 without a lookup
     """
     # Validate query parameters
     lat = request.args.get('lat', type=float)
@@ -92,9 +206,44 @@ def get_light_pollution():
             "message": "Longitude must be between -180 and 180"
         }), 400
 
+    cell = h3.latlng_to_cell(lat, lon, H3_RESOLUTION)
+    version = dataset_version()
+    etag = cell_etag(version, h3.str_to_int(cell))
+    if etag in request.if_none_match:
+        return cacheable(make_response('', 304), etag)
+    entry = lp_cache.get((version, cell))
+    if entry is not None:
+        return cacheable(jsonify({"lat": lat, "lon": lon, **entry}), etag), 200
+
+    if LP_BACKEND == 'zones_db':
+        store = get_zones_store()
+        if store is not None:
+            result = store.lookup(lat, lon)
+            entry = {
+                "mpsas": round(result["sqm"], 2),
+                "bortle_class": result["zone"],
+                "h3": result["h3"],
+                "implicit": result["implicit"],
+                "fallback": False
+            }
+            lp_cache.put((version, cell), entry)
+            return cacheable(jsonify({"lat": lat, "lon": lon, **entry}), etag), 200
+
     # Get database connection
     db = get_db()
     if db is None:
+        # Approximate answer from zones_lite.db, never cached so real data replaces it
+        lite = get_lite_zones()
+        if lite is not None:
+            zone, sqm = lite.lookup_cells([h3.str_to_int(cell)])
+            return jsonify({
+                "lat": lat,
+                "lon": lon,
+                "mpsas": round(float(sqm[0]), 2),
+                "bortle_class": int(zone[0]),
+                "fallback": False,
+                "approximate": True
+            }), 200
         return jsonify({
             "error": "Database unavailable",
             "message": "Unable to connect to MongoDB. Using fallback data.",
@@ -109,13 +258,15 @@ def get_light_pollution():
     try:
         collection = db.light_pollution
 
-        # Use geospatial query to find nearest point
+        # Use geospatial query to find the point nearest the cell centre,
+        # so every coordinate in the cell gets the cached answer
+        centre_lat, centre_lon = h3.cell_to_latlng(cell)
         result = collection.find_one({
             "location": {
                 "$near": {
                     "$geometry": {
                         "type": "Point",
-                        "coordinates": [lon, lat]  # GeoJSON uses [lon, lat] order
+                        "coordinates": [centre_lon, centre_lat]  # GeoJSON uses [lon, lat] order
                     },
                     "$maxDistance": 50000  # 50km radius
                 }
@@ -126,13 +277,13 @@ def get_light_pollution():
             mpsas = result.get('mpsas', 18.5)
             bortle = calculate_bortle_class(mpsas)
 
-            return jsonify({
-                "lat": lat,
-                "lon": lon,
+            entry = {
                 "mpsas": round(mpsas, 2),
                 "bortle_class": bortle,
                 "fallback": False
-            }), 200
+            }
+            lp_cache.put((version, cell), entry)
+            return cacheable(jsonify({"lat": lat, "lon": lon, **entry}), etag), 200
         else:
             # No data found, return fallback
             return jsonify({
@@ -0,0 +1,260 @@
+"""
+Zone statistics over an area (GeoJSON polygon or bounding box).
+
+The shape is polyfilled to H3 cells at the finest resolution (8 at most)
+whose estimated cell count stays under max_cells, then compacted, so the
+interior becomes a few coarse cells and only the boundary stays fine.
+Every compact cell is resolved as a range: the res-8 descendants of an H3
+cell are one contiguous run of integers, and zones.db is sorted by cell,
+so two searchsorted calls bound the stored cells inside it. Cells at or
+coarser than PYRAMID_RESOLUTION read the same kind of range from a pyramid
+of per-parent aggregates (zone counts, SQM sum, brightest and darkest cell)
+instead of the raw records. All ranges are gathered and reduced in one
+vectorized pass; descendants that are not stored are implicit Zone 1.
+
+Statistics are area-weighted: every compact cell contributes its own area
+(H3 cells vary in size with latitude), split evenly over its descendants.
+"""
+import h3
+import numpy as np
+from h3.api import numpy_int as h3_int
+
+try:
+    from .zones_store import H3_RESOLUTION, IMPLICIT_ZONE, IMPLICIT_SQM
+except ImportError:
+    from zones_store import H3_RESOLUTION, IMPLICIT_ZONE, IMPLICIT_SQM
+
+ZONES = 9
+PYRAMID_RESOLUTION = 5
+EARTH_RADIUS_KM = 6371.0088
+
+_RES_SHIFT = np.uint64(52)
+_RES_MASK = np.uint64(0xF << 52)
+_BASE_SHIFT = np.uint64(45)
+# Digit 6 in all 15 digit positions (3 bits each)
+_SIXES = np.uint64(int('6' * 15, 8))
+
+
+def descendant_range(cells, resolution):
+    """
+    (first, last) res-`resolution` descendants of each cell as H3 integers:
+    digits below the cell's own resolution set to 0 and to 6.
+    """
+    cells = np.asarray(cells, dtype=np.uint64)
+    res = np.array([h3_int.get_resolution(c) for c in cells.tolist()], dtype=np.uint64)
+    base = (cells & ~_RES_MASK) | (np.uint64(resolution) << _RES_SHIFT)
+    free = ((np.uint64(1) << (np.uint64(3) * (np.uint64(resolution) - res))) - np.uint64(1)) \
+        << np.uint64(3 * (15 - resolution))
+    first = base & ~free
+    return first, first | (free & _SIXES)
+
+
+def parents_of(cells, resolution):
+    """Vectorized cell_to_parent for cells finer than `resolution`"""
+    below = np.uint64((1 << (3 * (15 - resolution))) - 1)
+    return (cells & ~_RES_MASK) | (np.uint64(resolution) << _RES_SHIFT) | below
+
+
+class AreaPyramid:
+    """Per-parent aggregates of a ZonesStore at PYRAMID_RESOLUTION, built in memory"""
+
+    def __init__(self, store, resolution=PYRAMID_RESOLUTION):
+        self.store = store
+        self.resolution = resolution
+        cells = np.asarray(store.cells)
+        zone = np.asarray(store.records['zone']).astype(np.intp)
+        sqm = np.asarray(store.records['sqm']).astype(np.float64)
+        if len(cells) == 0:
+            self.cells = np.zeros(0, dtype=np.uint64)
+            self.counts = np.zeros((0, ZONES), dtype=np.uint32)
+            self.sqm_sum = self.sqm_min = self.sqm_max = np.zeros(0)
+            self.min_cell = self.max_cell = np.zeros(0, dtype=np.uint64)
+            return
+        # Parents of sorted cells are sorted too, so each parent is one run
+        parents = parents_of(cells, resolution)
+        starts = np.flatnonzero(np.r_[True, parents[1:] != parents[:-1]])
+        group = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(cells)]))
+        self.cells = parents[starts]
+        self.counts = np.bincount(group * ZONES + zone - 1,
+                                  minlength=len(starts) * ZONES).reshape(-1, ZONES).astype(np.uint32)
+        self.sqm_sum = np.add.reduceat(sqm, starts)
+        self.sqm_min = np.minimum.reduceat(sqm, starts)
+        self.sqm_max = np.maximum.reduceat(sqm, starts)
+        index = np.arange(len(cells))
+        at_min = np.where(sqm == self.sqm_min[group], index, len(cells))
+        at_max = np.where(sqm == self.sqm_max[group], index, len(cells))
+        self.min_cell = cells[np.minimum.reduceat(at_min, starts)]
+        self.max_cell = cells[np.minimum.reduceat(at_max, starts)]
+
+
+def gather_ranges(keys, first, last):
+    """Indices into sorted keys within [first, last] per range, and the range each belongs to"""
+    lo = np.searchsorted(keys, first, side='left')
+    hi = np.searchsorted(keys, last, side='right')
+    sizes = hi - lo
+    offsets = np.repeat(lo - np.cumsum(np.r_[0, sizes[:-1]]), sizes)
+    return np.arange(sizes.sum()) + offsets, np.repeat(np.arange(len(first)), sizes)
+
+
+def shape_from_bbox(bbox):
+    """H3 shape of [west, south, east, north]; west > east crosses the antimeridian"""
+    try:
+        west, south, east, north = (float(v) for v in bbox)
+    except (TypeError, ValueError):
+        raise ValueError("'bbox' must be [west, south, east, north] in degrees")
+    if not (-90 <= south < north <= 90 and abs(west) <= 180 and abs(east) <= 180) or west == east:
+        raise ValueError("bbox needs -180 <= west, east <= 180 and -90 <= south < north <= 90")
+    ring = lambda w, e: [(south, w), (south, e), (north, e), (north, w)]
+    if west < east:
+        return h3.LatLngPoly(ring(west, east))
+    return h3.LatLngMultiPoly(h3.LatLngPoly(ring(west, 180.0)), h3.LatLngPoly(ring(-180.0, east)))
+
+
+def shape_from_geojson(geometry):
+    """H3 shape of a GeoJSON Polygon or MultiPolygon (bare or as a Feature)"""
+    if isinstance(geometry, dict) and geometry.get('type') == 'Feature':
+        geometry = geometry.get('geometry')
+    if not isinstance(geometry, dict) or geometry.get('type') not in ('Polygon', 'MultiPolygon'):
+        raise ValueError("'geometry' must be a GeoJSON Polygon or MultiPolygon")
+    try:
+        shape = h3.geo_to_h3shape(geometry)
+    except (TypeError, ValueError, KeyError, IndexError, h3.H3BaseException):
+        raise ValueError("Polygon coordinates must be rings of [lon, lat] positions")
+    for lat, lon in shape_vertices(shape):
+        if not (abs(lat) <= 90 and abs(lon) <= 180):
+            raise ValueError("Polygon coordinates must be [lon, lat] with -180 <= lon <= 180 and -90 <= lat <= 90")
+    return shape
+
+
+def shape_vertices(shape):
+    polys = shape.polys if isinstance(shape, h3.LatLngMultiPoly) else [shape]
+    return [vertex for poly in polys for vertex in poly.outer]
+
+
+def bounds_area_km2(shape):
+    """Area of the lat/lon box around each polygon of the shape (an upper bound of its area)"""
+    polys = shape.polys if isinstance(shape, h3.LatLngMultiPoly) else [shape]
+    total = 0.0
+    for poly in polys:
+        lats, lons = np.radians(np.array(poly.outer)).T
+        total += (np.ptp(lons) * EARTH_RADIUS_KM ** 2 *
+                  abs(np.sin(lats.max()) - np.sin(lats.min())))
+    return total
+
+
+def estimate_resolution(area_km2, max_cells):
+    """Finest resolution (<= 8) at which an area holds at most max_cells cells"""
+    for resolution in range(H3_RESOLUTION, -1, -1):
+        if area_km2 / h3.average_hexagon_area(resolution, 'km^2') <= max_cells:
+            return resolution
+    return 0
+
+
+def compact(cells):
+    """
+    compact_cells of same-resolution cells, one base cell at a time: h3 4.1
+    raises H3ResDomainError on some sets spanning many whole base cells.
+    """
+    cells = np.unique(np.asarray(cells, dtype=np.uint64))
+    base = (cells >> _BASE_SHIFT) & np.uint64(0x7F)
+    starts = np.flatnonzero(np.r_[True, base[1:] != base[:-1]])
+    return np.concatenate([np.asarray(h3_int.compact_cells(part), dtype=np.uint64)
+                           for part in np.split(cells, starts[1:])]) if len(cells) else cells
+
+
+def polyfill(shape, resolution):
+    """Compacted cells of an H3 shape; a shape smaller than one cell gets the cell of its first vertex"""
+    cells = np.asarray(h3_int.h3shape_to_cells(shape, resolution), dtype=np.uint64)
+    if len(cells) == 0:
+        lat, lon = shape_vertices(shape)[0]
+        cells = np.array([h3_int.latlng_to_cell(lat, lon, resolution)], dtype=np.uint64)
+    return compact(cells)
+
+
+def _implicit_descendant(store, cell):
+    """Some res-8 descendant of cell that zones.db does not store (the caller knows one exists)"""
+    while h3_int.get_resolution(cell) < H3_RESOLUTION:
+        children = np.asarray(h3_int.cell_to_children(cell, h3_int.get_resolution(cell) + 1), dtype=np.uint64)
+        first, last = descendant_range(children, H3_RESOLUTION)
+        stored = np.searchsorted(store.cells, last, side='right') - np.searchsorted(store.cells, first)
+        size = np.array([h3_int.cell_to_children_size(c, H3_RESOLUTION) for c in children.tolist()])
+        cell = int(children[np.flatnonzero(stored < size)[0]])
+    return cell
+
+
+def _cell_summary(store, cell, sqm):
+    lat, lon = h3_int.cell_to_latlng(cell)
+    zone = store.lookup_cells(np.array([cell], dtype=np.uint64))["zone"][0]
+    return {"h3": h3.int_to_str(int(cell)), "lat": round(lat, 5), "lon": round(lon, 5),
+            "sqm": round(float(sqm), 2), "bortle_class": int(zone)}
+
+
+def _pyramid_rows(pyramid, index):
+    return (pyramid.counts[index], pyramid.sqm_sum[index],
+            pyramid.sqm_min[index], pyramid.min_cell[index], pyramid.sqm_max[index], pyramid.max_cell[index])
+
+
+def _store_rows(store, index):
+    zone = store.records['zone'][index].astype(np.intp)
+    sqm = store.records['sqm'][index].astype(np.float64)
+    counts = np.zeros((len(index), ZONES))
+    counts[np.arange(len(index)), zone - 1] = 1
+    cells = store.cells[index]
+    return counts, sqm, sqm, cells, sqm, cells
+
+
+def area_stats(store, pyramid, cells):
+    """
+    Zone histogram (km² and share per Bortle class), area-weighted mean SQM and
+    the brightest and darkest res-8 cells over compacted cells.
+    """
+    cells = np.asarray(cells, dtype=np.uint64)
+    res = np.array([h3_int.get_resolution(c) for c in cells.tolist()])
+    area = np.array([h3_int.cell_area(c, 'km^2') for c in cells.tolist()])
+    size = np.array([h3_int.cell_to_children_size(c, H3_RESOLUTION) for c in cells.tolist()], dtype=np.float64)
+
+    counts = np.zeros((len(cells), ZONES))
+    sqm_sum = np.zeros(len(cells))
+    brightest = darkest = None  # (sqm, cell)
+
+    coarse = res <= pyramid.resolution
+    sources = ((coarse, pyramid.cells, pyramid.resolution, lambda index: _pyramid_rows(pyramid, index)),
+               (~coarse, store.cells, H3_RESOLUTION, lambda index: _store_rows(store, index)))
+    for mask, keys, resolution, rows_of in sources:
+        if not mask.any():
+            continue
+        index, group = gather_ranges(keys, *descendant_range(cells[mask], resolution))
+        if len(index) == 0:
+            continue
+        group = np.flatnonzero(mask)[group]
+        part_counts, part_sums, lows, low_cells, highs, high_cells = rows_of(index)
+        np.add.at(counts, group, part_counts)
+        np.add.at(sqm_sum, group, part_sums)
+        i, j = int(np.argmin(lows)), int(np.argmax(highs))
+        if brightest is None or lows[i] < brightest[0]:
+            brightest = (lows[i], int(low_cells[i]))
+        if darkest is None or highs[j] > darkest[0]:
+            darkest = (highs[j], int(high_cells[j]))
+
+    implicit = size - counts.sum(axis=1)
+    counts[:, IMPLICIT_ZONE - 1] += implicit
+    share = area / size
+    zone_km2 = (counts * share[:, None]).sum(axis=0)
+    total_km2 = float(area.sum())
+    mean_sqm = float(((sqm_sum + implicit * IMPLICIT_SQM) * share).sum() / total_km2)
+
+    if implicit.any() and (darkest is None or darkest[0] <= IMPLICIT_SQM):
+        darkest = (IMPLICIT_SQM, _implicit_descendant(store, int(cells[np.flatnonzero(implicit)[0]])))
+    if brightest is None:  # nothing stored in the area
+        brightest = darkest
+
+    return {
+        "area_km2": round(total_km2, 3),
+        "cells": int(size.sum()),
+        "compact_cells": int(len(cells)),
+        "mean_sqm": round(mean_sqm, 2),
+        "zones": {str(z + 1): {"area_km2": round(km2, 3), "fraction": round(km2 / total_km2, 4)}
+                  for z, km2 in enumerate(zone_km2.tolist()) if km2 > 0},
+        "brightest": _cell_summary(store, brightest[1], brightest[0]),
+        "darkest": _cell_summary(store, darkest[1], darkest[0]),
+    }
@@ -0,0 +1,353 @@
+"""
+ASGI entry point: the same routes as api/index.py on Starlette + Motor.
+
+The Flask app opens a single MongoClient on the first request and pings
+it while that request waits. Here the Mongo-backed routes (/api/health,
+/api/light-pollution and its batch variant) are async:
+  - one AsyncIOMotorClient per worker with a bounded pool (MONGO_MAX_POOL_SIZE)
+  - MONGO_MIN_POOL_SIZE connections opened during startup, before the first request
+  - slow $near queries wait without holding a thread, and a batch runs its
+    distinct cells concurrently (MONGO_BATCH_CONCURRENCY at a time); in the
+    H3 layout (LP_BACKEND=mongo_h3) a batch is a single $in instead
+  - concurrent lookups of one cell share a query, and in the H3 layout
+    single-point lookups are merged into one $in (api/coalesce.py)
+  - a connection error opens the Flask app's circuit breaker (index.mongo_breaker);
+    while it is open requests skip MongoDB and are answered from local data
+
+Results go through the same per-cell cache and ETags as the Flask app.
+Every other route (zones.db, tiles, profiles, dark sites) is NumPy work
+that finishes in milliseconds, so the Flask app is mounted underneath and
+serves it from a thread pool. With LP_BACKEND=zones_db the light
+pollution routes are served there too.
+
+Run:
+    uvicorn api.asgi:app --workers 4
+"""
+import asyncio
+import os
+import sys
+import time
+from contextlib import asynccontextmanager
+
+import numpy as np
+from a2wsgi import WSGIMiddleware
+from h3.api import numpy_int as h3_int
+from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse as StarletteJSONResponse, Response
+from starlette.routing import Mount, Route
+from werkzeug.http import parse_etags
+
+try:
+    from . import index
+    from .coalesce import AsyncMicroBatcher
+except ImportError:  # loaded as a top-level module
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import index
+    from coalesce import AsyncMicroBatcher
+
+class JSONResponse(StarletteJSONResponse):
+    """JSON through the API's encoder (orjson when installed)"""
+
+    def render(self, content):
+        return index.encode_json(content)
+
+
+MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', '100'))
+MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', '10'))
+MONGO_BATCH_CONCURRENCY = int(os.getenv('MONGO_BATCH_CONCURRENCY', '32'))
+# Worker threads for the mounted Flask app
+WSGI_THREADS = int(os.getenv('WSGI_THREADS', '16'))
+
+
+class MongoPool:
+    """Motor client opened and warmed at startup; db is None when MongoDB is not configured"""
+
+    def __init__(self):
+        self.client = None
+        self.db = None
+
+    async def connect(self, uri):
+        if not uri:
+            print("Warning: MONGODB_URI environment variable not set", file=sys.stderr)
+            return
+        listener = index.pool_listener(index.MONGO_POOL_OPEN, index.MONGO_POOL_CHECKED_OUT,
+                                       index.MONGO_CHECKOUT_FAILURES)
+        self.client = AsyncIOMotorClient(uri, maxPoolSize=MONGO_MAX_POOL_SIZE,
+                                         minPoolSize=MONGO_MIN_POOL_SIZE,
+                                         serverSelectionTimeoutMS=5000, event_listeners=[listener])
+        self.db = self.client['astr']
+        # Concurrent pings each check out their own connection, so the pool is
+        # filled to MONGO_MIN_POOL_SIZE before the first request arrives
+        try:
+            await asyncio.gather(*(self.client.admin.command('ping')
+                                   for _ in range(max(1, MONGO_MIN_POOL_SIZE))))
+            print(f"MongoDB connected, {MONGO_MIN_POOL_SIZE} connections warm", file=sys.stderr)
+        except Exception as e:
+            # Keep the client: the driver reconnects on its own and requests are
+            # answered locally until the breaker's probe reaches the server
+            print(f"MongoDB warm-up failed: {e}", file=sys.stderr)
+            index.mongo_failed(e)
+
+    def available(self):
+        """Client configured and the circuit closed"""
+        return self.db is not None and index.mongo_breaker.allow()
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+        self.client = self.db = None
+
+
+mongo = MongoPool()
+
+
+def cacheable(response, etag):
+    """Strong per-cell ETag plus shared (CDN) caching, as index.cacheable"""
+    response.headers['ETag'] = f'"{etag}"'
+    response.headers['Cache-Control'] = f'public, max-age={index.LP_MAX_AGE}'
+    return response
+
+
+def local_fallback(cell, lat, lon):
+    """Response while MongoDB is unavailable, as index.local_fallback"""
+    local = index.local_entries(np.array([cell], dtype=np.uint64))
+    if local is not None:
+        index.FALLBACKS.inc('local')
+        return JSONResponse({"lat": lat, "lon": lon, **local[0]})
+    return JSONResponse(index.fallback_body(lat, lon, *index.MONGO_UNAVAILABLE))
+
+
+def query_failed(e):
+    """Log a failed query; a connection error opens the circuit"""
+    print(f"Query error: {e}")
+    if index.is_connection_error(e):
+        index.mongo_failed(e)
+        return True
+    return False
+
+
+def query_float(request, name):
+    try:
+        return float(request.query_params[name])
+    except (KeyError, ValueError):
+        return None
+
+
+async def find_entry(cell):
+    """Cache entry from the document nearest the cell centre (None when there is none)"""
+    if index.LP_BACKEND == 'mongo_h3':
+        return (await find_h3_entries([cell]))[0]
+    with index.tracer.span('mongo.find_nearest', **{"db.system": "mongodb", "db.operation": "find_one"}), \
+            index.DB_LATENCY.time('mongo', 'find_nearest'):
+        document = await mongo.db.light_pollution.find_one(index.near_query(*h3_int.cell_to_latlng(cell)))
+    return index.entry_from_document(document)
+
+
+async def find_h3_ids(collection, ids):
+    """{_id: document} for the ids that have one, as index.find_h3_ids"""
+    found = {}
+    for start in range(0, len(ids), index.MONGO_H3_IN_CHUNK):
+        cursor = collection.find({"_id": {"$in": ids[start:start + index.MONGO_H3_IN_CHUNK]}}, index.H3_PROJECTION)
+        for document in await cursor.to_list(None):
+            found[document["_id"]] = document
+    return found
+
+
+async def find_h3_entries(cells):
+    """Entry (or None) per cell from the H3-keyed collection, as index.h3_entries"""
+    collection = mongo.db[index.MONGO_H3_COLLECTION]
+    ids = [int(c) for c in cells]
+    with index.tracer.span('mongo_h3.find_ids', cells=len(ids)), index.DB_LATENCY.time('mongo_h3', 'find_ids'):
+        found = await find_h3_ids(collection, ids)
+    entries = [index.entry_from_h3_document(found[c], c) if c in found else None for c in ids]
+    missing = [i for i, c in enumerate(ids) if c not in found]
+    if not missing:
+        return entries
+    if index.MONGO_H3_MISSING == 'dark':
+        for i in missing:
+            entries[i] = index.implicit_h3_entry(ids[i])
+        return entries
+    rings, ring_ids = index.h3_rings([ids[i] for i in missing])
+    with index.tracer.span('mongo_h3.find_ring', cells=len(ring_ids)), \
+            index.DB_LATENCY.time('mongo_h3', 'find_ring'):
+        found = await find_h3_ids(collection, ring_ids)
+    for i in missing:
+        entries[i] = index.nearest_in_ring(ids[i], rings[ids[i]], found)
+    return entries
+
+
+async def lookup_nearest(cells):
+    return list(await asyncio.gather(*(find_entry(cell) for cell in cells)))
+
+
+# Coalesced lookups, as index.h3_lookups and index.nearest_lookups
+h3_lookups = AsyncMicroBatcher(find_h3_entries, index.COALESCE_WINDOW_MS / 1000, index.COALESCE_MAX_BATCH,
+                               on_batch=lambda size: index.LOOKUP_BATCH_SIZE.observe(size, 'mongo_h3'))
+nearest_lookups = AsyncMicroBatcher(lookup_nearest, 0, index.COALESCE_MAX_BATCH,
+                                    on_batch=lambda size: index.LOOKUP_BATCH_SIZE.observe(size, 'mongo'))
+index.lookup_batchers += [('mongo_h3', h3_lookups), ('mongo', nearest_lookups)]
+
+
+async def health(request):
+    """Health check endpoint; reports the circuit state and never waits on MongoDB"""
+    response = {
+        "status": "healthy",
+        "service": "Astr Backend API",
+        "backend": index.LP_BACKEND,
+        "database": "connected" if mongo.available() else "disconnected",
+        "env_var_set": bool(index.MONGO_URI),
+        "server": "asgi",
+        "pool": {"max": MONGO_MAX_POOL_SIZE, "min": MONGO_MIN_POOL_SIZE},
+        "circuit": index.mongo_breaker.stats(),
+        "cache": index.lp_cache.stats()
+    }
+    if request.query_params.get('verbose') == 'true':
+        response["mongo_uri_prefix"] = index.MONGO_URI[:20] if index.MONGO_URI else None
+        response["python_version"] = sys.version
+    return JSONResponse(response)
+
+
+async def light_pollution(request):
+    """Async /api/light-pollution against MongoDB (same responses as the Flask route)"""
+    lat, lon = query_float(request, 'lat'), query_float(request, 'lon')
+    error = index.check_coordinates(lat, lon)
+    if error:
+        return JSONResponse(error[0], status_code=error[1])
+
+    cell = h3_int.latlng_to_cell(lat, lon, index.H3_RESOLUTION)
+    version = index.dataset_version()
+    etag = index.cell_etag(version, cell)
+    if parse_etags(request.headers.get('if-none-match')).contains(etag):
+        return cacheable(Response(status_code=304), etag)
+
+    entry = index.lp_cache.get((version, cell))
+    if entry is None:
+        if not mongo.available():
+            return local_fallback(cell, lat, lon)
+        try:
+            entry = await (h3_lookups if index.LP_BACKEND == 'mongo_h3' else nearest_lookups).get(int(cell))
+        except Exception as e:
+            if query_failed(e):
+                return local_fallback(cell, lat, lon)
+            return JSONResponse(index.fallback_body(lat, lon, "Query failed", str(e)))
+        if entry is None:
+            return JSONResponse(index.fallback_body(lat, lon, *index.MONGO_NO_DATA))
+        index.lp_cache.put((version, cell), entry)
+
+    return cacheable(JSONResponse({"lat": lat, "lon": lon, **entry}), etag)
+
+
+async def light_pollution_batch(request):
+    """Async batch lookup: distinct uncached cells are queried concurrently"""
+    try:
+        body = await request.json()
+    except ValueError:
+        body = None
+    fmt, error = index.batch_format(request.query_params.get('format'), request.headers.get('accept'))
+    if error:
+        return JSONResponse(error[0], status_code=error[1])
+    lats, lons, error = index.check_points(body, 'points', index.MAX_BATCH_POINTS)
+    if error:
+        return JSONResponse(error[0], status_code=error[1])
+
+    if not mongo.available():
+        result = index.batch_local(lats, lons)
+    else:
+        unique, inverse = np.unique(index.latlng_to_cells(lats, lons), return_inverse=True)
+        version = index.dataset_version()
+        keys = [(version, c) for c in unique.tolist()]
+        entries = [index.lp_cache.get(k) for k in keys]
+        gate = asyncio.Semaphore(MONGO_BATCH_CONCURRENCY)
+
+        async def resolve(i):
+            async with gate:
+                if not index.mongo_breaker.allow():
+                    return
+                try:
+                    entries[i] = await nearest_lookups.get(int(unique[i]))
+                except Exception as e:
+                    query_failed(e)
+                    index.FALLBACKS.inc('query_failed')
+                    return
+            if entries[i] is None:
+                index.FALLBACKS.inc('no_data')
+            else:
+                index.lp_cache.put(keys[i], entries[i])
+
+        missing = [i for i, e in enumerate(entries) if e is None]
+        if index.LP_BACKEND == 'mongo_h3':
+            # One $in for every uncached cell instead of a query each
+            try:
+                for i, entry in zip(missing, await find_h3_entries(unique[missing].tolist())):
+                    entries[i] = entry
+                    if entry is None:
+                        index.FALLBACKS.inc('no_data')
+                    else:
+                        index.lp_cache.put(keys[i], entry)
+            except Exception as e:
+                query_failed(e)
+                index.FALLBACKS.inc('query_failed', amount=len(missing))
+        else:
+            await asyncio.gather(*(resolve(i) for i in missing))
+        missing = [i for i, e in enumerate(entries) if e is None]
+        if missing and not index.mongo_breaker.allow():
+            # MongoDB went away during the batch: the rest comes from local data
+            local = index.local_entries(unique[missing])
+            if local is not None:
+                index.FALLBACKS.inc('local', amount=len(local))
+                for i, entry in zip(missing, local):
+                    entries[i] = entry
+        result = index.BatchResult(lats, lons, [e or index.BATCH_FALLBACK for e in entries], inverse.ravel())
+
+    body, media_type = index.encode_batch(result, fmt, index.LP_BACKEND)
+    return Response(body, media_type=media_type, headers={"Vary": "Accept"})
+
+
+def instrumented(route, handler):
+    """Same request metrics and trace root span as the Flask request hooks"""
+    async def endpoint(request):
+        start = time.perf_counter()
+        span, token = index.tracer.start_trace(f"{request.method} {route}",
+                                               {"http.method": request.method, "http.route": route},
+                                               request.headers.get('traceparent'))
+        try:
+            response = await handler(request)
+        except Exception:
+            if span is not None:
+                span.status = 'ERROR'
+                index.tracer.end_trace(span, token)
+            raise
+        status = str(response.status_code)
+        index.HTTP_REQUESTS.inc(route, request.method, status)
+        index.HTTP_LATENCY.observe(time.perf_counter() - start, route, status)
+        if span is not None:
+            span.set('http.status_code', response.status_code)
+            response.headers['traceparent'] = index.tracer.traceparent(span)
+            index.tracer.end_trace(span, token)
+        return response
+    return endpoint
+
+
+@asynccontextmanager
+async def lifespan(app):
+    if index.LP_BACKEND != 'zones_db':
+        await mongo.connect(index.MONGO_URI)
+    yield
+    mongo.close()
+
+
+def build_routes():
+    routes = []
+    if index.LP_BACKEND != 'zones_db':
+        routes += [Route(path, instrumented(path, handler), methods=methods) for path, handler, methods in (
+            ('/api/health', health, ['GET']),
+            ('/api/light-pollution', light_pollution, ['GET']),
+            ('/api/light-pollution/batch', light_pollution_batch, ['POST']),
+        )]
+    # Everything else (including /metrics and the zones_db backend) is served by the Flask app
+    routes.append(Mount('/', app=WSGIMiddleware(index.app, workers=WSGI_THREADS)))
+    return routes
+
+
+app = Starlette(routes=build_routes(), lifespan=lifespan)
@@ -0,0 +1,91 @@
+"""
+Circuit breaker for the MongoDB connection.
+
+Without it every request after an outage builds a fresh client and waits
+out serverSelectionTimeoutMS (5 s) before falling back. The breaker opens
+on the first connection failure. While it is open, requests skip MongoDB
+at once and are answered from local data. A single background thread
+probes the server with exponential backoff (1, 2, 4 ... up to max_delay
+seconds) and closes the breaker when a probe succeeds.
+"""
+import threading
+import time
+
+# pymongo errors embed the whole topology description
+MAX_ERROR_CHARS = 200
+
+
+def describe(error):
+    return f"{type(error).__name__}: {error}"[:MAX_ERROR_CHARS]
+
+
+class CircuitBreaker:
+    """closed -> open on failure -> closed again once a background probe succeeds"""
+
+    def __init__(self, probe, base_delay=1.0, max_delay=60.0, name='breaker'):
+        self.probe = probe
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.name = name
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.state = 'closed'
+        self.opened_at = None
+        self.next_probe = None
+        self.last_error = None
+        self.trips = self.probes = 0
+
+    def allow(self):
+        """True when requests may use the protected resource"""
+        return self.state == 'closed'
+
+    def trip(self, error):
+        """Open the breaker (if closed) and start probing in the background"""
+        with self.lock:
+            self.last_error = describe(error)
+            if self.state == 'open':
+                return
+            self.state = 'open'
+            self.opened_at = time.time()
+            self.trips += 1
+            # Fresh event per probe thread, so reset() stops exactly that thread
+            self.wake = threading.Event()
+        threading.Thread(target=self._reconnect, name=f'{self.name}-probe', daemon=True).start()
+
+    def _reconnect(self):
+        wake = self.wake
+        delay = self.base_delay
+        while True:
+            self.next_probe = time.time() + delay
+            if wake.wait(delay):
+                return
+            self.probes += 1
+            try:
+                self.probe()
+            except Exception as e:
+                self.last_error = describe(e)
+                delay = min(delay * 2, self.max_delay)
+                continue
+            with self.lock:
+                self.state = 'closed'
+                self.opened_at = self.next_probe = None
+            return
+
+    def reset(self):
+        """Close the breaker and stop any probe thread"""
+        with self.lock:
+            self.wake.set()
+            self.state = 'closed'
+            self.opened_at = self.next_probe = self.last_error = None
+            self.trips = self.probes = 0
+
+    def stats(self):
+        now = time.time()
+        return {
+            "state": self.state,
+            "open_for_s": round(now - self.opened_at, 1) if self.opened_at else None,
+            "next_probe_in_s": round(max(self.next_probe - now, 0.0), 1) if self.next_probe else None,
+            "trips": self.trips,
+            "probes": self.probes,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,117 @@
+"""
+Precomputed sky quality per city (city_index.db).
+
+The file is produced by scripts/city_index.py from assets/db/cities.json,
+zones.db and dark_distance.db:
+  Header (16 bytes): magic "ASTC", version u16, max zone u8, reserved u8, radius km f32, count u32
+  Records (48 bytes), in cities.json order (most populous first):
+    lat f32, lon f32, map bortle u8, zone u8, sqm f32,
+    dark lat f32, dark lon f32, dark km f32 (NaN when none is known),
+    radius sqm f32, radius zone shares u16 x 9 (1/10000)
+A city's id is its position in cities.json. The whole file (~0.7 MB for
+15k cities) is read into memory and every ranking is sorted once at load,
+so a lookup or a page of a ranking is a few array reads.
+"""
+import math
+import struct
+
+import numpy as np
+
+try:
+    from .route_profile import EARTH_RADIUS_KM
+except ImportError:
+    from route_profile import EARTH_RADIUS_KM
+
+HEADER_SIZE = 16
+CITY_MAGIC = b'ASTC'
+ZONES = 9
+SHARE_UNIT = 10000
+
+CITY_DTYPE = np.dtype([('lat', '<f4'), ('lon', '<f4'), ('map_bortle', 'u1'), ('zone', 'u1'), ('sqm', '<f4'),
+                       ('dark_lat', '<f4'), ('dark_lon', '<f4'), ('dark_km', '<f4'),
+                       ('radius_sqm', '<f4'), ('radius_shares', '<u2', (ZONES,))])
+
+# Ranking orders: darkest/brightest by the city's own SQM, nearest_dark by
+# distance to a dark site, dark_share by the share of dark area in reach
+RANKINGS = ("darkest", "brightest", "nearest_dark", "dark_share")
+
+
+class CityIndex:
+    """city_index.db held in memory, with each ranking pre-sorted (ties by population rank)"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            header = f.read(HEADER_SIZE)
+        if len(header) < HEADER_SIZE or header[:4] != CITY_MAGIC:
+            raise ValueError(f"{path} is not a city_index.db file")
+
+        self.path = path
+        self.version, self.max_zone, _, self.radius_km, self.count = struct.unpack('<HBBfI', header[4:])
+        self.records = np.fromfile(path, dtype=CITY_DTYPE, count=self.count, offset=HEADER_SIZE)
+        if len(self.records) != self.count:
+            raise ValueError(f"{path} is truncated ({len(self.records)} of {self.count} cities)")
+        lat = np.radians(self.records['lat'].astype(np.float64))
+        lon = np.radians(self.records['lon'].astype(np.float64))
+        # Unit vectors: the nearest city is the largest dot product
+        self.xyz = np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=1)
+        self.dark_share = self.records['radius_shares'][:, :self.max_zone].sum(axis=1) / SHARE_UNIT
+        # Plain Python columns, so building a city's response does no NumPy scalar work
+        self.columns = {name: self.records[name].tolist() for name in CITY_DTYPE.names}
+        self.columns['dark_share'] = self.dark_share.tolist()
+
+        ids = np.arange(self.count)
+        sqm = self.records['sqm']
+        dark_km = np.nan_to_num(self.records['dark_km'], nan=np.inf)
+        self.rankings = {
+            "darkest": np.lexsort((ids, -sqm)),
+            "brightest": np.lexsort((ids, sqm)),
+            "nearest_dark": np.lexsort((ids, dark_km)),
+            "dark_share": np.lexsort((ids, -self.dark_share)),
+        }
+
+    def __len__(self):
+        return self.count
+
+    def nearest(self, lat, lon):
+        """(id, distance km) of the city closest to (lat, lon)"""
+        phi, lam = math.radians(lat), math.radians(lon)
+        dots = self.xyz @ np.array([math.cos(phi) * math.cos(lam), math.cos(phi) * math.sin(lam), math.sin(phi)])
+        i = int(np.argmax(dots))
+        return i, EARTH_RADIUS_KM * math.acos(min(float(dots[i]), 1.0))
+
+    def city(self, i):
+        c = self.columns
+        shares = c['radius_shares'][i]
+        dark_km = c['dark_km'][i]
+        nearest_dark = None
+        if not math.isnan(dark_km):
+            nearest_dark = {"lat": round(c['dark_lat'][i], 5), "lon": round(c['dark_lon'][i], 5),
+                            "distance_km": round(dark_km, 1)}
+        zones = {str(z + 1): share / SHARE_UNIT for z, share in enumerate(shares) if share}
+        return {
+            "id": i,
+            "lat": round(c['lat'][i], 4),
+            "lon": round(c['lon'][i], 4),
+            "map_bortle": c['map_bortle'][i],
+            "bortle_class": c['zone'][i],
+            "sqm": round(c['sqm'][i], 2),
+            "max_bortle": self.max_zone,
+            "nearest_dark": nearest_dark,
+            "radius": {
+                "radius_km": round(self.radius_km, 1),
+                "mean_sqm": round(c['radius_sqm'][i], 2),
+                "dark_share": round(c['dark_share'][i], 4),
+                "darkest_bortle": int(next(iter(zones))) if zones else None,
+                "zones": zones,
+            },
+        }
+
+    def ranking(self, order, limit, offset=0, top=None):
+        """
+        (cities, total) for one page of a ranking; top keeps only the `top`
+        most populous cities (ids below top)
+        """
+        ranked = self.rankings[order]
+        if top is not None and top < self.count:
+            ranked = ranked[ranked < top]
+        return [self.city(i) for i in ranked[offset:offset + limit].tolist()], len(ranked)
@@ -0,0 +1,158 @@
+"""
+Single-flight and micro-batching for per-cell backend lookups.
+
+A burst of requests for one popular spot all resolve to the same res-8
+cell. Each uncached cell is looked up once: a request for a cell that is
+already waiting or being queried attaches to that lookup and gets its
+result (or its exception) instead of issuing a query of its own.
+
+Distinct cells are merged into one multi-key query. The first request into
+an empty batch leads it: while another batch is being resolved it waits up
+to `window` seconds (or until max_batch cells have joined), then resolves
+every cell in the batch with one resolve_many(cells, *args) call, args
+being the leader's. An idle server resolves at once, so batching only costs
+latency when queries are already queued behind each other. window=0 is
+plain single-flight.
+
+MicroBatcher serves threaded servers (each request waits on a
+concurrent.futures.Future); AsyncMicroBatcher does the same on an asyncio
+event loop with an async resolve_many.
+"""
+import asyncio
+import threading
+from concurrent.futures import Future
+
+
+class _Batch:
+    __slots__ = ('keys', 'futures', 'full')
+
+    def __init__(self, full):
+        self.keys = []
+        self.futures = []
+        self.full = full
+
+
+class _Coalescer:
+    """Bookkeeping shared by both batchers: which keys are waiting or in flight"""
+
+    def __init__(self, resolve_many, window=0.0, max_batch=64, on_batch=None):
+        self.resolve_many = resolve_many
+        self.window = window
+        self.max_batch = max_batch
+        # on_batch(size) after each batch is resolved (e.g. a histogram)
+        self.on_batch = on_batch
+        self.lock = threading.Lock()
+        self.futures = {}
+        self.batch = None
+        self.resolving = 0
+        self.requests = self.coalesced = self.batches = 0
+
+    def _join(self, key):
+        """(future, batch to lead or None, whether the leader should wait)"""
+        with self.lock:
+            self.requests += 1
+            future = self.futures.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, None, False
+            future = self.futures[key] = self._future()
+            batch, leader = self.batch, self.batch is None
+            if leader:
+                batch = self.batch = _Batch(self._event())
+            batch.keys.append(key)
+            batch.futures.append(future)
+            if len(batch.keys) >= self.max_batch:
+                self.batch = None
+                batch.full.set()
+            return future, batch if leader else None, self.window > 0 and self.resolving > 0
+
+    def _take(self, batch):
+        """Close the batch to new keys; called by its leader before resolving"""
+        with self.lock:
+            if self.batch is batch:
+                self.batch = None
+            self.resolving += 1
+            self.batches += 1
+
+    def _settle(self, batch, results=None, error=None):
+        with self.lock:
+            self.resolving -= 1
+            for key in batch.keys:
+                del self.futures[key]
+        if error is None and len(results) != len(batch.keys):
+            error = ValueError(f"resolve_many returned {len(results)} results for {len(batch.keys)} keys")
+        for i, future in enumerate(batch.futures):
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(results[i])
+        if self.on_batch is not None:
+            self.on_batch(len(batch.keys))
+
+    def stats(self):
+        return {"requests": self.requests, "coalesced": self.coalesced, "batches": self.batches,
+                "in_flight": len(self.futures)}
+
+
+class MicroBatcher(_Coalescer):
+    """Coalesces lookups from concurrent threads"""
+
+    _future = staticmethod(Future)
+    _event = staticmethod(threading.Event)
+
+    def get(self, key, *args):
+        """Result for key, sharing the lookup with concurrent callers; raises what resolve_many raised"""
+        future, batch, wait = self._join(key)
+        if batch is not None:
+            if wait:
+                batch.full.wait(self.window)
+            self._take(batch)
+            try:
+                results = self.resolve_many(batch.keys, *args)
+            except Exception as e:
+                self._settle(batch, error=e)
+            else:
+                self._settle(batch, results)
+        return future.result()
+
+
+class AsyncMicroBatcher(_Coalescer):
+    """
+    Coalesces lookups from concurrent tasks on one event loop. A batch is
+    resolved in its own task, so a cancelled leader request does not strand
+    the requests that joined it.
+    """
+
+    _event = staticmethod(asyncio.Event)
+
+    def __init__(self, resolve_many, window=0.0, max_batch=64, on_batch=None):
+        super().__init__(resolve_many, window, max_batch, on_batch)
+        self.tasks = set()
+
+    def _future(self):
+        return asyncio.get_running_loop().create_future()
+
+    async def get(self, key, *args):
+        future, batch, wait = self._join(key)
+        if batch is not None:
+            task = asyncio.get_running_loop().create_task(self._run(batch, wait, args))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+        # Shielded: cancelling one waiter must not cancel the shared future
+        return await asyncio.shield(future)
+
+    async def _run(self, batch, wait, args):
+        if wait:
+            try:
+                await asyncio.wait_for(batch.full.wait(), self.window)
+            except asyncio.TimeoutError:
+                pass
+        self._take(batch)
+        try:
+            results = await self.resolve_many(batch.keys, *args)
+        except Exception as e:
+            self._settle(batch, error=e)
+        else:
+            self._settle(batch, results)
@@ -0,0 +1,119 @@
+"""
+Nearest dark-sky site search over zones.db with a coarse parent index.
+
+dark_index.db is produced by scripts/dark_index.py:
+  Header (16 bytes): magic "ASTD", version u16, resolution u8, child resolution u8, count u64
+  Records: h3 u64, zone_min u8, counts u32 x 9 (children per zone 1..9), sorted by h3
+Parents that are not stored are entirely implicit Zone 1.
+
+A search takes the grid disk of coarse parents covering the radius, drops
+parents whose minimum zone is above the target, and opens the remaining
+parents best-first by a lower bound on their distance. Each opened parent
+contributes one site (its nearest qualifying res-8 cell), so the k results
+are distinct areas rather than k neighbouring cells of the same valley.
+"""
+import math
+import struct
+
+import h3
+import numpy as np
+from h3.api import numpy_int as h3_int
+
+try:
+    from .route_profile import haversine_km
+except ImportError:
+    from route_profile import haversine_km
+
+HEADER_SIZE = 16
+DARK_MAGIC = b'ASTD'
+ZONES = 9
+
+
+class DarkIndex:
+    """Memory-mapped per-parent zone minimum and histogram"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            header = f.read(HEADER_SIZE)
+        if len(header) < HEADER_SIZE or header[:4] != DARK_MAGIC:
+            raise ValueError(f"{path} is not a dark_index.db file")
+
+        self.version, self.resolution, self.child_resolution, self.count = \
+            struct.unpack('<HBBQ', header[4:])
+        dtype = np.dtype([('h3', '<u8'), ('zone_min', 'u1'), ('counts', '<u4', (ZONES,))])
+        if self.count:
+            self.records = np.memmap(path, dtype=dtype, mode='r', offset=HEADER_SIZE, shape=(self.count,))
+        else:
+            self.records = np.zeros(0, dtype=dtype)
+        self.cells = self.records['h3']
+        self.children = 7 ** (self.child_resolution - self.resolution)
+        # Upper bound on centre-to-vertex distance of a parent (H3 cells vary ~2x in area)
+        self.parent_radius_km = 2 * h3.average_hexagon_edge_length(self.resolution, 'km')
+
+    def summary(self, parents):
+        """(zone_min, counts) arrays for parent cells; unstored parents are all Zone 1"""
+        parents = np.asarray(parents, dtype=np.uint64)
+        zone_min = np.ones(len(parents), dtype=np.uint8)
+        counts = np.zeros((len(parents), ZONES), dtype=np.uint32)
+        counts[:, 0] = self.children
+        if self.count and len(parents):
+            i = np.minimum(np.searchsorted(self.cells, parents), self.count - 1)
+            hit = self.cells[i] == parents
+            rec = self.records[i[hit]]
+            zone_min[hit] = rec['zone_min']
+            counts[hit] = rec['counts']
+        return zone_min, counts
+
+
+def _centres(cells):
+    return np.array([h3_int.cell_to_latlng(c) for c in cells.tolist()], dtype=np.float64).reshape(-1, 2)
+
+
+def nearest_dark_sites(store, index, lat, lon, max_zone, radius_km, k):
+    """
+    Up to k sites at or below max_zone within radius_km of (lat, lon),
+    one per coarse parent, ranked by great-circle distance.
+    """
+    origin = h3_int.latlng_to_cell(lat, lon, index.resolution)
+    rings = math.ceil(radius_km / h3.average_hexagon_edge_length(index.resolution, 'km')) + 1
+    parents = np.asarray(h3_int.grid_disk(origin, rings), dtype=np.uint64)
+
+    zone_min, counts = index.summary(parents)
+    keep = zone_min <= max_zone
+    parents, counts = parents[keep], counts[keep]
+    centres = _centres(parents)
+    bound = np.maximum(haversine_km(lat, lon, centres[:, 0], centres[:, 1]) - index.parent_radius_km, 0.0)
+    order = np.argsort(bound, kind='stable')
+
+    sites = []
+    opened = 0
+    for i in order.tolist():
+        if bound[i] > radius_km:
+            break
+        if len(sites) >= k and bound[i] > sites[k - 1]["distance_km"]:
+            break
+        opened += 1
+        children = np.asarray(h3_int.cell_to_children(int(parents[i]), index.child_resolution), dtype=np.uint64)
+        found = store.lookup_cells(children)
+        ok = found["zone"] <= max_zone
+        if not ok.any():  # index out of step with zones.db
+            continue
+        cells = children[ok]
+        pts = _centres(cells)
+        dist = haversine_km(lat, lon, pts[:, 0], pts[:, 1])
+        j = int(np.argmin(dist))
+        if dist[j] > radius_km:
+            continue
+        sites.append({
+            "lat": round(float(pts[j, 0]), 5),
+            "lon": round(float(pts[j, 1]), 5),
+            "h3": h3.int_to_str(int(cells[j])),
+            "distance_km": round(float(dist[j]), 3),
+            "bortle_class": int(found["zone"][ok][j]),
+            "sqm": round(float(found["sqm"][ok][j]), 2),
+            "parent": h3.int_to_str(int(parents[i])),
+            "qualifying_cells": int(counts[i, :max_zone].sum()),
+        })
+        sites.sort(key=lambda s: s["distance_km"])
+
+    return {"sites": sites[:k], "parents_considered": int(len(parents)), "parents_opened": opened}
@@ -0,0 +1,136 @@
+"""
+Response encodings for bulk lookup results.
+
+Batch results are held as the distinct cache entries plus, per point, the
+index of its entry (what cached_entries returns), so columnar formats are
+built per distinct entry and expanded with one NumPy take per column
+instead of a dict per point:
+
+  json     {"count", "backend", "results": [{lat, lon, ...}, ...]} (default,
+           unchanged); orjson when installed, else the stdlib encoder
+  msgpack  {"count", "backend", "columns": {name: column}}: numeric columns
+           as {"dtype": "<f8", "data": <raw bytes>} (np.frombuffer on the
+           client), other columns (strings, nested, with gaps) as arrays
+  arrow    Arrow IPC stream of one record batch, one column per field,
+           with the backend in the schema metadata
+
+Formats are chosen by ?format= or the Accept header. orjson, msgpack and
+pyarrow are optional (requirements-formats.txt); a format whose library is
+missing is not offered.
+"""
+import io
+import json
+from operator import itemgetter
+
+import numpy as np
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+MEDIA_TYPES = {
+    "json": "application/json",
+    "msgpack": "application/msgpack",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+# Other names clients send for the same formats
+MEDIA_ALIASES = {"application/x-msgpack": "msgpack"}
+
+
+def available_formats():
+    return ["json"] + [f for f, module in (("msgpack", msgpack), ("arrow", pyarrow)) if module is not None]
+
+
+def negotiate(accept, requested=None):
+    """
+    Format name for an explicit ?format= value or else the Accept header
+    (JSON without one); None when nothing acceptable is available.
+    """
+    available = available_formats()
+    if requested:
+        return requested if requested in available else None
+    if not accept:
+        return "json"
+    offered = {MEDIA_TYPES[f]: f for f in available}
+    offered.update({m: f for m, f in MEDIA_ALIASES.items() if f in available})
+    best = parse_accept_header(accept, MIMEAccept).best_match(list(offered))
+    return offered.get(best)
+
+
+def encode_json(body):
+    if orjson is not None:
+        return orjson.dumps(body, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(body, separators=(',', ':')).encode()
+
+
+def _column(values):
+    """Typed NumPy column of per-entry values; object dtype for strings, nested values and gaps"""
+    if values and type(values[0]) in (bool, int, float):
+        column = np.array(values)
+        if column.ndim == 1 and column.dtype.kind in 'bif':
+            return column
+    return np.fromiter(values, dtype=object, count=len(values))
+
+
+class BatchResult:
+    """Points of a batch lookup: entries[inverse[i]] belongs to (lats[i], lons[i])"""
+
+    def __init__(self, lats, lons, entries, inverse):
+        self.lats = lats
+        self.lons = lons
+        self.entries = entries
+        self.inverse = np.asarray(inverse, dtype=np.intp)
+
+    def __len__(self):
+        return len(self.inverse)
+
+    def rows(self):
+        entries = self.entries
+        return [{"lat": lat, "lon": lon, **entries[i]}
+                for lat, lon, i in zip(self.lats.tolist(), self.lons.tolist(), self.inverse.tolist())]
+
+    def columns(self):
+        """{field: column per point}; fields an entry lacks are None in object columns"""
+        entries = self.entries
+        first = list(entries[0]) if entries else []
+        names = first + sorted(set().union(*entries) - set(first))
+        columns = {"lat": np.asarray(self.lats, dtype=np.float64), "lon": np.asarray(self.lons, dtype=np.float64)}
+        for name in names:
+            try:
+                values = list(map(itemgetter(name), entries))
+            except KeyError:
+                values = [entry.get(name) for entry in entries]
+            columns[name] = _column(values)[self.inverse]
+        return columns
+
+
+def encode_batch(result, fmt, backend):
+    """(body bytes, media type) of a BatchResult in a negotiated format"""
+    if fmt == "msgpack":
+        columns = {name: column.tolist() if column.dtype == object else
+                   {"dtype": column.dtype.str, "data": column.tobytes()}
+                   for name, column in result.columns().items()}
+        body = msgpack.packb({"count": len(result), "backend": backend, "columns": columns})
+    elif fmt == "arrow":
+        table = pyarrow.table({name: column.tolist() if column.dtype == object else column
+                               for name, column in result.columns().items()})
+        table = table.replace_schema_metadata({"backend": backend})
+        sink = io.BytesIO()
+        with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        body = sink.getvalue()
+    else:
+        body = encode_json({"count": len(result), "backend": backend, "results": result.rows()})
+    return body, MEDIA_TYPES[fmt]
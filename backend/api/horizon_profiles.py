@@ -0,0 +1,51 @@
+"""
+Read-only access to horizon.db (per-azimuth light-dome profiles).
+
+The file is produced by scripts/horizon_profile.py --precompute:
+  Header (16 bytes): magic "ASTH", version u16, bins u8, resolution u8, count u64
+  Records: h3 u64 + bins x u8 log-quantized radiance, sorted by h3
+"""
+import struct
+
+import h3
+import numpy as np
+
+HEADER_SIZE = 16
+HORIZON_MAGIC = b'ASTH'
+
+# Quantization (must match scripts/horizon_profile.py)
+LOG_MIN = -4.0
+LOG_STEP = 7.0 / 254
+
+
+def dequantize(q):
+    """uint8 log-quantized values -> radiance in nW/cm^2/sr (0 for q=0)"""
+    q = np.asarray(q)
+    return np.where(q > 0, 10 ** (LOG_MIN + (q.astype(np.float64) - 1) * LOG_STEP), 0.0)
+
+
+class HorizonProfiles:
+    """Memory-mapped profile table with binary-search lookup by H3 parent"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            header = f.read(HEADER_SIZE)
+        if len(header) < HEADER_SIZE or header[:4] != HORIZON_MAGIC:
+            raise ValueError(f"{path} is not a horizon.db file")
+
+        self.version, self.bins, self.resolution, self.count = struct.unpack('<HBBQ', header[4:])
+        dtype = np.dtype([('h3', '<u8'), ('bins', 'u1', (self.bins,))])
+        self.records = np.memmap(path, dtype=dtype, mode='r', offset=HEADER_SIZE, shape=(self.count,))
+        self.cells = self.records['h3']
+
+    def lookup(self, lat, lon):
+        """
+        Profile for the stored parent cell covering (lat, lon).
+        Returns (cell_hex, radiance array) or (cell_hex, None) when no light reaches the cell.
+        """
+        cell = h3.latlng_to_cell(lat, lon, self.resolution)
+        target = h3.str_to_int(cell)
+        i = int(np.searchsorted(self.cells, target))
+        if i < self.count and int(self.cells[i]) == target:
+            return cell, dequantize(self.records['bins'][i])
+        return cell, None
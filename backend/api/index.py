@@ -1,16 +1,132 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, make_response, g
 import os
 import sys
+import tempfile
+import threading
+import time
 from dotenv import load_dotenv
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
 import math
+import numpy as np
+from h3.api import numpy_int as h3_int
+
+try:
+    from .horizon_profiles import HorizonProfiles
+    from .zones_store import ZonesStore, LiteZones, H3_RESOLUTION, IMPLICIT_ZONE, IMPLICIT_SQM, latlng_to_cells
+    from .route_profile import route_profile, haversine_km
+    from .dark_sites import DarkIndex, nearest_dark_sites
+    from .city_index import CityIndex, RANKINGS as CITY_RANKINGS
+    from .area_stats import (AreaPyramid, area_stats, polyfill, estimate_resolution, bounds_area_km2,
+                             shape_from_bbox, shape_from_geojson)
+    from .viewport import zoom_resolution, viewport_shape, covering, stream_cells, encode_binary, encode_ndjson
+    from .tiles import TileCache, TileRenderer, MAX_TILE_ZOOM, tile_etag
+    from .response_cache import CellCache, cell_etag, file_stamp
+    from .circuit_breaker import CircuitBreaker
+    from .metrics import Registry, CONTENT_TYPE as METRICS_CONTENT_TYPE, pool_listener
+    from .tracing import Tracer, JsonLinesExporter
+    from .encoding import BatchResult, MEDIA_TYPES, negotiate, available_formats, encode_json, encode_batch
+    from .coalesce import MicroBatcher
+except ImportError:  # loaded as a top-level module (Vercel, `python api/index.py`)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from horizon_profiles import HorizonProfiles
+    from zones_store import ZonesStore, LiteZones, H3_RESOLUTION, IMPLICIT_ZONE, IMPLICIT_SQM, latlng_to_cells
+    from route_profile import route_profile, haversine_km
+    from dark_sites import DarkIndex, nearest_dark_sites
+    from city_index import CityIndex, RANKINGS as CITY_RANKINGS
+    from area_stats import (AreaPyramid, area_stats, polyfill, estimate_resolution, bounds_area_km2,
+                            shape_from_bbox, shape_from_geojson)
+    from viewport import zoom_resolution, viewport_shape, covering, stream_cells, encode_binary, encode_ndjson
+    from tiles import TileCache, TileRenderer, MAX_TILE_ZOOM, tile_etag
+    from response_cache import CellCache, cell_etag, file_stamp
+    from circuit_breaker import CircuitBreaker
+    from metrics import Registry, CONTENT_TYPE as METRICS_CONTENT_TYPE, pool_listener
+    from tracing import Tracer, JsonLinesExporter
+    from encoding import BatchResult, MEDIA_TYPES, negotiate, available_formats, encode_json, encode_batch
+    from coalesce import MicroBatcher
 
 # Load environment variables
 load_dotenv()
 
 app = Flask(__name__)
 
+# Prometheus metrics (/metrics). Labels are route templates, statuses,
+# backends and reasons only, so cardinality stays bounded.
+metrics = Registry()
+HTTP_REQUESTS = metrics.counter('astr_http_requests_total', 'HTTP requests by route, method and status',
+                                ('route', 'method', 'status'))
+HTTP_LATENCY = metrics.histogram('astr_http_request_duration_seconds', 'Request latency by route and status',
+                                 ('route', 'status'))
+DB_LATENCY = metrics.histogram('astr_db_query_duration_seconds', 'Data lookup time by backend and operation',
+                               ('backend', 'operation'))
+FALLBACKS = metrics.counter('astr_fallback_responses_total',
+                            'Lookups not answered by the primary backend, by reason', ('reason',))
+MONGO_POOL_OPEN = metrics.gauge('astr_mongo_pool_connections', 'Open MongoDB connections')
+MONGO_POOL_CHECKED_OUT = metrics.gauge('astr_mongo_pool_checked_out', 'MongoDB connections in use')
+MONGO_CHECKOUT_FAILURES = metrics.counter('astr_mongo_pool_checkout_failures_total',
+                                          'Failed MongoDB connection checkouts by reason', ('reason',))
+LOOKUP_BATCH_SIZE = metrics.histogram('astr_lookup_batch_cells', 'Cells per coalesced backend lookup by backend',
+                                      ('backend',), buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+HTTP_METHODS = frozenset(('GET', 'POST', 'HEAD', 'OPTIONS', 'PUT', 'PATCH', 'DELETE'))
+
+# Request tracing (api/tracing.py): TRACE_SAMPLE_RATE of requests, plus any whose
+# traceparent header is sampled, are written as spans to TRACE_FILE. 0 turns it off.
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '0'))
+TRACE_FILE = os.getenv('TRACE_FILE', os.path.join(tempfile.gettempdir(), 'astr-traces.jsonl'))
+TRACE_MAX_MB = int(os.getenv('TRACE_MAX_MB', '10'))
+TRACE_BACKUPS = int(os.getenv('TRACE_BACKUPS', '3'))
+tracer = Tracer(JsonLinesExporter(TRACE_FILE, TRACE_MAX_MB * 1024 * 1024, TRACE_BACKUPS)
+                if TRACE_SAMPLE_RATE > 0 else None, TRACE_SAMPLE_RATE)
+
+class RequestClock:
+    """Stamps arrival before Flask matches the URL, so traces include routing"""
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        environ['astr.arrival_ns'] = time.time_ns()
+        return self.wsgi_app(environ, start_response)
+
+app.wsgi_app = RequestClock(app.wsgi_app)
+
+def route_label():
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    if tracer.exporter is not None:
+        route = route_label()
+        arrival = request.environ.get('astr.arrival_ns')
+        span, token = tracer.start_trace(f"{request.method} {route}",
+                                         {"http.method": request.method, "http.route": route},
+                                         request.headers.get('traceparent'), arrival)
+        if span is not None:
+            g.trace = (span, token)
+            tracer.record('routing', span.start_ns, time.time_ns())
+
+@app.after_request
+def record_request(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        route = route_label()
+        method = request.method if request.method in HTTP_METHODS else 'other'
+        status = str(response.status_code)
+        HTTP_REQUESTS.inc(route, method, status)
+        HTTP_LATENCY.observe(time.perf_counter() - start, route, status)
+    trace = g.pop('trace', None)
+    if trace is not None:
+        trace[0].set('http.status_code', response.status_code)
+        response.headers['traceparent'] = tracer.traceparent(trace[0])
+        tracer.end_trace(*trace)
+    return response
+
+@app.teardown_request
+def end_unfinished_trace(error):
+    # after_request is skipped when a response could not be built
+    trace = g.pop('trace', None)
+    if trace is not None:
+        trace[0].status = 'ERROR'
+        tracer.end_trace(*trace)
+
 # Global error handler
 @app.errorhandler(Exception)
 def handle_exception(e):
@@ -24,34 +140,271 @@ def handle_exception(e):
         "type": type(e).__name__
     }), 500
 
-# MongoDB connection
+# MongoDB connection. pymongo (with dnspython) is imported on first use, so
+# cold starts that never reach MongoDB (health, zones.db, tiles) skip it.
+#   ping        connect and ping on the first request that needs the database (default)
+#   background  connect and ping on a thread; requests never wait for it and are
+#               answered from local data until the ping succeeds
 MONGO_URI = os.getenv('MONGODB_URI')
+MONGO_CONNECT = os.getenv('MONGO_CONNECT', 'ping')
+# Reconnect backoff while the circuit is open (seconds, doubling up to the max)
+MONGO_BACKOFF_S = float(os.getenv('MONGO_BACKOFF_S', '1'))
+MONGO_BACKOFF_MAX_S = float(os.getenv('MONGO_BACKOFF_MAX_S', '60'))
 mongo_client = None
 db = None
+# idle | connecting | connected | failed
+mongo_state = 'idle'
+mongo_lock = threading.Lock()
 
-def get_db():
-    """Initialize MongoDB connection lazily"""
-    global mongo_client, db
+def connect_mongo():
+    """Create the client (once; it is reused across warm invocations and reconnects) and ping it"""
+    global mongo_client, db, mongo_state
     if mongo_client is None:
-        if not MONGO_URI:
-            print("Warning: MONGODB_URI environment variable not set", file=sys.stderr)
+        # SRV URIs resolve DNS in the constructor
+        from pymongo import MongoClient
+        mongo_client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000, event_listeners=[
+            pool_listener(MONGO_POOL_OPEN, MONGO_POOL_CHECKED_OUT, MONGO_CHECKOUT_FAILURES)])
+    with tracer.span('mongo.ping', **{"db.system": "mongodb"}), DB_LATENCY.time('mongo', 'ping'):
+        mongo_client.admin.command('ping')
+    # Get database - use 'astr' as default database name
+    db = mongo_client['astr']
+    mongo_state = 'connected'
+    print("MongoDB connected successfully", file=sys.stderr)
+
+# Open after a connection failure: requests skip MongoDB and a background
+# thread reconnects with exponential backoff
+mongo_breaker = CircuitBreaker(connect_mongo, MONGO_BACKOFF_S, MONGO_BACKOFF_MAX_S, name='mongo')
+
+def mongo_failed(e):
+    """Record a connection failure and open the circuit"""
+    global mongo_state
+    print(f"MongoDB connection failed: {e}", file=sys.stderr)
+    print(f"Connection error type: {type(e).__name__}", file=sys.stderr)
+    mongo_state = 'failed'
+    mongo_breaker.trip(e)
+
+def is_connection_error(e):
+    """Server down or unreachable (pymongo ConnectionFailure), as opposed to a failed query"""
+    # Matched by name so pymongo need not be imported to classify other errors
+    return any(c.__name__ == 'ConnectionFailure' and c.__module__ == 'pymongo.errors'
+               for c in type(e).__mro__)
+
+def get_db():
+    """MongoDB database; None when not configured, not connected yet or the circuit is open"""
+    if not MONGO_URI:
+        print("Warning: MONGODB_URI environment variable not set", file=sys.stderr)
+        return None
+    if not mongo_breaker.allow():
+        return None
+    if db is not None:
+        return db
+    if MONGO_CONNECT == 'background':
+        start_connect()
+        return None
+    with mongo_lock:
+        if db is None and mongo_breaker.allow():
+            try:
+                print("Attempting MongoDB connection...", file=sys.stderr)
+                connect_mongo()
+            except Exception as e:
+                mongo_failed(e)
+    return db if mongo_breaker.allow() else None
+
+def start_connect():
+    """First background connection attempt; later ones are the circuit breaker's"""
+    global mongo_state
+    with mongo_lock:
+        if mongo_state != 'idle':
+            return
+        mongo_state = 'connecting'
+    threading.Thread(target=connect_in_background, name='mongo-connect', daemon=True).start()
+
+def connect_in_background():
+    try:
+        connect_mongo()
+    except Exception as e:
+        mongo_failed(e)
+
+# Light-pollution storage backend:
+#   mongo     $near query over point documents in MongoDB (default)
+#   mongo_h3  _id lookup in a MongoDB collection keyed by res-8 H3 cell
+#   zones_db  memory-mapped zones.db, H3 cell lookup with no network hop
+LP_BACKEND = os.getenv('LP_BACKEND', 'mongo')
+# mongo_h3 layout: {_id: H3 integer, radiance, mpsas, bortle} per cell, loaded by
+# scripts/load_h3_collection.py. A cell without a document takes the nearest one
+# within MONGO_H3_RING cells (one $in over the ring); with MONGO_H3_MISSING=dark
+# it is implicit Zone 1 instead, as in zones.db (for a collection loaded from it).
+MONGO_H3_COLLECTION = os.getenv('MONGO_H3_COLLECTION', 'light_pollution_h3')
+MONGO_H3_RING = int(os.getenv('MONGO_H3_RING', '2'))
+MONGO_H3_MISSING = os.getenv('MONGO_H3_MISSING', 'nearest')
+# Ids per $in query
+MONGO_H3_IN_CHUNK = 5000
+# Concurrent single-point lookups of one cell share a query (api/coalesce.py).
+# mongo_h3 also merges distinct cells into one $in: while a query is in flight,
+# new cells wait up to COALESCE_WINDOW_MS for up to COALESCE_MAX_BATCH others.
+# 0 keeps single-flight only. $near queries are never merged.
+COALESCE_WINDOW_MS = float(os.getenv('COALESCE_WINDOW_MS', '2'))
+COALESCE_MAX_BATCH = int(os.getenv('COALESCE_MAX_BATCH', '64'))
+ZONES_DB_PATH = os.getenv('ZONES_DB_PATH', os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '..', 'assets', 'db', 'zones.db'))
+# Optional per-cell distance to darker sky (scripts/dark_distance.py)
+DARK_DISTANCE_PATH = os.getenv('DARK_DISTANCE_PATH', os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '..', 'assets', 'db', 'dark_distance.db'))
+zones_store = None
+
+def get_zones_store():
+    """Open zones.db lazily; None when the file is not deployed"""
+    global zones_store
+    if zones_store is None:
+        if not os.path.exists(ZONES_DB_PATH):
+            print(f"Warning: zones.db not found at {ZONES_DB_PATH}", file=sys.stderr)
+            return None
+        try:
+            zones_store = ZonesStore(ZONES_DB_PATH)
+        except (OSError, ValueError) as e:
+            print(f"Failed to open zones.db: {e}", file=sys.stderr)
+            return None
+        if os.path.exists(DARK_DISTANCE_PATH):
+            try:
+                zones_store.attach_dark_distance(DARK_DISTANCE_PATH)
+            except (OSError, ValueError) as e:
+                print(f"Ignoring dark_distance.db: {e}", file=sys.stderr)
+    return zones_store
+
+# Map zones.db at import so pre-forked workers (gunicorn --preload) share it
+if LP_BACKEND == 'zones_db':
+    get_zones_store()
+elif MONGO_CONNECT == 'background' and MONGO_URI:
+    # Start connecting while the rest of the cold start runs
+    start_connect()
+
+# Bundled coarse dataset (scripts/lite_zones.py) answering while MongoDB connects
+LITE_DB_PATH = os.getenv('LITE_DB_PATH', os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '..', 'assets', 'db', 'zones_lite.db'))
+lite_zones = None
+
+def get_lite_zones():
+    """Load zones_lite.db lazily; None when the file is not deployed"""
+    global lite_zones
+    if lite_zones is None:
+        if not os.path.exists(LITE_DB_PATH):
+            return None
+        try:
+            lite_zones = LiteZones(LITE_DB_PATH)
+        except (OSError, ValueError) as e:
+            print(f"Failed to open zones_lite.db: {e}", file=sys.stderr)
+            return None
+    return lite_zones
+
+# Precomputed light-dome profiles (scripts/horizon_profile.py --precompute)
+HORIZON_DB_PATH = os.getenv('HORIZON_DB_PATH', os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '..', 'assets', 'db', 'horizon.db'))
+horizon_profiles = None
+
+def get_horizon_profiles():
+    """Open horizon.db lazily; None when the file is not deployed"""
+    global horizon_profiles
+    if horizon_profiles is None:
+        if not os.path.exists(HORIZON_DB_PATH):
+            return None
+        try:
+            horizon_profiles = HorizonProfiles(HORIZON_DB_PATH)
+        except (OSError, ValueError) as e:
+            print(f"Failed to open horizon profiles: {e}", file=sys.stderr)
+            return None
+    return horizon_profiles
+
+# Coarse parent index for nearest dark-site search (scripts/dark_index.py)
+DARK_INDEX_PATH = os.getenv('DARK_INDEX_PATH', os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '..', 'assets', 'db', 'dark_index.db'))
+dark_index = None
+
+def get_dark_index():
+    """Open dark_index.db lazily; None when the file is not deployed"""
+    global dark_index
+    if dark_index is None:
+        if not os.path.exists(DARK_INDEX_PATH):
+            return None
+        try:
+            dark_index = DarkIndex(DARK_INDEX_PATH)
+        except (OSError, ValueError) as e:
+            print(f"Failed to open dark index: {e}", file=sys.stderr)
+            return None
+    return dark_index
+
+# Per-city sky quality (scripts/city_index.py), held in memory
+CITY_INDEX_PATH = os.getenv('CITY_INDEX_PATH', os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '..', 'assets', 'db', 'city_index.db'))
+city_index = None
+
+def get_city_index():
+    """Load city_index.db lazily; None when the file is not deployed"""
+    global city_index
+    if city_index is None:
+        if not os.path.exists(CITY_INDEX_PATH):
+            return None
+        try:
+            city_index = CityIndex(CITY_INDEX_PATH)
+        except (OSError, ValueError) as e:
+            print(f"Failed to open city index: {e}", file=sys.stderr)
+            return None
+    return city_index
+
+# Read at import (~1 ms) so pre-forked workers start with it
+get_city_index()
+
+# Res-5 aggregates of zones.db for /api/area-stats, built on first use
+area_pyramid = None
+
+def get_area_pyramid(store):
+    """Area pyramid of the open zones.db (rebuilt when the store is swapped)"""
+    global area_pyramid
+    if area_pyramid is None or area_pyramid.store is not store:
+        area_pyramid = AreaPyramid(store)
+    return area_pyramid
+
+# Rendered map tiles: size-bounded LRU on local disk (/tmp is the only
+# writable path on serverless hosts)
+TILE_CACHE_DIR = os.getenv('TILE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'astr-tiles'))
+TILE_CACHE_MAX_MB = int(os.getenv('TILE_CACHE_MAX_MB', '512'))
+tile_renderer = None
+
+def get_tile_renderer():
+    """Tile renderer over zones.db (+ dark_index.db for low zooms); None without zones.db"""
+    global tile_renderer
+    if tile_renderer is None:
+        store = get_zones_store()
+        if store is None:
             return None
+        index = get_dark_index()
+        # Cache key follows the data files, so a rebuilt zones.db gets fresh tiles
+        stamp = file_stamp(ZONES_DB_PATH, DARK_INDEX_PATH if index is not None else None)
         try:
-            print(f"Attempting MongoDB connection...", file=sys.stderr)
-            mongo_client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
-            # Test connection
-            mongo_client.admin.command('ping')
-            # Get database - use 'astr' as default database name
-            db = mongo_client['astr']
-            print("MongoDB connected successfully", file=sys.stderr)
-            return db
-        except (ConnectionFailure, Exception) as e:
-            print(f"MongoDB connection failed: {e}", file=sys.stderr)
-            print(f"Connection error type: {type(e).__name__}", file=sys.stderr)
-            mongo_client = None
-            db = None
+            os.makedirs(TILE_CACHE_DIR, exist_ok=True)
+            cache = TileCache(TILE_CACHE_DIR, TILE_CACHE_MAX_MB * 1024 * 1024)
+        except OSError as e:
+            print(f"Tile cache disabled: {e}", file=sys.stderr)
+            cache = None
+        tile_renderer = TileRenderer(store, index, cache, stamp)
+    return tile_renderer
+
+# Per-cell light pollution results shared by the single and batch endpoints
+LP_CACHE_SIZE = int(os.getenv('LP_CACHE_SIZE', '50000'))
+LP_CACHE_TTL = int(os.getenv('LP_CACHE_TTL', '86400'))
+# Browser/CDN lifetime of a light pollution response (matches cloudflare/worker.js)
+LP_MAX_AGE = 3600
+# Optional release tag of the deployed data; defaults to a stamp of zones.db
+DATASET_VERSION = os.getenv('DATASET_VERSION')
+lp_cache = CellCache(LP_CACHE_SIZE, LP_CACHE_TTL)
+
+def dataset_version():
+    """Cache and ETag namespace of the active backend; None when its data is not deployed"""
+    if LP_BACKEND == 'zones_db':
+        store = get_zones_store()
+        if store is None:
             return None
-    return db
+        return f"zones_db:{DATASET_VERSION or file_stamp(store.path, store.dark_distance_path)}"
+    return f"{LP_BACKEND}:{DATASET_VERSION or 'default'}"
 
 def calculate_bortle_class(mpsas):
     """
@@ -89,19 +442,144 @@ def calculate_bortle_class(mpsas):
     else:
         return 9  # Inner city sky
 
+def check_coordinates(lat, lon):
+    """Validation error (body, status) for query coordinates, or None when valid"""
+    if lat is None or lon is None:
+        return {
+            "error": "Missing required parameters",
+            "message": "Both 'lat' and 'lon' query parameters are required"
+        }, 400
+
+    # Validate coordinate ranges
+    if not (-90 <= lat <= 90):
+        return {
+            "error": "Invalid latitude",
+            "message": "Latitude must be between -90 and 90"
+        }, 400
+
+    if not (-180 <= lon <= 180):
+        return {
+            "error": "Invalid longitude",
+            "message": "Longitude must be between -180 and 180"
+        }, 400
+
+    return None
+
+def parse_coordinates():
+    """
+    Read and validate the lat/lon query parameters.
+    Returns (lat, lon, None) or (None, None, error_response).
+    """
+    lat = request.args.get('lat', type=float)
+    lon = request.args.get('lon', type=float)
+
+    error = check_coordinates(lat, lon)
+    if error:
+        return None, None, (jsonify(error[0]), error[1])
+    return lat, lon, None
+
+# Largest batch accepted by /api/light-pollution/batch
+MAX_BATCH_POINTS = 50000
+# Route profile limits (/api/route-profile)
+MAX_ROUTE_VERTICES = 10000
+MAX_ROUTE_KM = 5000
+# Nearest dark-site search limits (/api/dark-sites)
+MAX_DARK_RADIUS_KM = 500
+MAX_DARK_SITES = 20
+# Page size limit for /api/city-ranking
+MAX_CITY_RANKING = 100
+# Area statistics limits (/api/area-stats): the polyfill resolution drops
+# below 8 once the area would need more than MAX_AREA_CELLS cells
+MAX_AREA_KM2 = float(os.getenv('MAX_AREA_KM2', '20000000'))
+MAX_AREA_CELLS = int(os.getenv('MAX_AREA_CELLS', '200000'))
+MAX_AREA_VERTICES = 10000
+# Viewport streaming (/api/viewport): the zoom's resolution is lowered while
+# covering the viewport would take more than MAX_VIEWPORT_CELLS cells
+MAX_VIEWPORT_CELLS = int(os.getenv('MAX_VIEWPORT_CELLS', '20000'))
+MAX_VIEWPORT_ZOOM = 22
+
+def check_points(body, key, max_points):
+    """
+    Validate a JSON body {key: [[lat, lon], ...]} as NumPy arrays.
+    Returns (lats, lons, None) or (None, None, (error body, status)).
+    """
+    points = body.get(key) if isinstance(body, dict) else None
+    if points is None:
+        return None, None, ({
+            "error": "Missing required parameters",
+            "message": f"JSON body with a '{key}' list of [lat, lon] pairs is required"
+        }, 400)
+
+    try:
+        coords = np.asarray(points, dtype=np.float64)
+    except (TypeError, ValueError):
+        coords = None
+    if coords is not None and coords.size == 0:
+        coords = coords.reshape(0, 2)
+    if coords is None or coords.ndim != 2 or coords.shape[1] != 2:
+        return None, None, ({
+            "error": "Invalid points",
+            "message": f"'{key}' must be a list of [lat, lon] number pairs"
+        }, 400)
+
+    if len(coords) > max_points:
+        return None, None, ({
+            "error": "Too many points",
+            "message": f"At most {max_points} points per request"
+        }, 413)
+
+    lats, lons = coords[:, 0], coords[:, 1]
+    bad = np.flatnonzero(~(np.abs(lats) <= 90))
+    if len(bad):
+        return None, None, ({
+            "error": "Invalid latitude",
+            "message": f"Latitude must be between -90 and 90 (point {int(bad[0])})"
+        }, 400)
+    bad = np.flatnonzero(~(np.abs(lons) <= 180))
+    if len(bad):
+        return None, None, ({
+            "error": "Invalid longitude",
+            "message": f"Longitude must be between -180 and 180 (point {int(bad[0])})"
+        }, 400)
+
+    return lats, lons, None
+
+def parse_batch_coordinates(key='points', max_points=None):
+    """
+    Read and validate a JSON body {key: [[lat, lon], ...]} as NumPy arrays.
+    Returns (lats, lons, None) or (None, None, error_response).
+    """
+    if max_points is None:
+        max_points = MAX_BATCH_POINTS
+    lats, lons, error = check_points(request.get_json(silent=True), key, max_points)
+    if error:
+        return None, None, (jsonify(error[0]), error[1])
+    return lats, lons, None
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    """Health check endpoint"""
-    db = get_db()
-    db_status = "connected" if db is not None else "disconnected"
+    """Health check endpoint; reports the last known MongoDB state and never waits on a connection"""
+    if LP_BACKEND == 'zones_db':
+        db_status = "connected" if get_zones_store() is not None else "disconnected"
+    else:
+        if MONGO_URI and MONGO_CONNECT == 'background':
+            start_connect()
+        db_status = "connected" if db is not None and mongo_breaker.allow() else "disconnected"
 
     # Include diagnostic info
     response = {
         "status": "healthy",
         "service": "Astr Backend API",
+        "backend": LP_BACKEND,
         "database": db_status,
-        "env_var_set": MONGO_URI is not None and len(MONGO_URI) > 0
+        "env_var_set": MONGO_URI is not None and len(MONGO_URI) > 0,
+        "cache": lp_cache.stats()
     }
+    if LP_BACKEND != 'zones_db':
+        response["database_state"] = mongo_state
+        response["circuit"] = mongo_breaker.stats()
+        response["local_fallback"] = ("zones_db" if os.path.exists(ZONES_DB_PATH)
+                                      else "zones_lite" if get_lite_zones() is not None else None)
 
     # If verbose mode requested, include more details
     if request.args.get('verbose') == 'true':
@@ -116,95 +594,754 @@ def get_light_pollution():
     Get light pollution data for given coordinates
     Query params: lat (latitude), lon (longitude)
     Returns: MPSAS value and Bortle class
+    Results are cached per res-8 H3 cell; If-None-Match with the cell's
+    ETag returns 304 without a lookup
     """
-    # Validate query parameters
-    lat = request.args.get('lat', type=float)
-    lon = request.args.get('lon', type=float)
+    with tracer.span('parse'):
+        lat, lon, error = parse_coordinates()
+    if error:
+        return error
 
-    if lat is None or lon is None:
-        return jsonify({
-            "error": "Missing required parameters",
-            "message": "Both 'lat' and 'lon' query parameters are required"
-        }), 400
+    with tracer.span('h3.latlng_to_cell'):
+        cell = h3_int.latlng_to_cell(lat, lon, H3_RESOLUTION)
+    version = dataset_version()
+    if version is not None:
+        etag = cell_etag(version, cell)
+        if etag in request.if_none_match:
+            return cacheable(make_response('', 304), etag)
+        with tracer.span('cache.get') as span:
+            entry = lp_cache.get((version, cell))
+            span.set('cache.hit', entry is not None)
+        if entry is not None:
+            return cacheable(json_response({"lat": lat, "lon": lon, **entry}), etag), 200
 
-    # Validate coordinate ranges
-    if not (-90 <= lat <= 90):
-        return jsonify({
-            "error": "Invalid latitude",
-            "message": "Latitude must be between -90 and 90"
-        }), 400
+    if LP_BACKEND == 'zones_db':
+        entry, fallback = light_pollution_from_zones(cell, lat, lon)
+    else:
+        entry, fallback = light_pollution_from_mongo(cell, lat, lon)
+    if entry is None:
+        return fallback
 
-    if not (-180 <= lon <= 180):
-        return jsonify({
-            "error": "Invalid longitude",
-            "message": "Longitude must be between -180 and 180"
-        }), 400
+    lp_cache.put((version, cell), entry)
+    return cacheable(json_response({"lat": lat, "lon": lon, **entry}), cell_etag(version, cell)), 200
+
+def json_response(body):
+    """JSON response (orjson when installed), traced as the encoding stage"""
+    with tracer.span('json.encode'):
+        return app.response_class(encode_json(body), mimetype='application/json')
+
+def cacheable(response, etag):
+    """Strong per-cell ETag plus shared (CDN) caching"""
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'public, max-age={LP_MAX_AGE}'
+    return response
 
-    # Get database connection
+# Fallback reasons for the Mongo backend: (error, message)
+MONGO_UNAVAILABLE = ("Database unavailable", "Unable to connect to MongoDB. Using fallback data.")
+MONGO_NO_DATA = ("No data found",
+                 "No light pollution data found within 50km of the given coordinates. Using fallback data.")
+# Fallback counter label per error
+FALLBACK_REASONS = {MONGO_UNAVAILABLE[0]: 'unavailable', MONGO_NO_DATA[0]: 'no_data', "Query failed": 'query_failed'}
+
+def fallback_body(lat, lon, error, message):
+    """Fallback payload (served with 200) when no real lookup is possible"""
+    FALLBACKS.inc(FALLBACK_REASONS.get(error, 'other'))
+    return {
+        "error": error,
+        "message": message,
+        "lat": lat,
+        "lon": lon,
+        "mpsas": 18.5,
+        "bortle_class": 6,
+        "fallback": True
+    }
+
+def light_pollution_from_mongo(cell, lat, lon):
+    """
+    Nearest MongoDB document to the cell centre (or the cell's own document in the
+    H3 layout), so every point in the cell gets the same answer.
+    Returns (entry, None) or (None, fallback response); fallbacks are not cached.
+    """
+    # Get database connection (None at once while the circuit is open)
     db = get_db()
     if db is None:
-        return jsonify({
+        return None, local_fallback(cell, lat, lon)
+
+    # Query MongoDB for nearest light pollution data, shared with concurrent requests
+    try:
+        entry = (h3_lookups if LP_BACKEND == 'mongo_h3' else nearest_lookups).get(int(cell), db)
+    except Exception as e:
+        print(f"Query error: {e}")
+        if is_connection_error(e):
+            mongo_failed(e)
+            return None, local_fallback(cell, lat, lon)
+        return None, (jsonify(fallback_body(lat, lon, "Query failed", str(e))), 200)
+
+    if entry is None:
+        # No data found, return fallback
+        return None, (jsonify(fallback_body(lat, lon, *MONGO_NO_DATA)), 200)
+    return entry, None
+
+def lookup_h3(cells, db):
+    """Entries for a coalesced batch of cells: find_one for a lone cell, else one $in"""
+    return [h3_entry(db, cells[0])] if len(cells) == 1 else h3_entries(db, cells)
+
+def lookup_nearest(cells, db):
+    """Entries for a coalesced batch of cells, one $near query each"""
+    return [mongo_entry(db, cell) for cell in cells]
+
+h3_lookups = MicroBatcher(lookup_h3, COALESCE_WINDOW_MS / 1000, COALESCE_MAX_BATCH,
+                          on_batch=lambda size: LOOKUP_BATCH_SIZE.observe(size, 'mongo_h3'))
+nearest_lookups = MicroBatcher(lookup_nearest, 0, COALESCE_MAX_BATCH,
+                               on_batch=lambda size: LOOKUP_BATCH_SIZE.observe(size, 'mongo'))
+# (backend, batcher) pairs behind astr_coalesced_lookups_total; api/asgi.py adds its own
+lookup_batchers = [('mongo_h3', h3_lookups), ('mongo', nearest_lookups)]
+
+def coalesced_lookups():
+    totals = {}
+    for backend, batcher in lookup_batchers:
+        totals[(backend,)] = totals.get((backend,), 0) + batcher.coalesced
+    return sorted(totals.items())
+
+def find_nearest(db, lat, lon):
+    """Nearest light_pollution document within 50km, or None"""
+    return db.light_pollution.find_one(near_query(lat, lon))
+
+def near_query(lat, lon):
+    """$near filter for the light_pollution collection (shared with the async app)"""
+    # Use geospatial query to find nearest point
+    # MongoDB 2dsphere index query
+    return {
+        "location": {
+            "$near": {
+                "$geometry": {
+                    "type": "Point",
+                    "coordinates": [lon, lat]  # GeoJSON uses [lon, lat] order
+                },
+                "$maxDistance": 50000  # 50km radius
+            }
+        }
+    }
+
+def mongo_entry(db, cell):
+    """Cache entry for one cell from the document nearest its centre, or None"""
+    with tracer.span('mongo.find_nearest', **{"db.system": "mongodb", "db.operation": "find_one"}), \
+            DB_LATENCY.time('mongo', 'find_nearest'):
+        document = find_nearest(db, *h3_int.cell_to_latlng(cell))
+    return entry_from_document(document)
+
+def entry_from_document(result):
+    """Cache entry for a light_pollution document, or None when there is none"""
+    if not result:
+        return None
+    mpsas = result.get('mpsas', 18.5)
+    return {"mpsas": round(mpsas, 2), "bortle_class": calculate_bortle_class(mpsas), "fallback": False}
+
+def h3_entry(db, cell):
+    """Cache entry for one cell from its _id document, else the nearest in its ring; None without either"""
+    collection = db[MONGO_H3_COLLECTION]
+    with tracer.span('mongo_h3.find_id', **{"db.system": "mongodb", "db.operation": "find_one"}), \
+            DB_LATENCY.time('mongo_h3', 'find_id'):
+        document = collection.find_one({"_id": int(cell)}, H3_PROJECTION)
+    if document is not None:
+        return entry_from_h3_document(document, int(cell))
+    return h3_missing_entries(collection, [int(cell)])[0]
+
+def h3_entries(db, cells):
+    """Entry (or None) per cell: one chunked $in for the cells, one more over the rings of the misses"""
+    collection = db[MONGO_H3_COLLECTION]
+    ids = [int(c) for c in cells]
+    with tracer.span('mongo_h3.find_ids', cells=len(ids), **{"db.system": "mongodb", "db.operation": "find"}), \
+            DB_LATENCY.time('mongo_h3', 'find_ids'):
+        found = find_h3_ids(collection, ids)
+    entries = [entry_from_h3_document(found[c], c) if c in found else None for c in ids]
+    missing = [i for i, c in enumerate(ids) if c not in found]
+    if missing:
+        for i, entry in zip(missing, h3_missing_entries(collection, [ids[i] for i in missing])):
+            entries[i] = entry
+    return entries
+
+def h3_missing_entries(collection, cells):
+    """Entries for cells without a document: implicit dark sky, or the nearest document in the ring"""
+    if MONGO_H3_MISSING == 'dark':
+        return [implicit_h3_entry(c) for c in cells]
+    rings, ids = h3_rings(cells)
+    with tracer.span('mongo_h3.find_ring', cells=len(ids), **{"db.system": "mongodb", "db.operation": "find"}), \
+            DB_LATENCY.time('mongo_h3', 'find_ring'):
+        found = find_h3_ids(collection, ids)
+    return [nearest_in_ring(c, rings[c], found) for c in cells]
+
+# Only the fields an entry needs
+H3_PROJECTION = {"mpsas": 1, "bortle": 1}
+
+def find_h3_ids(collection, ids):
+    """{_id: document} for the ids that have one, in $in queries of MONGO_H3_IN_CHUNK ids"""
+    found = {}
+    for start in range(0, len(ids), MONGO_H3_IN_CHUNK):
+        for document in collection.find({"_id": {"$in": ids[start:start + MONGO_H3_IN_CHUNK]}}, H3_PROJECTION):
+            found[document["_id"]] = document
+    return found
+
+def h3_rings(cells):
+    """grid_disk of MONGO_H3_RING per cell, and the distinct neighbour ids to query"""
+    rings = {c: h3_int.grid_disk(c, MONGO_H3_RING).tolist() for c in cells}
+    ids = sorted({n for ring in rings.values() for n in ring} - set(cells))
+    return rings, ids
+
+def nearest_in_ring(cell, ring, found):
+    """Entry from the closest cell of the ring that has a document (lowest id on ties), or None"""
+    candidates = [n for n in ring if n in found]
+    if not candidates:
+        return None
+    distance, nearest = min((h3_int.grid_distance(cell, n), n) for n in candidates)
+    return {**entry_from_h3_document(found[nearest], cell), "ring": distance}
+
+def entry_from_h3_document(document, cell):
+    """Cache entry for an H3-layout document; bortle is stored, as the zone is in zones.db"""
+    return {"mpsas": round(document["mpsas"], 2), "bortle_class": int(document["bortle"]),
+            "h3": format(cell, 'x'), "implicit": False, "fallback": False}
+
+def implicit_h3_entry(cell):
+    return {"mpsas": IMPLICIT_SQM, "bortle_class": IMPLICIT_ZONE, "h3": format(cell, 'x'),
+            "implicit": True, "fallback": False}
+
+def local_fallback(cell, lat, lon):
+    """Response while MongoDB is unavailable: local data when deployed, else the constant fallback"""
+    local = local_entries(np.array([cell], dtype=np.uint64))
+    if local is not None:
+        FALLBACKS.inc('local')
+        return jsonify({"lat": lat, "lon": lon, **local[0]}), 200
+    return jsonify(fallback_body(lat, lon, *MONGO_UNAVAILABLE)), 200
+
+def local_entries(cells):
+    """
+    Entries from data deployed alongside the API while MongoDB is unavailable:
+    zones.db when present, else the approximate zones_lite.db; None without either.
+    """
+    if os.path.exists(ZONES_DB_PATH):
+        store = get_zones_store()
+        if store is not None:
+            return [{**e, "source": "zones_db"} for e in zones_entries(store, cells)]
+    return lite_entries(cells)
+
+def lite_entries(cells):
+    """
+    Approximate entries (median zone of the coarse parent) from zones_lite.db,
+    or None when it is not deployed. Never cached, so real data replaces them.
+    """
+    lite = get_lite_zones()
+    if lite is None:
+        return None
+    with tracer.span('zones_lite.lookup', cells=len(cells)), DB_LATENCY.time('zones_lite', 'lookup'):
+        zone, sqm = lite.lookup_cells(cells)
+    return [{"mpsas": m, "bortle_class": z, "fallback": False, "approximate": True}
+            for m, z in zip(np.round(sqm.astype(np.float64), 2).tolist(), zone.tolist())]
+
+def light_pollution_from_zones(cell, lat, lon):
+    """Light pollution lookup against the memory-mapped zones.db"""
+    store = get_zones_store()
+    if store is None:
+        FALLBACKS.inc('unavailable')
+        return None, (jsonify({
             "error": "Database unavailable",
-            "message": "Unable to connect to MongoDB. Using fallback data.",
+            "message": "zones.db is not deployed on this server. Using fallback data.",
             "lat": lat,
             "lon": lon,
             "mpsas": 18.5,
             "bortle_class": 6,
             "fallback": True
-        }), 200
+        }), 200)
+    return zones_entries(store, np.array([cell], dtype=np.uint64))[0], None
 
-    # Query MongoDB for nearest light pollution data
-    try:
-        collection = db.light_pollution
-
-        # Use geospatial query to find nearest point
-        # MongoDB 2dsphere index query
-        result = collection.find_one({
-            "location": {
-                "$near": {
-                    "$geometry": {
-                        "type": "Point",
-                        "coordinates": [lon, lat]  # GeoJSON uses [lon, lat] order
-                    },
-                    "$maxDistance": 50000  # 50km radius
-                }
-            }
-        })
+def zones_entries(store, cells):
+    """Cache entries for an array of res-8 cells from one vectorized search of zones.db"""
+    with tracer.span('zones_db.lookup', cells=len(cells)), DB_LATENCY.time('zones_db', 'lookup'):
+        found = store.lookup_cells(cells)
+    sqm = np.round(found["sqm"].astype(np.float64), 2).tolist()
+    entries = [{"mpsas": m, "bortle_class": z, "h3": format(c, 'x'), "implicit": imp, "fallback": False}
+               for m, z, c, imp in zip(sqm, found["zone"].tolist(), found["h3"].tolist(),
+                                       found["implicit"].tolist())]
+    if "dark_distance" in found:
+        for e, d, b in zip(entries, found["dark_distance"], found["dark_bearing"]):
+            e["nearest_dark"] = store.nearest_dark(d, b, e["bortle_class"])
+    return entries
+
+def cached_entries(cells, resolve):
+    """
+    Entry per distinct cell, from lp_cache where possible.
+    resolve(missing cells) returns entries for the misses (None = not cacheable).
+    Returns (entries, inverse) with entries[inverse[i]] belonging to cells[i].
+    """
+    unique, inverse = np.unique(cells, return_inverse=True)
+    version = dataset_version()
+    keys = [(version, c) for c in unique.tolist()]
+    with tracer.span('cache.get', cells=len(keys)) as span:
+        entries = [lp_cache.get(k) for k in keys]
+        missing = [i for i, e in enumerate(entries) if e is None]
+        span.set('cache.misses', len(missing))
+    if missing:
+        for i, entry in zip(missing, resolve(unique[missing])):
+            entries[i] = entry
+            if entry is not None:
+                lp_cache.put(keys[i], entry)
+    return entries, inverse.ravel()
 
-        if result:
-            mpsas = result.get('mpsas', 18.5)
-            bortle = calculate_bortle_class(mpsas)
+@app.route('/api/light-pollution/batch', methods=['POST'])
+def get_light_pollution_batch():
+    """
+    Light pollution for many coordinates in one request
+    Body: {"points": [[lat, lon], ...]} (up to MAX_BATCH_POINTS)
+    Returns: results in input order, each with its own fallback flag, as JSON,
+    or as MessagePack / Arrow columns (?format= or Accept, see api/encoding.py)
+    """
+    fmt, error = batch_format(request.args.get('format'), request.headers.get('Accept'))
+    if error:
+        return jsonify(error[0]), error[1]
+    with tracer.span('parse'):
+        lats, lons, error = parse_batch_coordinates()
+    if error:
+        return error
 
+    if LP_BACKEND == 'zones_db':
+        result = batch_from_zones(lats, lons)
+    else:
+        result = batch_from_mongo(lats, lons)
+
+    with tracer.span(f'{fmt}.encode', points=len(result)):
+        body, mimetype = encode_batch(result, fmt, LP_BACKEND)
+    response = app.response_class(body, mimetype=mimetype)
+    response.headers['Vary'] = 'Accept'
+    return response, 200
+
+def batch_format(requested, accept):
+    """Negotiated batch format, or (None, (error body, status))"""
+    if requested is not None and requested not in MEDIA_TYPES:
+        return None, ({
+            "error": "Invalid format",
+            "message": f"format must be one of {', '.join(MEDIA_TYPES)}"
+        }, 400)
+    fmt = negotiate(accept, requested)
+    if fmt is None:
+        return None, ({
+            "error": "Not acceptable",
+            "message": f"Available formats: {', '.join(available_formats())}"
+        }, 406)
+    return fmt, None
+
+def batch_cells(lats, lons):
+    with tracer.span('h3.latlng_to_cells', points=len(lats)):
+        return latlng_to_cells(lats, lons)
+
+# Batch entry of points without data
+BATCH_FALLBACK = {"mpsas": 18.5, "bortle_class": 6, "fallback": True}
+
+def batch_fallback(lats, lons):
+    FALLBACKS.inc('unavailable', amount=len(lats))
+    return BatchResult(lats, lons, [BATCH_FALLBACK], np.zeros(len(lats), dtype=np.intp))
+
+def batch_local(lats, lons):
+    """Batch answer while MongoDB is unavailable: local data if deployed, else fallback"""
+    cells = batch_cells(lats, lons)
+    entries = local_entries(cells)
+    if entries is None:
+        return batch_fallback(lats, lons)
+    FALLBACKS.inc('local', amount=len(entries))
+    return BatchResult(lats, lons, entries, np.arange(len(entries)))
+
+def batch_from_zones(lats, lons):
+    """Bulk H3 conversion, then one vectorized search of zones.db for the uncached cells"""
+    store = get_zones_store()
+    if store is None:
+        return batch_fallback(lats, lons)
+
+    entries, inverse = cached_entries(batch_cells(lats, lons), lambda cells: zones_entries(store, cells))
+    return BatchResult(lats, lons, entries, inverse)
+
+def batch_from_mongo(lats, lons):
+    """
+    $near per distinct uncached cell (point documents carry no H3 key to $in on),
+    or one $in over all of them in the H3 layout.
+    Failed or empty lookups fall back per point.
+    """
+    db = get_db()
+    if db is None:
+        return batch_local(lats, lons)
+
+    def resolve_h3(cells):
+        try:
+            resolved = h3_entries(db, cells)
+        except Exception as e:
+            print(f"Query error: {e}")
+            if is_connection_error(e):
+                mongo_failed(e)
+            FALLBACKS.inc('query_failed', amount=len(cells))
+            return [None] * len(cells)
+        FALLBACKS.inc('no_data', amount=sum(e is None for e in resolved))
+        return resolved
+
+    def resolve(cells):
+        resolved = []
+        for cell in cells.tolist():
+            if not mongo_breaker.allow():
+                resolved.append(None)
+                continue
+            try:
+                entry = mongo_entry(db, cell)
+            except Exception as e:
+                print(f"Query error: {e}")
+                if is_connection_error(e):
+                    mongo_failed(e)
+                FALLBACKS.inc('query_failed')
+                resolved.append(None)
+                continue
+            if entry is None:
+                FALLBACKS.inc('no_data')
+            resolved.append(entry)
+        return resolved
+
+    cells = batch_cells(lats, lons)
+    entries, inverse = cached_entries(cells, resolve_h3 if LP_BACKEND == 'mongo_h3' else resolve)
+    missing = [i for i, e in enumerate(entries) if e is None]
+    if missing and not mongo_breaker.allow():
+        # MongoDB went away during the batch: the rest comes from local data
+        local = local_entries(np.unique(cells)[missing])
+        if local is not None:
+            FALLBACKS.inc('local', amount=len(local))
+            for i, entry in zip(missing, local):
+                entries[i] = entry
+    return BatchResult(lats, lons, [e or BATCH_FALLBACK for e in entries], inverse)
+
+@app.route('/api/route-profile', methods=['POST'])
+def get_route_profile():
+    """
+    Darkness profile along a polyline
+    Body: {"path": [[lat, lon], ...]} (at least two vertices)
+    Returns: run-length segments of equal Bortle class with distances along the route
+    """
+    lats, lons, error = parse_batch_coordinates('path', MAX_ROUTE_VERTICES)
+    if error:
+        return error
+    if len(lats) < 2:
+        return jsonify({
+            "error": "Invalid path",
+            "message": "A route needs at least two [lat, lon] vertices"
+        }), 400
+
+    store = get_zones_store()
+    if store is None:
+        return jsonify({
+            "error": "Route profiles unavailable",
+            "message": "zones.db is not deployed on this server"
+        }), 503
+
+    length_km = float(haversine_km(lats[:-1], lons[:-1], lats[1:], lons[1:]).sum())
+    if length_km > MAX_ROUTE_KM:
+        return jsonify({
+            "error": "Route too long",
+            "message": f"Routes are limited to {MAX_ROUTE_KM} km (got {length_km:.0f} km)"
+        }), 413
+
+    return jsonify(route_profile(store, lats, lons)), 200
+
+@app.route('/api/dark-sites', methods=['GET'])
+def get_dark_sites():
+    """
+    Nearest dark-sky sites around given coordinates
+    Query params: lat, lon, max_bortle (default 3), radius_km (default 150), k (default 5)
+    Returns: up to k sites at or below max_bortle, nearest first, one per coarse area
+    """
+    lat, lon, error = parse_coordinates()
+    if error:
+        return error
+
+    max_bortle = request.args.get('max_bortle', 3, type=int)
+    radius_km = request.args.get('radius_km', 150.0, type=float)
+    k = request.args.get('k', 5, type=int)
+    if not 1 <= max_bortle <= 9:
+        return jsonify({
+            "error": "Invalid max_bortle",
+            "message": "max_bortle must be between 1 and 9"
+        }), 400
+    if not 0 < radius_km <= MAX_DARK_RADIUS_KM:
+        return jsonify({
+            "error": "Invalid radius_km",
+            "message": f"radius_km must be between 0 and {MAX_DARK_RADIUS_KM}"
+        }), 400
+    if not 1 <= k <= MAX_DARK_SITES:
+        return jsonify({
+            "error": "Invalid k",
+            "message": f"k must be between 1 and {MAX_DARK_SITES}"
+        }), 400
+
+    store = get_zones_store()
+    index = get_dark_index()
+    if store is None or index is None:
+        return jsonify({
+            "error": "Dark-site search unavailable",
+            "message": "zones.db and dark_index.db must both be deployed on this server"
+        }), 503
+
+    result = nearest_dark_sites(store, index, lat, lon, max_bortle, radius_km, k)
+    return jsonify({
+        "lat": lat,
+        "lon": lon,
+        "max_bortle": max_bortle,
+        "radius_km": radius_km,
+        **result
+    }), 200
+
+@app.route('/api/city-darkness', methods=['GET'])
+def get_city_darkness():
+    """
+    Precomputed sky quality of a city and the darkest skies within a drive of it
+    Query params: city (id, its position in cities.json), or lat and lon for the nearest city
+    Returns: the city's zone and SQM, its nearest site at or below max_bortle and the
+    zone shares, mean SQM and darkest zone within radius_km
+    """
+    cities = get_city_index()
+    if cities is None:
+        return jsonify({
+            "error": "City index unavailable",
+            "message": "city_index.db is not deployed on this server"
+        }), 503
+
+    if 'city' in request.args:
+        city_id = request.args.get('city', type=int)
+        if city_id is None or not 0 <= city_id < len(cities):
             return jsonify({
-                "lat": lat,
-                "lon": lon,
-                "mpsas": round(mpsas, 2),
-                "bortle_class": bortle,
-                "fallback": False
-            }), 200
-        else:
-            # No data found, return fallback
-            return jsonify({
-                "error": "No data found",
-                "message": "No light pollution data found within 50km of the given coordinates. Using fallback data.",
-                "lat": lat,
-                "lon": lon,
-                "mpsas": 18.5,
-                "bortle_class": 6,
-                "fallback": True
-            }), 200
+                "error": "Invalid city",
+                "message": f"city must be an id between 0 and {len(cities) - 1}"
+            }), 400
+        return jsonify(cities.city(city_id)), 200
 
-    except Exception as e:
-        print(f"Query error: {e}")
+    lat, lon, error = parse_coordinates()
+    if error:
+        return error
+    city_id, distance_km = cities.nearest(lat, lon)
+    return jsonify({**cities.city(city_id), "distance_km": round(distance_km, 2)}), 200
+
+@app.route('/api/city-ranking', methods=['GET'])
+def get_city_ranking():
+    """
+    Cities ranked by precomputed sky quality
+    Query params: order (darkest, brightest, nearest_dark or dark_share; default darkest),
+    limit (default 20), offset (default 0), top (only the top most populous cities)
+    """
+    order = request.args.get('order', 'darkest')
+    limit = request.args.get('limit', 20, type=int)
+    offset = request.args.get('offset', 0, type=int)
+    top = request.args.get('top', type=int)
+    if order not in CITY_RANKINGS:
         return jsonify({
-            "error": "Query failed",
-            "message": str(e),
-            "lat": lat,
-            "lon": lon,
-            "mpsas": 18.5,
-            "bortle_class": 6,
-            "fallback": True
-        }), 200
+            "error": "Invalid order",
+            "message": f"order must be one of {', '.join(CITY_RANKINGS)}"
+        }), 400
+    if not 1 <= limit <= MAX_CITY_RANKING or offset < 0 or (top is not None and top < 1):
+        return jsonify({
+            "error": "Invalid page",
+            "message": f"limit must be between 1 and {MAX_CITY_RANKING}; offset and top must be positive"
+        }), 400
+
+    cities = get_city_index()
+    if cities is None:
+        return jsonify({
+            "error": "City index unavailable",
+            "message": "city_index.db is not deployed on this server"
+        }), 503
+
+    ranked, total = cities.ranking(order, limit, offset, top)
+    return jsonify({"order": order, "total": total, "offset": offset, "cities": ranked}), 200
+
+@app.route('/api/area-stats', methods=['POST'])
+def get_area_stats():
+    """
+    Bortle zone statistics over an area
+    Body: {"bbox": [west, south, east, north]} or {"geometry": GeoJSON Polygon/MultiPolygon/Feature}
+    Returns: area per zone, area-weighted mean SQM and the brightest and darkest cells.
+    Large areas are filled at a coarser H3 resolution ("approximate": true).
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or ('bbox' in body) == ('geometry' in body):
+        return jsonify({
+            "error": "Missing required parameters",
+            "message": "JSON body with either 'bbox' [west, south, east, north] or a GeoJSON 'geometry' is required"
+        }), 400
+    try:
+        with tracer.span('parse'):
+            shape = shape_from_bbox(body['bbox']) if 'bbox' in body else shape_from_geojson(body['geometry'])
+    except ValueError as e:
+        return jsonify({"error": "Invalid area", "message": str(e)}), 400
+
+    vertices = sum(len(p.outer) + sum(len(h) for h in p.holes) for p in getattr(shape, 'polys', [shape]))
+    if vertices > MAX_AREA_VERTICES:
+        return jsonify({
+            "error": "Too many vertices",
+            "message": f"At most {MAX_AREA_VERTICES} polygon vertices per request"
+        }), 413
+    bounds_km2 = bounds_area_km2(shape)
+    if bounds_km2 > MAX_AREA_KM2:
+        return jsonify({
+            "error": "Area too large",
+            "message": f"Areas are limited to {MAX_AREA_KM2:.0f} km² (bounding box {bounds_km2:.0f} km²)"
+        }), 413
+
+    store = get_zones_store()
+    if store is None:
+        return jsonify({
+            "error": "Area statistics unavailable",
+            "message": "zones.db is not deployed on this server"
+        }), 503
+
+    pyramid = get_area_pyramid(store)
+    resolution = estimate_resolution(bounds_km2, MAX_AREA_CELLS)
+    with tracer.span('h3.polyfill', resolution=resolution):
+        cells = polyfill(shape, resolution)
+    with tracer.span('zones_db.aggregate', cells=len(cells)):
+        result = area_stats(store, pyramid, cells)
+    return jsonify({"resolution": resolution, "approximate": resolution < H3_RESOLUTION, **result}), 200
+
+@app.route('/api/viewport', methods=['GET'])
+def get_viewport():
+    """
+    Stored cells (or their coarse parents) in a map viewport, streamed in H3 order
+    Query params: bbox=west,south,east,north, zoom (0-22),
+                  format=binary (default, see api/viewport.py) or ndjson
+    The H3 resolution used is returned in X-H3-Resolution.
+    """
+    try:
+        west, south, east, north = (float(v) for v in request.args.get('bbox', '').split(','))
+    except ValueError:
+        return jsonify({
+            "error": "Invalid bbox",
+            "message": "bbox must be west,south,east,north in degrees"
+        }), 400
+    if not (-90 <= south < north <= 90 and abs(west) <= 180 and abs(east) <= 180) or west == east:
+        return jsonify({
+            "error": "Invalid bbox",
+            "message": "bbox needs -180 <= west, east <= 180 and -90 <= south < north <= 90"
+        }), 400
+    zoom = request.args.get('zoom', type=int)
+    if zoom is None or not 0 <= zoom <= MAX_VIEWPORT_ZOOM:
+        return jsonify({
+            "error": "Invalid zoom",
+            "message": f"zoom must be an integer between 0 and {MAX_VIEWPORT_ZOOM}"
+        }), 400
+    fmt = request.args.get('format', 'binary')
+    if fmt not in ('binary', 'ndjson'):
+        return jsonify({
+            "error": "Invalid format",
+            "message": "format must be binary or ndjson"
+        }), 400
+
+    store = get_zones_store()
+    if store is None:
+        return jsonify({
+            "error": "Viewport cells unavailable",
+            "message": "zones.db is not deployed on this server"
+        }), 503
+
+    resolution = zoom_resolution(zoom)
+    shape = viewport_shape(west, south, east, north)
+    resolution = min(resolution, estimate_resolution(bounds_area_km2(shape), MAX_VIEWPORT_CELLS))
+    # Pad by one cell edge so cells cut by the viewport edge are included
+    shape = viewport_shape(west, south, east, north, h3_int.average_hexagon_edge_length(resolution, 'km'))
+    with tracer.span('h3.polyfill', resolution=resolution):
+        cells = covering(shape, resolution)
+    chunks = stream_cells(store, get_area_pyramid(store), cells, resolution)
+    if fmt == 'ndjson':
+        response = app.response_class(encode_ndjson(chunks), mimetype='application/x-ndjson')
+    else:
+        response = app.response_class(encode_binary(chunks, resolution), mimetype='application/octet-stream')
+    response.headers['X-H3-Resolution'] = str(resolution)
+    response.headers['Cache-Control'] = f'public, max-age={LP_MAX_AGE}'
+    return response
+
+@app.route('/tiles/<int:z>/<int:x>/<int:y>.png', methods=['GET'])
+def get_tile(z, x, y):
+    """
+    XYZ map tile (256 px Web Mercator PNG) of Bortle zones
+    Supports If-None-Match revalidation via the tile's ETag
+    """
+    if not 0 <= z <= MAX_TILE_ZOOM or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        return jsonify({
+            "error": "Invalid tile",
+            "message": f"Tiles exist for zoom 0-{MAX_TILE_ZOOM} with 0 <= x, y < 2^zoom"
+        }), 404
+
+    renderer = get_tile_renderer()
+    if renderer is None:
+        return jsonify({
+            "error": "Tiles unavailable",
+            "message": "zones.db is not deployed on this server"
+        }), 503
+
+    data = renderer.tile(z, x, y)
+    response = make_response(data)
+    response.headers['Content-Type'] = 'image/png'
+    response.headers['Cache-Control'] = 'public, max-age=86400'
+    response.set_etag(tile_etag(data))
+    return response.make_conditional(request)
+
+@app.route('/api/horizon-profile', methods=['GET'])
+def get_horizon_profile():
+    """
+    Get the directional light-dome profile for given coordinates
+    Query params: lat (latitude), lon (longitude)
+    Returns: scattered radiance per azimuth sector, clockwise from north
+    """
+    lat, lon, error = parse_coordinates()
+    if error:
+        return error
+
+    profiles = get_horizon_profiles()
+    if profiles is None:
+        return jsonify({
+            "error": "Horizon profiles unavailable",
+            "message": "horizon.db is not deployed on this server"
+        }), 503
+
+    cell, profile = profiles.lookup(lat, lon)
+    implicit = profile is None
+    if implicit:
+        profile = np.zeros(profiles.bins)
+
+    step = 360.0 / profiles.bins
+    return jsonify({
+        "lat": lat,
+        "lon": lon,
+        "h3": cell,
+        "azimuth_step_deg": step,
+        "profile": [round(float(v), 4) for v in profile],
+        "peak_azimuth_deg": None if implicit else float(np.argmax(profile)) * step,
+        "total": round(float(profile.sum()), 4),
+        "implicit": implicit
+    }), 200
+
+def tile_cache_bytes():
+    renderer = tile_renderer
+    if renderer is None or renderer.cache is None:
+        return []
+    return [((), renderer.cache.size)]
+
+metrics.gauge('astr_lp_cache_entries', 'Cached light pollution cells',
+              fn=lambda: [((), lp_cache.stats()['size'])])
+metrics.gauge('astr_lp_cache_lookups_total', 'Light pollution cache lookups by result', ('result',),
+              fn=lambda: [(('hit',), lp_cache.hits), (('miss',), lp_cache.misses)], kind='counter')
+metrics.gauge('astr_lp_cache_removals_total', 'Light pollution cache entries removed by reason', ('reason',),
+              fn=lambda: [(('evicted',), lp_cache.evictions), (('expired',), lp_cache.expirations)],
+              kind='counter')
+metrics.gauge('astr_tile_cache_bytes', 'Disk tile cache size', fn=tile_cache_bytes)
+metrics.gauge('astr_coalesced_lookups_total', 'Lookups answered by a query already in flight, by backend',
+              ('backend',), fn=coalesced_lookups, kind='counter')
+metrics.gauge('astr_mongo_circuit_open', 'MongoDB circuit breaker open (1) or closed (0)',
+              fn=lambda: [((), int(not mongo_breaker.allow()))])
+metrics.gauge('astr_mongo_circuit_trips_total', 'Times the MongoDB circuit has opened',
+              fn=lambda: [((), mongo_breaker.trips)], kind='counter')
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus scrape endpoint"""
+    return app.response_class(metrics.render(), content_type=METRICS_CONTENT_TYPE)
 
 @app.route('/', methods=['GET'])
 def root():
@@ -214,7 +1351,17 @@ def root():
         "version": "1.0.0",
         "endpoints": {
             "/api/health": "Health check",
-            "/api/light-pollution": "Get light pollution data (requires lat and lon query params)"
+            "/api/light-pollution": "Get light pollution data (requires lat and lon query params)",
+            "/api/light-pollution/batch": "POST {\"points\": [[lat, lon], ...]} for many coordinates at once (JSON, MessagePack or Arrow)",
+            "/api/route-profile": "POST {\"path\": [[lat, lon], ...]} for the darkness profile along a route",
+            "/api/dark-sites": "Nearest sites at or below max_bortle (requires lat and lon query params)",
+            "/api/city-darkness": "Precomputed sky quality near a city (requires city, or lat and lon query params)",
+            "/api/city-ranking": "Cities ranked by sky quality (order, limit, offset and top query params)",
+            "/api/area-stats": "POST {\"bbox\": [west, south, east, north]} or {\"geometry\": GeoJSON} for zone statistics over an area",
+            "/api/viewport": "Stored cells in a map viewport, streamed (requires bbox and zoom query params)",
+            "/tiles/{z}/{x}/{y}.png": "Bortle zone map tiles (XYZ, zoom 0-14)",
+            "/api/horizon-profile": "Get per-azimuth light-dome profile (requires lat and lon query params)",
+            "/metrics": "Prometheus metrics"
         }
     }), 200
 
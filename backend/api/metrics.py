@@ -0,0 +1,218 @@
+"""
+Minimal Prometheus metrics for the API (text exposition format 0.0.4).
+
+Counters and histograms keep one series per label tuple in a dict under a
+lock, so recording a request is a dict update and a bisect (~1-2 µs). The
+labels are route templates, status codes, backends and fallback reasons,
+never coordinates. A metric that still reaches MAX_SERIES folds further
+label sets into a single "other" series.
+
+Values are per process. Under gunicorn each worker reports its own counts
+and the scraper sees whichever worker answers, so deploy one worker per
+scrape target (or sum by instance) when exact totals matter.
+"""
+import bisect
+import threading
+import time
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+MAX_SERIES = 500
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def _key(self, labels):
+        if labels in self.series or len(self.series) < MAX_SERIES:
+            return labels
+        return ('other',) * len(self.labelnames)
+
+    def header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+    def clear(self):
+        with self.lock:
+            self.series.clear()
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            key = self._key(labels)
+            self.series[key] = self.series.get(key, 0) + amount
+
+    def value(self, *labels):
+        return self.series.get(labels, 0)
+
+    def render(self):
+        with self.lock:
+            items = sorted(self.series.items())
+        return self.header() + [f'{self.name}{_labels(self.labelnames, k)} {_number(v)}' for k, v in items]
+
+
+class Gauge(Metric):
+    """
+    Gauge set directly, or read from a callback at scrape time:
+    fn() -> [(label values tuple, value)]. A callback may also report a
+    counter kept elsewhere (kind='counter').
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), fn=None, kind='gauge'):
+        super().__init__(name, documentation, labelnames)
+        self.fn = fn
+        self.kind = kind
+
+    def set(self, *labels, value):
+        with self.lock:
+            self.series[self._key(labels)] = value
+
+    def add(self, *labels, amount=1):
+        with self.lock:
+            key = self._key(labels)
+            self.series[key] = self.series.get(key, 0) + amount
+
+    def render(self):
+        if self.fn is not None:
+            items = list(self.fn())
+        else:
+            with self.lock:
+                items = sorted(self.series.items())
+        return self.header() + [f'{self.name}{_labels(self.labelnames, k)} {_number(v)}'
+                                for k, v in items if v is not None]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            key = self._key(labels)
+            series = self.series.get(key)
+            if series is None:
+                # Per-bucket (non-cumulative) counts, then sum and count
+                series = self.series[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def time(self, *labels):
+        return Timer(self, labels)
+
+    def count(self, *labels):
+        series = self.series.get(labels)
+        return series[-1] if series else 0
+
+    def render(self):
+        with self.lock:
+            items = sorted((k, list(v)) for k, v in self.series.items())
+        lines = self.header()
+        for key, series in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), series):
+                cumulative += n
+                le = 'le="%s"' % _number(bound)
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, key)} {_number(series[-2])}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, key)} {series[-1]}')
+        return lines
+
+
+class Timer:
+    """with histogram.time(*labels): ... observes the block's wall time"""
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+        return False
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), fn=None, kind='gauge'):
+        return self.register(Gauge(name, documentation, labelnames, fn, kind))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        for metric in self.metrics:
+            metric.clear()
+
+
+def pool_listener(open_connections, checked_out, checkout_failures):
+    """
+    pymongo ConnectionPoolListener feeding the pool gauges and counter.
+    Imports pymongo, so it is only built when a client is created.
+    """
+    from pymongo import monitoring
+
+    class PoolListener(monitoring.ConnectionPoolListener):
+        def pool_created(self, event): pass
+        def pool_ready(self, event): pass
+        def pool_cleared(self, event): pass
+        def pool_closed(self, event): pass
+        def connection_created(self, event): open_connections.add(amount=1)
+        def connection_ready(self, event): pass
+        def connection_closed(self, event): open_connections.add(amount=-1)
+        def connection_check_out_started(self, event): pass
+        def connection_check_out_failed(self, event): checkout_failures.inc(str(event.reason))
+        def connection_checked_out(self, event): checked_out.add(amount=1)
+        def connection_checked_in(self, event): checked_out.add(amount=-1)
+
+    return PoolListener()
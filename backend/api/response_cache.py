@@ -0,0 +1,86 @@
+"""
+In-process cache of per-cell light pollution results.
+
+Both /api/light-pollution and the batch endpoint resolve a point to its
+res-8 H3 cell and share one CellCache, so every point in a cell is served
+from the first lookup. Keys carry the dataset version, so a redeploy with
+new data never serves old entries.
+
+The same version and cell make a strong ETag. A client or CDN that sends
+If-None-Match gets a 304 before any lookup runs.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class CellCache:
+    """Thread-safe LRU with a per-entry TTL, counting hits, misses and evictions"""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def get(self, key):
+        """Cached value, or None on a miss or an expired entry"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires > time.monotonic():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "maxsize": self.maxsize,
+                "ttl_s": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+def file_stamp(*paths):
+    """Short version tag from the path, size and mtime of each existing file"""
+    stamp = hashlib.sha1()
+    for path in paths:
+        if path and os.path.exists(path):
+            st = os.stat(path)
+            stamp.update(f"{path}:{st.st_size}:{st.st_mtime_ns};".encode())
+    return stamp.hexdigest()[:12]
+
+
+def cell_etag(version, cell):
+    """Strong ETag value (unquoted) for one cell of one dataset version"""
+    return hashlib.sha1(f"{version}:{cell:x}".encode()).hexdigest()[:20]
@@ -0,0 +1,140 @@
+"""
+Darkness profile along a polyline (road trip, hiking route).
+
+The path is split into great-circle steps of at most MAX_STEP_KM, each step
+is densified into res-8 cells with H3's grid-path algorithm, repeated cells
+are dropped and all cells are resolved with one ZonesStore.lookup_cells call.
+Consecutive cells in the same zone are run-length compressed into segments.
+"""
+import h3
+import numpy as np
+from h3.api import numpy_int as h3_int
+
+H3_RESOLUTION = 8
+EARTH_RADIUS_KM = 6371.0088
+
+# grid_path_cells works in a local IJ frame and fails across icosahedron
+# faces on long hops; short steps keep it reliable and cheap.
+MAX_STEP_KM = 25.0
+# Sampling interval when grid_path_cells still cannot connect two cells
+FALLBACK_SAMPLE_KM = 0.2
+
+
+def _unit_vectors(lats, lons):
+    phi, lam = np.radians(lats), np.radians(lons)
+    return np.stack([np.cos(phi) * np.cos(lam), np.cos(phi) * np.sin(lam), np.sin(phi)], axis=-1)
+
+
+def _to_latlng(v):
+    v = v / np.linalg.norm(v, axis=-1, keepdims=True)
+    return np.degrees(np.arcsin(np.clip(v[..., 2], -1, 1))), np.degrees(np.arctan2(v[..., 1], v[..., 0]))
+
+
+def haversine_km(lats1, lons1, lats2, lons2):
+    phi1, phi2 = np.radians(lats1), np.radians(lats2)
+    a = (np.sin((phi2 - phi1) / 2) ** 2 +
+         np.cos(phi1) * np.cos(phi2) * np.sin(np.radians(lons2 - lons1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def great_circle_points(lat1, lon1, lat2, lon2, n):
+    """n + 1 points from (lat1, lon1) to (lat2, lon2) along the great circle"""
+    a, b = _unit_vectors(np.array([lat1, lat2]), np.array([lon1, lon2]))
+    omega = np.arccos(np.clip(np.dot(a, b), -1.0, 1.0))
+    t = np.linspace(0.0, 1.0, n + 1)[:, None]
+    if omega < 1e-12:
+        v = a + t * (b - a)
+    else:
+        v = (np.sin((1 - t) * omega) * a + np.sin(t * omega) * b) / np.sin(omega)
+    return _to_latlng(v)
+
+
+def _cells_between(c1, c2, lat1, lon1, lat2, lon2):
+    try:
+        return h3_int.grid_path_cells(c1, c2)
+    except h3.H3BaseException:
+        n = max(1, int(np.ceil(haversine_km(lat1, lon1, lat2, lon2) / FALLBACK_SAMPLE_KM)))
+        lats, lons = great_circle_points(lat1, lon1, lat2, lon2, n)
+        return np.array([h3_int.latlng_to_cell(a, b, H3_RESOLUTION) for a, b in zip(lats, lons)],
+                        dtype=np.uint64)
+
+
+def densify_path(lats, lons):
+    """
+    Ordered res-8 cells covering the polyline, with consecutive repeats removed.
+    Returns (cells uint64 array, path length in km).
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    parts = []
+    length_km = 0.0
+    for i in range(len(lats) - 1):
+        d = float(haversine_km(lats[i], lons[i], lats[i + 1], lons[i + 1]))
+        length_km += d
+        steps = max(1, int(np.ceil(d / MAX_STEP_KM)))
+        plats, plons = great_circle_points(lats[i], lons[i], lats[i + 1], lons[i + 1], steps)
+        cells = [h3_int.latlng_to_cell(a, b, H3_RESOLUTION) for a, b in zip(plats, plons)]
+        for j in range(steps):
+            parts.append(_cells_between(cells[j], cells[j + 1],
+                                        plats[j], plons[j], plats[j + 1], plons[j + 1]))
+    if not parts:
+        if len(lats):
+            return np.array([h3_int.latlng_to_cell(lats[0], lons[0], H3_RESOLUTION)], dtype=np.uint64), 0.0
+        return np.zeros(0, dtype=np.uint64), 0.0
+
+    cells = np.concatenate(parts).astype(np.uint64)
+    keep = np.r_[True, cells[1:] != cells[:-1]]
+    return cells[keep], length_km
+
+
+def run_length_segments(cells, zones, sqm, length_km):
+    """
+    Compress the per-cell profile into runs of equal zone.
+    Distances follow the cell centres, scaled to the polyline's length_km;
+    run boundaries sit halfway between the last cell of one run and the
+    first of the next.
+    """
+    if len(cells) == 0:
+        return []
+    centres = np.array([h3_int.cell_to_latlng(c) for c in cells.tolist()]).reshape(-1, 2)
+    step = haversine_km(centres[:-1, 0], centres[:-1, 1], centres[1:, 0], centres[1:, 1])
+    cum = np.r_[0.0, np.cumsum(step)]
+    if cum[-1] > 0:
+        cum *= length_km / cum[-1]
+    total = length_km
+
+    starts = np.flatnonzero(np.r_[True, zones[1:] != zones[:-1]])
+    ends = np.r_[starts[1:], len(cells)] - 1
+    segments = []
+    for s, e in zip(starts.tolist(), ends.tolist()):
+        start_km = 0.0 if s == 0 else (cum[s - 1] + cum[s]) / 2
+        end_km = total if e == len(cells) - 1 else (cum[e] + cum[e + 1]) / 2
+        run_sqm = sqm[s:e + 1]
+        segments.append({
+            "bortle_class": int(zones[s]),
+            "sqm_min": round(float(run_sqm.min()), 2),
+            "sqm_max": round(float(run_sqm.max()), 2),
+            "start_km": round(float(start_km), 3),
+            "end_km": round(float(end_km), 3),
+            "cells": e - s + 1,
+            "start": [round(float(centres[s, 0]), 5), round(float(centres[s, 1]), 5)],
+            "end": [round(float(centres[e, 0]), 5), round(float(centres[e, 1]), 5)],
+        })
+    return segments
+
+
+def route_profile(store, lats, lons):
+    """Densify, resolve in one batch and run-length compress a polyline"""
+    cells, length_km = densify_path(lats, lons)
+    found = store.lookup_cells(cells)
+    segments = run_length_segments(cells, found["zone"], found["sqm"], length_km)
+    km_by_bortle = {}
+    for seg in segments:
+        key = str(seg["bortle_class"])
+        km_by_bortle[key] = round(km_by_bortle.get(key, 0.0) + seg["end_km"] - seg["start_km"], 3)
+    return {
+        "distance_km": round(length_km, 3),
+        "cells": int(len(cells)),
+        "segments": segments,
+        "km_by_bortle": km_by_bortle,
+    }
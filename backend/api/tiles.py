@@ -0,0 +1,255 @@
+"""
+XYZ raster tiles of Bortle zones (256 px, Web Mercator, palette PNG).
+
+Pixels are mapped to H3 cells with a quadtree over the tile: a block whose
+four corner pixels fall in the same cell is filled without indexing the
+pixels inside it. Only blocks that straddle a cell edge are split, so
+zoomed-in tiles cost a few thousand H3 calls instead of 65,536.
+
+Up to COARSE_MAX_ZOOM the tile is drawn from the res-5 dark_index.db
+summaries (the pyramid level for low zooms). Above it, a res-5 pass first
+masks out parents with no stored cells, and only the remaining pixels are
+resolved to res-8 cells in one ZonesStore.lookup_cells batch.
+
+Rendered tiles live in a size-bounded on-disk LRU keyed by the data
+version, so a new zones.db never serves stale tiles.
+"""
+import hashlib
+import math
+import os
+import struct
+import tempfile
+import zlib
+
+import numpy as np
+from h3.api import numpy_int as h3_int
+
+TILE_SIZE = 256
+MAX_TILE_ZOOM = 14
+COARSE_MAX_ZOOM = 6         # pixel ≈ 2.4 km at z6; res-5 parents are ~16 km across
+COARSE_RESOLUTION = 5
+FINE_RESOLUTION = 8
+QUADTREE_BLOCK = 16
+# A res-5 parent shows the brightest zone covering at least this many res-8 children
+COARSE_MIN_CELLS = 7
+
+# RGBA per palette index; index = Bortle zone, 0 = no data. Zone 1 is transparent.
+BORTLE_PALETTE = [
+    (0, 0, 0, 0),
+    (0, 0, 0, 0),
+    (34, 34, 110, 150),
+    (40, 90, 200, 160),
+    (40, 170, 80, 170),
+    (225, 215, 50, 180),
+    (245, 145, 35, 190),
+    (225, 45, 35, 200),
+    (245, 200, 210, 210),
+    (255, 255, 255, 220),
+]
+
+
+# ============================================================================
+# PNG encoding
+# ============================================================================
+def _chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+
+def encode_png(indices, palette=BORTLE_PALETTE):
+    """8-bit palette PNG with a tRNS alpha table from a 2-D uint8 index array"""
+    height, width = indices.shape
+    raw = np.zeros((height, width + 1), dtype=np.uint8)  # filter byte 0 per row
+    raw[:, 1:] = indices
+    return b''.join([
+        b'\x89PNG\r\n\x1a\n',
+        _chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 3, 0, 0, 0)),
+        _chunk(b'PLTE', bytes(c for rgba in palette for c in rgba[:3])),
+        _chunk(b'tRNS', bytes(rgba[3] for rgba in palette)),
+        _chunk(b'IDAT', zlib.compress(raw.tobytes(), 6)),
+        _chunk(b'IEND', b''),
+    ])
+
+
+# ============================================================================
+# Tile geometry
+# ============================================================================
+def tile_pixel_centres(z, x, y, size=TILE_SIZE):
+    """Latitudes (per row) and longitudes (per column) of pixel centres"""
+    n = 2 ** z
+    t = (np.arange(size) + 0.5) / size
+    lons = (x + t) / n * 360.0 - 180.0
+    lats = np.degrees(np.arctan(np.sinh(math.pi * (1 - 2 * (y + t) / n))))
+    return lats, lons
+
+
+def quadtree_cells(lats, lons, resolution, need=None, block=QUADTREE_BLOCK):
+    """
+    H3 cell per pixel of the len(lats) x len(lons) grid (0 where need is False).
+    Uniform blocks are filled from their corners; the rest split in four.
+    """
+    n = len(lats)
+    grid = np.zeros((n, n), dtype=np.uint64)
+    known = np.zeros((n, n), dtype=bool)
+    if need is None:
+        need = np.ones((n, n), dtype=bool)
+
+    def resolve(rows, cols):
+        todo = ~known[rows, cols]
+        r, c = rows[todo], cols[todo]
+        grid[r, c] = np.fromiter((h3_int.latlng_to_cell(a, b, resolution)
+                                  for a, b in zip(lats[r].tolist(), lons[c].tolist())),
+                                 dtype=np.uint64, count=len(r))
+        known[r, c] = True
+
+    s = block
+    starts = np.arange(0, n, s)
+    r0, c0 = [a.ravel() for a in np.meshgrid(starts, starts, indexing='ij')]
+    while len(r0):
+        keep = need.reshape(n // s, s, n // s, s).any(axis=(1, 3))[r0 // s, c0 // s]
+        r0, c0 = r0[keep], c0[keep]
+        corners_r = np.stack([r0, r0, r0 + s - 1, r0 + s - 1], axis=1)
+        corners_c = np.stack([c0, c0 + s - 1, c0, c0 + s - 1], axis=1)
+        resolve(corners_r.ravel(), corners_c.ravel())
+        if s <= 2:
+            break
+        corner_cells = grid[corners_r, corners_c]
+        uniform = (corner_cells == corner_cells[:, :1]).all(axis=1)
+
+        span = np.arange(s)
+        ur, uc = r0[uniform], c0[uniform]
+        rows = (ur[:, None, None] + span[None, :, None]).repeat(s, axis=2)
+        cols = (uc[:, None, None] + span[None, None, :]).repeat(s, axis=1)
+        grid[rows, cols] = corner_cells[uniform, 0][:, None, None]
+        known[rows, cols] = True
+
+        h = s // 2
+        sr, sc = r0[~uniform], c0[~uniform]
+        r0 = np.concatenate([sr, sr, sr + h, sr + h])
+        c0 = np.concatenate([sc, sc + h, sc, sc + h])
+        s = h
+
+    grid[~need] = 0
+    return grid
+
+
+def coarse_zones(index, parents):
+    """Brightest zone covering at least COARSE_MIN_CELLS children of each res-5 parent"""
+    _, counts = index.summary(parents)
+    enough = counts >= COARSE_MIN_CELLS
+    zones = counts.shape[1] - np.argmax(enough[:, ::-1], axis=1)
+    return np.where(enough.any(axis=1), zones, 1).astype(np.uint8)
+
+
+def render_tile(store, index, z, x, y):
+    """Palette-index array (zone per pixel, 0 = no data) for tile z/x/y"""
+    lats, lons = tile_pixel_centres(z, x, y)
+    out = np.zeros((TILE_SIZE, TILE_SIZE), dtype=np.uint8)
+
+    need = None
+    if index is not None and index.resolution == COARSE_RESOLUTION:
+        parents = quadtree_cells(lats, lons, COARSE_RESOLUTION)
+        uniq, inverse = np.unique(parents, return_inverse=True)
+        if z <= COARSE_MAX_ZOOM:
+            return coarse_zones(index, uniq)[inverse.reshape(parents.shape)]
+        _, counts = index.summary(uniq)
+        stored = counts[:, 0] < index.children
+        need = stored[inverse.reshape(parents.shape)]
+        if not need.any():
+            out[:] = 1
+            return out
+
+    cells = quadtree_cells(lats, lons, FINE_RESOLUTION, need)
+    uniq, inverse = np.unique(cells, return_inverse=True)
+    zones = store.lookup_cells(uniq)["zone"]
+    zones[uniq == 0] = 1
+    out[:] = zones[inverse.reshape(cells.shape)]
+    return out
+
+
+# ============================================================================
+# Disk cache
+# ============================================================================
+class TileCache:
+    """
+    Size-bounded on-disk LRU of rendered PNGs under <directory>/<data_key>/z/x/y.png.
+    Reads touch the file's mtime; writes evict the least recently used tiles
+    (across all data keys) once the directory exceeds max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = sum(size for _, _, size in self._entries())
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.png'):
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    yield path, st.st_mtime, st.st_size
+
+    def path(self, key, z, x, y):
+        return os.path.join(self.directory, key, str(z), str(x), f"{y}.png")
+
+    def get(self, key, z, x, y):
+        path = self.path(key, z, x, y)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        return data
+
+    def put(self, key, z, x, y, data):
+        path = self.path(key, z, x, y)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """Drop least recently used tiles until the cache is back under 90% of max_bytes"""
+        entries = sorted(self._entries(), key=lambda e: e[1])
+        total = sum(size for _, _, size in entries)
+        target = self.max_bytes * 0.9
+        for path, _, size in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self.size = total
+
+
+def tile_etag(data):
+    return hashlib.sha1(data).hexdigest()[:20]
+
+
+class TileRenderer:
+    """Renders tiles from the zones data and serves them through the disk cache"""
+
+    def __init__(self, store, index, cache, data_key):
+        self.store = store
+        self.index = index
+        self.cache = cache
+        self.data_key = data_key
+
+    def tile(self, z, x, y):
+        """PNG bytes for tile z/x/y, rendered on a cache miss"""
+        data = self.cache.get(self.data_key, z, x, y) if self.cache else None
+        if data is None:
+            data = encode_png(render_tile(self.store, self.index, z, x, y))
+            if self.cache:
+                self.cache.put(self.data_key, z, x, y, data)
+        return data
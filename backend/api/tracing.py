@@ -0,0 +1,212 @@
+"""
+Sampled request tracing with a local JSON-lines exporter.
+
+Spans follow the OpenTelemetry data model (trace_id, span_id,
+parent_span_id, start/end in unix nanoseconds, attributes, status) and the
+W3C traceparent header. They are written with no collector: each sampled
+request becomes one JSON line per span, appended to a size-rotated file
+(TRACE_FILE, TRACE_FILE.1, ...). scripts/trace_summary.py turns the files
+into per-stage percentile tables.
+
+Sampling is decided once per request. An unsampled request only pays for a
+random() call; span() then hands back a shared no-op span. A request whose
+incoming traceparent has the sampled flag set is always traced. A trace
+keeps at most MAX_SPANS spans (a large Mongo batch makes one per cell) and
+notes how many it dropped on the root span.
+
+The current span lives in a ContextVar, so nesting works across threads
+(Flask) and asyncio tasks (ASGI) alike.
+"""
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import random
+import time
+
+MAX_SPANS = 1000
+
+
+class Span:
+    __slots__ = ('trace', 'name', 'span_id', 'parent_id', 'start_ns', 'end_ns', 'attributes', 'status')
+
+    def __init__(self, trace, name, parent_id, attributes, start_ns=None):
+        self.trace = trace
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes
+        self.status = 'OK'
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def end(self, end_ns=None):
+        self.end_ns = end_ns or time.time_ns()
+        self.trace.add(self)
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_id,
+            "name": self.name,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "status": self.status,
+        }
+
+
+class NoopSpan:
+    """Stand-in for unsampled requests"""
+    __slots__ = ()
+
+    def set(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NOOP = NoopSpan()
+
+
+class Trace:
+    __slots__ = ('trace_id', 'spans', 'dropped')
+
+    def __init__(self, trace_id):
+        self.trace_id = trace_id
+        self.spans = []
+        self.dropped = 0
+
+    def add(self, span):
+        if len(self.spans) < MAX_SPANS:
+            self.spans.append(span)
+        else:
+            self.dropped += 1
+
+
+class SpanContext:
+    """with tracer.span(...) as span: child of the current span, ended on exit"""
+    __slots__ = ('span', 'token')
+
+    def __init__(self, span):
+        self.span = span
+
+    def __enter__(self):
+        self.token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.span.status = 'ERROR'
+            self.span.attributes['exception.type'] = exc_type.__name__
+        _current.reset(self.token)
+        self.span.end()
+        return False
+
+
+_current = contextvars.ContextVar('astr_span', default=None)
+
+
+def parse_traceparent(header):
+    """(trace_id, parent span id, sampled) from a W3C traceparent header, or None"""
+    parts = (header or '').strip().split('-')
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+        flags = int(parts[3], 16)
+    except ValueError:
+        return None
+    if parts[1] == '0' * 32 or parts[2] == '0' * 16:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+
+class JsonLinesExporter:
+    """One JSON object per span, in files rotated at max_bytes (backup_count kept)"""
+
+    def __init__(self, path, max_bytes=10 * 1024 * 1024, backup_count=3):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count,
+                                                            encoding='utf-8', delay=True)
+        self.handler.setFormatter(logging.Formatter('%(message)s'))
+
+    def export(self, spans):
+        # One record per trace: a single lock and write, and traces never straddle a rotation
+        lines = '\n'.join(json.dumps(s.to_dict(), separators=(',', ':')) for s in spans)
+        self.handler.emit(logging.makeLogRecord({'msg': lines, 'levelno': logging.INFO}))
+
+    def close(self):
+        self.handler.close()
+
+
+class Tracer:
+    def __init__(self, exporter=None, sample_rate=0.0):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.exported = self.dropped = 0
+
+    def start_trace(self, name, attributes=None, traceparent=None, start_ns=None):
+        """
+        Root span of a request, made current; returns (span, token) or (None, None)
+        when the request is not sampled. Close it with end_trace(span, token).
+        """
+        if self.exporter is None:
+            return None, None
+        parent = parse_traceparent(traceparent)
+        if parent is not None and parent[2]:
+            trace_id, parent_id = parent[0], parent[1]
+        elif self.sample_rate > 0 and random.random() < self.sample_rate:
+            trace_id, parent_id = (parent[0], parent[1]) if parent else (os.urandom(16).hex(), None)
+        else:
+            return None, None
+        span = Span(Trace(trace_id), name, parent_id, dict(attributes or ()), start_ns)
+        return span, _current.set(span)
+
+    def end_trace(self, span, token):
+        _current.reset(token)
+        span.end_ns = time.time_ns()
+        trace = span.trace
+        if trace.dropped:
+            span.attributes['spans_dropped'] = trace.dropped
+        trace.spans.append(span)
+        try:
+            self.exporter.export(trace.spans)
+            self.exported += 1
+        except Exception as e:
+            # Tracing must never fail a request
+            self.dropped += 1
+            print(f"Trace export failed: {e}")
+
+    def span(self, name, **attributes):
+        """Child span of the current one; the shared no-op span outside a sampled trace"""
+        parent = _current.get()
+        if parent is None:
+            return NOOP
+        return SpanContext(Span(parent.trace, name, parent.span_id, attributes))
+
+    def record(self, name, start_ns, end_ns, **attributes):
+        """Child span for a stage that already happened (e.g. routing before the first hook)"""
+        parent = _current.get()
+        if parent is not None:
+            Span(parent.trace, name, parent.span_id, attributes, start_ns).end(end_ns)
+
+    @staticmethod
+    def current():
+        return _current.get()
+
+    @staticmethod
+    def traceparent(span):
+        """W3C traceparent for a response header"""
+        return f"00-{span.trace.trace_id}-{span.span_id}-01"
@@ -0,0 +1,156 @@
+"""
+Stored cells inside a map viewport, streamed as they are read.
+
+The viewport's lat/lon box is covered with H3 cells at a zoom-dependent
+resolution (padded by one cell edge so cells cut by the box edge are
+included), then compacted. zones.db is sorted by H3 and the res-8
+descendants of a cell are one contiguous integer range, so every covering
+cell is a range scan; covering cells are taken a batch at a time and each
+batch is encoded and sent before the next is read. Below res 8 the stored
+cells are aggregated to their parents (res 6-7 from zones.db, res 5 and
+coarser from the res-5 area pyramid), showing the brightest zone that
+covers at least the same share of children as the coarse map tiles.
+
+Binary format (little-endian):
+    header  b'ASTV', u8 version, u8 resolution, u16 reserved
+    chunk   u32 n, n x u64 H3 index, n x u8 zone     (repeated)
+    end     u32 0
+NDJSON: one {"h3": "<hex>", "zone": z} object per line.
+"""
+import struct
+
+import h3
+import numpy as np
+from h3.api import numpy_int as h3_int
+
+try:
+    from .zones_store import H3_RESOLUTION, IMPLICIT_ZONE
+    from .area_stats import ZONES, compact, descendant_range, gather_ranges, parents_of
+    from .tiles import COARSE_MIN_CELLS, COARSE_RESOLUTION
+except ImportError:
+    from zones_store import H3_RESOLUTION, IMPLICIT_ZONE
+    from area_stats import ZONES, compact, descendant_range, gather_ranges, parents_of
+    from tiles import COARSE_MIN_CELLS, COARSE_RESOLUTION
+
+MAGIC = b'ASTV'
+FORMAT_VERSION = 1
+# Source rows (zones.db records or pyramid rows) read per streamed chunk
+CHUNK_ROWS = 16384
+# Web Mercator latitude limit
+MAX_LATITUDE = 85.0511
+# Longitude step of the densified box edges, so they follow parallels
+# rather than great circles
+DENSIFY_DEG = 1.0
+# (highest zoom, resolution): cells stay a few pixels wide at every zoom
+ZOOM_RESOLUTIONS = ((4, 3), (6, 4), (7, 5), (9, 6), (11, 7))
+
+
+def zoom_resolution(zoom):
+    for max_zoom, resolution in ZOOM_RESOLUTIONS:
+        if zoom <= max_zoom:
+            return resolution
+    return H3_RESOLUTION
+
+
+def viewport_shape(west, south, east, north, pad_km=0.0):
+    """
+    H3 shape of a lat/lon box (west > east crosses the antimeridian), padded
+    by pad_km, split into pieces at most 90° wide with densified edges.
+    """
+    pad_lat = pad_km / 111.2
+    south, north = max(south - pad_lat, -MAX_LATITUDE), min(north + pad_lat, MAX_LATITUDE)
+    pad_lon = pad_lat / max(np.cos(np.radians(max(abs(south), abs(north)))), 0.01)
+    start = west - pad_lon
+    end = (east if east > west else east + 360.0) + pad_lon
+    if end - start >= 360.0:
+        start, end = -180.0, 180.0
+    breaks = [start] + [k * 90.0 for k in range(-3, 8) if start < k * 90.0 < end] + [end]
+    polys = []
+    for a, b in zip(breaks[:-1], breaks[1:]):
+        shift = -360.0 if a >= 180.0 else (360.0 if b <= -180.0 else 0.0)
+        lons = np.linspace(a, b, int(np.ceil((b - a) / DENSIFY_DEG)) + 1) + shift
+        polys.append(h3.LatLngPoly([(south, lon) for lon in lons.tolist()] +
+                                   [(north, lon) for lon in lons[::-1].tolist()]))
+    return polys[0] if len(polys) == 1 else h3.LatLngMultiPoly(*polys)
+
+
+def covering(shape, resolution):
+    """Compacted cells at `resolution` whose centres fall in the shape"""
+    return compact(h3_int.h3shape_to_cells(shape, resolution))
+
+
+def brightest_zone(counts, resolution):
+    """Brightest zone covering COARSE_MIN_CELLS per res-5 parent's worth of children"""
+    min_cells = max(1, round(COARSE_MIN_CELLS * 7 ** (COARSE_RESOLUTION - resolution)))
+    enough = counts >= min_cells
+    zones = counts.shape[1] - np.argmax(enough[:, ::-1], axis=1)
+    return np.where(enough.any(axis=1), zones, IMPLICIT_ZONE).astype(np.uint8)
+
+
+def stream_cells(store, pyramid, cells, resolution, chunk=CHUNK_ROWS):
+    """
+    Yield (H3 indexes, zones) at `resolution` under compacted covering cells,
+    in H3 order, about `chunk` source rows at a time. Covering cells are never
+    split across chunks, so every output cell appears once.
+    """
+    if resolution <= pyramid.resolution:
+        keys, scan = pyramid.cells, pyramid.resolution
+    else:
+        keys, scan = store.cells, H3_RESOLUTION
+    first, last = descendant_range(cells, scan)
+    # Mixed-resolution cells sort by their resolution bits first; order the ranges instead
+    order = np.argsort(first)
+    first, last = first[order], last[order]
+    filled = np.cumsum(np.searchsorted(keys, last, side='right') - np.searchsorted(keys, first, side='left'))
+    start = 0
+    while start < len(cells):
+        before = filled[start - 1] if start else 0
+        stop = max(start + 1, int(np.searchsorted(filled, before + chunk, side='right')))
+        index, _ = gather_ranges(keys, first[start:stop], last[start:stop])
+        start = stop
+        if len(index) == 0:
+            continue
+        if resolution == H3_RESOLUTION:
+            yield store.cells[index], store.records['zone'][index]
+            continue
+        if keys is pyramid.cells:
+            counts = pyramid.counts[index]
+        else:
+            counts = np.zeros((len(index), ZONES), dtype=np.uint32)
+            counts[np.arange(len(index)), store.records['zone'][index].astype(np.intp) - 1] = 1
+        parents = parents_of(keys[index], resolution)
+        starts = np.flatnonzero(np.r_[True, parents[1:] != parents[:-1]])
+        yield parents[starts], brightest_zone(np.add.reduceat(counts, starts, axis=0), resolution)
+
+
+def encode_binary(chunks, resolution):
+    yield MAGIC + struct.pack('<BBH', FORMAT_VERSION, resolution, 0)
+    for cells, zones in chunks:
+        yield struct.pack('<I', len(cells)) + cells.astype('<u8').tobytes() + zones.astype(np.uint8).tobytes()
+    yield struct.pack('<I', 0)
+
+
+def encode_ndjson(chunks):
+    for cells, zones in chunks:
+        yield ''.join(f'{{"h3":"{c:x}","zone":{z}}}\n' for c, z in zip(cells.tolist(), zones.tolist())).encode()
+
+
+def decode_binary(data):
+    """(resolution, H3 indexes, zones) of a complete binary payload"""
+    if data[:4] != MAGIC:
+        raise ValueError("Not a viewport payload")
+    version, resolution, _ = struct.unpack_from('<BBH', data, 4)
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported viewport format version {version}")
+    offset, cells, zones = 8, [], []
+    while True:
+        (n,) = struct.unpack_from('<I', data, offset)
+        offset += 4
+        if n == 0:
+            break
+        cells.append(np.frombuffer(data, '<u8', n, offset))
+        zones.append(np.frombuffer(data, np.uint8, n, offset + 8 * n))
+        offset += 9 * n
+    empty = (np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.uint8))
+    return (resolution, np.concatenate(cells) if cells else empty[0],
+            np.concatenate(zones) if zones else empty[1])
@@ -0,0 +1,252 @@
+"""
+Read-only access to zones.db (res-8 H3 cells with Zone 2+ light pollution).
+
+The file is produced by scripts/generate_zones_vnl.py / apply_skyglow.py:
+  Header (16 bytes): magic "ASTR", version u32, count u64
+  Records (20 bytes): h3 u64, zone u8, radiance f32, sqm f32, 3 pad bytes, sorted by h3
+Cells that are not stored are implicit Zone 1 (pristine sky).
+
+The records are memory-mapped, so the page cache holds a single copy shared
+by every worker process. Opening the store before the workers fork
+(gunicorn --preload) also shares the small fence index below.
+
+An optional dark_distance.db sidecar (scripts/dark_distance.py) is aligned
+record-for-record with zones.db, so the distance to darker sky is read at
+the index the H3 search already found:
+  Header (16 bytes): magic "ASTN", version u16, threshold bitmask u16, count u64
+  Records (9 bytes): distance u16 per threshold (0.1 km, 0xFFFF unknown),
+                     bearing u8 per threshold (360/256 degrees)
+
+zones_lite.db (scripts/lite_zones.py) keeps only the median child of each
+coarse parent. It is small enough to bundle with a serverless function and
+answers approximately while MongoDB is still connecting:
+  Header (16 bytes): magic "ASTL", version u16, resolution u8, child resolution u8, count u64
+  Records (13 bytes): h3 u64, zone u8, sqm f32, sorted by h3
+"""
+import struct
+
+import h3
+import numpy as np
+from h3.api import numpy_int as h3_int
+
+HEADER_SIZE = 16
+ZONES_MAGIC = b'ASTR'
+H3_RESOLUTION = 8
+
+ZONES_DTYPE = np.dtype([('h3', '<u8'), ('zone', 'u1'), ('radiance', '<f4'),
+                        ('sqm', '<f4'), ('reserved', 'V3')])
+
+# Implicit Zone 1 (matches cloudflare/worker.js)
+IMPLICIT_ZONE = 1
+IMPLICIT_SQM = 22.0
+
+# Every FENCE_STRIDE-th key is copied into a contiguous array. A lookup
+# binary-searches the fence, then one FENCE_STRIDE-record block of the map,
+# so only ~40 KB is touched per query and the full key column is never copied.
+FENCE_STRIDE = 4096
+
+DARK_DISTANCE_MAGIC = b'ASTN'
+DISTANCE_UNIT_KM = 0.1
+DISTANCE_UNKNOWN = 0xFFFF
+
+LITE_MAGIC = b'ASTL'
+LITE_DTYPE = np.dtype([('h3', '<u8'), ('zone', 'u1'), ('sqm', '<f4')])
+
+
+def latlng_to_cells(lats, lons):
+    """Res-8 cell (uint64) per point"""
+    return np.fromiter((h3_int.latlng_to_cell(lat, lon, H3_RESOLUTION)
+                        for lat, lon in zip(lats, lons)),
+                       dtype=np.uint64, count=len(lats))
+
+
+class ZonesStore:
+    """Memory-mapped zones.db with two-level binary search by H3 cell"""
+
+    def __init__(self, path, dark_distance_path=None):
+        with open(path, 'rb') as f:
+            header = f.read(HEADER_SIZE)
+        if len(header) < HEADER_SIZE or header[:4] != ZONES_MAGIC:
+            raise ValueError(f"{path} is not a zones.db file")
+
+        self.path = path
+        self.version, self.count = struct.unpack('<IQ', header[4:])
+        if self.count:
+            self.records = np.memmap(path, dtype=ZONES_DTYPE, mode='r',
+                                     offset=HEADER_SIZE, shape=(self.count,))
+        else:
+            self.records = np.zeros(0, dtype=ZONES_DTYPE)
+        self.cells = self.records['h3']
+        self.fence = np.ascontiguousarray(self.cells[::FENCE_STRIDE])
+
+        self.dark_distance = None
+        self.dark_distance_path = None
+        self.dark_thresholds = ()
+        if dark_distance_path is not None:
+            self.attach_dark_distance(dark_distance_path)
+
+    def attach_dark_distance(self, path):
+        """Map a dark_distance.db sidecar; it must have been built from this zones.db"""
+        with open(path, 'rb') as f:
+            header = f.read(HEADER_SIZE)
+        if len(header) < HEADER_SIZE or header[:4] != DARK_DISTANCE_MAGIC:
+            raise ValueError(f"{path} is not a dark_distance.db file")
+        _, mask, count = struct.unpack('<HHQ', header[4:])
+        if count != self.count:
+            raise ValueError(f"{path} has {count} records, zones.db has {self.count}")
+
+        thresholds = tuple(z for z in range(1, 10) if mask >> z & 1)
+        dtype = np.dtype([('distance', '<u2', (len(thresholds),)), ('bearing', 'u1', (len(thresholds),))])
+        if count:
+            self.dark_distance = np.memmap(path, dtype=dtype, mode='r', offset=HEADER_SIZE, shape=(count,))
+        else:
+            self.dark_distance = np.zeros(0, dtype=dtype)
+        self.dark_thresholds = thresholds
+        self.dark_distance_path = path
+
+    def nearest_dark(self, distance, bearing, zone):
+        """
+        Sidecar row -> {"<bortle>": {"distance_km", "bearing_deg"}} per threshold.
+        Zero distance (already at or below the threshold) has no bearing;
+        unknown distances are None.
+        """
+        out = {}
+        for t, threshold in enumerate(self.dark_thresholds):
+            d = int(distance[t])
+            if zone <= threshold:
+                out[str(threshold)] = {"distance_km": 0.0, "bearing_deg": None}
+            elif d == DISTANCE_UNKNOWN:
+                out[str(threshold)] = None
+            else:
+                out[str(threshold)] = {"distance_km": round(d * DISTANCE_UNIT_KM, 1),
+                                       "bearing_deg": round(int(bearing[t]) * 360.0 / 256, 1)}
+        return out
+
+    def find(self, cell):
+        """Record index of an H3 cell (int), or -1 when it is implicit Zone 1"""
+        block = int(np.searchsorted(self.fence, cell, side='right')) - 1
+        if block < 0:
+            return -1
+        start = block * FENCE_STRIDE
+        keys = self.cells[start:start + FENCE_STRIDE]
+        i = int(np.searchsorted(keys, cell))
+        if i < len(keys) and int(keys[i]) == cell:
+            return start + i
+        return -1
+
+    def find_many(self, cells):
+        """
+        Vectorized find: record index per H3 cell (uint64 array), -1 for implicit Zone 1.
+        Lock-step binary search inside each query's fence block, gathering only the
+        probed keys from the map on each of the log2(FENCE_STRIDE) rounds.
+        """
+        cells = np.asarray(cells, dtype=np.uint64)
+        out = np.full(len(cells), -1, dtype=np.int64)
+        if self.count == 0 or len(cells) == 0:
+            return out
+
+        block = np.searchsorted(self.fence, cells, side='right') - 1
+        lo = np.maximum(block, 0) * FENCE_STRIDE
+        hi = np.minimum(lo + FENCE_STRIDE, self.count)
+        while True:
+            active = lo < hi
+            if not active.any():
+                break
+            mid = (lo + hi) // 2
+            go_right = active & (self.cells[np.minimum(mid, self.count - 1)] < cells)
+            lo = np.where(go_right, mid + 1, lo)
+            hi = np.where(active & ~go_right, mid, hi)
+
+        candidate = (block >= 0) & (lo < self.count)
+        hit = np.zeros(len(cells), dtype=bool)
+        hit[candidate] = self.cells[lo[candidate]] == cells[candidate]
+        out[hit] = lo[hit]
+        return out
+
+    def lookup_many(self, lats, lons):
+        """
+        Zone data for many points at once.
+        Returns dict of arrays: h3 (uint64), zone, radiance, sqm and implicit,
+        plus per-threshold dark_distance and dark_bearing when the sidecar is attached.
+        """
+        return self.lookup_cells(latlng_to_cells(lats, lons))
+
+    def lookup_cells(self, cells):
+        """Zone data for an array of res-8 cells (same dict of arrays as lookup_many)"""
+        cells = np.asarray(cells, dtype=np.uint64)
+        idx = self.find_many(cells)
+        implicit = idx < 0
+        zone = np.full(len(cells), IMPLICIT_ZONE, dtype=np.uint8)
+        radiance = np.zeros(len(cells), dtype=np.float32)
+        sqm = np.full(len(cells), IMPLICIT_SQM, dtype=np.float32)
+        if (~implicit).any():
+            rec = self.records[idx[~implicit]]
+            zone[~implicit] = rec['zone']
+            radiance[~implicit] = rec['radiance']
+            sqm[~implicit] = rec['sqm']
+        found = {"h3": cells, "zone": zone, "radiance": radiance, "sqm": sqm, "implicit": implicit}
+        if self.dark_distance is not None:
+            k = len(self.dark_thresholds)
+            distance = np.zeros((len(cells), k), dtype=np.uint16)
+            bearing = np.zeros((len(cells), k), dtype=np.uint8)
+            if (~implicit).any():
+                side = self.dark_distance[idx[~implicit]]
+                distance[~implicit] = side['distance']
+                bearing[~implicit] = side['bearing']
+            found["dark_distance"] = distance
+            found["dark_bearing"] = bearing
+        return found
+
+    def lookup(self, lat, lon):
+        """
+        Zone data for the res-8 cell covering (lat, lon).
+        Returns dict with h3, zone, radiance, sqm and implicit, plus
+        nearest_dark when the dark_distance.db sidecar is attached.
+        """
+        cell = h3.latlng_to_cell(lat, lon, H3_RESOLUTION)
+        i = self.find(h3.str_to_int(cell))
+        if i < 0:
+            result = {"h3": cell, "zone": IMPLICIT_ZONE, "radiance": 0.0,
+                      "sqm": IMPLICIT_SQM, "implicit": True}
+            if self.dark_distance is not None:
+                k = len(self.dark_thresholds)
+                result["nearest_dark"] = self.nearest_dark([0] * k, [0] * k, IMPLICIT_ZONE)
+            return result
+        rec = self.records[i]
+        result = {"h3": cell, "zone": int(rec['zone']), "radiance": float(rec['radiance']),
+                  "sqm": float(rec['sqm']), "implicit": False}
+        if self.dark_distance is not None:
+            side = self.dark_distance[i]
+            result["nearest_dark"] = self.nearest_dark(side['distance'], side['bearing'], result["zone"])
+        return result
+
+
+class LiteZones:
+    """zones_lite.db read into memory: median zone and SQM per coarse parent"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            header = f.read(HEADER_SIZE)
+            if len(header) < HEADER_SIZE or header[:4] != LITE_MAGIC:
+                raise ValueError(f"{path} is not a zones_lite.db file")
+            self.version, self.resolution, child_resolution, self.count = struct.unpack('<HBBQ', header[4:])
+            if child_resolution != H3_RESOLUTION:
+                raise ValueError(f"{path} summarizes res-{child_resolution} cells, expected {H3_RESOLUTION}")
+            self.records = np.fromfile(f, dtype=LITE_DTYPE, count=self.count)
+        if len(self.records) != self.count:
+            raise ValueError(f"{path} is truncated")
+        self.path = path
+        self.cells = self.records['h3']
+
+    def lookup_cells(self, cells):
+        """(zone, sqm) arrays for res-8 cells; parents that are not stored are Zone 1"""
+        parents = np.fromiter((h3_int.cell_to_parent(c, self.resolution) for c in np.asarray(cells).tolist()),
+                              dtype=np.uint64, count=len(cells))
+        zone = np.full(len(parents), IMPLICIT_ZONE, dtype=np.uint8)
+        sqm = np.full(len(parents), IMPLICIT_SQM, dtype=np.float32)
+        if self.count and len(parents):
+            i = np.minimum(np.searchsorted(self.cells, parents), self.count - 1)
+            hit = self.cells[i] == parents
+            zone[hit] = self.records['zone'][i[hit]]
+            sqm[hit] = self.records['sqm'][i[hit]]
+        return zone, sqm
@@ -0,0 +1,440 @@
+"""
+Load-test the API end to end against a synthetic light pollution dataset.
+
+Builds a dataset of --points documents, clustered around the cities in
+assets/db/cities.json (brightest at the centre) with a uniform scatter
+elsewhere. It serves that dataset from each backend:
+  mongo     a local mongod (--mongo-uri, seeded into --mongo-db) or, without
+            one, an in-process stand-in that answers the same $near queries
+            from an H3 bucket index after --standin-rtt-ms of simulated
+            network time
+  mongo_h3  the same points averaged per res-8 cell into the H3-keyed
+            collection (_id lookups and $in), on the same mongod or stand-in
+  zones_db  a zones.db written from the same cells (or --zones-db)
+Each --server runs in-process: flask is the app on a threaded Werkzeug
+server, asgi is api/asgi.py on uvicorn (its Motor queries go to async
+versions of the same stand-ins, or to --mongo-uri). The keep-alive
+clients of scripts/benchmark_servers.py replay coordinates at each
+--concurrency. A --city-share of the queries fall near cities; the
+rest are uniform over the globe, and therefore mostly ocean.
+
+Per server, backend and concurrency it reports req/s, p50/p95/p99 latency, errors
+and the per-cell cache hit ratio. --output writes the results as JSON with
+the git commit, and --compare prints the change against an earlier file.
+
+Usage:
+    python scripts/benchmark_api.py --points 200000 --concurrency 1 16 64 --output bench.json
+    python scripts/benchmark_api.py --mongo-uri mongodb://localhost:27017 --backend mongo
+    python scripts/benchmark_api.py --server flask asgi --backend mongo --concurrency 100 200
+    python scripts/benchmark_api.py --compare bench-main.json --output bench.json
+    python scripts/benchmark_api.py --url http://localhost:8000   # an already running server
+"""
+import os
+import sys
+import json
+import time
+import struct
+import asyncio
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import urllib.request
+
+import numpy as np
+from h3.api import numpy_int as h3_int
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmark_servers import run
+
+CITIES_PATH = os.path.join(BACKEND_DIR, '..', 'assets', 'db', 'cities.json')
+# Spread of points around a city centre (degrees) and of its light dome (km)
+CITY_SIGMA_DEG = 0.25
+DOME_KM = 15.0
+# H3 resolution of the stand-in's buckets: ring 3 covers the 50 km $near radius
+BUCKET_RESOLUTION = 4
+BUCKET_RING = 3
+EARTH_RADIUS_M = 6_371_000
+
+
+def load_cities():
+    """(lat, lon, bortle) rows; cities.json is one flat list of triples"""
+    with open(CITIES_PATH) as f:
+        return np.array(json.load(f), dtype=np.float64).reshape(-1, 3)
+
+
+def near_cities(rng, cities, n):
+    """n points scattered around random cities, with their distance (km) and the city's Bortle class"""
+    centres = cities[rng.integers(len(cities), size=n)]
+    lats = np.clip(centres[:, 0] + rng.normal(0, CITY_SIGMA_DEG, n), -89.9, 89.9)
+    lons = (centres[:, 1] + rng.normal(0, CITY_SIGMA_DEG, n) + 180) % 360 - 180
+    km = haversine_m(lats, lons, centres[:, 0], centres[:, 1]) / 1000
+    return lats, lons, km, centres[:, 2]
+
+
+def uniform(rng, n):
+    """Uniform on the sphere (~70% ocean)"""
+    lats = np.degrees(np.arcsin(rng.uniform(-1, 1, n)))
+    lons = rng.uniform(-180, 180, n)
+    return lats, lons
+
+
+def synthetic_dataset(seed, points, city_share, cities):
+    """(lats, lons, mpsas): city points get a light dome, the rest are near-pristine"""
+    rng = np.random.default_rng(seed)
+    n_city = int(points * city_share)
+    city_lats, city_lons, km, bortle = near_cities(rng, cities, n_city)
+    # Brighter domes for brighter cities: ~17 mpsas at a Bortle 9 centre
+    city_mpsas = 22.0 - 0.55 * bortle * np.exp(-km / DOME_KM) + rng.normal(0, 0.1, n_city)
+    far_lats, far_lons = uniform(rng, points - n_city)
+    far_mpsas = rng.uniform(21.6, 22.0, points - n_city)
+    return (np.concatenate([city_lats, far_lats]), np.concatenate([city_lons, far_lons]),
+            np.clip(np.concatenate([city_mpsas, far_mpsas]), 16.0, 22.0))
+
+
+def query_paths(seed, n, city_share, cities):
+    rng = np.random.default_rng(seed + 1)
+    n_city = int(n * city_share)
+    lats, lons, _, _ = near_cities(rng, cities, n_city)
+    far_lats, far_lons = uniform(rng, n - n_city)
+    lats, lons = np.concatenate([lats, far_lats]), np.concatenate([lons, far_lons])
+    order = rng.permutation(n)
+    return [f'/api/light-pollution?lat={a:.5f}&lon={b:.5f}'
+            for a, b in zip(lats[order].tolist(), lons[order].tolist())]
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class StandInCollection:
+    """
+    light_pollution stand-in: find_one($near, $maxDistance) over points
+    bucketed by res-4 H3 cell, after a simulated round trip. Read-only, so it
+    is safe to share between the server's threads.
+    """
+
+    def __init__(self, lats, lons, mpsas, rtt_s):
+        buckets = np.fromiter((h3_int.latlng_to_cell(a, b, BUCKET_RESOLUTION) for a, b in zip(lats, lons)),
+                              dtype=np.uint64, count=len(lats))
+        order = np.argsort(buckets)
+        self.buckets = buckets[order]
+        self.lats, self.lons, self.mpsas = lats[order], lons[order], mpsas[order]
+        self.rtt_s = rtt_s
+
+    def find_one(self, query):
+        near = query['location']['$near']
+        lon, lat = near['$geometry']['coordinates']
+        if self.rtt_s:
+            time.sleep(self.rtt_s)
+        ring = h3_int.grid_disk(h3_int.latlng_to_cell(lat, lon, BUCKET_RESOLUTION), BUCKET_RING)
+        spans = [(np.searchsorted(self.buckets, c), np.searchsorted(self.buckets, c, side='right'))
+                 for c in ring.astype(np.uint64)]
+        index = np.concatenate([np.arange(a, b) for a, b in spans if b > a] or [np.zeros(0, dtype=np.int64)])
+        if len(index) == 0:
+            return None
+        distance = haversine_m(lat, lon, self.lats[index], self.lons[index])
+        best = int(np.argmin(distance))
+        if distance[best] > near['$maxDistance']:
+            return None
+        i = index[best]
+        return {"location": {"type": "Point", "coordinates": [float(self.lons[i]), float(self.lats[i])]},
+                "mpsas": round(float(self.mpsas[i]), 2)}
+
+
+class StandInH3Collection:
+    """light_pollution_h3 stand-in: _id find_one and $in find, one simulated round trip each"""
+
+    def __init__(self, cells, mpsas, bortle, rtt_s):
+        self.documents = {c: {"_id": c, "mpsas": round(m, 2), "bortle": b}
+                          for c, m, b in zip(cells.tolist(), mpsas.tolist(), bortle.tolist())}
+        self.rtt_s = rtt_s
+
+    def find_one(self, query, projection=None):
+        if self.rtt_s:
+            time.sleep(self.rtt_s)
+        return self.documents.get(query["_id"])
+
+    def find(self, query, projection=None):
+        if self.rtt_s:
+            time.sleep(self.rtt_s)
+        return [self.documents[i] for i in query["_id"]["$in"] if i in self.documents]
+
+
+class AsyncStandIn:
+    """
+    Motor-style view of a stand-in collection (built with no round trip of
+    its own) for the ASGI app: the simulated round trip is awaited, so a
+    waiting query does not hold a thread
+    """
+
+    def __init__(self, collection, rtt_s):
+        self.collection = collection
+        self.rtt_s = rtt_s
+
+    async def round_trip(self):
+        if self.rtt_s:
+            await asyncio.sleep(self.rtt_s)
+
+    async def find_one(self, *args):
+        await self.round_trip()
+        return self.collection.find_one(*args)
+
+    def find(self, *args):
+        return StandInCursor(self, args)
+
+
+class StandInCursor:
+    """Motor cursor stand-in: the query's round trip is paid on to_list"""
+
+    def __init__(self, collection, args):
+        self.collection = collection
+        self.args = args
+
+    async def to_list(self, length):
+        await self.collection.round_trip()
+        return self.collection.collection.find(*self.args)
+
+
+class StandInDatabase:
+    def __init__(self, collection, h3_collection):
+        self.light_pollution = collection
+        self.h3_collection = h3_collection
+
+    def __getitem__(self, name):
+        return self.h3_collection
+
+
+def cell_table(lats, lons, mpsas, calculate_bortle_class):
+    """(cells, mean mpsas, bortle) per distinct res-8 cell of the dataset"""
+    from api.zones_store import latlng_to_cells
+    cells, inverse = np.unique(latlng_to_cells(lats, lons), return_inverse=True)
+    mean = np.bincount(inverse, weights=mpsas) / np.bincount(inverse)
+    return cells, mean, np.array([calculate_bortle_class(m) for m in mean.tolist()], dtype=np.int64)
+
+
+def seed_mongo(uri, name, lats, lons, mpsas, table, h3_collection):
+    """Fresh light_pollution (2dsphere) and H3-keyed collections in database `name`"""
+    from pymongo import MongoClient, GEOSPHERE
+    client = MongoClient(uri, serverSelectionTimeoutMS=5000)
+    collection = client[name].light_pollution
+    collection.drop()
+    for start in range(0, len(lats), 10_000):
+        collection.insert_many([{"location": {"type": "Point", "coordinates": [b, a]}, "mpsas": round(m, 2)}
+                                for a, b, m in zip(lats[start:start + 10_000].tolist(),
+                                                   lons[start:start + 10_000].tolist(),
+                                                   mpsas[start:start + 10_000].tolist())])
+    collection.create_index([("location", GEOSPHERE)])
+    cells = client[name][h3_collection]
+    cells.drop()
+    cells.insert_many([{"_id": c, "mpsas": round(m, 2), "bortle": b}
+                       for c, m, b in zip(*(a.tolist() for a in table))], ordered=False)
+    return client, client[name]
+
+
+def write_zones_db(path, table):
+    """zones.db with one record per distinct res-8 cell of the dataset"""
+    from api.zones_store import ZONES_DTYPE
+    cells, mpsas, bortle = table
+    records = np.zeros(len(cells), dtype=ZONES_DTYPE)
+    records['h3'] = cells
+    records['sqm'] = mpsas
+    records['zone'] = bortle
+    with open(path, 'wb') as f:
+        f.write(b'ASTR\x01\x00\x00\x00' + struct.pack('<Q', len(records)))
+        records.tofile(f)
+
+
+def start_server(app):
+    from werkzeug.serving import make_server, WSGIRequestHandler
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args):
+            pass
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+class AsgiServer:
+    """uvicorn serving an ASGI app from a background thread, with start_server's shutdown()"""
+
+    def __init__(self, app):
+        import socket
+        import uvicorn
+        self.socket = socket.create_server(('127.0.0.1', 0))
+        # Lifespan off: the Mongo pool is set up by the caller
+        self.server = uvicorn.Server(uvicorn.Config(app, lifespan='off', log_level='warning', access_log=False))
+        self.thread = threading.Thread(target=self.server.run, kwargs={'sockets': [self.socket]}, daemon=True)
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        self.url = f'http://127.0.0.1:{self.socket.getsockname()[1]}'
+
+    def shutdown(self):
+        self.server.should_exit = True
+        self.thread.join()
+        self.socket.close()
+
+
+def start_asgi_server():
+    """api/asgi.py's routes for the current index.LP_BACKEND, on uvicorn"""
+    from starlette.applications import Starlette
+    from api import asgi
+    server = AsgiServer(Starlette(routes=asgi.build_routes()))
+    return server, server.url
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure(url, server, backend, concurrency, duration, paths, cache_stats=None):
+    before = cache_stats() if cache_stats else None
+    latencies, errors, elapsed = asyncio.run(run(url, concurrency, duration, paths))
+    row = {"server": server, "backend": backend, "concurrency": concurrency, "requests": len(latencies),
+           "errors": len(errors), "rps": round(len(latencies) / elapsed, 1)}
+    if latencies:
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+        row.update(p50_ms=round(p50, 3), p95_ms=round(p95, 3), p99_ms=round(p99, 3))
+    if before is not None:
+        after = cache_stats()
+        lookups = (after['hits'] - before['hits']) + (after['misses'] - before['misses'])
+        row["cache_hit_ratio"] = round((after['hits'] - before['hits']) / lookups, 3) if lookups else None
+    return row
+
+
+def print_row(row, baseline=None):
+    p = [f"{row[k]:>8.2f}" if k in row else f"{'-':>8}" for k in ('p50_ms', 'p95_ms', 'p99_ms')]
+    hit = row.get('cache_hit_ratio')
+    line = (f"{row['server']:<6} {row['backend']:<9} {row['concurrency']:>7} {row['rps']:>9.0f} {' '.join(p)} "
+            f"{row['errors']:>7} {'-' if hit is None else f'{hit:.0%}':>6}")
+    if baseline is not None:
+        change = lambda k: f"{(row[k] / baseline[k] - 1) * 100:+.0f}%" if baseline.get(k) and row.get(k) else '-'
+        line += f"   req/s {change('rps'):>6}  p99 {change('p99_ms'):>6}"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='API throughput and latency against a synthetic dataset')
+    parser.add_argument('--backend', nargs='+', default=['mongo', 'mongo_h3', 'zones_db'],
+                        choices=['mongo', 'mongo_h3', 'zones_db'])
+    parser.add_argument('--server', nargs='+', default=['flask'], choices=['flask', 'asgi'],
+                        help='In-process server(s): threaded Werkzeug or uvicorn (api/asgi.py)')
+    parser.add_argument('--points', type=int, default=200_000, help='Synthetic dataset size')
+    parser.add_argument('--city-share', type=float, default=0.8,
+                        help='Share of dataset points and queries clustered on cities')
+    parser.add_argument('--queries', type=int, default=100_000, help='Distinct query coordinates')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 16, 64])
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds per run')
+    parser.add_argument('--mongo-uri', default=None, help='Local mongod to seed (default: in-process stand-in)')
+    parser.add_argument('--mongo-db', default='astr_bench', help='Database seeded on --mongo-uri')
+    parser.add_argument('--standin-rtt-ms', type=float, default=1.0, help='Simulated round trip of the stand-in')
+    parser.add_argument('--zones-db', default=None, help='Existing zones.db instead of the synthetic one')
+    parser.add_argument('--url', default=None, help='Benchmark a running server instead')
+    parser.add_argument('--output', default=None, help='Write results as JSON')
+    parser.add_argument('--compare', default=None, help='Earlier --output file to compare against')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    cities = load_cities()
+    paths = query_paths(args.seed, args.queries, args.city_share, cities)
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = {(r.get('server', 'flask'), r['backend'], r['concurrency']): r
+                        for r in json.load(f)['results']}
+
+    print(f"{'server':<6} {'backend':<9} {'clients':>7} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'errors':>7} {'cache':>6}")
+    results = []
+
+    def report(row):
+        results.append(row)
+        print_row(row, baseline.get((row['server'], row['backend'], row['concurrency'])) if args.compare else None)
+
+    if args.url:
+        with urllib.request.urlopen(args.url.rstrip('/') + '/api/health') as response:
+            health = json.load(response)
+        server, backend = health.get('server', 'flask'), health.get('backend', 'unknown')
+        for concurrency in args.concurrency:
+            report(measure(args.url, server, backend, concurrency, args.duration, paths))
+    else:
+        os.environ.setdefault('TRACE_SAMPLE_RATE', '0')
+        import api.index as index
+        t0 = time.perf_counter()
+        lats, lons, mpsas = synthetic_dataset(args.seed, args.points, args.city_share, cities)
+        table = cell_table(lats, lons, mpsas, index.calculate_bortle_class)
+        tmp = tempfile.TemporaryDirectory()
+        if {'mongo', 'mongo_h3'} & set(args.backend):
+            if args.mongo_uri:
+                index.mongo_client, index.db = seed_mongo(args.mongo_uri, args.mongo_db, lats, lons, mpsas,
+                                                          table, index.MONGO_H3_COLLECTION)
+                index.MONGO_URI = args.mongo_uri
+                if 'asgi' in args.server:
+                    from api import asgi
+                    from motor.motor_asyncio import AsyncIOMotorClient
+                    asgi.mongo.client = AsyncIOMotorClient(args.mongo_uri, maxPoolSize=asgi.MONGO_MAX_POOL_SIZE)
+                    asgi.mongo.db = asgi.mongo.client[args.mongo_db]
+            else:
+                rtt = args.standin_rtt_ms / 1000
+                index.db = StandInDatabase(StandInCollection(lats, lons, mpsas, rtt),
+                                           StandInH3Collection(*table, rtt))
+                index.MONGO_URI = 'standin://'
+                if 'asgi' in args.server:
+                    from api import asgi
+                    asgi.mongo.db = StandInDatabase(
+                        AsyncStandIn(StandInCollection(lats, lons, mpsas, 0), rtt),
+                        AsyncStandIn(StandInH3Collection(*table, 0), rtt))
+            index.mongo_state = 'connected'
+        if 'zones_db' in args.backend:
+            index.ZONES_DB_PATH = args.zones_db or os.path.join(tmp.name, 'zones.db')
+            if not args.zones_db:
+                write_zones_db(index.ZONES_DB_PATH, table)
+            index.zones_store = None
+        print(f"# {args.points} points ({args.city_share:.0%} near cities) in {len(table[0])} cells, ready in "
+              f"{time.perf_counter() - t0:.1f} s")
+
+        try:
+            for name in args.server:
+                for backend in args.backend:
+                    index.LP_BACKEND = backend
+                    # The ASGI routes depend on the backend, so each gets its own server
+                    server, url = start_server(index.app) if name == 'flask' else start_asgi_server()
+                    try:
+                        for concurrency in args.concurrency:
+                            index.lp_cache.clear()
+                            report(measure(url, name, backend, concurrency, args.duration, paths,
+                                           index.lp_cache.stats))
+                    finally:
+                        server.shutdown()
+        finally:
+            tmp.cleanup()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                "commit": git_commit(),
+                "timestamp": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "cpus": os.cpu_count(),
+                "parameters": {k: v for k, v in vars(args).items() if k not in ('output', 'compare')},
+                "results": results,
+            }, f, indent=2)
+        print(f"Results written to {args.output}")
+    sys.exit(1 if any(r['errors'] for r in results) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Benchmark /api/light-pollution/batch against sequential GET requests.
+
+By default runs in-process through the Flask test client, so the numbers
+cover routing, validation and lookup but no network. With --url the same
+comparison is made against a running server.
+
+Usage:
+    LP_BACKEND=zones_db python scripts/benchmark_batch.py --points 10000
+    python scripts/benchmark_batch.py --url http://localhost:5000 --points 10000
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import urllib.request
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+def random_points(n, seed):
+    """Uniform points between 60S and 70N (where nearly everyone lives)"""
+    rng = np.random.default_rng(seed)
+    lats = np.round(rng.uniform(-60, 70, n), 5)
+    lons = np.round(rng.uniform(-180, 180, n), 5)
+    return np.stack([lats, lons], axis=1).tolist()
+
+
+class TestClientTransport:
+    def __init__(self):
+        from api.index import app
+        self.client = app.test_client()
+
+    def get(self, lat, lon):
+        return self.client.get(f'/api/light-pollution?lat={lat}&lon={lon}').get_json()
+
+    def post(self, points):
+        return self.client.post('/api/light-pollution/batch', json={"points": points}).get_json()
+
+
+class HttpTransport:
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+
+    def get(self, lat, lon):
+        with urllib.request.urlopen(f'{self.url}/api/light-pollution?lat={lat}&lon={lon}') as r:
+            return json.load(r)
+
+    def post(self, points):
+        req = urllib.request.Request(f'{self.url}/api/light-pollution/batch',
+                                     data=json.dumps({"points": points}).encode(),
+                                     headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(req) as r:
+            return json.load(r)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Batch vs sequential light-pollution lookups')
+    parser.add_argument('--points', type=int, default=10000)
+    parser.add_argument('--url', help='Benchmark a running server instead of the in-process app')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    transport = HttpTransport(args.url) if args.url else TestClientTransport()
+    points = random_points(args.points, args.seed)
+    print(f"Backend: {os.getenv('LP_BACKEND', 'mongo') if not args.url else args.url}")
+    print(f"Points: {len(points):,}")
+
+    # Warm up (connection, mmap, imports)
+    transport.get(*points[0])
+    transport.post(points[:10])
+
+    t0 = time.perf_counter()
+    sequential = [transport.get(lat, lon) for lat, lon in points]
+    t_seq = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    batch = transport.post(points)['results']
+    t_batch = time.perf_counter() - t0
+
+    keys = ('mpsas', 'bortle_class', 'fallback')
+    mismatches = sum(any(s.get(k) != b.get(k) for k in keys) for s, b in zip(sequential, batch))
+
+    print(f"\nSequential: {t_seq * 1000:9.1f} ms  ({t_seq / len(points) * 1e6:7.1f} µs/point)")
+    print(f"Batch:      {t_batch * 1000:9.1f} ms  ({t_batch / len(points) * 1e6:7.1f} µs/point)")
+    print(f"Speedup:    {t_seq / t_batch:9.1f}x")
+    print(f"Mismatched results: {mismatches}")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
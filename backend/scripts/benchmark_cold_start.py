@@ -0,0 +1,99 @@
+"""
+Benchmark serverless cold starts of api/index.py.
+
+Every run is a fresh interpreter (as a cold Vercel invocation), which
+imports the app and sends one request through the Flask test client, then
+a second one to show the warm latency. Reported per mode:
+  import   time to import api.index
+  first    latency of the first request (connection, lazy loads)
+  warm     latency of the second request to another point
+Medians and maxima over --runs. Each mode runs with MONGO_CONNECT set to
+that mode; pass --mongo-uri (or set MONGODB_URI) to include a real or
+unreachable server.
+
+Usage:
+    python scripts/benchmark_cold_start.py --runs 10
+    python scripts/benchmark_cold_start.py --mongo-uri mongodb://10.255.255.1 --path /api/health
+    python scripts/benchmark_cold_start.py --importtime    # slowest imports of one cold start
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+import statistics
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+CHILD = r'''
+import json, sys, time
+t0 = time.perf_counter()
+import api.index as index
+t1 = time.perf_counter()
+client = index.app.test_client()
+first = client.get(sys.argv[1])
+t2 = time.perf_counter()
+second = client.get(sys.argv[2])
+t3 = time.perf_counter()
+print(json.dumps({"import": t1 - t0, "first": t2 - t1, "warm": t3 - t2,
+                  "status": first.status_code, "body": first.get_json()}))
+'''
+
+
+def cold_start(mode, paths, uri):
+    env = {**os.environ, 'MONGO_CONNECT': mode}
+    if uri is not None:
+        env['MONGODB_URI'] = uri
+    out = subprocess.run([sys.executable, '-c', CHILD, *paths], cwd=BACKEND_DIR, env=env,
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def import_profile(top):
+    """Slowest top-level imports of one cold start (python -X importtime)"""
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import api.index'],
+                         cwd=BACKEND_DIR, capture_output=True, text=True, check=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Only modules imported directly by api.index (one nesting level)
+        if name.startswith('   ') and not name.startswith('    '):
+            rows.append((int(cumulative), name.strip()))
+    for us, name in sorted(rows, reverse=True)[:top]:
+        print(f"  {us / 1000:8.1f} ms  {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cold-start import and first-response latency')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--mode', nargs='+', default=['ping', 'background'], choices=['ping', 'background'])
+    parser.add_argument('--path', default='/api/light-pollution?lat=30.3165&lon=78.0322',
+                        help='First request')
+    parser.add_argument('--mongo-uri', default=None, help='Defaults to MONGODB_URI')
+    parser.add_argument('--importtime', action='store_true', help='Show the slowest imports and exit')
+    args = parser.parse_args()
+
+    if args.importtime:
+        import_profile(15)
+        return
+
+    warm_path = '/api/light-pollution?lat=32.7795&lon=78.9641'
+    print(f"First request: {args.path}")
+    print(f"{'mode':<11} {'import ms':>15} {'first ms':>15} {'warm ms':>15}  first response")
+    for mode in args.mode:
+        runs = [cold_start(mode, (args.path, warm_path), args.mongo_uri) for _ in range(args.runs)]
+        cols = []
+        for key in ('import', 'first', 'warm'):
+            values = [r[key] * 1000 for r in runs]
+            cols.append(f"{statistics.median(values):7.1f} ({max(values):5.0f})")
+        body = runs[-1]['body'] or {}
+        summary = {k: body[k] for k in ('database', 'database_state', 'bortle_class', 'fallback', 'approximate')
+                   if k in body}
+        print(f"{mode:<11} {cols[0]:>15} {cols[1]:>15} {cols[2]:>15}  {runs[-1]['status']} {summary}")
+    print("(median, max in parentheses)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Benchmark the batch response encodings: time to encode and payload size.
+
+Looks up --sizes points (clustered on cities like scripts/benchmark_api.py)
+through the zones.db batch path once per size, then encodes the result in
+every format available here:
+  jsonify  Flask's jsonify of per-row dicts (the encoder before formats existed)
+  json     the default path: per-row dicts through orjson (stdlib json without it)
+  msgpack  columns, numeric ones as raw NumPy buffers
+  arrow    Arrow IPC stream of the columns
+Times are the median of --repeat encodes; gzip is the size on the wire
+with Content-Encoding: gzip (level 6).
+
+Usage:
+    python scripts/benchmark_encoding.py
+    python scripts/benchmark_encoding.py --sizes 1000 10000 100000 --zones-db ../assets/db/zones.db
+"""
+import os
+import sys
+import gzip
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmark_api import load_cities, near_cities, uniform, synthetic_dataset, cell_table, write_zones_db
+
+
+def query_points(seed, n, city_share, cities):
+    rng = np.random.default_rng(seed + 1)
+    n_city = int(n * city_share)
+    lats, lons, _, _ = near_cities(rng, cities, n_city)
+    far_lats, far_lons = uniform(rng, n - n_city)
+    return np.concatenate([lats, far_lats]), np.concatenate([lons, far_lons])
+
+
+def median_ms(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = fn()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times)) * 1000, body
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Encode time and payload size per batch response format')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--zones-db', help='Existing zones.db (default: a synthetic one)')
+    parser.add_argument('--points', type=int, default=200_000, help='Synthetic dataset size')
+    parser.add_argument('--city-share', type=float, default=0.8)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    os.environ.setdefault('TRACE_SAMPLE_RATE', '0')
+    from api import index, encoding
+
+    tmp = tempfile.TemporaryDirectory()
+    cities = load_cities()
+    index.LP_BACKEND = 'zones_db'
+    index.ZONES_DB_PATH = args.zones_db or os.path.join(tmp.name, 'zones.db')
+    if not args.zones_db:
+        lats, lons, mpsas = synthetic_dataset(args.seed, args.points, args.city_share, cities)
+        write_zones_db(index.ZONES_DB_PATH, cell_table(lats, lons, mpsas, index.calculate_bortle_class))
+    index.zones_store = None
+
+    formats = ['jsonify'] + encoding.available_formats()
+    print(f"Formats: {', '.join(formats)} (JSON through {'orjson' if encoding.orjson else 'the stdlib encoder'})")
+    print(f"\n{'points':>8} {'format':<8} {'encode ms':>10} {'bytes':>12} {'gzip':>11} {'vs jsonify':>11}")
+    for size in args.sizes:
+        lats, lons = query_points(args.seed, size, args.city_share, cities)
+        index.lp_cache.clear()
+        result = index.batch_from_zones(lats, lons)
+        baseline = None
+        for fmt in formats:
+            if fmt == 'jsonify':
+                with index.app.app_context():
+                    body = {"count": len(result), "backend": index.LP_BACKEND, "results": result.rows()}
+                    ms, data = median_ms(lambda: index.jsonify(body).get_data(), args.repeat)
+                    # Rows were built once outside the timer; add their cost back
+                    ms += median_ms(result.rows, args.repeat)[0]
+            else:
+                ms, (data, _) = median_ms(lambda: encoding.encode_batch(result, fmt, index.LP_BACKEND), args.repeat)
+            baseline = baseline or ms
+            print(f"{size:>8} {fmt:<8} {ms:>10.2f} {len(data):>12,} {len(gzip.compress(data, 6)):>11,} "
+                  f"{baseline / ms:>10.1f}x")
+    tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
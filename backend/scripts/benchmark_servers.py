@@ -0,0 +1,127 @@
+"""
+Load-test running servers with many concurrent keep-alive clients.
+
+Compares the sync Flask app with the ASGI app (api/asgi.py) on
+GET /api/light-pollution. Each client holds one HTTP/1.1 connection and
+sends requests back to back for --duration seconds. Random points are used
+by default so most lookups miss the per-cell cache and reach MongoDB; use
+--repeat to measure cache hits instead.
+
+Start the servers first, e.g.
+    gunicorn -w 4 --threads 8 -b :5000 api.index:app
+    uvicorn api.asgi:app --workers 4 --port 8000
+
+Usage:
+    python scripts/benchmark_servers.py --server flask=http://localhost:5000 \\
+        --server asgi=http://localhost:8000 --concurrency 1 10 100 200
+
+Without a mongod, scripts/benchmark_api.py runs the same clients against
+both apps in-process, backed by its Mongo stand-in:
+    python scripts/benchmark_api.py --server flask asgi --backend mongo mongo_h3 --concurrency 100 200
+"""
+import sys
+import time
+import asyncio
+import argparse
+from urllib.parse import urlsplit
+
+import numpy as np
+
+
+async def read_response(reader):
+    """Status code of one HTTP/1.1 response (body consumed) and whether the server keeps the connection"""
+    status = await reader.readline()
+    if not status:
+        raise ConnectionError("connection closed")
+    length, keep_alive = 0, True
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.partition(b':')
+        name = name.strip().lower()
+        if name == b'content-length':
+            length = int(value)
+        elif name == b'connection' and value.strip().lower() == b'close':
+            keep_alive = False
+    await reader.readexactly(length)
+    return int(status.split()[1]), keep_alive
+
+
+async def client(host, port, paths, start, deadline, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    i = start
+    try:
+        while time.perf_counter() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            t0 = time.perf_counter()
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode())
+            try:
+                status, keep_alive = await read_response(reader)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                errors.append('closed')
+                keep_alive = False
+            else:
+                latencies.append(time.perf_counter() - t0)
+                if status != 200:
+                    errors.append(status)
+            if not keep_alive:
+                # e.g. the Werkzeug dev server: one request per connection
+                writer.close()
+                reader, writer = await asyncio.open_connection(host, port)
+    finally:
+        writer.close()
+
+
+async def run(url, concurrency, duration, paths):
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    rng = np.random.default_rng(concurrency)
+    t0 = time.perf_counter()
+    # Each client starts at a different offset so clients don't share cells
+    await asyncio.gather(*(client(host, port, paths, int(rng.integers(len(paths))),
+                                  deadline, latencies, errors)
+                           for _ in range(concurrency)))
+    elapsed = time.perf_counter() - t0
+    return latencies, errors, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent load test of running API servers')
+    parser.add_argument('--server', action='append', required=True, metavar='NAME=URL',
+                        help='Server to test (repeatable)')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 100, 200])
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds per run')
+    parser.add_argument('--repeat', type=int, default=0,
+                        help='Cycle through this many points (cache hits) instead of random ones')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    n = args.repeat or 200_000
+    lats = np.round(rng.uniform(-60, 70, n), 5)
+    lons = np.round(rng.uniform(-180, 180, n), 5)
+    paths = [f'/api/light-pollution?lat={a}&lon={b}' for a, b in zip(lats.tolist(), lons.tolist())]
+
+    print(f"{'server':<10} {'clients':>7} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    failed = False
+    for spec in args.server:
+        name, _, url = spec.partition('=')
+        for concurrency in args.concurrency:
+            latencies, errors, elapsed = asyncio.run(run(url, concurrency, args.duration, paths))
+            if not latencies:
+                print(f"{name:<10} {concurrency:>7} {'-':>9} {'-':>8} {'-':>8} {len(errors):>7}")
+                failed = True
+                continue
+            p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+            print(f"{name:<10} {concurrency:>7} {len(latencies) / elapsed:>9.0f} "
+                  f"{p50:>8.1f} {p99:>8.1f} {len(errors):>7}")
+            failed |= bool(errors)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Bulk-load the H3-keyed light pollution collection (LP_BACKEND=mongo_h3).
+
+One document per res-8 H3 cell, keyed by the cell's integer so the API
+reads it with an _id lookup instead of a $near query:
+    {"_id": 613196571542028287, "radiance": 40.2, "mpsas": 18.71, "bortle": 7, "samples": 3}
+
+Sources:
+  --zones PATH     every stored zones.db cell. zones.db leaves dark cells
+                   out, so serve it with MONGO_H3_MISSING=dark
+  --hdf5 FILE ...  VNP46A2 tiles, read in parallel processes; the valid
+                   pixels of a cell (every --step-th) are averaged, and
+                   cells on tile edges are merged across tiles
+
+Documents are written by --workers threads in unordered insert_many
+batches of --batch documents. --drop recreates the collection first (the
+fastest load); without it existing cells are replaced by upserts.
+
+Usage:
+    python scripts/load_h3_collection.py --zones ../assets/db/zones.db --drop
+    python scripts/load_h3_collection.py --hdf5 data/VNP46A2.*.h5 --step 1 --workers 8
+    python scripts/load_h3_collection.py --zones ../assets/db/zones.db --dry-run
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from api.zones_store import ZonesStore, latlng_to_cells
+from process_nasa_data import radiance_to_mpsas, get_bortle_class, parse_tile_id, tile_to_bounds
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+load_dotenv(os.path.join(os.path.dirname(__file__), '../.env'))
+
+DEFAULT_COLLECTION = os.getenv('MONGO_H3_COLLECTION', 'light_pollution_h3')
+HDF5_FIELD = ('HDFEOS', 'GRIDS', 'VIIRS_Grid_DNB_2d', 'Data Fields', 'Gap_Filled_DNB_BRDF-Corrected_NTL')
+# Largest valid radiance; VNP46A2 fills missing pixels with 65535
+MAX_RADIANCE = 65000
+
+
+def zones_table(path):
+    """(cells, radiance, mpsas, bortle, samples) for every stored zones.db cell"""
+    store = ZonesStore(path)
+    records = store.records
+    return (records['h3'], records['radiance'].astype(np.float64), records['sqm'].astype(np.float64),
+            records['zone'].astype(np.int64), np.ones(len(records), dtype=np.int64))
+
+
+def tile_sums(file_path, step):
+    """(cells, radiance sums, pixel counts) of one VNP46A2 tile; runs in a worker process"""
+    import h5py
+
+    h_tile, v_tile = parse_tile_id(file_path)
+    if h_tile is None:
+        raise ValueError(f"Could not parse tile ID from filename: {file_path}")
+    lat_min, lat_max, lon_min, lon_max = tile_to_bounds(h_tile, v_tile)
+    with h5py.File(file_path, 'r') as f:
+        field = f
+        for name in HDF5_FIELD:
+            field = field[name]
+        data = field[::step, ::step].astype(np.float64)
+
+    # Same linear pixel mapping as process_nasa_data.pixel_to_latlon, on the full-resolution grid
+    rows, cols = field.shape
+    r, c = np.nonzero((data >= 0) & (data <= MAX_RADIANCE))
+    lats = lat_max - (r * step / rows) * (lat_max - lat_min)
+    lons = lon_min + (c * step / cols) * (lon_max - lon_min)
+    cells, inverse = np.unique(latlng_to_cells(lats, lons), return_inverse=True)
+    return cells, np.bincount(inverse, weights=data[r, c]), np.bincount(inverse)
+
+
+def hdf5_table(files, step, workers):
+    """(cells, radiance, mpsas, bortle, samples) averaged over every valid pixel of the tiles"""
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        parts = []
+        for path, part in zip(files, pool.map(tile_sums, files, [step] * len(files))):
+            logger.info(f"{os.path.basename(path)}: {len(part[0])} cells")
+            parts.append(part)
+    cells, inverse = np.unique(np.concatenate([p[0] for p in parts]), return_inverse=True)
+    sums = np.bincount(inverse, weights=np.concatenate([p[1] for p in parts]))
+    samples = np.bincount(inverse, weights=np.concatenate([p[2] for p in parts])).astype(np.int64)
+    radiance = sums / samples
+    mpsas = np.array([radiance_to_mpsas(x) for x in radiance.tolist()])
+    bortle = np.array([get_bortle_class(m) for m in mpsas.tolist()], dtype=np.int64)
+    return cells, radiance, mpsas, bortle, samples
+
+
+def documents(table, start, stop):
+    cells, radiance, mpsas, bortle, samples = (a[start:stop].tolist() for a in table)
+    # H3 indexes leave the top bit clear, so they fit a signed BSON int64
+    return [{"_id": c, "radiance": round(r, 2), "mpsas": round(m, 2), "bortle": b, "samples": n}
+            for c, r, m, b, n in zip(cells, radiance, mpsas, bortle, samples)]
+
+
+def write_batch(collection, docs, upsert):
+    from pymongo import ReplaceOne
+    from pymongo.errors import BulkWriteError
+    try:
+        if upsert:
+            collection.bulk_write([ReplaceOne({"_id": d["_id"]}, d, upsert=True) for d in docs], ordered=False)
+        else:
+            collection.insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        logger.warning(f"Bulk write errors: {len(e.details.get('writeErrors', []))} documents")
+    return len(docs)
+
+
+def load(collection, table, batch, workers, upsert):
+    count = len(table[0])
+    written = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(write_batch, collection, documents(table, start, start + batch), upsert)
+                   for start in range(0, count, batch)]
+        for future in futures:
+            written += future.result()
+            if written % (batch * 20) == 0 or written == count:
+                logger.info(f"Wrote {written}/{count} documents")
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load the H3-keyed light pollution collection')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--zones', help='zones.db to load')
+    source.add_argument('--hdf5', nargs='+', help='VNP46A2 HDF5 tiles to aggregate')
+    parser.add_argument('--step', type=int, default=1, help='Read every Nth pixel of each HDF5 tile')
+    parser.add_argument('--collection', default=DEFAULT_COLLECTION)
+    parser.add_argument('--database', default='astr')
+    parser.add_argument('--batch', type=int, default=5000, help='Documents per insert')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4)
+    parser.add_argument('--drop', action='store_true', help='Recreate the collection instead of upserting')
+    parser.add_argument('--dry-run', action='store_true', help='Build the documents but do not write them')
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    table = zones_table(args.zones) if args.zones else hdf5_table(args.hdf5, args.step, args.workers)
+    logger.info(f"{len(table[0])} cells in {time.perf_counter() - t0:.1f} s")
+    if args.dry_run:
+        for doc in documents(table, 0, 3):
+            logger.info(f"Sample: {doc}")
+        return
+
+    uri = os.getenv('MONGODB_URI')
+    if not uri:
+        logger.error("MONGODB_URI not found in environment variables.")
+        sys.exit(1)
+    from pymongo import MongoClient
+    client = MongoClient(uri, maxPoolSize=args.workers)
+    collection = client[args.database][args.collection]
+    if args.drop:
+        collection.drop()
+        logger.info(f"Dropped {args.database}.{args.collection}")
+
+    t0 = time.perf_counter()
+    written = load(collection, table, args.batch, args.workers, upsert=not args.drop)
+    elapsed = time.perf_counter() - t0
+    logger.info(f"Loaded {written} documents in {elapsed:.1f} s ({written / max(elapsed, 1e-9):.0f}/s)")
+    if args.zones:
+        logger.info("zones.db omits dark cells: run the API with LP_BACKEND=mongo_h3 MONGO_H3_MISSING=dark")
+    else:
+        logger.info("Run the API with LP_BACKEND=mongo_h3")
+
+
+if __name__ == "__main__":
+    main()
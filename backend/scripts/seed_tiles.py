@@ -0,0 +1,70 @@
+"""
+Pre-render Bortle map tiles into the disk tile cache.
+
+Renders every tile from --min-zoom to --max-zoom through the same
+TileRenderer as /tiles/{z}/{x}/{y}.png, so a deploy can ship (or warm) a
+cache that covers the zooms most clients open the map at. Tiles already in
+the cache for the current data version are skipped.
+
+Usage:
+    python scripts/seed_tiles.py
+    TILE_CACHE_DIR=/var/cache/astr-tiles python scripts/seed_tiles.py --max-zoom 8 --workers 4
+"""
+import os
+import sys
+import time
+import argparse
+from multiprocessing import Pool
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+_renderer = None
+
+
+def _init():
+    global _renderer
+    from api.index import get_tile_renderer
+    _renderer = get_tile_renderer()
+
+
+def _seed(zxy):
+    z, x, y = zxy
+    cache = _renderer.cache
+    if cache.get(_renderer.data_key, z, x, y) is not None:
+        return 0
+    _renderer.tile(z, x, y)
+    return 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pre-render Bortle map tiles into the tile cache')
+    parser.add_argument('--min-zoom', type=int, default=0)
+    parser.add_argument('--max-zoom', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    from api.index import get_tile_renderer, TILE_CACHE_DIR, MAX_TILE_ZOOM
+    if not 0 <= args.min_zoom <= args.max_zoom <= MAX_TILE_ZOOM:
+        print(f"Error: zooms must satisfy 0 <= min <= max <= {MAX_TILE_ZOOM}")
+        sys.exit(1)
+    renderer = get_tile_renderer()
+    if renderer is None or renderer.cache is None:
+        print("Error: zones.db or a writable TILE_CACHE_DIR is missing")
+        sys.exit(1)
+
+    tiles = [(z, x, y) for z in range(args.min_zoom, args.max_zoom + 1)
+             for x in range(2 ** z) for y in range(2 ** z)]
+    print(f"Seeding {len(tiles):,} tiles (z{args.min_zoom}-{args.max_zoom}) into {TILE_CACHE_DIR}")
+
+    t0 = time.time()
+    with Pool(args.workers, initializer=_init) as pool:
+        rendered = sum(pool.imap_unordered(_seed, tiles, chunksize=16))
+    elapsed = time.time() - t0
+    print(f"  Rendered {rendered:,}, already cached {len(tiles) - rendered:,} in {elapsed:.1f}s")
+    # Workers each tracked their own size; re-scan and trim once at the end
+    renderer.cache.evict()
+    print(f"  Cache size: {renderer.cache.size / (1024**2):.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Summarize spans written by the API's tracer (TRACE_SAMPLE_RATE > 0).
+
+Reads TRACE_FILE and its rotated copies (TRACE_FILE.1, .2, ...) and prints,
+per traced route, one row per stage:
+  count          spans of that stage
+  p50/p90/p99    duration percentiles in ms
+  max            slowest span in ms
+  share          stage time as a share of the route's total request time
+Stages are span names (routing, parse, h3.latlng_to_cell, cache.get,
+mongo.find_nearest, zones_db.lookup, json.encode, ...). --slowest lists the
+slowest requests with their own stage breakdown.
+
+Usage:
+    python scripts/trace_summary.py
+    python scripts/trace_summary.py /tmp/astr-traces.jsonl --route light-pollution --slowest 5
+"""
+import os
+import sys
+import glob
+import json
+import argparse
+import tempfile
+from collections import defaultdict
+
+import numpy as np
+
+DEFAULT_FILE = os.getenv('TRACE_FILE', os.path.join(tempfile.gettempdir(), 'astr-traces.jsonl'))
+
+
+def read_spans(paths):
+    """Spans grouped by trace id; unreadable lines (e.g. cut by a crash) are skipped"""
+    traces = defaultdict(list)
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    span = json.loads(line)
+                except ValueError:
+                    continue
+                traces[span['trace_id']].append(span)
+    return traces
+
+
+def root_of(spans):
+    """The request span: the one whose parent is not in this trace"""
+    ids = {s['span_id'] for s in spans}
+    roots = [s for s in spans if s['parent_span_id'] not in ids]
+    return max(roots, key=lambda s: s['duration_ms']) if roots else None
+
+
+def stage_table(traces):
+    """{route: (request durations, {stage: durations})}"""
+    routes = defaultdict(lambda: ([], defaultdict(list)))
+    for spans in traces.values():
+        root = root_of(spans)
+        if root is None:
+            continue
+        totals, stages = routes[root['name']]
+        totals.append(root['duration_ms'])
+        for span in spans:
+            if span is not root:
+                stages[span['name']].append(span['duration_ms'])
+    return routes
+
+
+def print_table(route, totals, stages):
+    print(f"\n{route}  ({len(totals)} requests)")
+    print(f"  {'stage':<22} {'count':>7} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9} {'share':>7}")
+    total = sum(totals)
+    rows = [('(request)', totals)] + sorted(stages.items(), key=lambda kv: -sum(kv[1]))
+    for name, durations in rows:
+        p50, p90, p99 = np.percentile(durations, [50, 90, 99])
+        share = sum(durations) / total * 100 if total else 0.0
+        print(f"  {name:<22} {len(durations):>7} {p50:>9.3f} {p90:>9.3f} {p99:>9.3f} "
+              f"{max(durations):>9.3f} {share:>6.1f}%")
+
+
+def print_slowest(traces, n, route):
+    rows = []
+    for trace_id, spans in traces.items():
+        root = root_of(spans)
+        if root is not None and route in root['name']:
+            rows.append((root['duration_ms'], trace_id, root, spans))
+    print(f"\nSlowest {min(n, len(rows))} requests")
+    for duration, trace_id, root, spans in sorted(rows, key=lambda r: -r[0])[:n]:
+        print(f"  {duration:9.3f} ms  {root['name']}  status={root['attributes'].get('http.status_code')}  "
+              f"trace={trace_id}")
+        for span in sorted(spans, key=lambda s: s['start_time_unix_nano']):
+            if span is not root:
+                offset = (span['start_time_unix_nano'] - root['start_time_unix_nano']) / 1e6
+                print(f"      +{offset:8.3f}  {span['duration_ms']:9.3f} ms  {span['name']}"
+                      f"{'  ERROR' if span['status'] != 'OK' else ''}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-stage latency percentiles from trace files')
+    parser.add_argument('files', nargs='*', help=f'Trace files (default {DEFAULT_FILE} and rotations)')
+    parser.add_argument('--route', default='', help='Only routes whose span name contains this')
+    parser.add_argument('--slowest', type=int, default=0, help='Also list the N slowest requests')
+    args = parser.parse_args()
+
+    paths = args.files or sorted(glob.glob(DEFAULT_FILE) + glob.glob(DEFAULT_FILE + '.*'))
+    if not paths:
+        sys.exit(f"No trace files at {DEFAULT_FILE}; run the API with TRACE_SAMPLE_RATE > 0")
+    traces = read_spans(paths)
+    print(f"{sum(len(s) for s in traces.values())} spans in {len(traces)} traces from {len(paths)} file(s)")
+
+    for route, (totals, stages) in sorted(stage_table(traces).items()):
+        if args.route in route:
+            print_table(route, totals, stages)
+    if args.slowest:
+        print_slowest(traces, args.slowest, args.route)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,7 @@ from unittest.mock import patch, MagicMock
 # Add parent directory to path to import api module
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from api.index import app, calculate_bortle_class
+from api.index import app, calculate_bortle_class, lp_cache
 
 class TestHealthEndpoint(unittest.TestCase):
     """Test suite for /api/health endpoint"""
@@ -51,6 +51,7 @@ class TestLightPollutionEndpoint(unittest.TestCase):
         """Set up test client"""
         self.client = app.test_client()
         self.client.testing = True
+        lp_cache.clear()  # mocked databases change between tests
 
     def test_missing_lat_parameter(self):
         """Test endpoint returns 400 when lat parameter is missing"""
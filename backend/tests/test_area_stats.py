@@ -0,0 +1,185 @@
+import unittest
+import sys
+import os
+import time
+import tempfile
+from unittest.mock import patch
+
+import h3
+import numpy as np
+from h3.api import numpy_int as h3_int
+
+# Add parent directory to path to import api module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import api.index as index
+from api.zones_store import ZonesStore
+from api.area_stats import (AreaPyramid, area_stats, descendant_range, polyfill,
+                            shape_from_bbox, shape_from_geojson)
+from tests.test_zones_store import write_zones_db
+
+DEHRADUN = (30.3165, 78.0322)
+
+
+def box(lat, lon, half_km):
+    """[west, south, east, north] of a square of 2 * half_km around a point"""
+    dlat = half_km / 111.2
+    dlon = dlat / np.cos(np.radians(lat))
+    return [lon - dlon, lat - dlat, lon + dlon, lat + dlat]
+
+
+def setUpModule():
+    # A lit city: every res-8 cell of a res-6 cell, brighter towards the centre,
+    # plus a scattering of suburbs in the surrounding res-5 cells
+    global tmp, zones_path
+    rng = np.random.default_rng(7)
+    city = h3_int.latlng_to_cell(*DEHRADUN, 6)
+    rows = {}
+    for cell in np.asarray(h3_int.cell_to_children(city, 8)).tolist():
+        sqm = 18.0 + 0.2 * h3_int.grid_distance(cell, h3_int.latlng_to_cell(*DEHRADUN, 8))
+        rows[cell] = (min(9, max(4, int(25 - sqm))), 40.0, sqm)
+    around = np.asarray(h3_int.grid_disk(h3_int.latlng_to_cell(*DEHRADUN, 5), 3))
+    suburbs = np.concatenate([np.asarray(h3_int.cell_to_children(c, 8)) for c in around.tolist()])
+    for cell in rng.choice(suburbs, 3000, replace=False).tolist():
+        rows.setdefault(cell, (int(rng.integers(2, 6)), 1.0, float(rng.uniform(20.0, 21.9))))
+    tmp = tempfile.TemporaryDirectory()
+    zones_path = os.path.join(tmp.name, 'zones.db')
+    write_zones_db(zones_path, rows)
+
+
+def tearDownModule():
+    tmp.cleanup()
+
+
+class TestAreaStats(unittest.TestCase):
+    """Test suite for area statistics over zones.db ranges and the res-5 pyramid"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.store = ZonesStore(zones_path)
+        cls.pyramid = AreaPyramid(cls.store)
+
+    def brute_force(self, shape):
+        cells = np.asarray(h3_int.h3shape_to_cells(shape, 8), dtype=np.uint64)
+        return self.store.lookup_cells(cells)
+
+    def test_descendant_range(self):
+        pentagon = h3_int.get_pentagons(3)[0]
+        for cell in (h3_int.latlng_to_cell(*DEHRADUN, 3), h3_int.latlng_to_cell(*DEHRADUN, 8), pentagon):
+            children = np.sort(np.asarray(h3_int.cell_to_children(cell, 8), dtype=np.uint64))
+            first, last = descendant_range(np.array([cell], dtype=np.uint64), 8)
+            self.assertEqual((first[0], last[0]), (children[0], children[-1]))
+
+    def test_pyramid(self):
+        counts = self.pyramid.counts.sum(axis=1)
+        self.assertEqual(int(counts.sum()), len(self.store.cells))
+        for i in range(len(self.pyramid.cells)):
+            parent = int(self.pyramid.cells[i])
+            inside = np.array([h3_int.cell_to_parent(c, 5) == parent for c in self.store.cells.tolist()])
+            sqm = self.store.records['sqm'][inside]
+            self.assertEqual(counts[i], inside.sum())
+            self.assertAlmostEqual(self.pyramid.sqm_min[i], sqm.min(), places=5)
+            self.assertEqual(self.store.lookup_cells(self.pyramid.max_cell[i:i + 1])['sqm'][0], sqm.max())
+
+    def test_matches_brute_force(self):
+        """Compacted ranges (pyramid interior, raw boundary) agree with a full res-8 polyfill"""
+        shape = shape_from_bbox(box(*DEHRADUN, 60))
+        cells = polyfill(shape, 8)
+        self.assertTrue((np.array([h3_int.get_resolution(c) for c in cells.tolist()]) <= 5).any())
+        result = area_stats(self.store, self.pyramid, cells)
+        full = self.brute_force(shape)
+        self.assertEqual(result['cells'], len(full['zone']))
+        self.assertAlmostEqual(result['mean_sqm'], float(full['sqm'].mean()), delta=0.02)
+        for zone in range(1, 10):
+            fraction = result['zones'].get(str(zone), {"fraction": 0.0})['fraction']
+            self.assertAlmostEqual(fraction, float((full['zone'] == zone).mean()), delta=0.002)
+        self.assertAlmostEqual(result['brightest']['sqm'], float(full['sqm'].min()), places=2)
+        self.assertEqual(result['brightest']['bortle_class'], 7)
+        # Unlit cells in the area: the darkest is an implicit one
+        darkest = result['darkest']
+        self.assertEqual((darkest['sqm'], darkest['bortle_class']), (22.0, 1))
+        self.assertTrue(self.store.lookup_cells(np.array([h3.str_to_int(darkest['h3'])], dtype=np.uint64))['implicit'][0])
+
+    def test_all_lit(self):
+        """An area inside the city has no implicit cells: darkest comes from zones.db"""
+        shape = shape_from_geojson({"type": "Feature", "geometry": h3.cells_to_geo(
+            [h3.latlng_to_cell(*DEHRADUN, 7)])})
+        result = area_stats(self.store, self.pyramid, polyfill(shape, 8))
+        full = self.brute_force(shape)
+        self.assertNotIn('1', result['zones'])
+        self.assertAlmostEqual(result['darkest']['sqm'], float(full['sqm'].max()), places=2)
+
+    def test_tiny_polygon(self):
+        """A polygon smaller than a res-8 cell still reports the cell it lies in"""
+        result = area_stats(self.store, self.pyramid, polyfill(shape_from_bbox(box(*DEHRADUN, 0.05)), 8))
+        self.assertEqual(result['cells'], 1)
+        self.assertEqual(result['brightest']['h3'], h3.latlng_to_cell(*DEHRADUN, 8))
+
+    def test_latency(self):
+        """100 x 100 km answers well inside 200 ms"""
+        shape = shape_from_bbox(box(*DEHRADUN, 50))
+        area_stats(self.store, self.pyramid, polyfill(shape, 8))
+        elapsed = []
+        for _ in range(3):
+            start = time.perf_counter()
+            area_stats(self.store, self.pyramid, polyfill(shape, 8))
+            elapsed.append(time.perf_counter() - start)
+        self.assertLess(min(elapsed), 0.2)
+
+
+class TestAreaStatsEndpoint(unittest.TestCase):
+    """Test suite for POST /api/area-stats"""
+
+    def setUp(self):
+        self.client = index.app.test_client()
+        self.client.testing = True
+        self.saved = (index.ZONES_DB_PATH, index.zones_store, index.area_pyramid)
+        index.ZONES_DB_PATH, index.zones_store, index.area_pyramid = zones_path, None, None
+
+    def tearDown(self):
+        index.ZONES_DB_PATH, index.zones_store, index.area_pyramid = self.saved
+
+    def post(self, body):
+        return self.client.post('/api/area-stats', json=body)
+
+    def test_bbox(self):
+        response = self.post({"bbox": box(*DEHRADUN, 50)})
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual((data['resolution'], data['approximate']), (8, False))
+        self.assertAlmostEqual(data['area_km2'], 10000, delta=300)
+        self.assertAlmostEqual(sum(z['fraction'] for z in data['zones'].values()), 1.0, places=3)
+
+    def test_geojson(self):
+        west, south, east, north = box(*DEHRADUN, 50)
+        ring = [[west, south], [east, south], [east, north], [west, north], [west, south]]
+        data = self.post({"geometry": {"type": "Polygon", "coordinates": [ring]}}).get_json()
+        self.assertEqual(data, self.post({"bbox": [west, south, east, north]}).get_json())
+
+    def test_coarse_fill(self):
+        with patch.object(index, 'MAX_AREA_CELLS', 1000):
+            data = self.post({"bbox": box(*DEHRADUN, 50)}).get_json()
+        self.assertTrue(data['approximate'])
+        self.assertLess(data['resolution'], 8)
+
+    def test_antimeridian(self):
+        data = self.post({"bbox": [179.5, -17.0, -179.5, -16.0]}).get_json()
+        self.assertAlmostEqual(data['area_km2'], 111.2 ** 2 * np.cos(np.radians(16.5)), delta=300)
+        self.assertEqual(data['zones'], {"1": {"area_km2": data['area_km2'], "fraction": 1.0}})
+
+    def test_invalid(self):
+        for body in ({}, {"bbox": [1, 2, 3]}, {"bbox": [0, 10, 1, 5]}, {"bbox": [0, 0, 1, 1], "geometry": {}},
+                     {"geometry": {"type": "Point", "coordinates": [0, 0]}},
+                     {"geometry": {"type": "Polygon", "coordinates": [[["a", "b"]]]}},
+                     {"geometry": {"type": "Polygon", "coordinates": [[[0, 0], [0, 95], [1, 95], [0, 0]]]}}):
+            response = self.post(body)
+            self.assertEqual(response.status_code, 400, body)
+        self.assertEqual(self.post({"bbox": [-180, -80, 180, 80]}).status_code, 413)
+
+    def test_unavailable(self):
+        index.ZONES_DB_PATH = os.path.join(tmp.name, 'missing.db')
+        self.assertEqual(self.post({"bbox": box(*DEHRADUN, 10)}).status_code, 503)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+import unittest
+import sys
+import os
+import json
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+from urllib.parse import urlsplit
+
+# Add parent directory to path to import api module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import api.index as index
+
+try:
+    from pymongo.errors import ServerSelectionTimeoutError
+except ImportError:
+    ServerSelectionTimeoutError = None
+
+try:
+    import api.asgi as asgi
+except ImportError:  # starlette / motor / a2wsgi not installed
+    asgi = None
+
+DEHRADUN = (30.3165, 78.0322)
+DEHRADUN_NEARBY = (30.3168, 78.0324)
+HANLE = (32.7795, 78.9641)
+
+
+def call(app, method, url, body=None, headers=None):
+    """Run one HTTP request through an ASGI app; returns (status, headers, body bytes)"""
+    parts = urlsplit(url)
+    payload = json.dumps(body).encode() if body is not None else b''
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': method, 'scheme': 'http', 'path': parts.path, 'raw_path': parts.path.encode(),
+        'query_string': parts.query.encode(), 'root_path': '',
+        'headers': [(k.lower().encode(), v.encode()) for k, v in
+                    {'host': 'test', 'content-type': 'application/json',
+                     'content-length': str(len(payload)), **(headers or {})}.items()],
+        'client': ('127.0.0.1', 1234), 'server': ('test', 80),
+    }
+    received = {'status': None, 'headers': {}, 'body': b''}
+
+    async def receive():
+        return {'type': 'http.request', 'body': payload, 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            received['status'] = message['status']
+            received['headers'] = {k.decode().lower(): v.decode() for k, v in message['headers']}
+        elif message['type'] == 'http.response.body':
+            received['body'] += message.get('body', b'')
+
+    asyncio.run(app(scope, receive, send))
+    return received['status'], received['headers'], received['body']
+
+
+@unittest.skipIf(asgi is None, "ASGI dependencies not installed (requirements-asgi.txt)")
+@unittest.skipIf(index.LP_BACKEND == 'zones_db', "Async routes are only mounted for the MongoDB backend")
+class TestAsgiLightPollution(unittest.TestCase):
+    """Test suite for the async MongoDB routes in api/asgi.py"""
+
+    def setUp(self):
+        self.db = MagicMock()
+        self.db.light_pollution.find_one = AsyncMock(return_value={"mpsas": 20.1})
+        self.saved = asgi.mongo.db
+        asgi.mongo.db = self.db
+        index.lp_cache.clear()
+
+    def tearDown(self):
+        asgi.mongo.db = self.saved
+        index.lp_cache.clear()
+
+    def get(self, point, headers=None):
+        return call(asgi.app, 'GET', f'/api/light-pollution?lat={point[0]}&lon={point[1]}', headers=headers)
+
+    def test_same_response_as_flask(self):
+        status, headers, body = self.get(DEHRADUN)
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body), {"lat": DEHRADUN[0], "lon": DEHRADUN[1], "mpsas": 20.1,
+                                            "bortle_class": index.calculate_bortle_class(20.1),
+                                            "fallback": False})
+        self.assertIn('public', headers['cache-control'])
+
+    def test_validation(self):
+        self.assertEqual(call(asgi.app, 'GET', '/api/light-pollution?lat=abc&lon=1')[0], 400)
+        self.assertEqual(call(asgi.app, 'GET', '/api/light-pollution?lat=95&lon=1')[0], 400)
+
+    def test_cached_and_conditional(self):
+        """Shares the per-cell cache and answers If-None-Match with 304"""
+        etag = self.get(DEHRADUN)[1]['etag']
+        self.assertEqual(self.get(DEHRADUN_NEARBY)[1]['etag'], etag)
+        self.assertEqual(self.db.light_pollution.find_one.await_count, 1)
+        self.assertEqual(self.get(DEHRADUN, headers={'If-None-Match': etag})[0], 304)
+
+    def test_fallback(self):
+        """No document, a failed query or no client all give the fallback body"""
+        self.db.light_pollution.find_one.return_value = None
+        self.assertEqual(json.loads(self.get(HANLE)[2])['error'], index.MONGO_NO_DATA[0])
+        self.db.light_pollution.find_one.side_effect = RuntimeError("timeout")
+        self.assertEqual(json.loads(self.get(HANLE)[2])['error'], "Query failed")
+        asgi.mongo.db = None
+        data = json.loads(self.get(HANLE)[2])
+        self.assertTrue(data['fallback'])
+        self.assertEqual(data['error'], index.MONGO_UNAVAILABLE[0])
+
+    def test_batch_queries_distinct_cells_concurrently(self):
+        in_flight = peak = 0
+
+        async def find_one(query):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return {"mpsas": 21.5}
+
+        self.db.light_pollution.find_one = find_one
+        points = [list(DEHRADUN), list(DEHRADUN_NEARBY)] + [[10 + i, 20 + i] for i in range(40)]
+        status, _, body = call(asgi.app, 'POST', '/api/light-pollution/batch', {"points": points})
+        data = json.loads(body)
+        self.assertEqual(status, 200)
+        self.assertEqual(data['count'], 42)
+        self.assertTrue(all(r['mpsas'] == 21.5 for r in data['results']))
+        self.assertEqual(index.lp_cache.stats()['size'], 41)
+        self.assertGreater(peak, 1)
+        self.assertLessEqual(peak, asgi.MONGO_BATCH_CONCURRENCY)
+
+    def test_batch_validation(self):
+        status = call(asgi.app, 'POST', '/api/light-pollution/batch', {"points": [[95, 0]]})[0]
+        self.assertEqual(status, 400)
+
+    @unittest.skipIf(ServerSelectionTimeoutError is None, "pymongo not installed")
+    def test_connection_error_opens_circuit(self):
+        """A connection error trips index.mongo_breaker; requests then skip MongoDB for local data"""
+        local = {"mpsas": 21.2, "bortle_class": 3, "fallback": False, "approximate": True}
+        self.db.light_pollution.find_one.side_effect = ServerSelectionTimeoutError("timed out")
+        # Keep the breaker's probe thread asleep for the whole test
+        with patch.object(index.mongo_breaker, 'base_delay', 60), \
+                patch.object(index, 'local_entries', side_effect=lambda cells: [local] * len(cells)):
+            self.addCleanup(index.mongo_breaker.reset)
+            self.assertEqual(json.loads(self.get(HANLE)[2]), {"lat": HANLE[0], "lon": HANLE[1], **local})
+            self.assertFalse(index.mongo_breaker.allow())
+            self.assertEqual(json.loads(self.get(DEHRADUN)[2])['mpsas'], 21.2)
+            status, _, body = call(asgi.app, 'POST', '/api/light-pollution/batch', {"points": [list(DEHRADUN)]})
+            self.assertEqual(json.loads(body)['results'][0]['bortle_class'], 3)
+            health = json.loads(call(asgi.app, 'GET', '/api/health')[2])
+        self.assertEqual(self.db.light_pollution.find_one.await_count, 1)
+        self.assertEqual((health['database'], health['circuit']['state']), ('disconnected', 'open'))
+
+    def test_other_routes_served_by_flask(self):
+        status, _, body = call(asgi.app, 'GET', '/')
+        self.assertEqual(status, 200)
+        self.assertEqual(body, index.app.test_client().get('/').data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import unittest
+import sys
+import os
+import tempfile
+from unittest.mock import patch, MagicMock
+
+import h3
+
+# Add parent directory to path to import api module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import api.index as index
+from tests.test_zones_store import write_zones_db, write_dark_distance
+
+DEHRADUN = (30.3165, 78.0322)
+HANLE = (32.7795, 78.9641)
+
+
+class TestBatchValidation(unittest.TestCase):
+    """Test suite for /api/light-pollution/batch request validation"""
+
+    def setUp(self):
+        self.client = index.app.test_client()
+        self.client.testing = True
+
+    def post(self, body):
+        return self.client.post('/api/light-pollution/batch', json=body)
+
+    def test_missing_points(self):
+        """Body without 'points' returns 400"""
+        self.assertEqual(self.post({}).status_code, 400)
+        self.assertEqual(self.client.post('/api/light-pollution/batch', data='x').status_code, 400)
+
+    def test_malformed_points(self):
+        """Points that are not [lat, lon] pairs return 400"""
+        for points in ([[1.0, 2.0, 3.0]], [[1.0, 2.0], [3.0]], [1.0, 2.0], [["a", "b"]]):
+            response = self.post({"points": points})
+            self.assertEqual(response.status_code, 400, points)
+            self.assertEqual(response.get_json()['error'], 'Invalid points')
+
+    def test_out_of_range_reports_index(self):
+        """First invalid coordinate is named by its index"""
+        response = self.post({"points": [[10, 10], [10, 10], [91, 10]]})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('point 2', response.get_json()['message'])
+
+        response = self.post({"points": [[10, -181]]})
+        self.assertEqual(response.get_json()['error'], 'Invalid longitude')
+
+    def test_too_many_points(self):
+        """Batches over MAX_BATCH_POINTS return 413"""
+        with patch.object(index, 'MAX_BATCH_POINTS', 2):
+            response = self.post({"points": [[0, 0]] * 3})
+        self.assertEqual(response.status_code, 413)
+
+    @patch('api.index.get_db')
+    def test_empty_batch(self, mock_get_db):
+        """An empty list is valid and returns no results"""
+        mock_get_db.return_value = None
+        data = self.post({"points": []}).get_json()
+        self.assertEqual(data['count'], 0)
+        self.assertEqual(data['results'], [])
+
+
+class TestBatchZonesBackend(unittest.TestCase):
+    """Test suite for batch lookups served from zones.db"""
+
+    def setUp(self):
+        self.client = index.app.test_client()
+        self.client.testing = True
+        self.tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(self.tmp.name, 'zones.db')
+        write_zones_db(path, {h3.str_to_int(h3.latlng_to_cell(*DEHRADUN, 8)): (7, 40.0, 18.7)})
+        self.saved = (index.LP_BACKEND, index.ZONES_DB_PATH, index.zones_store)
+        index.LP_BACKEND = 'zones_db'
+        index.ZONES_DB_PATH = path
+        index.zones_store = None
+
+    def tearDown(self):
+        index.LP_BACKEND, index.ZONES_DB_PATH, index.zones_store = self.saved
+        self.tmp.cleanup()
+
+    def test_results_in_input_order(self):
+        """Batch results match single lookups, in input order"""
+        points = [list(HANLE), list(DEHRADUN), list(HANLE)]
+        data = self.client.post('/api/light-pollution/batch', json={"points": points}).get_json()
+        self.assertEqual(data['count'], 3)
+        self.assertEqual([r['bortle_class'] for r in data['results']], [1, 7, 1])
+        self.assertEqual([r['implicit'] for r in data['results']], [True, False, True])
+        self.assertEqual(data['results'][1]['lat'], DEHRADUN[0])
+
+        single = self.client.get(f'/api/light-pollution?lat={DEHRADUN[0]}&lon={DEHRADUN[1]}').get_json()
+        for key in ('mpsas', 'bortle_class', 'h3', 'implicit', 'fallback'):
+            self.assertEqual(data['results'][1][key], single[key])
+
+    def test_nearest_dark_per_point(self):
+        """Sidecar distances are attached to every batch result"""
+        sidecar = os.path.join(self.tmp.name, 'dark_distance.db')
+        write_dark_distance(sidecar, [([250, 180, 41], [64, 64, 128])])
+        with patch.object(index, 'DARK_DISTANCE_PATH', sidecar):
+            data = self.client.post('/api/light-pollution/batch',
+                                    json={"points": [list(DEHRADUN), list(HANLE)]}).get_json()
+        self.assertEqual(data['results'][0]['nearest_dark']['2'], {"distance_km": 25.0, "bearing_deg": 90.0})
+        self.assertEqual(data['results'][1]['nearest_dark']['2']['distance_km'], 0.0)
+
+    def test_missing_file_falls_back_per_point(self):
+        """Without zones.db every point carries the fallback flag"""
+        index.ZONES_DB_PATH = os.path.join(self.tmp.name, 'absent.db')
+        data = self.client.post('/api/light-pollution/batch',
+                                json={"points": [list(DEHRADUN), list(HANLE)]}).get_json()
+        self.assertTrue(all(r['fallback'] for r in data['results']))
+
+
+class TestBatchMongoBackend(unittest.TestCase):
+    """Test suite for batch lookups against MongoDB"""
+
+    def setUp(self):
+        self.client = index.app.test_client()
+        self.client.testing = True
+        index.lp_cache.clear()  # mocked databases change between tests
+
+    @patch('api.index.get_db')
+    def test_per_point_fallback(self, mock_get_db):
+        """Points without a nearby document fall back individually"""
+        mock_db = MagicMock()
+        mock_db.light_pollution.find_one.side_effect = (
+            lambda query: {"mpsas": 21.5} if query["location"]["$near"]["$geometry"]["coordinates"][1] > 31 else None)
+        mock_get_db.return_value = mock_db
+
+        points = [list(HANLE), list(DEHRADUN), list(HANLE)]
+        data = self.client.post('/api/light-pollution/batch', json={"points": points}).get_json()
+        self.assertEqual([r['fallback'] for r in data['results']], [False, True, False])
+        self.assertEqual(data['results'][0]['mpsas'], 21.5)
+        # Duplicate coordinates are queried once
+        self.assertEqual(mock_db.light_pollution.find_one.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,165 @@
+import unittest
+import sys
+import os
+import json
+import tempfile
+from pathlib import Path
+from unittest.mock import patch
+
+# Add the repository's scripts directory to path to import the pipeline scripts
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'scripts')))
+
+import build_pipeline
+from build_pipeline import Pipeline, Stage
+
+# Stub stage: records that it ran, then writes its output from its inputs;
+# exits 1 while a fail-<name> file exists
+STUB = '''
+import sys
+from pathlib import Path
+name, out, *inputs = sys.argv[1:]
+with open('runs.log', 'a') as f:
+    f.write(name + '\\n')
+if Path('fail-' + name).exists():
+    sys.exit(1)
+Path(out).write_text(name + ':' + '|'.join(Path(p).read_text() for p in inputs))
+'''
+
+
+class TestBuildPipeline(unittest.TestCase):
+    """Test suite for the incremental stage runner, with stub stages
+
+        a ──> b ──> c
+        └───> d (also reads extra.txt)
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        (self.dir / 'stage.py').write_text(STUB)
+        self.source = self.dir / 'source.txt'
+        self.extra = self.dir / 'extra.txt'
+        self.source.write_text('v1')
+        self.extra.write_text('x1')
+        self.build_dir = self.dir / 'build'
+        patcher = patch.object(build_pipeline, 'SCRIPT_DIR', self.dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def out(self, name):
+        return self.dir / f'{name}.out'
+
+    def stages(self):
+        def stage(name, inputs, deps=()):
+            return Stage(name, 'stage.py', [name, str(self.out(name)), *map(str, inputs)], deps=deps,
+                         inputs=[p for p in inputs if not p.name.endswith('.out')], outputs=[self.out(name)])
+        return [
+            stage('a', [self.source]),
+            stage('b', [self.out('a')], ('a',)),
+            stage('c', [self.out('b')], ('b',)),
+            stage('d', [self.out('a'), self.extra], ('a',)),
+        ]
+
+    def build(self, stages=None, **kwargs):
+        """Run the pipeline; returns (ok, stages that ran, status per stage)"""
+        log = self.dir / 'runs.log'
+        if log.exists():
+            log.unlink()
+        pipeline = Pipeline(stages or self.stages(), self.build_dir, **kwargs)
+        ok = pipeline.run()
+        ran = log.read_text().split() if log.exists() else []
+        return ok, sorted(ran), {name: r['status'] for name, r in pipeline.results.items()}
+
+    def state(self):
+        with open(self.build_dir / 'state.json') as f:
+            return json.load(f)
+
+    def test_unchanged_inputs_skip(self):
+        """Test that a second run with unchanged inputs runs nothing"""
+        ok, ran, _ = self.build()
+        self.assertTrue(ok)
+        self.assertEqual(ran, ['a', 'b', 'c', 'd'])
+        self.assertEqual(self.out('c').read_text(), 'c:b:a:v1')
+
+        ok, ran, status = self.build()
+        self.assertTrue(ok)
+        self.assertEqual(ran, [])
+        self.assertEqual(set(status.values()), {'cached'})
+
+    def test_changed_input_reruns_downstream_only(self):
+        """Test that a changed input reruns only the stages downstream of it"""
+        self.build()
+        self.extra.write_text('x2')
+        _, ran, status = self.build()
+        self.assertEqual(ran, ['d'])
+        self.assertEqual(status, {'a': 'cached', 'b': 'cached', 'c': 'cached', 'd': 'built'})
+
+        self.source.write_text('v2')
+        _, ran, _ = self.build()
+        self.assertEqual(ran, ['a', 'b', 'c', 'd'])
+
+        # A removed output rebuilds its stage; unchanged content stops the rebuild there
+        self.out('b').unlink()
+        _, ran, status = self.build()
+        self.assertEqual(ran, ['b'])
+        self.assertEqual(status['c'], 'cached')
+
+    def test_dry_run(self):
+        """Test that a dry run plans the rebuild without running it"""
+        self.build()
+        self.source.write_text('v2')
+        ok, ran, status = self.build(dry_run=True)
+        self.assertTrue(ok)
+        self.assertEqual(ran, [])
+        self.assertEqual(set(status.values()), {'planned'})
+
+    def test_no_output_dependency(self):
+        """Test that a change upstream of a stage without outputs reaches its dependents"""
+        # a ──> check (no outputs, like validate) ──> publish (like upload)
+        stages = self.stages()[:1] + [
+            Stage('check', 'stage.py', ['check', str(self.dir / 'check.txt'), str(self.out('a'))], deps=('a',)),
+            Stage('publish', 'stage.py', ['publish', str(self.out('publish'))], deps=('check',),
+                  outputs=[self.out('publish')]),
+        ]
+        self.build(stages)
+        _, ran, _ = self.build(stages)
+        self.assertEqual(ran, [])
+
+        self.source.write_text('v2')
+        _, ran, status = self.build(stages)
+        self.assertEqual(ran, ['a', 'check', 'publish'])
+        self.assertEqual(status['publish'], 'built')
+
+    def test_failed_stage_keeps_state_consistent(self):
+        """Test that a failed stage keeps its last good record and reruns once fixed"""
+        self.build()
+        before = self.state()['stages']
+        self.source.write_text('v2')
+        (self.dir / 'fail-b').touch()
+        ok, ran, status = self.build()
+        self.assertFalse(ok)
+        self.assertEqual(ran, ['a', 'b', 'd'])
+        self.assertEqual(status, {'a': 'built', 'b': 'failed', 'c': 'blocked', 'd': 'built'})
+
+        # Built stages are recorded; the failed and blocked ones keep their last good record
+        after = self.state()['stages']
+        self.assertNotEqual(after['a']['key'], before['a']['key'])
+        self.assertNotEqual(after['d']['key'], before['d']['key'])
+        self.assertEqual(after['b'], before['b'])
+        self.assertEqual(after['c'], before['c'])
+        with open(self.build_dir / 'manifest.json') as f:
+            self.assertEqual(json.load(f)['stages']['b']['status'], 'failed')
+
+        # Once the failure is fixed, only the failed stage and what it blocked run
+        (self.dir / 'fail-b').unlink()
+        ok, ran, _ = self.build()
+        self.assertTrue(ok)
+        self.assertEqual(ran, ['b', 'c'])
+        self.assertEqual(self.out('c').read_text(), 'c:b:a:v2')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+import unittest
+import sys
+import os
+import tempfile
+import threading
+from unittest.mock import patch, MagicMock
+
+import h3
+from pymongo.errors import ServerSelectionTimeoutError, AutoReconnect
+
+# Add parent directory to path to import api module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import api.index as index
+from api.circuit_breaker import CircuitBreaker
+from tests.test_zones_store import write_zones_db
+
+DEHRADUN = (30.3165, 78.0322)
+HANLE = (32.7795, 78.9641)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """Test suite for the breaker state machine"""
+
+    def test_probes_with_backoff_until_success(self):
+        attempts = []
+        closed = threading.Event()
+
+        def probe():
+            attempts.append(breaker.stats()['next_probe_in_s'])
+            if len(attempts) < 3:
+                raise ConnectionError("still down")
+            closed.set()
+
+        breaker = CircuitBreaker(probe, base_delay=0.01, max_delay=0.02)
+        self.assertTrue(breaker.allow())
+        breaker.trip(ConnectionError("down"))
+        self.assertFalse(breaker.allow())
+        self.assertEqual(breaker.stats()['state'], 'open')
+        self.assertTrue(closed.wait(5))
+        for _ in range(100):
+            if breaker.allow():
+                break
+            closed.wait(0.01)
+        stats = breaker.stats()
+        self.assertEqual((stats['state'], stats['trips'], stats['probes']), ('closed', 1, 3))
+        self.assertIn('still down', stats['last_error'])
+
+    def test_backoff_doubles_to_max(self):
+        waits = []
+        breaker = CircuitBreaker(MagicMock(side_effect=OSError), base_delay=1, max_delay=4)
+        # Record the delays instead of sleeping; stop after five probes
+        breaker.wake = MagicMock()
+        breaker.wake.wait.side_effect = lambda delay: waits.append(delay) or len(waits) > 5
+        breaker.state = 'open'
+        breaker._reconnect()
+        self.assertEqual(waits, [1, 2, 4, 4, 4, 4])
+
+    def test_trip_while_open_starts_no_second_probe(self):
+        breaker = CircuitBreaker(MagicMock(), base_delay=60)
+        with patch('api.circuit_breaker.threading.Thread') as thread:
+            breaker.trip(OSError("a"))
+            breaker.trip(OSError("b"))
+        thread.assert_called_once()
+        self.assertEqual(breaker.stats()['trips'], 1)
+        self.assertIn('b', breaker.stats()['last_error'])
+
+
+class TestMongoCircuit(unittest.TestCase):
+    """Test suite for failing fast to local zones.db while MongoDB is down"""
+
+    def setUp(self):
+        self.client = index.app.test_client()
+        self.client.testing = True
+        self.tmp = tempfile.TemporaryDirectory()
+        self.saved = (index.MONGO_CONNECT, index.MONGO_URI, index.mongo_client, index.db, index.mongo_state,
+                      index.ZONES_DB_PATH, index.zones_store, index.LITE_DB_PATH, index.lite_zones)
+        index.MONGO_CONNECT = 'ping'
+        index.MONGO_URI = 'mongodb://example.invalid'
+        index.mongo_client = index.db = None
+        index.mongo_state = 'idle'
+        index.ZONES_DB_PATH = os.path.join(self.tmp.name, 'zones.db')
+        index.LITE_DB_PATH = os.path.join(self.tmp.name, 'absent.db')
+        index.zones_store = index.lite_zones = None
+        write_zones_db(index.ZONES_DB_PATH, {h3.str_to_int(h3.latlng_to_cell(*DEHRADUN, 8)): (7, 40.0, 18.7)})
+        index.mongo_breaker.reset()
+        index.lp_cache.clear()
+
+        self.mongo = MagicMock()
+        patcher = patch('pymongo.MongoClient', return_value=self.mongo)
+        self.mongo_client_cls = patcher.start()
+        self.addCleanup(patcher.stop)
+        # Keep the breaker's probe thread asleep for the whole test
+        patcher = patch.object(index.mongo_breaker, 'base_delay', 60)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        index.mongo_breaker.reset()
+        index.lp_cache.clear()
+        (index.MONGO_CONNECT, index.MONGO_URI, index.mongo_client, index.db, index.mongo_state,
+         index.ZONES_DB_PATH, index.zones_store, index.LITE_DB_PATH, index.lite_zones) = self.saved
+        self.tmp.cleanup()
+
+    def get(self, point):
+        return self.client.get(f'/api/light-pollution?lat={point[0]}&lon={point[1]}')
+
+    def test_open_circuit_fails_fast_to_zones_db(self):
+        """One failed connection; later requests do not touch MongoDB and use zones.db"""
+        self.mongo.admin.command.side_effect = ServerSelectionTimeoutError("timed out")
+        for _ in range(3):
+            data = self.get(DEHRADUN).get_json()
+            self.assertEqual((data['bortle_class'], data['source']), (7, 'zones_db'))
+            self.assertFalse(data['fallback'])
+        self.assertEqual(self.mongo.admin.command.call_count, 1)
+        self.assertEqual(index.lp_cache.stats()['size'], 0)
+
+        health = self.client.get('/api/health').get_json()
+        self.assertEqual(health['database'], 'disconnected')
+        self.assertEqual(health['circuit']['state'], 'open')
+        self.assertEqual(health['local_fallback'], 'zones_db')
+
+    def test_query_connection_error_trips(self):
+        """A connection error mid-query opens the circuit; other query errors do not"""
+        self.mongo.__getitem__.return_value.light_pollution.find_one.side_effect = RuntimeError("bad query")
+        self.assertEqual(self.get(DEHRADUN).get_json()['error'], "Query failed")
+        self.assertTrue(index.mongo_breaker.allow())
+
+        self.mongo.__getitem__.return_value.light_pollution.find_one.side_effect = AutoReconnect("reset")
+        self.assertEqual(self.get(DEHRADUN).get_json()['source'], 'zones_db')
+        self.assertFalse(index.mongo_breaker.allow())
+
+    def test_batch_outage_midway(self):
+        """Cells after the failure are not queried and come from zones.db"""
+        find_one = self.mongo.__getitem__.return_value.light_pollution.find_one
+        find_one.side_effect = AutoReconnect("reset")
+        data = self.client.post('/api/light-pollution/batch',
+                                json={"points": [list(DEHRADUN), list(HANLE)]}).get_json()
+        self.assertEqual(find_one.call_count, 1)
+        self.assertEqual([r['bortle_class'] for r in data['results']], [7, 1])
+        self.assertTrue(all(r['source'] == 'zones_db' for r in data['results']))
+
+    def test_probe_closes_circuit(self):
+        """A successful probe reconnects with the same client"""
+        self.mongo.admin.command.side_effect = ServerSelectionTimeoutError("timed out")
+        self.get(DEHRADUN)
+        self.mongo.admin.command.side_effect = None
+        # Run the probe loop inline without waiting out the backoff
+        with patch.object(index.mongo_breaker, 'wake', MagicMock(**{'wait.return_value': False})):
+            index.mongo_breaker._reconnect()
+        self.assertEqual(index.mongo_state, 'connected')
+        self.assertIs(index.get_db(), self.mongo['astr'])
+        self.mongo_client_cls.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
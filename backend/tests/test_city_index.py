@@ -0,0 +1,133 @@
+import unittest
+import sys
+import os
+import struct
+import tempfile
+
+import numpy as np
+
+# Add parent directory to path to import api module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import api.index as index
+from api.city_index import CityIndex, CITY_DTYPE, CITY_MAGIC
+
+# (lat, lon, zone, sqm, dark km or None, radius shares per zone): most populous first
+CITIES = [
+    (28.6139, 77.2090, 9, 17.20, 95.0, [0.50, 0, 0.10, 0.10, 0, 0, 0.10, 0.10, 0.10]),   # Delhi
+    (30.3165, 78.0322, 7, 18.71, 18.4, [0.80, 0.10, 0, 0, 0, 0, 0.10, 0, 0]),          # Dehradun
+    (32.7795, 78.9641, 1, 22.00, 0.0, [1.0, 0, 0, 0, 0, 0, 0, 0, 0]),                   # Hanle
+    (19.0760, 72.8777, 9, 17.10, None, [0, 0, 0, 0, 0.2, 0.2, 0.2, 0.2, 0.2]),          # Mumbai
+]
+
+
+def write_city_index(path, cities, max_zone=3, radius_km=100.0):
+    records = np.zeros(len(cities), dtype=CITY_DTYPE)
+    for i, (lat, lon, zone, sqm, dark_km, shares) in enumerate(cities):
+        dark = (np.nan, np.nan, np.nan) if dark_km is None else (lat - dark_km / 111.2, lon, dark_km)
+        records[i] = (lat, lon, zone, zone, sqm, *dark, sqm + 1.0, np.rint(np.array(shares) * 10000))
+    with open(path, 'wb') as f:
+        f.write(CITY_MAGIC + struct.pack('<HBBfI', 1, max_zone, 0, radius_km, len(records)))
+        records.tofile(f)
+
+
+class TestCityIndex(unittest.TestCase):
+    """Test suite for the in-memory city index"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.path = os.path.join(cls.tmp.name, 'city_index.db')
+        write_city_index(cls.path, CITIES)
+        cls.cities = CityIndex(cls.path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def ids(self, order, **kwargs):
+        return [c['id'] for c in self.cities.ranking(order, 10, **kwargs)[0]]
+
+    def test_city(self):
+        city = self.cities.city(1)
+        self.assertEqual((city['bortle_class'], city['sqm'], city['max_bortle']), (7, 18.71, 3))
+        self.assertEqual(city['nearest_dark']['distance_km'], 18.4)
+        self.assertEqual(city['radius']['zones'], {"1": 0.8, "2": 0.1, "7": 0.1})
+        self.assertEqual((city['radius']['dark_share'], city['radius']['darkest_bortle']), (0.9, 1))
+        self.assertIsNone(self.cities.city(3)['nearest_dark'])
+        self.assertEqual(self.cities.city(3)['radius']['darkest_bortle'], 5)
+
+    def test_rankings(self):
+        self.assertEqual(self.ids('darkest'), [2, 1, 0, 3])
+        self.assertEqual(self.ids('brightest'), [3, 0, 1, 2])
+        # Unknown distances rank last
+        self.assertEqual(self.ids('nearest_dark'), [2, 1, 0, 3])
+        self.assertEqual(self.ids('dark_share'), [2, 1, 0, 3])
+        # Ties keep population order; top keeps the most populous cities only
+        self.assertEqual(self.ids('brightest', top=2), [0, 1])
+        cities, total = self.cities.ranking('darkest', 1, offset=1)
+        self.assertEqual(([c['id'] for c in cities], total), ([1], 4))
+
+    def test_nearest(self):
+        city_id, distance_km = self.cities.nearest(30.4, 78.1)
+        self.assertEqual(city_id, 1)
+        self.assertAlmostEqual(distance_km, 11.4, delta=0.5)
+        city_id, distance_km = self.cities.nearest(*CITIES[2][:2])
+        self.assertEqual(city_id, 2)
+        self.assertLess(distance_km, 0.01)
+
+    def test_not_an_index(self):
+        path = os.path.join(self.tmp.name, 'other.db')
+        with open(path, 'wb') as f:
+            f.write(b'ASTR' + bytes(12))
+        with self.assertRaises(ValueError):
+            CityIndex(path)
+
+
+class TestCityEndpoints(unittest.TestCase):
+    """Test suite for /api/city-darkness and /api/city-ranking"""
+
+    def setUp(self):
+        self.client = index.app.test_client()
+        self.client.testing = True
+        self.tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(self.tmp.name, 'city_index.db')
+        write_city_index(path, CITIES)
+        self.saved = (index.CITY_INDEX_PATH, index.city_index)
+        index.CITY_INDEX_PATH, index.city_index = path, None
+
+    def tearDown(self):
+        index.CITY_INDEX_PATH, index.city_index = self.saved
+        self.tmp.cleanup()
+
+    def test_darkness_by_id(self):
+        response = self.client.get('/api/city-darkness?city=2')
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual((data['id'], data['bortle_class'], data['nearest_dark']['distance_km']), (2, 1, 0.0))
+
+    def test_darkness_nearest_city(self):
+        data = self.client.get('/api/city-darkness?lat=19.1&lon=72.9').get_json()
+        self.assertEqual(data['id'], 3)
+        self.assertLess(data['distance_km'], 5)
+
+    def test_ranking(self):
+        data = self.client.get('/api/city-ranking?order=darkest&limit=2').get_json()
+        self.assertEqual((data['total'], [c['id'] for c in data['cities']]), (4, [2, 1]))
+        data = self.client.get('/api/city-ranking?order=brightest&top=2').get_json()
+        self.assertEqual([c['id'] for c in data['cities']], [0, 1])
+
+    def test_invalid(self):
+        for url in ('/api/city-darkness', '/api/city-darkness?city=4', '/api/city-darkness?city=x',
+                    '/api/city-ranking?order=widest', '/api/city-ranking?limit=0', '/api/city-ranking?limit=500',
+                    '/api/city-ranking?offset=-1', '/api/city-ranking?top=0'):
+            self.assertEqual(self.client.get(url).status_code, 400, url)
+
+    def test_unavailable(self):
+        index.CITY_INDEX_PATH = os.path.join(self.tmp.name, 'missing.db')
+        self.assertEqual(self.client.get('/api/city-darkness?city=0').status_code, 503)
+        self.assertEqual(self.client.get('/api/city-ranking').status_code, 503)
+
+
+if __name__ == '__main__':
+    unittest.main()
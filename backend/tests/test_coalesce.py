@@ -0,0 +1,202 @@
+import unittest
+import sys
+import os
+import time
+import asyncio
+import threading
+from unittest.mock import patch, MagicMock
+
+# Add parent directory to path to import api module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import api.index as index
+from api.coalesce import MicroBatcher, AsyncMicroBatcher
+from tests.test_h3_collection import FakeH3Collection, cell_of, DEHRADUN
+
+
+class Backend:
+    """resolve_many recording each batch; blocks until released when gated"""
+
+    def __init__(self, gated=False):
+        self.calls = []
+        self.started = threading.Semaphore(0)
+        self.release = threading.Event()
+        if not gated:
+            self.release.set()
+
+    def __call__(self, keys, *args):
+        self.calls.append(list(keys))
+        self.started.release()
+        self.release.wait(5)
+        if 'boom' in keys:
+            raise ConnectionError('boom')
+        return [f'{k}:{len(keys)}' for k in keys]
+
+
+def run_threads(fn, args):
+    results = [None] * len(args)
+
+    def worker(i):
+        try:
+            results[i] = fn(args[i])
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(args))]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.001)
+
+
+class TestMicroBatcher(unittest.TestCase):
+    """Test suite for single-flight and micro-batching across threads"""
+
+    def test_single_flight(self):
+        backend = Backend(gated=True)
+        batcher = MicroBatcher(backend, window=0.01)
+        threads, results = run_threads(batcher.get, ['a'] * 8)
+        self.assertTrue(backend.started.acquire(timeout=5))
+        wait_for(lambda: batcher.requests == 8)
+        backend.release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(backend.calls, [['a']])
+        self.assertEqual(results, ['a:1'] * 8)
+        self.assertEqual((batcher.coalesced, batcher.batches), (7, 1))
+        self.assertEqual(batcher.stats()['in_flight'], 0)
+
+    def test_distinct_keys_batched_while_busy(self):
+        """Keys arriving while a batch is in flight share the next query, closed early at max_batch"""
+        backend = Backend(gated=True)
+        sizes = []
+        batcher = MicroBatcher(backend, window=5.0, max_batch=3, on_batch=sizes.append)
+        first, _ = run_threads(batcher.get, ['a'])
+        self.assertTrue(backend.started.acquire(timeout=5))
+        threads, results = run_threads(batcher.get, ['b', 'c', 'd', 'b'])
+        self.assertTrue(backend.started.acquire(timeout=5))
+        self.assertEqual(backend.calls, [['a'], ['b', 'c', 'd']])
+        backend.release.set()
+        for thread in first + threads:
+            thread.join()
+        self.assertEqual(results, ['b:3', 'c:3', 'd:3', 'b:3'])
+        self.assertEqual(sorted(sizes), [1, 3])
+        self.assertEqual(batcher.coalesced, 1)
+
+    def test_idle_resolves_at_once(self):
+        batcher = MicroBatcher(Backend(), window=5.0)
+        start = time.monotonic()
+        self.assertEqual(batcher.get('a'), 'a:1')
+        self.assertLess(time.monotonic() - start, 1.0)
+
+    def test_error_reaches_every_waiter(self):
+        backend = Backend(gated=True)
+        batcher = MicroBatcher(backend)
+        threads, results = run_threads(batcher.get, ['boom'] * 3)
+        wait_for(lambda: batcher.requests == 3)
+        backend.release.set()
+        for thread in threads:
+            thread.join()
+        self.assertTrue(all(isinstance(r, ConnectionError) for r in results))
+        # The failed lookup is not remembered
+        self.assertEqual(batcher.get('a'), 'a:1')
+        self.assertEqual(len(backend.calls), 2)
+
+    def test_leader_args(self):
+        batcher = MicroBatcher(lambda keys, db: [db[k] for k in keys])
+        self.assertEqual(batcher.get('a', {'a': 1}), 1)
+
+
+class TestAsyncMicroBatcher(unittest.TestCase):
+    """Test suite for the asyncio batcher"""
+
+    def test_coalesce_and_batch(self):
+        calls = []
+
+        async def resolve(keys):
+            calls.append(list(keys))
+            await asyncio.sleep(0.02)
+            return [k.upper() for k in keys]
+
+        batcher = AsyncMicroBatcher(resolve, window=0.01)
+
+        async def scenario():
+            first = asyncio.ensure_future(batcher.get('a'))
+            await asyncio.sleep(0)
+            rest = [batcher.get(k) for k in ('a', 'b', 'c', 'b')]
+            return await asyncio.gather(first, *rest)
+
+        self.assertEqual(asyncio.run(scenario()), ['A', 'A', 'B', 'C', 'B'])
+        self.assertEqual(calls, [['a'], ['b', 'c']])
+        self.assertEqual(batcher.coalesced, 2)
+
+    def test_cancelled_waiter(self):
+        async def resolve(keys):
+            await asyncio.sleep(0.02)
+            return keys
+
+        batcher = AsyncMicroBatcher(resolve)
+
+        async def scenario():
+            leader = asyncio.ensure_future(batcher.get('a'))
+            follower = asyncio.ensure_future(batcher.get('a'))
+            await asyncio.sleep(0)
+            leader.cancel()
+            return await follower
+
+        self.assertEqual(asyncio.run(scenario()), 'a')
+
+
+class SlowH3Collection(FakeH3Collection):
+    def find_one(self, query, projection=None):
+        time.sleep(0.05)
+        return super().find_one(query, projection)
+
+
+class TestCoalescedEndpoint(unittest.TestCase):
+    """Concurrent /api/light-pollution requests for one cell share a query"""
+
+    def setUp(self):
+        self.collection = SlowH3Collection([{"_id": cell_of(DEHRADUN), "radiance": 40.0, "mpsas": 18.712,
+                                             "bortle": 7}])
+        db = MagicMock()
+        db.__getitem__.return_value = self.collection
+        patcher = patch('api.index.get_db', return_value=db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.saved = index.LP_BACKEND
+        index.LP_BACKEND = 'mongo_h3'
+        index.lp_cache.clear()
+
+    def tearDown(self):
+        index.LP_BACKEND = self.saved
+        index.lp_cache.clear()
+
+    def test_burst(self):
+        coalesced = index.h3_lookups.coalesced
+        batches = index.LOOKUP_BATCH_SIZE.count('mongo_h3')
+
+        def get(_):
+            client = index.app.test_client()
+            return client.get(f'/api/light-pollution?lat={DEHRADUN[0]}&lon={DEHRADUN[1]}').get_json()
+
+        threads, results = run_threads(get, range(6))
+        for thread in threads:
+            thread.join()
+        self.assertEqual([r['bortle_class'] for r in results], [7] * 6)
+        # Requests that missed the cache all waited on the first lookup
+        self.assertEqual(self.collection.queries, [('find_one', 1)])
+        self.assertEqual(index.LOOKUP_BATCH_SIZE.count('mongo_h3') - batches, 1)
+        self.assertGreater(index.h3_lookups.coalesced, coalesced)
+        self.assertIn('astr_coalesced_lookups_total{backend="mongo_h3"}', index.metrics.render())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,185 @@
+import unittest
+import sys
+import os
+import struct
+import subprocess
+import tempfile
+import threading
+from unittest.mock import patch, MagicMock
+
+import h3
+import numpy as np
+
+# Add parent directory to path to import api module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import api.index as index
+from api.zones_store import LiteZones, LITE_DTYPE
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+DEHRADUN = (30.3165, 78.0322)
+HANLE = (32.7795, 78.9641)
+
+
+def write_lite_db(path, rows, resolution=6):
+    """Write a zones_lite.db with the given {parent h3_int: (zone, sqm)} rows"""
+    records = np.zeros(len(rows), dtype=LITE_DTYPE)
+    for i, cell in enumerate(sorted(rows)):
+        records[i] = (cell, *rows[cell])
+    with open(path, 'wb') as f:
+        f.write(b'ASTL')
+        f.write(struct.pack('<HBBQ', 1, resolution, 8, len(records)))
+        records.tofile(f)
+
+
+def dehradun_lite(path):
+    write_lite_db(path, {h3.str_to_int(h3.latlng_to_cell(*DEHRADUN, 6)): (7, 18.24)})
+
+
+class TestLiteZones(unittest.TestCase):
+    """Test suite for reading zones_lite.db"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'zones_lite.db')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_lookup(self):
+        """Res-8 cells take their parent's zone; unstored parents are Zone 1"""
+        dehradun_lite(self.path)
+        cells = [h3.str_to_int(h3.latlng_to_cell(*p, 8)) for p in (DEHRADUN, HANLE)]
+        zone, sqm = LiteZones(self.path).lookup_cells(np.array(cells, dtype=np.uint64))
+        self.assertEqual(zone.tolist(), [7, 1])
+        np.testing.assert_allclose(sqm, [18.24, 22.0], rtol=1e-6)
+
+    def test_rejects_other_files(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'ASTR' + bytes(12))
+        with self.assertRaises(ValueError):
+            LiteZones(self.path)
+
+
+class TestLiteServing(unittest.TestCase):
+    """Test suite for answering from zones_lite.db while MongoDB is unavailable"""
+
+    def setUp(self):
+        self.client = index.app.test_client()
+        self.client.testing = True
+        self.tmp = tempfile.TemporaryDirectory()
+        self.saved = (index.LITE_DB_PATH, index.lite_zones)
+        index.LITE_DB_PATH = os.path.join(self.tmp.name, 'zones_lite.db')
+        index.lite_zones = None
+        dehradun_lite(index.LITE_DB_PATH)
+        index.lp_cache.clear()
+
+    def tearDown(self):
+        index.LITE_DB_PATH, index.lite_zones = self.saved
+        index.lp_cache.clear()
+        self.tmp.cleanup()
+
+    @patch('api.index.get_db')
+    def test_single(self, mock_get_db):
+        """Approximate answer without an ETag, so it is never cached"""
+        mock_get_db.return_value = None
+        response = self.client.get(f'/api/light-pollution?lat={DEHRADUN[0]}&lon={DEHRADUN[1]}')
+        data = response.get_json()
+        self.assertEqual((data['bortle_class'], data['mpsas']), (7, 18.24))
+        self.assertTrue(data['approximate'])
+        self.assertFalse(data['fallback'])
+        self.assertNotIn('ETag', response.headers)
+        self.assertEqual(index.lp_cache.stats()['size'], 0)
+
+    @patch('api.index.get_db')
+    def test_batch(self, mock_get_db):
+        mock_get_db.return_value = None
+        data = self.client.post('/api/light-pollution/batch',
+                                json={"points": [list(DEHRADUN), list(HANLE)]}).get_json()
+        self.assertEqual([r['bortle_class'] for r in data['results']], [7, 1])
+        self.assertTrue(all(r['approximate'] for r in data['results']))
+
+    @patch('api.index.get_db')
+    def test_without_lite_file(self, mock_get_db):
+        """Missing zones_lite.db keeps the old fallback body"""
+        mock_get_db.return_value = None
+        index.LITE_DB_PATH = os.path.join(self.tmp.name, 'absent.db')
+        index.lite_zones = None
+        data = self.client.get(f'/api/light-pollution?lat={DEHRADUN[0]}&lon={DEHRADUN[1]}').get_json()
+        self.assertTrue(data['fallback'])
+        self.assertEqual(data['error'], index.MONGO_UNAVAILABLE[0])
+
+
+class TestBackgroundConnect(unittest.TestCase):
+    """Test suite for MONGO_CONNECT=background"""
+
+    def setUp(self):
+        self.client = index.app.test_client()
+        self.client.testing = True
+        self.saved = (index.MONGO_CONNECT, index.MONGO_URI, index.mongo_client, index.db,
+                      index.mongo_state)
+        index.MONGO_CONNECT = 'background'
+        index.MONGO_URI = 'mongodb://example.invalid'
+        index.mongo_client = index.db = None
+        index.mongo_state = 'idle'
+        index.mongo_breaker.reset()
+        self.release = threading.Event()
+        self.client_mock = MagicMock()
+        self.client_mock.admin.command.side_effect = lambda *_: self.release.wait(5)
+        patcher = patch('pymongo.MongoClient', return_value=self.client_mock)
+        self.mongo_client_cls = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.release.set()
+        index.mongo_breaker.reset()
+        (index.MONGO_CONNECT, index.MONGO_URI, index.mongo_client, index.db,
+         index.mongo_state) = self.saved
+
+    def wait_for(self, state):
+        for thread in threading.enumerate():
+            if thread.name == 'mongo-connect':
+                thread.join(5)
+        self.assertEqual(index.mongo_state, state)
+
+    def test_requests_do_not_wait_for_ping(self):
+        """Health reports 'connecting' while the ping is outstanding, then 'connected'"""
+        data = self.client.get('/api/health').get_json()
+        self.assertEqual((data['database'], data['database_state']), ('disconnected', 'connecting'))
+        self.assertIsNone(index.get_db())
+
+        self.release.set()
+        self.wait_for('connected')
+        self.assertIsNotNone(index.get_db())
+        self.assertEqual(self.client.get('/api/health').get_json()['database'], 'connected')
+        self.mongo_client_cls.assert_called_once()
+
+    def test_failed_connection_opens_circuit(self):
+        """A failed background connection leaves reconnects to the circuit breaker"""
+        self.client_mock.admin.command.side_effect = RuntimeError("no servers")
+        with patch.object(index.mongo_breaker, 'base_delay', 60):
+            self.assertIsNone(index.get_db())
+            self.wait_for('failed')
+            self.assertFalse(index.mongo_breaker.allow())
+            self.assertIsNone(index.get_db())
+        self.assertEqual(self.client_mock.admin.command.call_count, 1)
+
+    def test_health_does_not_connect(self):
+        """With MONGO_CONNECT=ping, health reports the state without connecting"""
+        index.MONGO_CONNECT = 'ping'
+        data = self.client.get('/api/health').get_json()
+        self.assertEqual((data['database'], data['database_state']), ('disconnected', 'idle'))
+        self.mongo_client_cls.assert_not_called()
+
+
+class TestDeferredImports(unittest.TestCase):
+    def test_pymongo_not_imported_at_startup(self):
+        """Cold starts only import pymongo once a request needs MongoDB"""
+        out = subprocess.run([sys.executable, '-c', 'import sys, api.index; print("pymongo" in sys.modules)'],
+                             cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+                             env={**os.environ, 'MONGO_CONNECT': 'ping'})
+        self.assertEqual(out.stdout.strip(), 'False')
+
+
+if __name__ == '__main__':
+    unittest.main()
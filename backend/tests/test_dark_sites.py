@@ -0,0 +1,156 @@
+import unittest
+import sys
+import os
+import struct
+import tempfile
+
+import h3
+import numpy as np
+from h3.api import numpy_int as h3_int
+
+# Add parent directory to path to import api module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import api.index as index
+from api.dark_sites import DarkIndex, nearest_dark_sites, ZONES
+from api.route_profile import haversine_km
+from api.zones_store import ZonesStore
+from tests.test_zones_store import write_zones_db
+
+DEHRADUN = (30.3165, 78.0322)
+
+
+def write_dark_index(path, zones, resolution=5):
+    """Build dark_index.db from the same {h3: (zone, radiance, sqm)} dict as write_zones_db"""
+    hists = {}
+    for cell, (zone, _, _) in zones.items():
+        parent = h3_int.cell_to_parent(cell, resolution)
+        hists.setdefault(parent, np.zeros(ZONES, dtype=np.uint32))[zone - 1] += 1
+    children = 7 ** (8 - resolution)
+    dtype = np.dtype([('h3', '<u8'), ('zone_min', 'u1'), ('counts', '<u4', (ZONES,))])
+    records = np.zeros(len(hists), dtype=dtype)
+    for i, parent in enumerate(sorted(hists)):
+        hist = hists[parent]
+        hist[0] += children - hist.sum()
+        records[i] = (parent, np.argmax(hist > 0) + 1, hist)
+    with open(path, 'wb') as f:
+        f.write(b'ASTD' + struct.pack('<HBBQ', 1, resolution, 8, len(records)))
+        records.tofile(f)
+
+
+def lit_city(zone=7):
+    """Whole res-5 parent around Dehradun lit, plus one ring of Zone 4 cells just outside"""
+    parent = h3_int.latlng_to_cell(*DEHRADUN, 5)
+    core = set(h3_int.cell_to_children(parent, 8).tolist())
+    zones = {c: (zone, 40.0, 18.7) for c in core}
+    for c in core:
+        for n in h3_int.grid_disk(c, 1).tolist():
+            if n not in core:
+                zones[n] = (4, 1.5, 21.0)
+    return zones
+
+
+class TestNearestDarkSites(unittest.TestCase):
+    """Test suite for the coarse-index dark-site search"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.zones = lit_city()
+        zones_path = os.path.join(self.tmp.name, 'zones.db')
+        index_path = os.path.join(self.tmp.name, 'dark_index.db')
+        write_zones_db(zones_path, self.zones)
+        write_dark_index(index_path, self.zones)
+        self.store = ZonesStore(zones_path)
+        self.index = DarkIndex(index_path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def brute_force(self, lat, lon, max_zone):
+        disk = np.asarray(h3_int.grid_disk(h3_int.latlng_to_cell(lat, lon, 8), 40), dtype=np.uint64)
+        found = self.store.lookup_cells(disk)
+        pts = np.array([h3_int.cell_to_latlng(c) for c in disk[found["zone"] <= max_zone].tolist()])
+        return float(haversine_km(lat, lon, pts[:, 0], pts[:, 1]).min())
+
+    def test_summary_of_unstored_parent(self):
+        """Parents absent from the index are entirely Zone 1"""
+        far = h3_int.latlng_to_cell(-45.0, 170.0, 5)
+        zone_min, counts = self.index.summary([far])
+        self.assertEqual(zone_min[0], 1)
+        self.assertEqual(counts[0, 0], 343)
+
+    def test_matches_brute_force(self):
+        """Nearest site equals the nearest qualifying res-8 cell"""
+        for max_zone in (1, 4, 7):
+            sites = nearest_dark_sites(self.store, self.index, *DEHRADUN, max_zone, 50, 3)["sites"]
+            self.assertAlmostEqual(sites[0]["distance_km"], self.brute_force(*DEHRADUN, max_zone), places=2)
+            self.assertLessEqual(sites[0]["bortle_class"], max_zone)
+
+    def test_prunes_lit_parent(self):
+        """A parent whose minimum zone is above the target is never opened"""
+        result = nearest_dark_sites(self.store, self.index, *DEHRADUN, 3, 50, 5)
+        lit_parent = h3.latlng_to_cell(*DEHRADUN, 5)
+        self.assertNotIn(lit_parent, [s["parent"] for s in result["sites"]])
+        self.assertLess(result["parents_opened"], result["parents_considered"])
+
+    def test_sites_sorted_and_distinct(self):
+        """Results are ordered by distance, one per parent, within the radius"""
+        sites = nearest_dark_sites(self.store, self.index, *DEHRADUN, 1, 40, 6)["sites"]
+        self.assertEqual(len(sites), 6)
+        distances = [s["distance_km"] for s in sites]
+        self.assertEqual(distances, sorted(distances))
+        self.assertEqual(len({s["parent"] for s in sites}), 6)
+        self.assertTrue(all(d <= 40 for d in distances))
+
+    def test_radius_limits_results(self):
+        """No site is returned when nothing qualifies inside the radius"""
+        sites = nearest_dark_sites(self.store, self.index, *DEHRADUN, 3, 1, 5)["sites"]
+        self.assertEqual(sites, [])
+
+
+class TestDarkSitesEndpoint(unittest.TestCase):
+    """Test suite for /api/dark-sites endpoint"""
+
+    def setUp(self):
+        self.client = index.app.test_client()
+        self.client.testing = True
+        self.tmp = tempfile.TemporaryDirectory()
+        zones = lit_city()
+        write_zones_db(os.path.join(self.tmp.name, 'zones.db'), zones)
+        write_dark_index(os.path.join(self.tmp.name, 'dark_index.db'), zones)
+        self.saved = (index.ZONES_DB_PATH, index.zones_store, index.DARK_INDEX_PATH, index.dark_index)
+        index.ZONES_DB_PATH = os.path.join(self.tmp.name, 'zones.db')
+        index.DARK_INDEX_PATH = os.path.join(self.tmp.name, 'dark_index.db')
+        index.zones_store = None
+        index.dark_index = None
+
+    def tearDown(self):
+        index.ZONES_DB_PATH, index.zones_store, index.DARK_INDEX_PATH, index.dark_index = self.saved
+        self.tmp.cleanup()
+
+    def get(self, query=''):
+        return self.client.get(f'/api/dark-sites?lat={DEHRADUN[0]}&lon={DEHRADUN[1]}{query}')
+
+    def test_sites(self):
+        """Default search returns Bortle <= 3 sites nearest first"""
+        response = self.get('&k=3')
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(data['max_bortle'], 3)
+        self.assertEqual(len(data['sites']), 3)
+        self.assertTrue(all(s['bortle_class'] <= 3 for s in data['sites']))
+
+    def test_invalid_parameters(self):
+        """Out-of-range max_bortle, radius_km and k return 400"""
+        for query in ('&max_bortle=0', '&max_bortle=10', '&radius_km=0', '&radius_km=5000', '&k=0', '&k=500'):
+            self.assertEqual(self.get(query).status_code, 400, query)
+        self.assertEqual(self.client.get('/api/dark-sites?lat=30').status_code, 400)
+
+    def test_unavailable(self):
+        """Missing dark_index.db returns 503"""
+        index.DARK_INDEX_PATH = os.path.join(self.tmp.name, 'absent.db')
+        self.assertEqual(self.get().status_code, 503)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+import unittest
+import sys
+import os
+import io
+import json
+import tempfile
+from unittest.mock import patch
+
+import h3
+import numpy as np
+
+# Add parent directory to path to import api module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import api.index as index
+import api.encoding as encoding
+from api.encoding import BatchResult, negotiate, encode_batch, encode_json
+from tests.test_zones_store import write_zones_db
+
+try:
+    import msgpack
+except ImportError:  # optional (requirements-formats.txt)
+    msgpack = None
+try:
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+DEHRADUN = (30.3165, 78.0322)
+HANLE = (32.7795, 78.9641)
+ARROW = 'application/vnd.apache.arrow.stream'
+
+
+def sample_result():
+    """Three points on two entries with different fields, one entry shared"""
+    entries = [
+        {"mpsas": 18.71, "bortle_class": 7, "h3": "883c...", "implicit": False, "fallback": False},
+        {"mpsas": 18.5, "bortle_class": 6, "fallback": True},
+    ]
+    return BatchResult(np.array([30.0, 32.0, 30.0]), np.array([78.0, 79.0, 78.0]), entries, [0, 1, 0])
+
+
+def decode_msgpack(data):
+    body = msgpack.unpackb(data)
+    return body, {name: np.frombuffer(c["data"], c["dtype"]).tolist() if isinstance(c, dict) else c
+                  for name, c in body["columns"].items()}
+
+
+class TestEncoding(unittest.TestCase):
+    """Test suite for format negotiation and the columnar encoders"""
+
+    def test_negotiate(self):
+        self.assertEqual(negotiate(None), 'json')
+        self.assertEqual(negotiate('*/*'), 'json')
+        self.assertEqual(negotiate('text/html,application/xhtml+xml,*/*;q=0.8'), 'json')
+        self.assertEqual(negotiate('application/json', 'json'), 'json')
+        self.assertIsNone(negotiate('image/png'))
+        with patch.object(encoding, 'msgpack', object()), patch.object(encoding, 'pyarrow', object()):
+            self.assertEqual(negotiate('application/x-msgpack'), 'msgpack')
+            self.assertEqual(negotiate(f'application/json;q=0.5, {ARROW}'), 'arrow')
+            self.assertEqual(negotiate('application/json', 'arrow'), 'arrow')
+        with patch.object(encoding, 'msgpack', None):
+            self.assertIsNone(negotiate(None, 'msgpack'))
+            self.assertEqual(negotiate('application/msgpack, application/json;q=0.1'), 'json')
+
+    def test_columns(self):
+        columns = sample_result().columns()
+        self.assertEqual(list(columns), ['lat', 'lon', 'mpsas', 'bortle_class', 'h3', 'implicit', 'fallback'])
+        self.assertEqual(columns['mpsas'].dtype, np.float64)
+        self.assertEqual(columns['bortle_class'].tolist(), [7, 6, 7])
+        self.assertEqual(columns['fallback'].dtype, np.bool_)
+        # Missing fields become gaps in an object column
+        self.assertEqual(columns['implicit'].tolist(), [False, None, False])
+
+    def test_json_unchanged(self):
+        result = sample_result()
+        body, media_type = encode_batch(result, 'json', 'zones_db')
+        self.assertEqual(media_type, 'application/json')
+        self.assertEqual(json.loads(body), {"count": 3, "backend": "zones_db", "results": result.rows()})
+        self.assertEqual(json.loads(encode_json({"x": np.float32(1.5), 3: [1]})), {"x": 1.5, "3": [1]})
+
+    @unittest.skipIf(msgpack is None, "msgpack not installed (requirements-formats.txt)")
+    def test_msgpack(self):
+        result = sample_result()
+        body, columns = decode_msgpack(encode_batch(result, 'msgpack', 'zones_db')[0])
+        self.assertEqual((body['count'], body['backend']), (3, 'zones_db'))
+        self.assertEqual(body['columns']['lat']['dtype'], '<f8')
+        rows = [{k: v[i] for k, v in columns.items() if v[i] is not None} for i in range(3)]
+        self.assertEqual(rows, result.rows())
+
+    @unittest.skipIf(pyarrow is None, "pyarrow not installed (requirements-formats.txt)")
+    def test_arrow(self):
+        result = sample_result()
+        table = pyarrow.ipc.open_stream(io.BytesIO(encode_batch(result, 'arrow', 'zones_db')[0])).read_all()
+        self.assertEqual(table.schema.metadata, {b'backend': b'zones_db'})
+        self.assertEqual(str(table.schema.field('bortle_class').type), 'int64')
+        rows = [{k: v for k, v in row.items() if v is not None} for row in table.to_pylist()]
+        self.assertEqual(rows, result.rows())
+
+
+class TestBatchFormats(unittest.TestCase):
+    """Test suite for format negotiation on /api/light-pollution/batch"""
+
+    def setUp(self):
+        self.client = index.app.test_client()
+        self.client.testing = True
+        self.tmp = tempfile.TemporaryDirectory()
+        zones = os.path.join(self.tmp.name, 'zones.db')
+        write_zones_db(zones, {h3.str_to_int(h3.latlng_to_cell(*DEHRADUN, 8)): (7, 40.0, 18.7)})
+        self.saved = (index.LP_BACKEND, index.ZONES_DB_PATH, index.zones_store)
+        index.LP_BACKEND, index.ZONES_DB_PATH, index.zones_store = 'zones_db', zones, None
+        index.lp_cache.clear()
+        self.points = {"points": [list(DEHRADUN), list(HANLE), list(DEHRADUN)]}
+
+    def tearDown(self):
+        index.LP_BACKEND, index.ZONES_DB_PATH, index.zones_store = self.saved
+        index.lp_cache.clear()
+        self.tmp.cleanup()
+
+    def post(self, query='', **headers):
+        return self.client.post(f'/api/light-pollution/batch{query}', json=self.points, headers=headers)
+
+    def test_json_default(self):
+        response = self.post()
+        self.assertEqual((response.content_type, response.headers['Vary']), ('application/json', 'Accept'))
+        results = response.get_json()['results']
+        self.assertEqual([(r['bortle_class'], r['implicit']) for r in results], [(7, False), (1, True), (7, False)])
+
+    @unittest.skipIf(msgpack is None, "msgpack not installed (requirements-formats.txt)")
+    def test_msgpack_accept(self):
+        response = self.post(Accept='application/msgpack')
+        self.assertEqual(response.content_type, 'application/msgpack')
+        _, columns = decode_msgpack(response.get_data())
+        self.assertEqual(columns['bortle_class'], [7, 1, 7])
+        self.assertEqual(columns['lat'], [DEHRADUN[0], HANLE[0], DEHRADUN[0]])
+
+    @unittest.skipIf(pyarrow is None, "pyarrow not installed (requirements-formats.txt)")
+    def test_arrow_query(self):
+        response = self.post('?format=arrow', Accept='application/json')
+        table = pyarrow.ipc.open_stream(io.BytesIO(response.get_data())).read_all()
+        self.assertEqual(table.column('bortle_class').to_pylist(), [7, 1, 7])
+
+    def test_errors(self):
+        self.assertEqual(self.post('?format=xml').status_code, 400)
+        self.assertEqual(self.post(Accept='image/png').status_code, 406)
+        with patch.object(encoding, 'pyarrow', None):
+            response = self.post('?format=arrow')
+        self.assertEqual(response.status_code, 406)
+        self.assertNotIn('arrow', response.get_json()['message'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+import unittest
+import sys
+import os
+import json
+from unittest.mock import patch, MagicMock
+
+import h3
+
+# Add parent directory to path to import api module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import api.index as index
+from tests.test_asgi import call
+
+try:
+    import api.asgi as asgi
+except ImportError:  # starlette / motor / a2wsgi not installed
+    asgi = None
+
+DEHRADUN = (30.3165, 78.0322)
+HANLE = (32.7795, 78.9641)
+
+
+def cell_of(point):
+    return h3.str_to_int(h3.latlng_to_cell(*point, 8))
+
+
+class FakeH3Collection:
+    """light_pollution_h3 in memory: _id find_one and $in find, recording each query"""
+
+    def __init__(self, documents):
+        self.documents = {d["_id"]: d for d in documents}
+        self.queries = []
+
+    def find_one(self, query, projection=None):
+        self.queries.append(('find_one', 1))
+        return self.documents.get(query["_id"])
+
+    def find(self, query, projection=None):
+        ids = query["_id"]["$in"]
+        self.queries.append(('find', len(ids)))
+        return [self.documents[i] for i in ids if i in self.documents]
+
+
+class TestH3Collection(unittest.TestCase):
+    """Test suite for LP_BACKEND=mongo_h3"""
+
+    def setUp(self):
+        self.client = index.app.test_client()
+        self.client.testing = True
+        self.dehradun = cell_of(DEHRADUN)
+        # A lit cell two rings away from Hanle, none at Hanle itself
+        self.hanle_neighbour = h3.str_to_int(sorted(h3.grid_ring(h3.int_to_str(cell_of(HANLE)), 2))[0])
+        self.collection = FakeH3Collection([
+            {"_id": self.dehradun, "radiance": 40.0, "mpsas": 18.712, "bortle": 7},
+            {"_id": self.hanle_neighbour, "radiance": 0.1, "mpsas": 21.95, "bortle": 2},
+        ])
+        db = MagicMock()
+        db.__getitem__.return_value = self.collection
+        patcher = patch('api.index.get_db', return_value=db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.saved = (index.LP_BACKEND, index.MONGO_H3_MISSING)
+        index.LP_BACKEND, index.MONGO_H3_MISSING = 'mongo_h3', 'nearest'
+        index.lp_cache.clear()
+
+    def tearDown(self):
+        index.LP_BACKEND, index.MONGO_H3_MISSING = self.saved
+        index.lp_cache.clear()
+
+    def get(self, point):
+        return self.client.get(f'/api/light-pollution?lat={point[0]}&lon={point[1]}').get_json()
+
+    def test_id_lookup(self):
+        data = self.get(DEHRADUN)
+        self.assertEqual((data['bortle_class'], data['mpsas'], data['h3']), (7, 18.71, format(self.dehradun, 'x')))
+        self.assertFalse(data['implicit'] or data['fallback'])
+        self.assertEqual(self.collection.queries, [('find_one', 1)])
+        # Cached apart from the $near backend's results
+        self.assertTrue(index.dataset_version().startswith('mongo_h3:'))
+
+    def test_ring_fallback(self):
+        """A cell without a document takes the nearest one in its grid_disk, in one $in"""
+        data = self.get(HANLE)
+        self.assertEqual((data['bortle_class'], data['ring']), (2, 2))
+        self.assertEqual(data['h3'], format(cell_of(HANLE), 'x'))
+        self.assertEqual(self.collection.queries, [('find_one', 1), ('find', 18)])
+
+    def test_empty_ring(self):
+        with patch.object(index, 'MONGO_H3_RING', 1):
+            data = self.get(HANLE)
+        self.assertTrue(data['fallback'])
+        self.assertEqual(data['error'], index.MONGO_NO_DATA[0])
+
+    def test_missing_is_dark(self):
+        index.MONGO_H3_MISSING = 'dark'
+        data = self.get(HANLE)
+        self.assertEqual((data['bortle_class'], data['mpsas'], data['implicit']), (1, 22.0, True))
+        self.assertEqual(self.collection.queries, [('find_one', 1)])
+
+    def test_batch_single_in(self):
+        """All distinct uncached cells in one $in, then one more for the rings of the misses"""
+        points = [list(DEHRADUN), list(HANLE), list(DEHRADUN)]
+        data = self.client.post('/api/light-pollution/batch', json={"points": points}).get_json()
+        self.assertEqual([r['bortle_class'] for r in data['results']], [7, 2, 7])
+        self.assertEqual(self.collection.queries, [('find', 2), ('find', 18)])
+
+    def test_in_chunks(self):
+        points = [[DEHRADUN[0] + i * 0.01, DEHRADUN[1]] for i in range(5)]
+        index.MONGO_H3_MISSING = 'dark'
+        with patch.object(index, 'MONGO_H3_IN_CHUNK', 2):
+            data = self.client.post('/api/light-pollution/batch', json={"points": points}).get_json()
+        self.assertEqual(len(data['results']), 5)
+        self.assertEqual(self.collection.queries, [('find', 2), ('find', 2), ('find', 1)])
+
+
+class AsyncCursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    async def to_list(self, length):
+        return self.documents
+
+
+@unittest.skipIf(asgi is None, "ASGI dependencies not installed (requirements-asgi.txt)")
+@unittest.skipIf(index.LP_BACKEND == 'zones_db', "Async routes are only mounted for the MongoDB backend")
+class TestAsgiH3Collection(unittest.TestCase):
+    """Test suite for the H3 layout on the async routes"""
+
+    def setUp(self):
+        self.collection = FakeH3Collection([{"_id": cell_of(DEHRADUN), "mpsas": 18.7, "bortle": 7}])
+        find = self.collection.find
+        self.collection.find = lambda query, projection=None: AsyncCursor(find(query, projection))
+        db = MagicMock()
+        db.__getitem__.return_value = self.collection
+        self.saved = (asgi.mongo.db, index.LP_BACKEND, index.MONGO_H3_MISSING)
+        asgi.mongo.db, index.LP_BACKEND, index.MONGO_H3_MISSING = db, 'mongo_h3', 'dark'
+        index.lp_cache.clear()
+
+    def tearDown(self):
+        asgi.mongo.db, index.LP_BACKEND, index.MONGO_H3_MISSING = self.saved
+        index.lp_cache.clear()
+
+    def test_batch(self):
+        status, _, body = call(asgi.app, 'POST', '/api/light-pollution/batch',
+                               {"points": [list(DEHRADUN), list(HANLE)]})
+        self.assertEqual(status, 200)
+        results = json.loads(body)['results']
+        self.assertEqual([(r['bortle_class'], r['implicit']) for r in results], [(7, False), (1, True)])
+        self.assertEqual(self.collection.queries, [('find', 2)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import unittest
+import sys
+import os
+import struct
+import tempfile
+
+import h3
+import numpy as np
+
+# Add parent directory to path to import api module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import api.index as index
+from api.horizon_profiles import HorizonProfiles, dequantize
+
+HANLE = (32.7795, 78.9641)
+
+
+def write_horizon_db(path, rows, bins=36, resolution=6):
+    """Write a horizon.db with the given {h3_int: uint8 bins} rows"""
+    dtype = np.dtype([('h3', '<u8'), ('bins', 'u1', (bins,))])
+    records = np.zeros(len(rows), dtype=dtype)
+    for i, cell in enumerate(sorted(rows)):
+        records[i] = (cell, rows[cell])
+    with open(path, 'wb') as f:
+        f.write(b'ASTH')
+        f.write(struct.pack('<HBBQ', 1, bins, resolution, len(records)))
+        records.tofile(f)
+
+
+class TestHorizonProfiles(unittest.TestCase):
+    """Test suite for the horizon.db reader"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'horizon.db')
+        self.cell = h3.str_to_int(h3.latlng_to_cell(*HANLE, 6))
+        bins = np.zeros(36, dtype=np.uint8)
+        bins[9] = 200  # glow towards the east
+        write_horizon_db(self.path, {self.cell: bins, self.cell + 1: bins})
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_lookup_hit(self):
+        """Stored parent returns a dequantized profile"""
+        profiles = HorizonProfiles(self.path)
+        cell, profile = profiles.lookup(*HANLE)
+        self.assertEqual(h3.str_to_int(cell), self.cell)
+        self.assertEqual(int(np.argmax(profile)), 9)
+        self.assertEqual(profile[0], 0.0)
+
+    def test_lookup_miss(self):
+        """Cells without scattered light return None"""
+        profiles = HorizonProfiles(self.path)
+        _, profile = profiles.lookup(-45.0, -120.0)
+        self.assertIsNone(profile)
+
+    def test_rejects_other_files(self):
+        """A zones.db header is not accepted"""
+        bad = os.path.join(self.tmp.name, 'zones.db')
+        with open(bad, 'wb') as f:
+            f.write(b'ASTR\x01\x00\x00\x00' + struct.pack('<Q', 0))
+        with self.assertRaises(ValueError):
+            HorizonProfiles(bad)
+
+    def test_dequantize_scale(self):
+        """q=1 is 1e-4 and q=255 is 1e3 nW/cm^2/sr"""
+        values = dequantize(np.array([0, 1, 255], dtype=np.uint8))
+        self.assertEqual(values[0], 0.0)
+        self.assertAlmostEqual(values[1], 1e-4)
+        self.assertAlmostEqual(values[2], 1e3, places=6)
+
+
+class TestHorizonProfileEndpoint(unittest.TestCase):
+    """Test suite for /api/horizon-profile endpoint"""
+
+    def setUp(self):
+        self.client = index.app.test_client()
+        self.client.testing = True
+        self.tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(self.tmp.name, 'horizon.db')
+        bins = np.zeros(36, dtype=np.uint8)
+        bins[27] = 150  # glow towards the west
+        write_horizon_db(path, {h3.str_to_int(h3.latlng_to_cell(*HANLE, 6)): bins})
+        self.saved = (index.HORIZON_DB_PATH, index.horizon_profiles)
+        index.HORIZON_DB_PATH = path
+        index.horizon_profiles = None
+
+    def tearDown(self):
+        index.HORIZON_DB_PATH, index.horizon_profiles = self.saved
+        self.tmp.cleanup()
+
+    def test_profile_found(self):
+        """Stored site returns 36 bins with the peak in the west"""
+        response = self.client.get(f'/api/horizon-profile?lat={HANLE[0]}&lon={HANLE[1]}')
+        self.assertEqual(response.status_code, 200)
+
+        data = response.get_json()
+        self.assertEqual(len(data['profile']), 36)
+        self.assertEqual(data['peak_azimuth_deg'], 270.0)
+        self.assertFalse(data['implicit'])
+
+    def test_profile_implicit(self):
+        """Unlit site returns an all-zero implicit profile"""
+        response = self.client.get('/api/horizon-profile?lat=-45.0&lon=-120.0')
+        self.assertEqual(response.status_code, 200)
+
+        data = response.get_json()
+        self.assertTrue(data['implicit'])
+        self.assertEqual(sum(data['profile']), 0)
+        self.assertIsNone(data['peak_azimuth_deg'])
+
+    def test_missing_parameters(self):
+        """Missing coordinates return 400"""
+        response = self.client.get('/api/horizon-profile?lat=10')
+        self.assertEqual(response.status_code, 400)
+
+    def test_unavailable(self):
+        """Missing horizon.db returns 503"""
+        index.HORIZON_DB_PATH = os.path.join(self.tmp.name, 'absent.db')
+        index.horizon_profiles = None
+        response = self.client.get(f'/api/horizon-profile?lat={HANLE[0]}&lon={HANLE[1]}')
+        self.assertEqual(response.status_code, 503)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import unittest
+import sys
+import os
+import time
+import tempfile
+from unittest.mock import patch, MagicMock
+
+import h3
+import pymongo
+from pymongo import monitoring
+
+# Add parent directory to path to import api module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import api.index as index
+import api.metrics as metrics
+from api.metrics import Registry, pool_listener
+from tests.test_zones_store import write_zones_db
+
+DEHRADUN = (30.3165, 78.0322)
+
+
+class TestRegistry(unittest.TestCase):
+    """Test suite for the exposition format"""
+
+    def test_counter_and_histogram(self):
+        registry = Registry()
+        counter = registry.counter('x_total', 'X', ('route',))
+        histogram = registry.histogram('y_seconds', 'Y', ('route',), buckets=(0.1, 1.0))
+        counter.inc('/a "b"\n')
+        for value in (0.05, 0.5, 5.0):
+            histogram.observe(value, '/a')
+        text = registry.render()
+        self.assertIn('# TYPE x_total counter', text)
+        self.assertIn(r'x_total{route="/a \"b\"\n"} 1', text)
+        self.assertIn('y_seconds_bucket{route="/a",le="0.1"} 1', text)
+        self.assertIn('y_seconds_bucket{route="/a",le="1.0"} 2', text)
+        self.assertIn('y_seconds_bucket{route="/a",le="+Inf"} 3', text)
+        self.assertIn('y_seconds_sum{route="/a"} 5.55', text)
+        self.assertIn('y_seconds_count{route="/a"} 3', text)
+
+    def test_series_are_capped(self):
+        counter = Registry().counter('x_total', 'X', ('route',))
+        with patch.object(metrics, 'MAX_SERIES', 3):
+            for i in range(10):
+                counter.inc(f'/r{i}')
+        self.assertEqual(len(counter.series), 4)
+        self.assertEqual(counter.value('other'), 7)
+
+    def test_pool_listener(self):
+        opened, checked_out = metrics.Gauge('o', 'O'), metrics.Gauge('c', 'C')
+        failures = metrics.Counter('f', 'F', ('reason',))
+        with patch.dict(sys.modules, {'pymongo': pymongo, 'pymongo.monitoring': monitoring}):
+            listener = pool_listener(opened, checked_out, failures)
+        self.assertIsInstance(listener, monitoring.ConnectionPoolListener)
+        listener.connection_created(None)
+        listener.connection_created(None)
+        listener.connection_checked_out(None)
+        listener.connection_closed(None)
+        listener.connection_check_out_failed(MagicMock(reason='timeout'))
+        self.assertEqual((opened.series[()], checked_out.series[()]), (1, 1))
+        self.assertEqual(failures.value('timeout'), 1)
+
+
+class TestMetricsEndpoint(unittest.TestCase):
+    """Test suite for /metrics and request instrumentation"""
+
+    def setUp(self):
+        self.client = index.app.test_client()
+        self.client.testing = True
+        index.metrics.clear()
+        index.lp_cache.clear()
+
+    def tearDown(self):
+        index.lp_cache.clear()
+
+    def test_scrape(self):
+        self.client.get('/api/health')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain; version=0.0.4'))
+        text = response.get_data(as_text=True)
+        self.assertIn('astr_http_requests_total{route="/api/health",method="GET",status="200"} 1', text)
+        self.assertIn('astr_http_request_duration_seconds_count{route="/api/health",status="200"} 1', text)
+        for name in ('astr_lp_cache_entries', 'astr_lp_cache_lookups_total', 'astr_mongo_circuit_open'):
+            self.assertIn(f'# TYPE {name}', text)
+
+    def test_route_templates_not_values(self):
+        """Labels carry the route rule, never coordinates or tile numbers"""
+        self.client.get('/api/light-pollution?lat=12.34567&lon=76.54321')
+        self.client.get('/tiles/99/1/2.png')
+        self.client.get('/no/such/path?lat=1')
+        text = self.client.get('/metrics').get_data(as_text=True)
+        self.assertNotIn('12.34567', text)
+        self.assertIn('route="/tiles/<int:z>/<int:x>/<int:y>.png",method="GET",status="404"', text)
+        self.assertIn('astr_http_requests_total{route="unmatched",method="GET"', text)
+
+    @patch('api.index.get_db')
+    def test_fallback_reasons(self, mock_get_db):
+        mock_db = MagicMock()
+        mock_get_db.return_value = mock_db
+        mock_db.light_pollution.find_one.return_value = None
+        self.client.get(f'/api/light-pollution?lat={DEHRADUN[0]}&lon={DEHRADUN[1]}')
+        mock_db.light_pollution.find_one.side_effect = RuntimeError("bad query")
+        self.client.get(f'/api/light-pollution?lat={DEHRADUN[0]}&lon={DEHRADUN[1]}')
+        mock_get_db.return_value = None
+        with patch.object(index, 'local_entries', return_value=None):
+            self.client.get(f'/api/light-pollution?lat={DEHRADUN[0]}&lon={DEHRADUN[1]}')
+        self.assertEqual([index.FALLBACKS.value(r) for r in ('no_data', 'query_failed', 'unavailable')],
+                         [1, 1, 1])
+        self.assertEqual(index.DB_LATENCY.count('mongo', 'find_nearest'), 2)
+
+    def test_zones_lookup_time(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'zones.db')
+            write_zones_db(path, {h3.str_to_int(h3.latlng_to_cell(*DEHRADUN, 8)): (7, 40.0, 18.7)})
+            saved = (index.LP_BACKEND, index.ZONES_DB_PATH, index.zones_store)
+            index.LP_BACKEND, index.ZONES_DB_PATH, index.zones_store = 'zones_db', path, None
+            try:
+                self.client.post('/api/light-pollution/batch', json={"points": [list(DEHRADUN)]})
+            finally:
+                index.LP_BACKEND, index.ZONES_DB_PATH, index.zones_store = saved
+        self.assertEqual(index.DB_LATENCY.count('zones_db', 'lookup'), 1)
+
+    def test_instrumentation_overhead(self):
+        """before/after hooks cost well under 20 µs per request"""
+        response = index.app.response_class('ok')
+        n = 5000
+        with index.app.test_request_context('/api/health'):
+            start = time.perf_counter()
+            for _ in range(n):
+                index.start_request_timer()
+                index.record_request(response)
+            per_request = (time.perf_counter() - start) / n
+        self.assertLess(per_request, 20e-6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,174 @@
+import unittest
+import sys
+import os
+import tempfile
+from unittest.mock import patch, MagicMock
+
+import h3
+
+# Add parent directory to path to import api module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import api.index as index
+from api.response_cache import CellCache
+from tests.test_zones_store import write_zones_db
+
+DEHRADUN = (30.3165, 78.0322)
+# Another point in Dehradun's res-8 cell
+DEHRADUN_NEARBY = (30.3168, 78.0324)
+HANLE = (32.7795, 78.9641)
+
+
+class TestCellCache(unittest.TestCase):
+    """Test suite for the in-process LRU/TTL cache"""
+
+    def test_lru_eviction(self):
+        """The least recently used entry goes first"""
+        cache = CellCache(2, 60)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_ttl_expiry(self):
+        """Expired entries are misses"""
+        cache = CellCache(10, 0)
+        cache.put('a', 1)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['expirations'], 1)
+
+    def test_hit_ratio(self):
+        cache = CellCache(10, 60)
+        self.assertIsNone(cache.stats()['hit_ratio'])
+        cache.put('a', 1)
+        cache.get('a')
+        cache.get('b')
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_ratio']), (1, 1, 0.5))
+
+
+class TestZonesResponseCache(unittest.TestCase):
+    """Test suite for cached, conditional /api/light-pollution responses from zones.db"""
+
+    def setUp(self):
+        self.client = index.app.test_client()
+        self.client.testing = True
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'zones.db')
+        write_zones_db(self.path, {h3.str_to_int(h3.latlng_to_cell(*DEHRADUN, 8)): (7, 40.0, 18.7)})
+        self.saved = (index.LP_BACKEND, index.ZONES_DB_PATH, index.zones_store)
+        index.LP_BACKEND = 'zones_db'
+        index.ZONES_DB_PATH = self.path
+        index.zones_store = None
+        index.lp_cache.clear()
+
+    def tearDown(self):
+        index.LP_BACKEND, index.ZONES_DB_PATH, index.zones_store = self.saved
+        index.lp_cache.clear()
+        self.tmp.cleanup()
+
+    def get(self, point, headers=None):
+        return self.client.get(f'/api/light-pollution?lat={point[0]}&lon={point[1]}', headers=headers)
+
+    def test_same_cell_is_a_hit(self):
+        """A second point in the same cell is served from the cache with the same ETag"""
+        first = self.get(DEHRADUN)
+        with patch.object(index.get_zones_store(), 'lookup_cells') as lookup:
+            second = self.get(DEHRADUN_NEARBY)
+        lookup.assert_not_called()
+        self.assertEqual(second.get_json()['bortle_class'], 7)
+        self.assertEqual(second.get_json()['lat'], DEHRADUN_NEARBY[0])
+        self.assertEqual(first.headers['ETag'], second.headers['ETag'])
+        self.assertEqual(index.lp_cache.stats()['hits'], 1)
+
+    def test_headers(self):
+        """Strong ETag and CDN-cacheable Cache-Control"""
+        response = self.get(DEHRADUN)
+        self.assertFalse(response.headers['ETag'].startswith('W/'))
+        self.assertIn('public', response.headers['Cache-Control'])
+        self.assertNotEqual(response.headers['ETag'], self.get(HANLE).headers['ETag'])
+
+    def test_not_modified(self):
+        """If-None-Match with the cell's ETag returns 304 without a lookup"""
+        etag = self.get(DEHRADUN).headers['ETag']
+        index.lp_cache.clear()
+        with patch.object(index.get_zones_store(), 'lookup_cells') as lookup:
+            response = self.get(DEHRADUN_NEARBY, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        lookup.assert_not_called()
+        self.assertEqual(self.get(HANLE, headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_new_dataset_changes_etag(self):
+        """Rebuilt zones.db gets a new ETag and fresh results"""
+        etag = self.get(DEHRADUN).headers['ETag']
+        write_zones_db(self.path, {h3.str_to_int(h3.latlng_to_cell(*DEHRADUN, 8)): (5, 10.0, 19.9),
+                                   h3.str_to_int(h3.latlng_to_cell(*HANLE, 8)): (2, 0.2, 21.7)})
+        index.zones_store = None
+        response = self.get(DEHRADUN, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['bortle_class'], 5)
+
+    def test_batch_shares_cache(self):
+        """Batch lookups reuse cells cached by single lookups and vice versa"""
+        self.get(DEHRADUN)
+        data = self.client.post('/api/light-pollution/batch',
+                                json={"points": [list(DEHRADUN_NEARBY), list(HANLE)]}).get_json()
+        self.assertEqual([r['bortle_class'] for r in data['results']], [7, 1])
+        stats = index.lp_cache.stats()
+        self.assertEqual((stats['hits'], stats['size']), (1, 2))
+        self.get(HANLE)
+        self.assertEqual(index.lp_cache.stats()['hits'], 2)
+
+    def test_health_reports_cache(self):
+        self.get(DEHRADUN)
+        self.get(DEHRADUN)
+        cache = self.client.get('/api/health').get_json()['cache']
+        self.assertEqual(cache['hit_ratio'], 0.5)
+        self.assertIn('evictions', cache)
+
+
+class TestMongoResponseCache(unittest.TestCase):
+    """Test suite for cached /api/light-pollution responses from MongoDB"""
+
+    def setUp(self):
+        self.client = index.app.test_client()
+        self.client.testing = True
+        index.lp_cache.clear()
+
+    def tearDown(self):
+        index.lp_cache.clear()
+
+    @patch('api.index.get_db')
+    def test_cell_queried_once(self, mock_get_db):
+        """Points in the same cell share one $near query at the cell centre"""
+        mock_db = MagicMock()
+        mock_db.light_pollution.find_one.return_value = {"mpsas": 20.1}
+        mock_get_db.return_value = mock_db
+
+        for lat, lon in (DEHRADUN, DEHRADUN_NEARBY):
+            data = self.client.get(f'/api/light-pollution?lat={lat}&lon={lon}').get_json()
+            self.assertEqual(data['mpsas'], 20.1)
+        self.assertEqual(mock_db.light_pollution.find_one.call_count, 1)
+        query = mock_db.light_pollution.find_one.call_args[0][0]
+        lon, lat = query["location"]["$near"]["$geometry"]["coordinates"]
+        self.assertEqual(h3.latlng_to_cell(lat, lon, 8), h3.latlng_to_cell(*DEHRADUN, 8))
+
+    @patch('api.index.get_db')
+    def test_fallback_not_cached(self, mock_get_db):
+        """Points without data are re-queried and carry no ETag"""
+        mock_db = MagicMock()
+        mock_db.light_pollution.find_one.return_value = None
+        mock_get_db.return_value = mock_db
+
+        for _ in range(2):
+            response = self.client.get(f'/api/light-pollution?lat={HANLE[0]}&lon={HANLE[1]}')
+            self.assertTrue(response.get_json()['fallback'])
+            self.assertNotIn('ETag', response.headers)
+        self.assertEqual(mock_db.light_pollution.find_one.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import unittest
+import sys
+import os
+import tempfile
+from unittest.mock import patch
+
+import h3
+import numpy as np
+
+# Add parent directory to path to import api module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import api.index as index
+import api.route_profile as route
+from api.zones_store import ZonesStore
+from tests.test_zones_store import write_zones_db
+
+DEHRADUN = (30.3165, 78.0322)
+RISHIKESH = (30.0869, 78.2676)
+
+
+class TestDensifyPath(unittest.TestCase):
+    """Test suite for polyline densification"""
+
+    def test_cells_are_contiguous(self):
+        """Every consecutive pair of cells are grid neighbours"""
+        cells, length_km = route.densify_path([DEHRADUN[0], RISHIKESH[0], 30.5],
+                                              [DEHRADUN[1], RISHIKESH[1], 78.4])
+        self.assertGreater(length_km, 40)
+        self.assertTrue(all(h3.are_neighbor_cells(h3.int_to_str(int(a)), h3.int_to_str(int(b)))
+                            for a, b in zip(cells[:-1], cells[1:])))
+
+    def test_endpoints_and_no_repeats(self):
+        """Path starts and ends in the vertex cells without consecutive repeats"""
+        cells, _ = route.densify_path([DEHRADUN[0], RISHIKESH[0]], [DEHRADUN[1], RISHIKESH[1]])
+        self.assertEqual(h3.int_to_str(int(cells[0])), h3.latlng_to_cell(*DEHRADUN, 8))
+        self.assertEqual(h3.int_to_str(int(cells[-1])), h3.latlng_to_cell(*RISHIKESH, 8))
+        self.assertTrue(np.all(cells[1:] != cells[:-1]))
+
+    def test_grid_path_failure_falls_back_to_sampling(self):
+        """A failing grid_path_cells is replaced by dense great-circle sampling"""
+        path, _ = route.densify_path([DEHRADUN[0], RISHIKESH[0]], [DEHRADUN[1], RISHIKESH[1]])
+        with patch.object(route.h3_int, 'grid_path_cells', side_effect=h3.H3FailedError):
+            cells, _ = route.densify_path([DEHRADUN[0], RISHIKESH[0]], [DEHRADUN[1], RISHIKESH[1]])
+        self.assertEqual(cells[0], path[0])
+        self.assertEqual(cells[-1], path[-1])
+        self.assertGreater(len(set(cells.tolist()) & set(path.tolist())), 0.8 * len(path))
+
+
+class TestRouteProfile(unittest.TestCase):
+    """Test suite for run-length route profiles"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'zones.db')
+        # Light up the first 10 cells of the route
+        cells, _ = route.densify_path([DEHRADUN[0], RISHIKESH[0]], [DEHRADUN[1], RISHIKESH[1]])
+        write_zones_db(self.path, {int(c): (7, 40.0, 18.7) for c in cells[:10]})
+        self.cells = cells
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_segments(self):
+        """Lit start and dark remainder form two runs covering the whole route"""
+        profile = route.route_profile(ZonesStore(self.path), [DEHRADUN[0], RISHIKESH[0]],
+                                      [DEHRADUN[1], RISHIKESH[1]])
+        self.assertEqual(profile['cells'], len(self.cells))
+        self.assertEqual([s['bortle_class'] for s in profile['segments']], [7, 1])
+        self.assertEqual(profile['segments'][0]['cells'], 10)
+        self.assertEqual(profile['segments'][0]['start_km'], 0.0)
+        self.assertEqual(profile['segments'][-1]['end_km'], profile['distance_km'])
+        self.assertAlmostEqual(sum(profile['km_by_bortle'].values()), profile['distance_km'], places=2)
+
+
+class TestRouteProfileEndpoint(unittest.TestCase):
+    """Test suite for /api/route-profile endpoint"""
+
+    def setUp(self):
+        self.client = index.app.test_client()
+        self.client.testing = True
+        self.tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(self.tmp.name, 'zones.db')
+        write_zones_db(path, {h3.str_to_int(h3.latlng_to_cell(*DEHRADUN, 8)): (7, 40.0, 18.7)})
+        self.saved = (index.ZONES_DB_PATH, index.zones_store)
+        index.ZONES_DB_PATH = path
+        index.zones_store = None
+
+    def tearDown(self):
+        index.ZONES_DB_PATH, index.zones_store = self.saved
+        self.tmp.cleanup()
+
+    def post(self, path):
+        return self.client.post('/api/route-profile', json={"path": path})
+
+    def test_profile(self):
+        """Route starting in a lit cell begins with a Zone 7 run"""
+        response = self.post([list(DEHRADUN), list(RISHIKESH)])
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(data['segments'][0]['bortle_class'], 7)
+        self.assertEqual(data['segments'][-1]['bortle_class'], 1)
+
+    def test_needs_two_vertices(self):
+        """A single vertex is not a route"""
+        self.assertEqual(self.post([list(DEHRADUN)]).status_code, 400)
+
+    def test_too_long(self):
+        """Routes over MAX_ROUTE_KM return 413"""
+        self.assertEqual(self.post([[0, 0], [0, 60]]).status_code, 413)
+
+    def test_unavailable(self):
+        """Missing zones.db returns 503"""
+        index.ZONES_DB_PATH = os.path.join(self.tmp.name, 'absent.db')
+        self.assertEqual(self.post([list(DEHRADUN), list(RISHIKESH)]).status_code, 503)
+
+
+if __name__ == '__main__':
+    unittest.main()
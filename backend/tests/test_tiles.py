@@ -0,0 +1,178 @@
+import unittest
+import sys
+import os
+import math
+import struct
+import tempfile
+import zlib
+
+import numpy as np
+from h3.api import numpy_int as h3_int
+
+# Add parent directory to path to import api module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import api.index as index
+from api.dark_sites import DarkIndex
+from api.tiles import (TileCache, encode_png, quadtree_cells, render_tile,
+                       tile_pixel_centres, TILE_SIZE)
+from api.zones_store import ZonesStore
+from tests.test_dark_sites import write_dark_index, lit_city
+from tests.test_zones_store import write_zones_db
+
+DEHRADUN = (30.3165, 78.0322)
+
+
+def tile_of(lat, lon, z):
+    n = 2 ** z
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return z, x, y
+
+
+def decode_png(data):
+    """Palette indices from an encode_png image (single IDAT, filter 0)"""
+    assert data[:8] == b'\x89PNG\r\n\x1a\n'
+    pos, chunks = 8, {}
+    while pos < len(data):
+        length = struct.unpack('>I', data[pos:pos + 4])[0]
+        chunks[data[pos + 4:pos + 8]] = data[pos + 8:pos + 8 + length]
+        pos += 12 + length
+    width, height = struct.unpack('>II', chunks[b'IHDR'][:8])
+    raw = np.frombuffer(zlib.decompress(chunks[b'IDAT']), dtype=np.uint8).reshape(height, width + 1)
+    return raw[:, 1:], chunks
+
+
+class TestTileRendering(unittest.TestCase):
+    """Test suite for tile sampling and PNG encoding"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        zones = lit_city()
+        write_zones_db(os.path.join(cls.tmp.name, 'zones.db'), zones)
+        write_dark_index(os.path.join(cls.tmp.name, 'dark_index.db'), zones)
+        cls.store = ZonesStore(os.path.join(cls.tmp.name, 'zones.db'))
+        cls.index = DarkIndex(os.path.join(cls.tmp.name, 'dark_index.db'))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def test_png_round_trip(self):
+        """Encoded PNG carries the palette, alpha table and pixel indices"""
+        pixels = np.arange(64, dtype=np.uint8).reshape(8, 8) % 10
+        decoded, chunks = decode_png(encode_png(pixels))
+        np.testing.assert_array_equal(decoded, pixels)
+        self.assertEqual(len(chunks[b'PLTE']), 30)
+        self.assertEqual(chunks[b'tRNS'][1], 0)  # Zone 1 is transparent
+
+    def test_quadtree_matches_per_pixel(self):
+        """Block filling gives the same cell as indexing every pixel"""
+        lats, lons = tile_pixel_centres(*tile_of(*DEHRADUN, 11))
+        grid = quadtree_cells(lats, lons, 8)
+        expected = np.array([[h3_int.latlng_to_cell(a, b, 8) for b in lons.tolist()] for a in lats.tolist()],
+                            dtype=np.uint64)
+        np.testing.assert_array_equal(grid, expected)
+
+    def test_fine_tile_zones(self):
+        """Pixels over the city show its zone, the rest of the tile is Zone 1"""
+        z, x, y = tile_of(*DEHRADUN, 9)
+        pixels = render_tile(self.store, self.index, z, x, y)
+        self.assertEqual(pixels.shape, (TILE_SIZE, TILE_SIZE))
+        self.assertEqual(set(np.unique(pixels).tolist()), {1, 4, 7})
+        # Same picture without the coarse mask
+        np.testing.assert_array_equal(render_tile(self.store, None, z, x, y), pixels)
+
+    def test_coarse_tile_uses_index(self):
+        """Low zooms draw the city's res-5 parent at its brightest zone"""
+        z, x, y = tile_of(*DEHRADUN, 5)
+        pixels = render_tile(self.store, self.index, z, x, y)
+        self.assertIn(7, pixels)
+        self.assertEqual(pixels.max(), 7)
+
+
+class TestTileCache(unittest.TestCase):
+    """Test suite for the on-disk tile LRU"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_round_trip(self):
+        cache = TileCache(self.tmp.name, 10_000)
+        self.assertIsNone(cache.get('v1', 3, 1, 2))
+        cache.put('v1', 3, 1, 2, b'png')
+        self.assertEqual(cache.get('v1', 3, 1, 2), b'png')
+        self.assertIsNone(cache.get('v2', 3, 1, 2))
+
+    def test_evicts_least_recently_used(self):
+        """Going over max_bytes drops the oldest tiles first"""
+        cache = TileCache(self.tmp.name, 2500)
+        for y in range(2):
+            cache.put('v1', 1, 0, y, b'x' * 1000)
+            os.utime(cache.path('v1', 1, 0, y), (1000 + y, 1000 + y))
+        cache.put('v1', 1, 1, 0, b'x' * 1000)
+        self.assertIsNone(cache.get('v1', 1, 0, 0))
+        self.assertIsNotNone(cache.get('v1', 1, 0, 1))
+        self.assertLessEqual(cache.size, 2500)
+        self.assertEqual(TileCache(self.tmp.name, 2500).size, cache.size)
+
+
+class TestTileEndpoint(unittest.TestCase):
+    """Test suite for /tiles/{z}/{x}/{y}.png endpoint"""
+
+    def setUp(self):
+        self.client = index.app.test_client()
+        self.client.testing = True
+        self.tmp = tempfile.TemporaryDirectory()
+        zones = lit_city()
+        write_zones_db(os.path.join(self.tmp.name, 'zones.db'), zones)
+        write_dark_index(os.path.join(self.tmp.name, 'dark_index.db'), zones)
+        self.saved = (index.ZONES_DB_PATH, index.zones_store, index.DARK_INDEX_PATH, index.dark_index,
+                      index.TILE_CACHE_DIR, index.tile_renderer)
+        index.ZONES_DB_PATH = os.path.join(self.tmp.name, 'zones.db')
+        index.DARK_INDEX_PATH = os.path.join(self.tmp.name, 'dark_index.db')
+        index.TILE_CACHE_DIR = os.path.join(self.tmp.name, 'tiles')
+        index.zones_store = None
+        index.dark_index = None
+        index.tile_renderer = None
+
+    def tearDown(self):
+        (index.ZONES_DB_PATH, index.zones_store, index.DARK_INDEX_PATH, index.dark_index,
+         index.TILE_CACHE_DIR, index.tile_renderer) = self.saved
+        self.tmp.cleanup()
+
+    def test_tile(self):
+        """Tile is a cached PNG with an ETag"""
+        z, x, y = tile_of(*DEHRADUN, 9)
+        response = self.client.get(f'/tiles/{z}/{x}/{y}.png')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'image/png')
+        self.assertTrue(response.data.startswith(b'\x89PNG'))
+        self.assertTrue(response.headers['ETag'])
+        self.assertIn('max-age', response.headers['Cache-Control'])
+        self.assertTrue(os.path.exists(index.tile_renderer.cache.path(index.tile_renderer.data_key, z, x, y)))
+
+    def test_not_modified(self):
+        """If-None-Match with the tile's ETag returns 304"""
+        first = self.client.get('/tiles/0/0/0.png')
+        response = self.client.get('/tiles/0/0/0.png', headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+
+    def test_out_of_range(self):
+        """Tiles outside the zoom range or the 2^z grid return 404"""
+        for path in ('/tiles/15/0/0.png', '/tiles/2/4/0.png', '/tiles/2/0/4.png'):
+            self.assertEqual(self.client.get(path).status_code, 404, path)
+
+    def test_unavailable(self):
+        """Missing zones.db returns 503"""
+        index.ZONES_DB_PATH = os.path.join(self.tmp.name, 'absent.db')
+        self.assertEqual(self.client.get('/tiles/0/0/0.png').status_code, 503)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,165 @@
+import unittest
+import sys
+import os
+import json
+import glob
+import tempfile
+from unittest.mock import patch
+
+import h3
+
+# Add parent directory to path to import api module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import api.index as index
+import api.tracing as tracing
+from api.tracing import Tracer, JsonLinesExporter, parse_traceparent, NOOP
+from tests.test_zones_store import write_zones_db
+
+DEHRADUN = (30.3165, 78.0322)
+UPSTREAM = '00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01'
+
+
+def read_spans(path):
+    spans = []
+    for name in sorted(glob.glob(path + '*')):
+        with open(name) as f:
+            spans += [json.loads(line) for line in f]
+    return spans
+
+
+class TestTracer(unittest.TestCase):
+    """Test suite for spans, sampling and the JSON-lines exporter"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'traces.jsonl')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_parse_traceparent(self):
+        self.assertEqual(parse_traceparent(UPSTREAM),
+                         ('0af7651916cd43dd8448eb211c80319c', 'b7ad6b7169203331', True))
+        self.assertFalse(parse_traceparent(UPSTREAM[:-2] + '00')[2])
+        for bad in (None, '', 'garbage', '00-xyz-b7ad6b7169203331-01', '00-' + '0' * 32 + '-b7ad6b7169203331-01'):
+            self.assertIsNone(parse_traceparent(bad))
+
+    def test_nested_spans(self):
+        exporter = JsonLinesExporter(self.path)
+        tracer = Tracer(exporter, 1.0)
+        root, token = tracer.start_trace('GET /x', {"http.route": "/x"})
+        with tracer.span('outer') as outer:
+            with tracer.span('inner', cells=3):
+                pass
+            outer.set('hit', True)
+        with self.assertRaises(KeyError):
+            with tracer.span('failing'):
+                raise KeyError('k')
+        tracer.end_trace(root, token)
+        exporter.close()
+        self.assertIsNone(Tracer.current())
+
+        spans = {s['name']: s for s in read_spans(self.path)}
+        self.assertEqual(set(spans), {'GET /x', 'outer', 'inner', 'failing'})
+        self.assertEqual(len({s['trace_id'] for s in spans.values()}), 1)
+        self.assertIsNone(spans['GET /x']['parent_span_id'])
+        self.assertEqual(spans['outer']['parent_span_id'], spans['GET /x']['span_id'])
+        self.assertEqual(spans['inner']['parent_span_id'], spans['outer']['span_id'])
+        self.assertEqual((spans['inner']['attributes'], spans['outer']['attributes']), ({"cells": 3}, {"hit": True}))
+        self.assertEqual(spans['failing']['status'], 'ERROR')
+        self.assertGreaterEqual(spans['GET /x']['duration_ms'], spans['outer']['duration_ms'])
+
+    def test_unsampled(self):
+        tracer = Tracer(JsonLinesExporter(self.path), 0.0)
+        self.assertEqual(tracer.start_trace('GET /x'), (None, None))
+        self.assertIs(tracer.span('stage'), NOOP)
+        # An upstream sampling decision is honoured and continues its trace
+        root, token = tracer.start_trace('GET /x', traceparent=UPSTREAM)
+        self.assertEqual((root.trace.trace_id, root.parent_id), ('0af7651916cd43dd8448eb211c80319c', 'b7ad6b7169203331'))
+        tracer.end_trace(root, token)
+        self.assertEqual(Tracer(None, 1.0).start_trace('GET /x', traceparent=UPSTREAM), (None, None))
+
+    def test_rotation(self):
+        exporter = JsonLinesExporter(self.path, max_bytes=2000, backup_count=2)
+        tracer = Tracer(exporter, 1.0)
+        for i in range(50):
+            root, token = tracer.start_trace(f'GET /{i}')
+            with tracer.span('stage'):
+                pass
+            tracer.end_trace(root, token)
+        exporter.close()
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), ['traces.jsonl', 'traces.jsonl.1', 'traces.jsonl.2'])
+        for name in os.listdir(self.tmp.name):
+            self.assertLessEqual(os.path.getsize(os.path.join(self.tmp.name, name)), 2000)
+        # Whole traces per file: every stage sits next to its request span
+        spans = read_spans(self.path)
+        by_trace = {}
+        for span in spans:
+            by_trace.setdefault(span['trace_id'], []).append(span['name'])
+        self.assertTrue(all(len(names) == 2 for names in by_trace.values()))
+
+    def test_span_cap(self):
+        tracer = Tracer(JsonLinesExporter(self.path), 1.0)
+        root, token = tracer.start_trace('POST /batch')
+        with patch.object(tracing, 'MAX_SPANS', 5):
+            for _ in range(8):
+                with tracer.span('mongo.find_nearest'):
+                    pass
+            tracer.end_trace(root, token)
+        spans = read_spans(self.path)
+        self.assertEqual(len(spans), 6)
+        self.assertEqual(spans[-1]['attributes']['spans_dropped'], 3)
+
+
+class TestRequestTracing(unittest.TestCase):
+    """Test suite for the Flask request hooks and stage spans"""
+
+    def setUp(self):
+        self.client = index.app.test_client()
+        self.client.testing = True
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'traces.jsonl')
+        zones = os.path.join(self.tmp.name, 'zones.db')
+        write_zones_db(zones, {h3.str_to_int(h3.latlng_to_cell(*DEHRADUN, 8)): (7, 40.0, 18.7)})
+        self.exporter = JsonLinesExporter(self.path)
+        self.saved = (index.tracer, index.LP_BACKEND, index.ZONES_DB_PATH, index.zones_store)
+        index.tracer = Tracer(self.exporter, 1.0)
+        index.LP_BACKEND, index.ZONES_DB_PATH, index.zones_store = 'zones_db', zones, None
+        index.lp_cache.clear()
+
+    def tearDown(self):
+        index.tracer, index.LP_BACKEND, index.ZONES_DB_PATH, index.zones_store = self.saved
+        index.lp_cache.clear()
+        self.exporter.close()
+        self.tmp.cleanup()
+
+    def test_light_pollution_stages(self):
+        response = self.client.get(f'/api/light-pollution?lat={DEHRADUN[0]}&lon={DEHRADUN[1]}')
+        self.assertEqual(response.status_code, 200)
+        spans = read_spans(self.path)
+        root = spans[-1]
+        self.assertEqual(root['name'], 'GET /api/light-pollution')
+        self.assertEqual((root['attributes']['http.route'], root['attributes']['http.status_code']),
+                         ('/api/light-pollution', 200))
+        self.assertEqual([s['name'] for s in spans[:-1]],
+                         ['routing', 'parse', 'h3.latlng_to_cell', 'cache.get', 'zones_db.lookup', 'json.encode'])
+        self.assertTrue(all(s['parent_span_id'] == root['span_id'] for s in spans[:-1]))
+        self.assertEqual(response.headers['traceparent'], f"00-{root['trace_id']}-{root['span_id']}-01")
+
+    def test_batch_stages(self):
+        self.client.post('/api/light-pollution/batch', json={"points": [list(DEHRADUN)] * 3})
+        names = [s['name'] for s in read_spans(self.path)]
+        for stage in ('parse', 'h3.latlng_to_cells', 'cache.get', 'zones_db.lookup', 'json.encode'):
+            self.assertIn(stage, names)
+
+    def test_disabled_tracer(self):
+        index.tracer = Tracer(None, 0.0)
+        response = self.client.get(f'/api/light-pollution?lat={DEHRADUN[0]}&lon={DEHRADUN[1]}',
+                                   headers={'traceparent': UPSTREAM})
+        self.assertNotIn('traceparent', response.headers)
+        self.assertEqual(read_spans(self.path), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+import unittest
+import sys
+import os
+import json
+import tempfile
+
+import h3
+import numpy as np
+from h3.api import numpy_int as h3_int
+
+# Add parent directory to path to import api module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import api.index as index
+from api.zones_store import ZonesStore
+from api.area_stats import AreaPyramid
+from api.viewport import (zoom_resolution, viewport_shape, covering, stream_cells, brightest_zone,
+                          encode_binary, decode_binary)
+from tests.test_zones_store import write_zones_db
+
+DEHRADUN = (30.3165, 78.0322)
+# Taveuni, Fiji: straddles the antimeridian
+TAVEUNI = (-16.85, 179.98)
+
+
+def setUpModule():
+    global tmp, zones_path
+    rng = np.random.default_rng(3)
+    rows = {}
+    for lat, lon in (DEHRADUN, TAVEUNI):
+        disk = np.asarray(h3_int.grid_disk(h3_int.latlng_to_cell(lat, lon, 5), 2))
+        cells = np.concatenate([np.asarray(h3_int.cell_to_children(c, 8)) for c in disk.tolist()])
+        for cell in rng.choice(cells, 4000, replace=False).tolist():
+            rows[cell] = (int(rng.integers(2, 10)), 1.0, float(rng.uniform(17.0, 21.9)))
+    tmp = tempfile.TemporaryDirectory()
+    zones_path = os.path.join(tmp.name, 'zones.db')
+    write_zones_db(zones_path, rows)
+
+
+def tearDownModule():
+    tmp.cleanup()
+
+
+def centre_in(cells, west, south, east, north):
+    latlng = np.array([h3_int.cell_to_latlng(c) for c in np.asarray(cells).tolist()]).reshape(-1, 2)
+    lons = latlng[:, 1] if west < east else np.where(latlng[:, 1] < 0, latlng[:, 1] + 360, latlng[:, 1])
+    east = east if west < east else east + 360
+    return (latlng[:, 0] >= south) & (latlng[:, 0] <= north) & (lons >= west) & (lons <= east)
+
+
+class TestViewport(unittest.TestCase):
+    """Test suite for viewport coverings and the streamed range scans"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.store = ZonesStore(zones_path)
+        cls.pyramid = AreaPyramid(cls.store)
+
+    def cells(self, bbox, resolution, chunk=16384, pad_km=0.0):
+        chunks = list(stream_cells(self.store, self.pyramid, covering(viewport_shape(*bbox, pad_km), resolution),
+                                   resolution, chunk))
+        cells = np.concatenate([c for c, _ in chunks]) if chunks else np.zeros(0, dtype=np.uint64)
+        zones = np.concatenate([z for _, z in chunks]) if chunks else np.zeros(0, dtype=np.uint8)
+        return cells, zones, len(chunks)
+
+    def test_zoom_resolution(self):
+        self.assertEqual([zoom_resolution(z) for z in (0, 4, 5, 7, 8, 10, 12, 18)], [3, 3, 4, 5, 6, 7, 8, 8])
+
+    def test_stored_cells(self):
+        """Res 8: exactly the stored cells centred in the box, sorted, with their zones"""
+        lat, lon = DEHRADUN
+        bbox = (lon - 0.2, lat - 0.15, lon + 0.25, lat + 0.1)
+        cells, zones, _ = self.cells(bbox, 8)
+        expected = self.store.cells[centre_in(self.store.cells, *bbox)]
+        np.testing.assert_array_equal(cells, expected)
+        np.testing.assert_array_equal(zones, self.store.lookup_cells(cells)['zone'])
+
+    def test_chunks(self):
+        lat, lon = DEHRADUN
+        bbox = (lon - 0.5, lat - 0.5, lon + 0.5, lat + 0.5)
+        whole, _, count = self.cells(bbox, 8)
+        chunked, _, chunks = self.cells(bbox, 8, chunk=200)
+        self.assertEqual(count, 1)
+        self.assertGreater(chunks, 5)
+        np.testing.assert_array_equal(whole, chunked)
+
+    def test_aggregates(self):
+        """Coarse resolutions from zones.db (6) and from the pyramid (4) match a direct grouping"""
+        lat, lon = DEHRADUN
+        bbox = (lon - 1.5, lat - 1.5, lon + 1.5, lat + 1.5)
+        for resolution in (6, 4):
+            cells, zones, _ = self.cells(bbox, resolution, chunk=50, pad_km=30)
+            self.assertTrue((np.diff(cells.astype(np.int64)) > 0).all())
+            parents = np.array([h3_int.cell_to_parent(c, resolution) for c in self.store.cells.tolist()])
+            cover = h3_int.uncompact_cells(covering(viewport_shape(*bbox, 30), resolution), resolution)
+            inside = np.isin(parents, np.asarray(cover, dtype=np.uint64))
+            expected = np.unique(parents[inside])
+            np.testing.assert_array_equal(cells, expected)
+            counts = np.zeros((len(expected), 9))
+            for parent, zone in zip(parents[inside], self.store.records['zone'][inside]):
+                counts[np.searchsorted(expected, parent), zone - 1] += 1
+            np.testing.assert_array_equal(zones, brightest_zone(counts, resolution))
+
+    def test_antimeridian(self):
+        lat, lon = TAVEUNI
+        bbox = (179.7, lat - 0.3, -179.7, lat + 0.3)
+        cells, _, _ = self.cells(bbox, 8)
+        lons = np.array([h3_int.cell_to_latlng(c)[1] for c in cells.tolist()])
+        self.assertTrue((lons > 0).any() and (lons < 0).any())
+        np.testing.assert_array_equal(cells, self.store.cells[centre_in(self.store.cells, *bbox)])
+
+    def test_binary_round_trip(self):
+        cells = np.array([h3.str_to_int(h3.latlng_to_cell(*DEHRADUN, 8))], dtype=np.uint64)
+        zones = np.array([7], dtype=np.uint8)
+        data = b''.join(encode_binary(iter([(cells, zones), (cells, zones)]), 8))
+        self.assertEqual(len(data), 8 + 2 * (4 + 9) + 4)
+        resolution, decoded, decoded_zones = decode_binary(data)
+        self.assertEqual((resolution, decoded.tolist(), decoded_zones.tolist()), (8, cells.tolist() * 2, [7, 7]))
+
+
+class TestViewportEndpoint(unittest.TestCase):
+    """Test suite for GET /api/viewport"""
+
+    def setUp(self):
+        self.client = index.app.test_client()
+        self.client.testing = True
+        self.saved = (index.ZONES_DB_PATH, index.zones_store, index.area_pyramid)
+        index.ZONES_DB_PATH, index.zones_store, index.area_pyramid = zones_path, None, None
+        lat, lon = DEHRADUN
+        self.bbox = f'{lon - 0.2},{lat - 0.2},{lon + 0.2},{lat + 0.2}'
+
+    def tearDown(self):
+        index.ZONES_DB_PATH, index.zones_store, index.area_pyramid = self.saved
+
+    def test_binary(self):
+        response = self.client.get(f'/api/viewport?bbox={self.bbox}&zoom=13')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed)
+        self.assertEqual((response.content_type, response.headers['X-H3-Resolution']),
+                         ('application/octet-stream', '8'))
+        resolution, cells, zones = decode_binary(response.get_data())
+        self.assertEqual(resolution, 8)
+        self.assertGreater(len(cells), 0)
+        np.testing.assert_array_equal(zones, index.zones_store.lookup_cells(cells)['zone'])
+
+    def test_ndjson(self):
+        binary = decode_binary(self.client.get(f'/api/viewport?bbox={self.bbox}&zoom=8').get_data())
+        response = self.client.get(f'/api/viewport?bbox={self.bbox}&zoom=8&format=ndjson')
+        self.assertEqual(response.content_type, 'application/x-ndjson')
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual([int(l['h3'], 16) for l in lines], binary[1].tolist())
+        self.assertEqual([l['zone'] for l in lines], binary[2].tolist())
+        self.assertEqual(response.headers['X-H3-Resolution'], '6')
+
+    def test_large_viewport_is_coarsened(self):
+        response = self.client.get('/api/viewport?bbox=-180,-85,180,85&zoom=12')
+        self.assertLessEqual(int(response.headers['X-H3-Resolution']), 3)
+        self.assertGreater(len(decode_binary(response.get_data())[1]), 0)
+
+    def test_invalid(self):
+        for query in ('zoom=8', 'bbox=1,2,3&zoom=8', 'bbox=0,10,1,5&zoom=8', f'bbox={self.bbox}',
+                      f'bbox={self.bbox}&zoom=30', f'bbox={self.bbox}&zoom=8&format=xml'):
+            self.assertEqual(self.client.get(f'/api/viewport?{query}').status_code, 400, query)
+
+    def test_unavailable(self):
+        index.ZONES_DB_PATH = os.path.join(tmp.name, 'missing.db')
+        self.assertEqual(self.client.get(f'/api/viewport?bbox={self.bbox}&zoom=8').status_code, 503)
+
+
+if __name__ == '__main__':
+    unittest.main()
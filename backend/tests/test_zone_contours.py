@@ -0,0 +1,181 @@
+import unittest
+import sys
+import os
+import tempfile
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+from h3.api import numpy_int as h3_int
+
+# Add the repository's scripts directory to path to import the pipeline scripts
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'scripts')))
+
+from tests.test_zones_store import write_zones_db
+
+try:
+    import zone_contours
+except ImportError:  # pipeline dependencies (rasterio, scipy, tqdm) not installed
+    zone_contours = None
+
+DEHRADUN = (30.3165, 78.0322)
+
+
+def polygons_of(path):
+    """Dissolve a zones.db into polygons, as zone_contours.main does"""
+    a, b, zone = zone_contours.dissolve_edges(path, 1)
+    rings = zone_contours.chain_rings(a, b, zone)
+    vertices = np.unique(a)
+    coords = zone_contours._vertex_latlng(vertices)
+    return zone_contours.build_polygons([(z, np.searchsorted(vertices, v)) for z, v in rings], coords)
+
+
+def read_varint(data, i):
+    value = shift = 0
+    while True:
+        byte = data[i]
+        value |= (byte & 0x7f) << shift
+        i += 1
+        if not byte & 0x80:
+            return value, i
+        shift += 7
+
+
+def read_fields(data):
+    """(field number, value) pairs of one protobuf message (varint or length-delimited)"""
+    fields, i = [], 0
+    while i < len(data):
+        key, i = read_varint(data, i)
+        if key & 7 == 0:
+            value, i = read_varint(data, i)
+        else:
+            size, i = read_varint(data, i)
+            value, i = data[i:i + size], i + size
+        fields.append((key >> 3, value))
+    return fields
+
+
+def read_packed(data):
+    values, i = [], 0
+    while i < len(data):
+        value, i = read_varint(data, i)
+        values.append(value)
+    return values
+
+
+def decode_rings(commands):
+    """Rings (lists of (x, y) in tile coordinates) from an MVT geometry"""
+    rings, ring, x, y, i = [], None, 0, 0, 0
+    while i < len(commands):
+        command, count = commands[i] & 7, commands[i] >> 3
+        i += 1
+        if command == 7:
+            rings.append(ring)
+            continue
+        for _ in range(count):
+            dx, dy = commands[i], commands[i + 1]
+            x += (dx >> 1) ^ -(dx & 1)
+            y += (dy >> 1) ^ -(dy & 1)
+            i += 2
+            if command == 1:
+                ring = []
+            ring.append((x, y))
+    return rings
+
+
+def tile_area(ring):
+    """Shoelace area in tile coordinates; positive is clockwise on screen (y down), the MVT exterior winding"""
+    return sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(ring, ring[1:] + ring[:1])) / 2
+
+
+@unittest.skipIf(zone_contours is None, "Pipeline dependencies not installed (scripts/requirements.txt)")
+class TestZoneContours(unittest.TestCase):
+    """Test suite for dissolving zones.db into polygons and vector tiles"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'zones.db')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write_nested(self):
+        """Zone 5 core (one ring of neighbours) inside a zone 2 ring out to four cells"""
+        centre = h3_int.latlng_to_cell(*DEHRADUN, 8)
+        core = set(h3_int.grid_disk(centre, 1))
+        rows = {int(c): (5 if c in core else 2, 1.0, 20.0) for c in h3_int.grid_disk(centre, 4)}
+        write_zones_db(self.path, rows)
+
+    def test_nested_zones(self):
+        self.write_nested()
+        polygons = polygons_of(self.path)
+        self.assertEqual(sorted((zone, len(rings)) for zone, rings in polygons), [(2, 2), (5, 1)])
+        outer, hole = dict(polygons)[2]
+        # Outer rings counter-clockwise, holes clockwise
+        self.assertGreater(zone_contours.signed_area(outer[:, 0], outer[:, 1]), 0)
+        self.assertLess(zone_contours.signed_area(hole[:, 0], hole[:, 1]), 0)
+        # The hole is exactly the zone 5 outline
+        core = dict(polygons)[5][0]
+        self.assertEqual(sorted(map(tuple, np.round(hole, 9))), sorted(map(tuple, np.round(core, 9))))
+
+    def test_split_base_cell_matches_unsplit(self):
+        # A patch of cells straddling two res-2 parents of one base cell
+        parent = h3_int.latlng_to_cell(*DEHRADUN, 2)
+        neighbour = next(c for c in h3_int.grid_ring(parent, 1)
+                         if h3_int.get_base_cell_number(c) == h3_int.get_base_cell_number(parent))
+        (lat0, lon0), (lat1, lon1) = h3_int.cell_to_latlng(parent), h3_int.cell_to_latlng(neighbour)
+        centre = h3_int.latlng_to_cell((lat0 + lat1) / 2, (lon0 + lon1) / 2, 8)
+        rng = np.random.default_rng(0)
+        cells = h3_int.grid_disk(centre, 12)
+        write_zones_db(self.path, {int(c): (int(rng.integers(2, 5)), 1.0, 20.0) for c in cells})
+        self.assertGreater(len({h3_int.cell_to_parent(c, 2) for c in cells}), 1)
+
+        records = zone_contours.open_zones(self.path)
+        self.assertEqual(len(zone_contours.plan_tasks(records)), 1)
+        whole = zone_contours.dissolve_edges(self.path, 1)
+        with patch.object(zone_contours, 'CHUNK', 100):
+            tasks = zone_contours.plan_tasks(records)
+            split = zone_contours.dissolve_edges(self.path, 1)
+        self.assertGreater(len(tasks), 1)
+        self.assertEqual(len({base for base, _, _ in tasks}), 1)
+
+        def edges(a, b, zone):
+            return sorted(zip(a.tolist(), b.tolist(), zone.tolist()))
+        self.assertEqual(edges(*split), edges(*whole))
+
+    def test_tile(self):
+        self.write_nested()
+        tiles_dir = Path(self.tmp.name) / 'tiles'
+        tiles_dir.mkdir()
+        zone_contours.write_tiles(polygons_of(self.path), tiles_dir, 12, 12, 1)
+        paths = sorted(tiles_dir.glob('12/*/*.mvt'))
+        self.assertTrue(paths)
+
+        features = {}
+        for path in paths:
+            (number, layer), = read_fields(path.read_bytes())
+            self.assertEqual(number, 3)
+            layer = read_fields(layer)
+            self.assertEqual(dict(layer)[1], b'bortle')
+            self.assertEqual(dict(layer)[5], zone_contours.TILE_EXTENT)
+            values = [read_fields(v)[0][1] for n, v in layer if n == 4]
+            for n, feature in layer:
+                if n != 2:
+                    continue
+                feature = dict(read_fields(feature))
+                self.assertEqual(feature[3], 3)  # polygon
+                zone = values[read_packed(feature[2])[1]]
+                features.setdefault(zone, []).append(decode_rings(read_packed(feature[4])))
+        self.assertEqual(sorted(features), [2, 5])
+
+        # The tile holding the centre has the zone 2 exterior plus a hole, and the zone 5 exterior
+        whole = [rings for rings in features[2] if len(rings) == 2]
+        self.assertTrue(whole)
+        exterior, hole = whole[0]
+        self.assertGreater(tile_area(exterior), 0)
+        self.assertLess(tile_area(hole), 0)
+        self.assertTrue(all(tile_area(rings[0]) > 0 for rings in features[5]))
+
+
+if __name__ == '__main__':
+    unittest.main()
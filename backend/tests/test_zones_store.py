@@ -0,0 +1,202 @@
+import unittest
+import sys
+import os
+import struct
+import tempfile
+from unittest.mock import patch
+
+import h3
+import numpy as np
+
+# Add parent directory to path to import api module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import api.index as index
+from api.zones_store import ZonesStore, ZONES_DTYPE, FENCE_STRIDE
+
+DEHRADUN = (30.3165, 78.0322)
+
+
+def write_zones_db(path, rows):
+    """Write a zones.db with the given {h3_int: (zone, radiance, sqm)} rows"""
+    records = np.zeros(len(rows), dtype=ZONES_DTYPE)
+    for i, cell in enumerate(sorted(rows)):
+        zone, radiance, sqm = rows[cell]
+        records[i]['h3'] = cell
+        records[i]['zone'] = zone
+        records[i]['radiance'] = radiance
+        records[i]['sqm'] = sqm
+    with open(path, 'wb') as f:
+        f.write(b'ASTR\x01\x00\x00\x00')
+        f.write(struct.pack('<Q', len(records)))
+        records.tofile(f)
+
+
+def write_dark_distance(path, rows, thresholds=(2, 3, 4)):
+    """Write a dark_distance.db with one (distances, bearings) row per zones.db record"""
+    k = len(thresholds)
+    records = np.zeros(len(rows), dtype=[('distance', '<u2', (k,)), ('bearing', 'u1', (k,))])
+    for i, (distance, bearing) in enumerate(rows):
+        records[i] = (distance, bearing)
+    with open(path, 'wb') as f:
+        f.write(b'ASTN' + struct.pack('<HHQ', 1, sum(1 << t for t in thresholds), len(records)))
+        records.tofile(f)
+
+
+class TestZonesStore(unittest.TestCase):
+    """Test suite for the zones.db reader"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'zones.db')
+        self.cell = h3.str_to_int(h3.latlng_to_cell(*DEHRADUN, 8))
+        write_zones_db(self.path, {self.cell: (7, 40.0, 18.7)})
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_lookup_hit(self):
+        """Stored cell returns its zone and SQM"""
+        result = ZonesStore(self.path).lookup(*DEHRADUN)
+        self.assertEqual(h3.str_to_int(result['h3']), self.cell)
+        self.assertEqual(result['zone'], 7)
+        self.assertAlmostEqual(result['sqm'], 18.7, places=5)
+        self.assertFalse(result['implicit'])
+
+    def test_lookup_miss_is_zone_1(self):
+        """Cells not stored are implicit Zone 1"""
+        result = ZonesStore(self.path).lookup(-45.0, -120.0)
+        self.assertEqual(result['zone'], 1)
+        self.assertEqual(result['sqm'], 22.0)
+        self.assertTrue(result['implicit'])
+
+    def test_find_across_fence_blocks(self):
+        """Every key is found when the table spans several fence blocks"""
+        cells = np.arange(1000, 1000 + 3 * FENCE_STRIDE + 17, 2, dtype=np.uint64)
+        write_zones_db(self.path, {int(c): (2, 0.3, 21.5) for c in cells})
+        store = ZonesStore(self.path)
+        self.assertTrue(all(store.find(int(c)) == i for i, c in enumerate(cells)))
+        self.assertEqual(store.find(999), -1)
+        self.assertEqual(store.find(1001), -1)
+        self.assertEqual(store.find(int(cells[-1]) + 2), -1)
+
+    def test_empty_file(self):
+        """A zones.db without records answers everything as Zone 1"""
+        write_zones_db(self.path, {})
+        self.assertTrue(ZonesStore(self.path).lookup(*DEHRADUN)['implicit'])
+
+    def test_rejects_other_files(self):
+        """A horizon.db header is not accepted"""
+        bad = os.path.join(self.tmp.name, 'horizon.db')
+        with open(bad, 'wb') as f:
+            f.write(b'ASTH' + struct.pack('<HBBQ', 1, 36, 6, 0))
+        with self.assertRaises(ValueError):
+            ZonesStore(bad)
+
+
+class TestDarkDistanceSidecar(unittest.TestCase):
+    """Test suite for the dark_distance.db sidecar"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'zones.db')
+        self.sidecar = os.path.join(self.tmp.name, 'dark_distance.db')
+        write_zones_db(self.path, {h3.str_to_int(h3.latlng_to_cell(*DEHRADUN, 8)): (3, 0.6, 21.7)})
+        # 12.3 km north for Bortle 2; Bortle 3 and 4 are already met
+        write_dark_distance(self.sidecar, [([123, 0, 0], [0, 0, 0])])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_lookup_includes_nearest_dark(self):
+        """Distances decode from 0.1 km units; met thresholds are zero"""
+        result = ZonesStore(self.path, self.sidecar).lookup(*DEHRADUN)
+        self.assertEqual(result['nearest_dark']['2'], {"distance_km": 12.3, "bearing_deg": 0.0})
+        self.assertEqual(result['nearest_dark']['3'], {"distance_km": 0.0, "bearing_deg": None})
+
+    def test_implicit_cell_is_already_dark(self):
+        """Implicit Zone 1 meets every threshold"""
+        result = ZonesStore(self.path, self.sidecar).lookup(-45.0, -120.0)
+        self.assertEqual({v["distance_km"] for v in result['nearest_dark'].values()}, {0.0})
+
+    def test_lookup_cells_columns(self):
+        """Batch lookups carry the raw sidecar columns"""
+        store = ZonesStore(self.path, self.sidecar)
+        found = store.lookup_many([DEHRADUN[0], -45.0], [DEHRADUN[1], -120.0])
+        self.assertEqual(found['dark_distance'].tolist(), [[123, 0, 0], [0, 0, 0]])
+        self.assertNotIn('dark_distance', ZonesStore(self.path).lookup_many([0.0], [0.0]))
+
+    def test_rejects_mismatched_sidecar(self):
+        """A sidecar built from a different zones.db is refused"""
+        write_dark_distance(self.sidecar, [([1, 1, 1], [0, 0, 0])] * 2)
+        with self.assertRaises(ValueError):
+            ZonesStore(self.path, self.sidecar)
+
+
+class TestZonesBackendEndpoint(unittest.TestCase):
+    """Test suite for /api/light-pollution with LP_BACKEND=zones_db"""
+
+    def setUp(self):
+        self.client = index.app.test_client()
+        self.client.testing = True
+        self.tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(self.tmp.name, 'zones.db')
+        write_zones_db(path, {h3.str_to_int(h3.latlng_to_cell(*DEHRADUN, 8)): (7, 40.0, 18.7)})
+        self.saved = (index.LP_BACKEND, index.ZONES_DB_PATH, index.zones_store)
+        index.LP_BACKEND = 'zones_db'
+        index.ZONES_DB_PATH = path
+        index.zones_store = None
+
+    def tearDown(self):
+        index.LP_BACKEND, index.ZONES_DB_PATH, index.zones_store = self.saved
+        self.tmp.cleanup()
+
+    @patch('api.index.get_db')
+    def test_lookup_found(self, mock_get_db):
+        """Stored cell is served from zones.db without touching MongoDB"""
+        response = self.client.get(f'/api/light-pollution?lat={DEHRADUN[0]}&lon={DEHRADUN[1]}')
+        self.assertEqual(response.status_code, 200)
+
+        data = response.get_json()
+        self.assertEqual(data['bortle_class'], 7)
+        self.assertEqual(data['mpsas'], 18.7)
+        self.assertFalse(data['fallback'])
+        self.assertFalse(data['implicit'])
+        mock_get_db.assert_not_called()
+
+    def test_lookup_implicit(self):
+        """Unlit site is implicit Zone 1"""
+        response = self.client.get('/api/light-pollution?lat=-45.0&lon=-120.0')
+        data = response.get_json()
+        self.assertEqual(data['bortle_class'], 1)
+        self.assertEqual(data['mpsas'], 22.0)
+        self.assertTrue(data['implicit'])
+
+    def test_missing_file_falls_back(self):
+        """Missing zones.db returns the standard fallback payload"""
+        index.ZONES_DB_PATH = os.path.join(self.tmp.name, 'absent.db')
+        response = self.client.get(f'/api/light-pollution?lat={DEHRADUN[0]}&lon={DEHRADUN[1]}')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.get_json()['fallback'])
+
+    def test_health_reports_backend(self):
+        """Health check names the active backend"""
+        data = self.client.get('/api/health').get_json()
+        self.assertEqual(data['backend'], 'zones_db')
+        self.assertEqual(data['database'], 'connected')
+
+    def test_nearest_dark_when_sidecar_deployed(self):
+        """nearest_dark appears only when dark_distance.db is present"""
+        url = f'/api/light-pollution?lat={DEHRADUN[0]}&lon={DEHRADUN[1]}'
+        self.assertNotIn('nearest_dark', self.client.get(url).get_json())
+
+        sidecar = os.path.join(self.tmp.name, 'dark_distance.db')
+        write_dark_distance(sidecar, [([250, 180, 41], [64, 64, 128])])
+        index.zones_store = None
+        with patch.object(index, 'DARK_DISTANCE_PATH', sidecar):
+            data = self.client.get(url).get_json()
+        self.assertEqual(data['nearest_dark']['4'], {"distance_km": 4.1, "bearing_deg": 180.0})
+
+
+if __name__ == '__main__':
+    unittest.main()
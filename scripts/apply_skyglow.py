@@ -9,15 +9,27 @@ for the "light dome" effect visible from dark sites near cities.
 Model: Garstang-inspired atmospheric scatter with exponential decay.
   scatter(d) = fraction * exp(-d/scale) / (1 + (d/d0)^power)
 
+Engines:
+  raster  Convolve a downsampled lat/lon raster, then re-scan the VNL raster
+          at full resolution to attach scatter to H3 cells (default).
+          With --sparse, both the coarse grid and the re-scan come from the
+          store written by generate_zones_vnl.py --fused instead.
+  h3      Aggregate the accumulator's cells to a coarse H3 resolution, spread
+          light over distance-weighted grid_disk rings and push the scatter
+          down to res-8 children. Never re-reads the raster.
+
 Usage:
     pip install scipy  (one-time)
     python apply_skyglow.py --tif "../VNL NPP 2024 Global Masked Data.tif.gz"
+    python apply_skyglow.py --sparse data/sparse
+    python apply_skyglow.py --engine h3 --accum data/zones_accumulator.db
 """
 
 import os
 os.environ['GDAL_CACHEMAX'] = '256'
 
-import sys, argparse, struct, hashlib, math, gc, sqlite3
+import sys, argparse, struct, hashlib, math, gc, sqlite3, json
+from functools import lru_cache
 import numpy as np
 from pathlib import Path
 from tqdm import tqdm
@@ -26,9 +38,13 @@ for pkg in ['rasterio', 'h3', 'scipy']:
     try: __import__(pkg)
     except ImportError: print(f"Missing: {pkg}. Run: pip install {pkg}"); sys.exit(1)
 
-import rasterio, rasterio.windows, h3
+import rasterio, rasterio.windows, rasterio.warp, h3
+from h3.api import numpy_int as h3_np
+from scipy import fft as sp_fft
 from scipy.signal import fftconvolve
 
+import sparse_store
+
 # ============================================================================
 # Configuration
 # ============================================================================
@@ -45,6 +61,20 @@ MAX_RADIUS_KM = 80.0     # truncation radius
 D_REF_KM = 10.0          # reference distance for power law
 PIXEL_KM = 5.55          # km per coarse pixel at equator
 
+# Spatially varying kernels (--elevation / --aod, raster engine)
+# Scatter seen at a site depends on the air above it: less column above
+# high sites, more (and shorter-range) scatter under hazy skies.
+KERNEL_BANK_SIZE = 3  # kernels, spaced geometrically over the local scale range
+AOD_REF = 0.15               # reference aerosol optical depth (550 nm)
+AEROSOL_SHARE = 0.5          # share of scatter from aerosols at sea level, AOD_REF
+RAYLEIGH_SCALE_HEIGHT_KM = 8.0
+AEROSOL_SCALE_HEIGHT_KM = 1.5
+
+# H3 engine (--engine h3)
+H3_COARSE_RESOLUTION = 6  # ~36 km² cells, close to the 5.55 km coarse pixel
+H3_CHUNK = 1_000_000      # accumulator rows per read
+EMITTER_CHUNK = 20_000    # coarse emitters spread per batch
+
 # Zone formula (must match generate_zones_vnl.py exactly)
 # Calibrated thresholds from ground-truth SQM studies
 ZONE_THRESHOLDS = [
@@ -63,26 +93,174 @@ def radiance_to_sqm(r):
     if r <= 0: return 22.0
     return max(16.0, min(22.0, 22.0 - 1.7 * math.log10(1.0 + 2.0 * r)))
 
+# zones.db record: h3 u64, zone u8, radiance f32, sqm f32, 3 pad bytes
+RECORD_DTYPE = np.dtype([('h3', '<u8'), ('zone', 'u1'), ('radiance', '<f4'), ('sqm', '<f4'), ('pad', 'V3')])
+
+def zone_records(cells, rads):
+    """radiance_to_zone / radiance_to_sqm over arrays: zones.db records of the Zone 2+ cells"""
+    zone = np.ones(len(rads), dtype=np.uint8)
+    for thresh, z in reversed(ZONE_THRESHOLDS):
+        zone[rads >= thresh] = z
+    keep = zone > 1
+    rads = rads[keep]
+    records = np.zeros(len(rads), dtype=RECORD_DTYPE)
+    records['h3'] = cells[keep]
+    records['zone'] = zone[keep]
+    records['radiance'] = rads
+    records['sqm'] = np.clip(22.0 - 1.7 * np.log10(1.0 + 2.0 * rads), 16.0, 22.0)
+    return records
+
 
 # ============================================================================
 # Scatter Kernel
 # ============================================================================
-def create_scatter_kernel():
+def scatter_weight(d_km, scale_km=None):
+    """Scatter kernel value at distance d_km (scalar or array). 0 outside [0.5, MAX_RADIUS_KM]."""
+    d = np.asarray(d_km, dtype=np.float64)
+    w = (SCATTER_FRACTION * np.exp(-d / (scale_km or SCATTER_SCALE_KM)) /
+         (1.0 + (d / D_REF_KM) ** SCATTER_POWER))
+    return np.where((d < 0.5) | (d > MAX_RADIUS_KM), 0.0, w)
+
+
+def create_scatter_kernel(scale_km=None):
     """Atmospheric scatter PSF. Center zeroed (no self-scatter)."""
     radius_px = int(MAX_RADIUS_KM / PIXEL_KM) + 1
     size = 2 * radius_px + 1
-    kernel = np.zeros((size, size), dtype=np.float64)
     c = radius_px
 
-    for y in range(size):
-        for x in range(size):
-            d = math.sqrt(((y - c) * PIXEL_KM)**2 + ((x - c) * PIXEL_KM)**2)
-            if d < 0.5 or d > MAX_RADIUS_KM:
-                continue
-            kernel[y, x] = (SCATTER_FRACTION *
-                            math.exp(-d / SCATTER_SCALE_KM) /
-                            (1.0 + (d / D_REF_KM) ** SCATTER_POWER))
-    return kernel.astype(np.float32)
+    y, x = np.mgrid[0:size, 0:size]
+    d = np.sqrt(((y - c) * PIXEL_KM)**2 + ((x - c) * PIXEL_KM)**2)
+    return scatter_weight(d, scale_km).astype(np.float32)
+
+
+# ============================================================================
+# Kernel bank: spatially varying scatter from elevation / aerosol rasters
+# ============================================================================
+def local_kernel_params(elevation_m, aod):
+    """
+    Per-pixel (amplitude, scale_km) of the scatter kernel seen at each site.
+
+    Amplitude splits scatter into a molecular part thinning with the
+    Rayleigh scale height and an aerosol part proportional to AOD that
+    thins with the much shorter aerosol scale height. Higher AOD also
+    shortens the decay length (light is extinguished sooner).
+    """
+    elev_km = np.maximum(np.asarray(elevation_m, dtype=np.float32), 0.0)
+    elev_km *= np.float32(1e-3)
+    aod = np.clip(np.asarray(aod, dtype=np.float32), 0.01, 5.0)
+
+    amplitude = np.exp(elev_km * np.float32(-1.0 / RAYLEIGH_SCALE_HEIGHT_KM))
+    amplitude *= np.float32(1.0 - AEROSOL_SHARE)
+    np.multiply(elev_km, np.float32(-1.0 / AEROSOL_SCALE_HEIGHT_KM), out=elev_km)
+    np.exp(elev_km, out=elev_km)
+    elev_km *= aod
+    amplitude += elev_km * np.float32(AEROSOL_SHARE / AOD_REF)
+
+    scale_km = np.sqrt(np.float32(AOD_REF) / aod)
+    scale_km *= np.float32(SCATTER_SCALE_KM)
+    return amplitude, scale_km
+
+
+def kernel_bank_scales(scale_km, size=KERNEL_BANK_SIZE):
+    """
+    `size` scale lengths spaced geometrically from the smallest to the
+    largest local scale, so every pixel interpolates between two kernels,
+    none is clipped to the edge of the bank, and the FFT count stays fixed.
+    A uniform scale needs a single kernel.
+    """
+    lo = math.floor(float(scale_km.min()) * 100) / 100
+    hi = math.ceil(float(scale_km.max()) * 100) / 100
+    if hi - lo < 0.01:
+        return (lo,)
+    return tuple(round(s, 2) for s in np.geomspace(lo, hi, size).tolist())
+
+
+def read_param_raster(path, shape, transform, default):
+    """Resample an elevation/AOD raster onto the coarse grid (area average), default where missing."""
+    out = np.full(shape, np.nan, dtype=np.float32)
+    with rasterio.open(path) as src:
+        rasterio.warp.reproject(
+            source=rasterio.band(src, 1), destination=out,
+            src_transform=src.transform, src_crs=src.crs, src_nodata=src.nodata,
+            dst_transform=transform, dst_crs=src.crs or 'EPSG:4326', dst_nodata=np.nan,
+            resampling=rasterio.warp.Resampling.average)
+    np.copyto(out, np.float32(default), where=np.isnan(out))
+    return out
+
+
+def convolve_kernel_bank(coarse, kernels):
+    """
+    Convolve the coarse grid with every kernel in the bank ('same' mode).
+
+    The source spectrum is computed once and shared, so a bank of B
+    kernels costs 1 + 2B FFTs against 3 for a single fftconvolve.
+    """
+    kh, kw = kernels[0].shape
+    fshape = [sp_fft.next_fast_len(n + k - 1, real=True)
+              for n, k in zip(coarse.shape, (kh, kw))]
+    y0, x0 = (kh - 1) // 2, (kw - 1) // 2
+    h, w = coarse.shape
+
+    src_f = sp_fft.rfft2(coarse, fshape, workers=-1)
+    outputs = []
+    for kernel in tqdm(kernels, desc="Kernel bank", unit="kernel"):
+        full = sp_fft.irfft2(src_f * sp_fft.rfft2(kernel, fshape, workers=-1), fshape, workers=-1)
+        outputs.append(np.maximum(full[y0:y0 + h, x0:x0 + w], 0).astype(np.float32))
+        del full
+    return outputs
+
+
+def blend_kernel_bank(outputs, amplitude, scale_km, bank):
+    """
+    Blend bank outputs per pixel by interpolating on scale_km.
+
+    Each bank interval clips scale_km into its own [0, 1] fraction, so
+    pixels fall into exactly one parameter class and the telescoping sum
+    reduces to linear interpolation between that class's two outputs.
+    """
+    blended = outputs[0].copy()
+    t = np.empty_like(scale_km)
+    for b in range(len(bank) - 1):
+        np.subtract(scale_km, np.float32(bank[b]), out=t)
+        t *= np.float32(1.0 / (bank[b + 1] - bank[b]))
+        np.clip(t, 0.0, 1.0, out=t)
+        t *= outputs[b + 1] - outputs[b]
+        blended += t
+    blended *= amplitude
+    return blended
+
+
+def variable_scatter(coarse, transform, elevation_path=None, aod_path=None):
+    """Scatter field with per-pixel kernels from local elevation and AOD rasters."""
+    elevation = (read_param_raster(elevation_path, coarse.shape, transform, 0.0)
+                 if elevation_path else np.zeros(coarse.shape, np.float32))
+    aod = (read_param_raster(aod_path, coarse.shape, transform, AOD_REF)
+           if aod_path else np.full(coarse.shape, AOD_REF, np.float32))
+    amplitude, scale_km = local_kernel_params(elevation, aod)
+    del elevation, aod
+    print(f"  Amplitude: {amplitude.min():.2f}–{amplitude.max():.2f}, "
+          f"scale: {scale_km.min():.1f}–{scale_km.max():.1f} km")
+
+    bank = kernel_bank_scales(scale_km)
+    print(f"  Kernel bank: scales {bank} km")
+    kernels = [create_scatter_kernel(s) for s in bank]
+    outputs = convolve_kernel_bank(coarse, kernels)
+    return blend_kernel_bank(outputs, amplitude, scale_km, bank)
+
+
+def scatter_coarse(coarse, coarse_transform, elevation_path=None, aod_path=None):
+    """Phase 2: single kernel, or the kernel bank when elevation/AOD rasters are given."""
+    if elevation_path or aod_path:
+        scattered = variable_scatter(coarse, coarse_transform, elevation_path, aod_path)
+    else:
+        kernel = create_scatter_kernel()
+        print(f"  Kernel: {kernel.shape[0]}×{kernel.shape[1]} pixels")
+        scattered = fftconvolve(coarse, kernel, mode='same').astype(np.float32)
+        scattered = np.maximum(scattered, 0)
+    sig = scattered[scattered > ZONE2_RADIANCE]
+    print(f"  Scatter: max={scattered.max():.4f} nW, "
+          f"pixels above threshold={len(sig):,}")
+    return scattered
 
 
 # ============================================================================
@@ -215,6 +393,254 @@ def enhanced_scan(raster_path, scattered, accum_path):
     return total
 
 
+def enhanced_scan_sparse(store_dir, scattered, accum_path):
+    """
+    Phase 3 from the sparse store written by generate_zones_vnl.py --fused.
+    Same result as enhanced_scan: dark pixels are implicit zeros, so the strip
+    is rebuilt from scatter plus the stored lit pixels without the raster.
+    Lit pixels reuse their stored cells; only dark (or unindexed dim) pixels
+    lifted above Zone 2 by scatter are indexed here.
+    """
+    manifest = sparse_store.read_manifest(store_dir)
+    transform = rasterio.Affine(*manifest['transform'])
+    width, height, strip_height = manifest['width'], manifest['height'], manifest['strip_height']
+
+    conn = sqlite3.connect(str(accum_path))
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA cache_size=-65536')
+
+    sc_h, sc_w = scattered.shape
+    cx_arr = np.minimum(np.arange(width) // DOWNSAMPLE, sc_w - 1)
+    num_strips = (height + strip_height - 1) // strip_height
+
+    for strip_idx, start_row, rows, cols, radiance, cells in tqdm(
+            sparse_store.iter_strips(store_dir), total=num_strips, desc="Enhanced scan", unit="strip"):
+        rows_in_strip = min(strip_height, height - start_row)
+        cy_arr = np.minimum(np.arange(start_row, start_row + rows_in_strip) // DOWNSAMPLE, sc_h - 1)
+        if len(rows) == 0 and scattered[cy_arr[0]:cy_arr[-1] + 1].max() < ZONE2_RADIANCE:
+            continue  # nothing lit and no scatter reaching Zone 2: no full-resolution work
+        scatter_strip = scattered[cy_arr][:, cx_arr]
+        rows_local = rows.astype(np.intp) - start_row
+
+        # Lit pixels: stored radiance + scatter
+        lit_rad = radiance + scatter_strip[rows_local, cols]
+        indexed = cells != 0
+        keep = (lit_rad >= ZONE2_RADIANCE) & indexed
+        all_cells, all_rads = [cells[keep]], [lit_rad[keep]]
+
+        # Dark pixels (scatter alone) and lit pixels the store left unindexed
+        scatter_strip[rows_local, cols] = np.where(indexed, np.float32(0), lit_rad)
+        dark_rows, dark_cols = np.nonzero(scatter_strip >= ZONE2_RADIANCE)
+        if len(dark_rows):
+            dark_cells = sparse_store.pixel_cells(dark_rows + start_row, dark_cols, transform, H3_RESOLUTION)
+            keep = dark_cells != 0
+            all_cells.append(dark_cells[keep])
+            all_rads.append(scatter_strip[dark_rows, dark_cols][keep])
+
+        cells_out, rads_out = sparse_store.reduce_max(
+            np.concatenate(all_cells), np.concatenate(all_rads).astype(np.float64))
+        if len(cells_out):
+            conn.executemany('''
+                INSERT INTO cells (h3, radiance) VALUES (?, ?)
+                ON CONFLICT(h3) DO UPDATE SET radiance = MAX(radiance, excluded.radiance)
+            ''', zip(cells_out.tolist(), rads_out.tolist()))
+            conn.commit()
+        del scatter_strip
+
+    total = conn.execute('SELECT COUNT(*) FROM cells').fetchone()[0]
+    print(f"\nEnhanced scan complete. Total cells: {total:,}")
+    conn.close()
+    return total
+
+
+# ============================================================================
+# H3 engine: propagate on the H3 grid straight from the accumulator
+# ============================================================================
+H3_RES_MASK = np.uint64(0xF << 52)
+
+
+def cells_to_parent(cells, res):
+    """Vectorized h3.cell_to_parent for uint64 cell arrays (pure bit twiddling)."""
+    cells = np.asarray(cells, dtype=np.uint64)
+    unused_digits = np.uint64((1 << (3 * (15 - res))) - 1)
+    return (cells & ~H3_RES_MASK) | np.uint64(res << 52) | unused_digits
+
+
+def reduce_sum(cells, values):
+    """Collapse duplicate cells, summing their values. Returns sorted (cells, sums)."""
+    uniq, inverse = np.unique(cells, return_inverse=True)
+    return uniq, np.bincount(inverse, weights=values)
+
+
+def max_ring():
+    """Number of grid_disk rings covering MAX_RADIUS_KM at the coarse resolution."""
+    spacing = math.sqrt(3) * h3.average_hexagon_edge_length(H3_COARSE_RESOLUTION, 'km')
+    return int(math.ceil(MAX_RADIUS_KM / spacing))
+
+
+@lru_cache(maxsize=None)
+def ring_distances(k):
+    """Cell-centre distances (km) of ring k around a reference hexagon, cached per ring size."""
+    ref = h3.latlng_to_cell(0.0, 0.0, H3_COARSE_RESOLUTION)
+    origin = h3.cell_to_latlng(ref)
+    return np.array([h3.great_circle_distance(origin, h3.cell_to_latlng(c), unit='km')
+                     for c in h3.grid_ring(ref, k)])
+
+
+def h3_weight_scale():
+    """
+    Factor turning scatter_weight(d) into a per-coarse-cell weight.
+
+    Chosen so a full grid_disk carries the same energy as the raster
+    kernel, keeping both engines on the same calibration.
+    """
+    raw = sum(float(scatter_weight(ring_distances(k)).sum()) for k in range(1, max_ring() + 1))
+    return float(create_scatter_kernel().sum()) / raw
+
+
+def ring_weights():
+    """Per-cell scatter weight for rings 1..max_ring(): mean kernel value over each ring's distances."""
+    scale = h3_weight_scale()
+    return [float(scatter_weight(ring_distances(k)).mean()) * scale
+            for k in range(1, max_ring() + 1)]
+
+
+def load_coarse_emitters(conn):
+    """Aggregate accumulator cells into mean radiance per coarse H3 parent."""
+    children = 7 ** (H3_RESOLUTION - H3_COARSE_RESOLUTION)
+    total = conn.execute('SELECT COUNT(*) FROM cells').fetchone()[0]
+    cursor = conn.execute('SELECT h3, radiance FROM cells ORDER BY h3')
+
+    parts_cells, parts_sums = [], []
+    pbar = tqdm(total=total, desc="Aggregating emitters", unit="cell")
+    while True:
+        rows = cursor.fetchmany(H3_CHUNK)
+        if not rows: break
+        cells = np.array([r[0] for r in rows], dtype=np.uint64)
+        rads = np.array([r[1] for r in rows], dtype=np.float64)
+        parents, sums = reduce_sum(cells_to_parent(cells, H3_COARSE_RESOLUTION), rads)
+        parts_cells.append(parents); parts_sums.append(sums)
+        pbar.update(len(rows))
+        del rows, cells, rads
+    pbar.close()
+
+    if not parts_cells:
+        return np.zeros(0, dtype=np.uint64), np.zeros(0)
+    # Rows arrive sorted by h3, so only chunk boundaries can repeat a parent.
+    cells, sums = reduce_sum(np.concatenate(parts_cells), np.concatenate(parts_sums))
+    return cells, sums / children
+
+
+def propagate_h3(emitters, radiance):
+    """Spread coarse emitter radiance over grid_disk rings. Returns sorted (cells, scatter)."""
+    weights = ring_weights()
+    k_max = len(weights)
+    print(f"  Rings: {k_max} at res {H3_COARSE_RESOLUTION}, "
+          f"weights {weights[0]:.4f} … {weights[-1]:.6f}")
+
+    field_cells = np.zeros(0, dtype=np.uint64)
+    field_vals = np.zeros(0)
+    for start in tqdm(range(0, len(emitters), EMITTER_CHUNK), desc="Propagating", unit="batch"):
+        targets, contrib = [], []
+        for cell, rad in zip(emitters[start:start + EMITTER_CHUNK].tolist(),
+                             radiance[start:start + EMITTER_CHUNK].tolist()):
+            for k in range(1, k_max + 1):
+                ring = h3_np.grid_ring(cell, k)
+                targets.append(ring)
+                contrib.append(np.full(len(ring), rad * weights[k - 1]))
+        field_cells, field_vals = reduce_sum(
+            np.concatenate([field_cells] + targets),
+            np.concatenate([field_vals] + contrib))
+        del targets, contrib
+    return field_cells, field_vals.astype(np.float32)
+
+
+def apply_h3_scatter(conn, scatter_cells, scatter_vals):
+    """Add coarse scatter to lit res-8 cells, then insert dark children lifted above Zone 2."""
+    total = conn.execute('SELECT COUNT(*) FROM cells').fetchone()[0]
+    cursor = conn.execute('SELECT h3, radiance FROM cells ORDER BY h3')
+    writer = conn.cursor()
+    updated = 0
+
+    pbar = tqdm(total=total, desc="Enhancing lit cells", unit="cell")
+    while True:
+        rows = cursor.fetchmany(H3_CHUNK)
+        if not rows: break
+        cells = np.array([r[0] for r in rows], dtype=np.uint64)
+        rads = np.array([r[1] for r in rows], dtype=np.float64)
+        parents = cells_to_parent(cells, H3_COARSE_RESOLUTION)
+        idx = np.minimum(np.searchsorted(scatter_cells, parents), len(scatter_cells) - 1)
+        hit = (scatter_cells[idx] == parents) & (scatter_vals[idx] > 0)
+        if hit.any():
+            writer.executemany('UPDATE cells SET radiance = ? WHERE h3 = ?',
+                               zip((rads[hit] + scatter_vals[idx[hit]]).tolist(),
+                                   cells[hit].astype(np.int64).tolist()))
+            updated += int(hit.sum())
+        pbar.update(len(rows))
+    pbar.close()
+    conn.commit()
+
+    lifted = np.flatnonzero(scatter_vals >= ZONE2_RADIANCE)
+    inserted = 0
+    for i in tqdm(lifted, desc="Inserting scatter-lit cells", unit="parent"):
+        children = h3_np.cell_to_children(int(scatter_cells[i]), H3_RESOLUTION)
+        writer.executemany('INSERT INTO cells (h3, radiance) VALUES (?, ?) ON CONFLICT(h3) DO NOTHING',
+                           ((int(c), float(scatter_vals[i])) for c in children))
+        inserted += max(writer.rowcount, 0)
+    conn.commit()
+
+    total = conn.execute('SELECT COUNT(*) FROM cells').fetchone()[0]
+    print(f"\nH3 enhancement complete. Updated: {updated:,}, inserted: {inserted:,}, "
+          f"total cells: {total:,}")
+    return total
+
+
+def check_skyglow_runs(conn, engine):
+    """
+    Exit if the accumulator was already enhanced in a way this engine would
+    count twice. The raster scan keeps MAX(radiance, direct + scatter), so
+    repeating it is harmless; the h3 engine adds scatter to what is stored,
+    and the two engines must never be stacked in either order.
+    """
+    conn.execute('CREATE TABLE IF NOT EXISTS skyglow_runs (engine TEXT, params TEXT)')
+    engines = sorted({row[0] for row in conn.execute('SELECT engine FROM skyglow_runs')})
+    if engines and (engine == 'h3' or engines != ['raster']):
+        print(f"Error: accumulator already enhanced by the {', '.join(engines)} engine.")
+        print("Re-run generate_zones_vnl.py --reset to rebuild it first.")
+        sys.exit(1)
+
+
+def record_skyglow_run(conn, engine, params):
+    conn.execute('INSERT INTO skyglow_runs VALUES (?, ?)', (engine, json.dumps(params)))
+    conn.commit()
+
+
+def run_h3_engine(accum_path):
+    """Phases 1-3 of the H3 engine. Refuses to run on an already enhanced accumulator."""
+    conn = sqlite3.connect(str(accum_path))
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA cache_size=-65536')
+    check_skyglow_runs(conn, 'h3')
+
+    print(f"\n=== Phase 1: Aggregate emitters to H3 res {H3_COARSE_RESOLUTION} ===")
+    emitters, radiance = load_coarse_emitters(conn)
+    print(f"  Coarse emitters: {len(emitters):,}")
+
+    print("\n=== Phase 2: Ring propagation ===")
+    scatter_cells, scatter_vals = propagate_h3(emitters, radiance)
+    print(f"  Scatter: max={scatter_vals.max() if len(scatter_vals) else 0:.4f} nW, "
+          f"cells above threshold={int((scatter_vals > ZONE2_RADIANCE).sum()):,}")
+    del emitters, radiance; gc.collect()
+
+    print("\n=== Phase 3: Push scatter down to res-8 cells ===")
+    apply_h3_scatter(conn, scatter_cells, scatter_vals)
+    record_skyglow_run(conn, 'h3', {'fraction': SCATTER_FRACTION, 'scale_km': SCATTER_SCALE_KM,
+                                    'coarse_res': H3_COARSE_RESOLUTION})
+    conn.close()
+
+
 # ============================================================================
 # Phase 4: Write zones.db from accumulator
 # ============================================================================
@@ -235,17 +661,12 @@ def write_zones_db(accum_path, output_path):
         while True:
             rows = cursor.fetchmany(100_000)
             if not rows: break
-            for h3_int, rad in rows:
-                zone = radiance_to_zone(rad)
-                if zone <= 1:
-                    skipped += 1; continue
-                sqm = radiance_to_sqm(rad)
-                f.write(struct.pack('<Q', h3_int))
-                f.write(struct.pack('B', zone))
-                f.write(struct.pack('<f', rad))
-                f.write(struct.pack('<f', sqm))
-                f.write(b'\x00\x00\x00')
-                written += 1
+            cells = np.fromiter((r[0] for r in rows), dtype=np.uint64, count=len(rows))
+            rads = np.fromiter((r[1] for r in rows), dtype=np.float64, count=len(rows))
+            records = zone_records(cells, rads)
+            records.tofile(f)
+            written += len(records)
+            skipped += len(rows) - len(records)
 
         f.seek(count_pos)
         f.write(struct.pack('<Q', written))
@@ -290,23 +711,33 @@ def main():
     global SCATTER_FRACTION, SCATTER_SCALE_KM
 
     parser = argparse.ArgumentParser(description='Apply skyglow propagation')
-    parser.add_argument('--tif', required=True, help='Path to VNL average-masked TIF/GZ')
-    parser.add_argument('--accum', help='Path to accumulator DB (default: next to TIF)')
+    parser.add_argument('--tif', help='Path to VNL average-masked TIF/GZ (raster engine)')
+    parser.add_argument('--sparse', help='Sparse store from generate_zones_vnl.py --fused (raster engine, replaces --tif)')
+    parser.add_argument('--accum', help='Path to accumulator DB (default: next to TIF / sparse store)')
+    parser.add_argument('--engine', choices=['raster', 'h3'], default='raster',
+                        help='raster: convolve + full-res re-scan; h3: propagate on the H3 grid')
     parser.add_argument('--fraction', type=float, default=SCATTER_FRACTION)
     parser.add_argument('--scale-km', type=float, default=SCATTER_SCALE_KM)
+    parser.add_argument('--elevation', help='Elevation raster (m) for per-pixel kernels (raster engine)')
+    parser.add_argument('--aod', help='Aerosol optical depth raster for per-pixel kernels (raster engine)')
+    parser.add_argument('--output', help='zones.db to write (default: assets/db/zones.db)')
     args = parser.parse_args()
 
     SCATTER_FRACTION = args.fraction
     SCATTER_SCALE_KM = args.scale_km
 
-    tif_path = Path(args.tif)
-    raster_path = str(tif_path)
-    if tif_path.suffix == '.gz':
-        raster_path = f'/vsigzip/{tif_path.absolute()}'
-        print(f"Using GZIP driver: {tif_path.name}")
-
-    accum_path = Path(args.accum) if args.accum else tif_path.parent / 'zones_accumulator.db'
-    output_path = Path(__file__).parent.parent / 'assets' / 'db' / 'zones.db'
+    if args.engine == 'raster' and not (args.tif or args.sparse):
+        parser.error('--tif or --sparse is required for the raster engine')
+    if not (args.tif or args.sparse or args.accum):
+        parser.error('--accum is required when neither --tif nor --sparse is given')
+
+    tif_path = Path(args.tif) if args.tif else None
+    sparse_dir = Path(args.sparse) if args.sparse else None
+    if args.accum:
+        accum_path = Path(args.accum)
+    else:
+        accum_path = (sparse_dir or tif_path).parent / 'zones_accumulator.db'
+    output_path = Path(args.output) if args.output else Path(__file__).parent.parent / 'assets' / 'db' / 'zones.db'
     output_path.parent.mkdir(parents=True, exist_ok=True)
 
     if not accum_path.exists():
@@ -315,26 +746,59 @@ def main():
         sys.exit(1)
 
     print(f"Scatter params: fraction={SCATTER_FRACTION}, scale={SCATTER_SCALE_KM}km, "
-          f"power={SCATTER_POWER}, max_radius={MAX_RADIUS_KM}km")
-
-    # Phase 1: Downsample
-    print("\n=== Phase 1: Downsample VNL raster ===")
-    coarse = downsample_raster(raster_path)
-
-    # Phase 2: Convolve
-    print("\n=== Phase 2: Atmospheric scatter convolution ===")
-    kernel = create_scatter_kernel()
-    print(f"  Kernel: {kernel.shape[0]}×{kernel.shape[1]} pixels")
-    scattered = fftconvolve(coarse, kernel, mode='same').astype(np.float32)
-    scattered = np.maximum(scattered, 0)
-    sig = scattered[scattered > ZONE2_RADIANCE]
-    print(f"  Scatter: max={scattered.max():.4f} nW, "
-          f"pixels above threshold={len(sig):,}")
-    del coarse, kernel; gc.collect()
-
-    # Phase 3: Enhanced scan
-    print("\n=== Phase 3: Re-scan with scatter enhancement ===")
-    enhanced_scan(raster_path, scattered, accum_path)
+          f"power={SCATTER_POWER}, max_radius={MAX_RADIUS_KM}km, engine={args.engine}")
+
+    if args.engine == 'raster':
+        conn = sqlite3.connect(str(accum_path))
+        check_skyglow_runs(conn, 'raster')
+        conn.close()
+
+    if args.engine == 'h3':
+        run_h3_engine(accum_path)
+    elif sparse_dir is not None:
+        manifest = sparse_store.read_manifest(sparse_dir)
+        if manifest['downsample'] != DOWNSAMPLE:
+            print(f"Error: sparse store downsample {manifest['downsample']} != {DOWNSAMPLE}")
+            sys.exit(1)
+
+        print("\n=== Phase 1: Coarse grid from sparse store ===")
+        coarse = sparse_store.load_coarse(sparse_dir)
+        print(f"  Coarse grid: {coarse.shape[1]}×{coarse.shape[0]}, non-zero: {np.count_nonzero(coarse):,}")
+        coarse_transform = rasterio.Affine(*manifest['transform']) * rasterio.Affine.scale(DOWNSAMPLE)
+
+        print("\n=== Phase 2: Atmospheric scatter convolution ===")
+        scattered = scatter_coarse(coarse, coarse_transform, args.elevation, args.aod)
+        del coarse; gc.collect()
+
+        print("\n=== Phase 3: Enhanced scan from sparse store ===")
+        enhanced_scan_sparse(sparse_dir, scattered, accum_path)
+    else:
+        raster_path = str(tif_path)
+        if tif_path.suffix == '.gz':
+            raster_path = f'/vsigzip/{tif_path.absolute()}'
+            print(f"Using GZIP driver: {tif_path.name}")
+
+        # Phase 1: Downsample
+        print("\n=== Phase 1: Downsample VNL raster ===")
+        coarse = downsample_raster(raster_path)
+
+        # Phase 2: Convolve
+        print("\n=== Phase 2: Atmospheric scatter convolution ===")
+        with rasterio.open(raster_path) as src:
+            coarse_transform = src.transform * rasterio.Affine.scale(DOWNSAMPLE)
+        scattered = scatter_coarse(coarse, coarse_transform, args.elevation, args.aod)
+        del coarse; gc.collect()
+
+        # Phase 3: Enhanced scan
+        print("\n=== Phase 3: Re-scan with scatter enhancement ===")
+        enhanced_scan(raster_path, scattered, accum_path)
+
+    if args.engine == 'raster':
+        conn = sqlite3.connect(str(accum_path))
+        record_skyglow_run(conn, 'raster', {'fraction': SCATTER_FRACTION, 'scale_km': SCATTER_SCALE_KM,
+                                            'downsample': DOWNSAMPLE, 'elevation': args.elevation,
+                                            'aod': args.aod})
+        conn.close()
 
     # Phase 4: Write zones.db
     print("\n=== Phase 4: Write zones.db ===")
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+End-to-end wall time of the fused and unfused zones.db pipelines.
+
+Runs vnl → skyglow → export both ways on the same gzipped raster:
+  unfused  generate_zones_vnl.py --tif, apply_skyglow.py --tif (the raster
+           is decompressed three times)
+  fused    generate_zones_vnl.py --fused, apply_skyglow.py --sparse (once)
+Each stage is a subprocess timed from start to exit, as build_pipeline.py
+runs it, and writes into a scratch directory, never into assets/db. The
+two zones.db files are compared byte for byte at the end.
+
+Without --tif the raster is synthetic: a --region of the 15" VNL grid
+with a light dome around every city in assets/db/cities.json (brighter
+for a higher Bortle class), masked to zero below 0.1 nW like the masked
+VNL product.
+
+Usage:
+    python benchmark_fused.py                                # synthetic, South Asia
+    python benchmark_fused.py --region 72 20 90 35 --repeat 3  # dense: northern India only
+    python benchmark_fused.py --tif data/vnl_average.tif.gz  # a real raster
+"""
+
+import sys
+import json
+import time
+import gzip
+import shutil
+import hashlib
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+import numpy as np
+import rasterio
+import rasterio.transform
+import rasterio.windows
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+CITIES_PATH = SCRIPT_DIR.parent / 'assets' / 'db' / 'cities.json'
+
+# ============================================================================
+# Configuration
+# ============================================================================
+PIXEL_DEG = 1 / 240                  # 15 arcsec, as the VNL grid
+DEFAULT_REGION = (60.0, 0.0, 100.0, 40.0)  # lon/lat box: South Asia and the northern Indian Ocean
+MASK_RADIANCE = 0.1                  # masked VNL: zero below this
+DOME_KM_PER_BORTLE = 1.2             # dome radius grows with the city's class
+STRIP_ROWS = 480
+
+
+# ============================================================================
+# Synthetic raster
+# ============================================================================
+def synthetic_raster(path, region, seed):
+    """Write a gzipped float32 GeoTIFF of city light domes over region; returns its size, cities and lit pixels."""
+    west, south, east, north = region
+    width, height = round((east - west) / PIXEL_DEG), round((north - south) / PIXEL_DEG)
+    transform = rasterio.transform.from_origin(west, north, PIXEL_DEG, PIXEL_DEG)
+    with open(CITIES_PATH) as f:
+        cities = np.array(json.load(f), dtype=np.float64).reshape(-1, 3)
+    inside = ((cities[:, 0] > south) & (cities[:, 0] < north) &
+              (cities[:, 1] > west) & (cities[:, 1] < east))
+    cities = cities[inside]
+    rng = np.random.default_rng(seed)
+    peaks = 10 ** (cities[:, 2] / 3.5) * rng.lognormal(0, 0.3, len(cities))
+    sigma_px = cities[:, 2] * DOME_KM_PER_BORTLE / (PIXEL_DEG * 111.2)
+    crow = (north - cities[:, 0]) / PIXEL_DEG
+    ccol = (cities[:, 1] - west) / PIXEL_DEG
+
+    lit = 0
+    tif = path.with_suffix('')
+    profile = dict(driver='GTiff', width=width, height=height, count=1, dtype='float32',
+                   crs='EPSG:4326', transform=transform, blockxsize=width, blockysize=1)
+    with rasterio.open(tif, 'w', **profile) as dst:
+        for r0 in range(0, height, STRIP_ROWS):
+            rows = min(STRIP_ROWS, height - r0)
+            strip = np.zeros((rows, width), dtype=np.float32)
+            reach = 4 * sigma_px
+            near = np.flatnonzero((crow + reach >= r0) & (crow - reach < r0 + rows))
+            for i in near:
+                c0, c1 = max(int(ccol[i] - reach[i]), 0), min(int(ccol[i] + reach[i]) + 1, width)
+                y = (np.arange(r0, r0 + rows) - crow[i])[:, None]
+                x = (np.arange(c0, c1) - ccol[i])[None, :]
+                dome = peaks[i] * np.exp(-(x * x + y * y) / (2 * sigma_px[i] ** 2))
+                np.maximum(strip[:, c0:c1], dome.astype(np.float32), out=strip[:, c0:c1])
+            strip[strip < MASK_RADIANCE] = 0
+            lit += np.count_nonzero(strip)
+            dst.write(strip, 1, window=rasterio.windows.Window(0, r0, width, rows))
+    with open(tif, 'rb') as src, gzip.open(path, 'wb', compresslevel=6) as dst:
+        shutil.copyfileobj(src, dst, 1 << 20)
+    tif.unlink()
+    return width, height, len(cities), lit
+
+
+# ============================================================================
+# Runs
+# ============================================================================
+def stages(mode, tif, work):
+    accum = tif.parent / 'zones_accumulator.db'
+    zones = work / f'zones.{mode}.db'
+    if mode == 'fused':
+        vnl = ['--fused', '--sparse-dir', str(work / 'sparse')]
+        skyglow = ['--sparse', str(work / 'sparse')]
+    else:
+        vnl, skyglow = [], ['--tif', str(tif)]
+    return zones, [
+        ('vnl', ['generate_zones_vnl.py', '--tif', str(tif), '--reset', '--output', str(zones), *vnl]),
+        ('skyglow', ['apply_skyglow.py', *skyglow, '--accum', str(accum), '--output', str(zones)]),
+        ('export', ['export_zones_to_sql.py', '--db', str(zones), '--out', str(work / f'sql.{mode}')]),
+    ]
+
+
+def run_mode(mode, tif, work):
+    """Seconds per stage and the zones.db written"""
+    zones, steps = stages(mode, tif, work)
+    times = {}
+    for name, cmd in steps:
+        with open(work / f'{mode}.{name}.log', 'w') as log:
+            t0 = time.perf_counter()
+            proc = subprocess.run([sys.executable, str(SCRIPT_DIR / cmd[0]), *cmd[1:]],
+                                  cwd=SCRIPT_DIR, stdout=log, stderr=subprocess.STDOUT)
+            times[name] = time.perf_counter() - t0
+        if proc.returncode != 0:
+            print(f"Error: {mode} {name} exited {proc.returncode}, see {work / f'{mode}.{name}.log'}")
+            sys.exit(1)
+    return times, zones
+
+
+def sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# ============================================================================
+# Main
+# ============================================================================
+def main():
+    parser = argparse.ArgumentParser(description='Fused vs unfused pipeline wall time')
+    parser.add_argument('--tif', help='VNL TIF/GZ to use instead of a synthetic raster (copied to scratch)')
+    parser.add_argument('--region', type=float, nargs=4, default=DEFAULT_REGION,
+                        metavar=('WEST', 'SOUTH', 'EAST', 'NORTH'), help='Synthetic raster extent (degrees)')
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per mode (best is reported)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--keep', action='store_true', help='Keep the scratch directory')
+    args = parser.parse_args()
+
+    work = Path(tempfile.mkdtemp(prefix='astr-fused-'))
+    try:
+        if args.tif:
+            tif = work / Path(args.tif).name
+            shutil.copyfile(args.tif, tif)
+            print(f"Raster: {args.tif}")
+        else:
+            tif = work / 'vnl_synthetic.tif.gz'
+            t0 = time.perf_counter()
+            width, height, n, lit = synthetic_raster(tif, args.region, args.seed)
+            print(f"Synthetic raster: {width}×{height}, {n:,} cities, {lit / (width * height):.1%} lit, "
+                  f"{tif.stat().st_size / 1024**2:.0f} MB gzipped, built in {time.perf_counter() - t0:.0f} s")
+
+        best = {}
+        for _ in range(args.repeat):
+            for mode in ('unfused', 'fused'):
+                times, zones = run_mode(mode, tif, work)
+                if mode not in best or sum(times.values()) < sum(best[mode][0].values()):
+                    best[mode] = (times, zones)
+
+        print(f"\n{'mode':<8} {'vnl s':>8} {'skyglow s':>10} {'export s':>9} {'total s':>8}")
+        for mode, (times, _) in best.items():
+            print(f"{mode:<8} {times['vnl']:>8.1f} {times['skyglow']:>10.1f} {times['export']:>9.1f} "
+                  f"{sum(times.values()):>8.1f}")
+        unfused, fused = (sum(best[m][0].values()) for m in ('unfused', 'fused'))
+        print(f"\nFused: {1 - fused / unfused:.0%} less wall time ({unfused / fused:.2f}× faster)")
+        same = sha256(best['unfused'][1]) == sha256(best['fused'][1])
+        print(f"zones.db identical: {'yes' if same else 'NO'}")
+        if not same:
+            sys.exit(1)
+    finally:
+        if args.keep:
+            print(f"Scratch kept: {work}")
+        else:
+            shutil.rmtree(work)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+Build runner for the zones pipeline.
+
+Declares the manual sequence as a DAG:
+
+    vnl ──> skyglow ──┬──> validate ──> upload (only with --upload)
+                      ├──> export
+                      ├──> dark_index
+                      ├──> dark_distance ──> city_index
+                      └──> contours
+
+Each stage is keyed by a content hash of its script (and the local modules
+it imports), its arguments and the artifacts it reads. A stage whose key is
+unchanged and whose recorded outputs are still on disk with the same hashes
+is skipped, so a parameter or threshold tweak only rebuilds the stages
+downstream of it. Stages whose dependencies are satisfied run concurrently
+(validate, export, dark_index, dark_distance and contours do).
+
+File hashes are cached by (size, mtime) in <build>/state.json, so unchanged
+multi-GB artifacts are not re-read. Every run writes <build>/manifest.json
+with per-stage status, duration and artifact hashes; stage output goes to
+<build>/logs/<stage>.log.
+
+Usage:
+    python build_pipeline.py --tif "../VNL NPP 2024 Global Masked Data.tif.gz"
+    python build_pipeline.py --tif ... --fraction 0.10       # rebuilds skyglow onwards
+    python build_pipeline.py --tif ... --upload              # also push zones.db to R2
+    python build_pipeline.py --tif ... --dry-run             # show what would run
+"""
+
+import sys, argparse, hashlib, json, shutil, sqlite3, subprocess, time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Optional
+
+SCRIPT_DIR = Path(__file__).parent.resolve()
+ASSETS_DB = SCRIPT_DIR.parent / 'assets' / 'db'
+
+HASH_BLOCK = 1024 * 1024
+
+
+# ============================================================================
+# Content hashing
+# ============================================================================
+class HashCache:
+    """SHA-256 of files and directories, memoised on (size, mtime_ns)."""
+
+    def __init__(self, entries=None):
+        self.entries = entries or {}
+
+    def file(self, path: Path) -> str:
+        st = path.stat()
+        key = str(path.resolve())
+        cached = self.entries.get(key)
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            return cached[2]
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_BLOCK), b''):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        self.entries[key] = [st.st_size, st.st_mtime_ns, digest]
+        return digest
+
+    def path(self, path: Path) -> Optional[str]:
+        """Hash of a file, or of a directory's (relative name, file hash) list. None if missing."""
+        if path.is_file():
+            return self.file(path)
+        if path.is_dir():
+            sha = hashlib.sha256()
+            for p in sorted(q for q in path.rglob('*') if q.is_file()):
+                sha.update(f"{p.relative_to(path)}\0{self.file(p)}\n".encode())
+            return sha.hexdigest()
+        return None
+
+
+# ============================================================================
+# Stage declarations
+# ============================================================================
+@dataclass
+class Stage:
+    name: str
+    script: str                              # entry point, relative to scripts/
+    args: list                               # CLI arguments (part of the key)
+    deps: tuple = ()                         # upstream stages
+    inputs: list = field(default_factory=list)   # external files/dirs read
+    sources: list = field(default_factory=list)  # local modules the script imports
+    outputs: list = field(default_factory=list)  # files/dirs produced
+    prepare: Optional[Callable] = None       # runs right before the script
+
+
+def copy_accumulator(src: Path, dst: Path):
+    """
+    Give skyglow its own copy: both engines modify the accumulator in place
+    (the h3 engine refuses a second run), so rebuilding skyglow must start
+    from the pristine vnl output every time.
+    """
+    for p in (dst, dst.with_name(dst.name + '-wal'), dst.with_name(dst.name + '-shm')):
+        if p.exists():
+            p.unlink()
+    with sqlite3.connect(str(src)) as s, sqlite3.connect(str(dst)) as d:
+        s.backup(d)
+
+
+def declare_stages(args, build_dir: Path):
+    tif = Path(args.tif).resolve()
+    accum = tif.parent / 'zones_accumulator.db'
+    sparse = build_dir / 'sparse'
+    work_accum = build_dir / 'zones_accumulator.skyglow.db'
+    zones_db = ASSETS_DB / 'zones.db'
+    sql_dir = build_dir / 'sql'
+    dark_db = ASSETS_DB / 'dark_index.db'
+    distance_db = ASSETS_DB / 'dark_distance.db'
+    cities_json = ASSETS_DB / 'cities.json'
+    city_db = ASSETS_DB / 'city_index.db'
+    lite_db = ASSETS_DB / 'zones_lite.db'
+    contours_dir = build_dir / 'contours'
+
+    skyglow_args = ['--accum', str(work_accum), '--engine', args.engine]
+    skyglow_inputs = []
+    if args.engine == 'raster':
+        skyglow_args += ['--sparse', str(sparse)]
+    # Unset → apply_skyglow.py's own defaults, which are covered by its source hash
+    for flag, value in (('--fraction', args.fraction), ('--scale-km', args.scale_km)):
+        if value is not None:
+            skyglow_args += [flag, repr(value)]
+    for flag, value in (('--elevation', args.elevation), ('--aod', args.aod)):
+        if value:
+            skyglow_args += [flag, str(Path(value).resolve())]
+            skyglow_inputs.append(Path(value).resolve())
+
+    stages = [
+        Stage('vnl', 'generate_zones_vnl.py',
+              ['--tif', str(tif), '--fused', '--sparse-dir', str(sparse), '--reset'],
+              inputs=[tif], sources=['sparse_store.py'], outputs=[accum, sparse]),
+        Stage('skyglow', 'apply_skyglow.py', skyglow_args, deps=('vnl',),
+              inputs=skyglow_inputs, sources=['sparse_store.py'], outputs=[zones_db],
+              prepare=lambda: copy_accumulator(accum, work_accum)),
+        Stage('validate', 'validate_zones_db.py', [], deps=('skyglow',)),
+        Stage('export', 'export_zones_to_sql.py', ['--db', str(zones_db), '--out', str(sql_dir)],
+              deps=('skyglow',), outputs=[sql_dir]),
+        Stage('dark_index', 'dark_index.py', ['--zones', str(zones_db), '--out', str(dark_db)],
+              deps=('skyglow',), sources=['apply_skyglow.py'], outputs=[dark_db]),
+        Stage('dark_distance', 'dark_distance.py', ['--zones', str(zones_db), '--out', str(distance_db)],
+              deps=('skyglow',), outputs=[distance_db]),
+        Stage('city_index', 'city_index.py',
+              ['--zones', str(zones_db), '--distance', str(distance_db), '--cities', str(cities_json),
+               '--out', str(city_db)],
+              deps=('skyglow', 'dark_distance'), inputs=[cities_json],
+              sources=['apply_skyglow.py', 'dark_distance.py'], outputs=[city_db]),
+        Stage('lite', 'lite_zones.py', ['--zones', str(zones_db), '--out', str(lite_db)],
+              deps=('skyglow',), sources=['apply_skyglow.py'], outputs=[lite_db]),
+        Stage('contours', 'zone_contours.py', ['--zones', str(zones_db), '--out', str(contours_dir)],
+              deps=('skyglow',), sources=['apply_skyglow.py'], outputs=[contours_dir]),
+    ]
+    if args.upload:
+        stages.append(Stage('upload', 'upload_to_r2.py', [], deps=('validate',), inputs=[zones_db]))
+    return stages
+
+
+# ============================================================================
+# Runner
+# ============================================================================
+class Pipeline:
+    def __init__(self, stages, build_dir: Path, force=(), dry_run=False, jobs=2):
+        self.stages = {s.name: s for s in stages}
+        self.build_dir = build_dir
+        self.log_dir = build_dir / 'logs'
+        self.state_path = build_dir / 'state.json'
+        self.force = set(force)
+        self.dry_run = dry_run
+        self.jobs = jobs
+
+        state = {}
+        if self.state_path.exists():
+            with open(self.state_path) as f:
+                state = json.load(f)
+        self.recorded = state.get('stages', {})
+        self.hashes = HashCache(state.get('files', {}))
+        self.results = {}
+
+    def stage_key(self, stage: Stage) -> str:
+        """Content key: script + imported modules + args + every artifact read."""
+        inputs = {str(p): self.hashes.path(Path(p)) for p in stage.inputs}
+        for dep in stage.deps:
+            inputs.update(self.results[dep]['artifacts'])
+            if not self.stages[dep].outputs:
+                # A check with no artifacts (validate): carry its key, so what it read reaches this stage
+                inputs[f'stage:{dep}'] = self.results[dep]['key']
+        material = {
+            'stage': stage.name,
+            'sources': {s: self.hashes.file(SCRIPT_DIR / s) for s in [stage.script, *stage.sources]},
+            'args': stage.args,
+            'inputs': inputs,
+        }
+        return hashlib.sha256(json.dumps(material, sort_keys=True).encode()).hexdigest()
+
+    def outputs_intact(self, stage: Stage, recorded) -> bool:
+        artifacts = recorded.get('artifacts', {})
+        return all(self.hashes.path(Path(p)) == artifacts.get(str(p)) for p in stage.outputs)
+
+    def clear_outputs(self, stage: Stage):
+        for p in map(Path, stage.outputs):
+            if p.is_dir():
+                shutil.rmtree(p)
+
+    def run_stage(self, stage: Stage):
+        """Worker: run one stage's script, capturing its output to a log file."""
+        if stage.prepare:
+            stage.prepare()
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.log_dir / f'{stage.name}.log', 'w') as log:
+            proc = subprocess.run([sys.executable, str(SCRIPT_DIR / stage.script), *stage.args],
+                                  cwd=SCRIPT_DIR, stdout=log, stderr=subprocess.STDOUT)
+        return proc.returncode
+
+    def plan(self, stage: Stage):
+        """Return (key, reason to run or None if it can be skipped)."""
+        key = self.stage_key(stage)
+        recorded = self.recorded.get(stage.name)
+        if stage.name in self.force:
+            return key, 'forced'
+        if not recorded or recorded.get('key') != key:
+            return key, 'inputs changed' if recorded else 'never built'
+        if not self.outputs_intact(stage, recorded):
+            return key, 'outputs missing or modified'
+        return key, None
+
+    def finish(self, stage: Stage, key, status, duration, reason=None):
+        artifacts = {str(p): self.hashes.path(Path(p)) for p in stage.outputs}
+        self.results[stage.name] = {
+            'status': status, 'reason': reason, 'key': key,
+            'duration_s': round(duration, 2), 'artifacts': artifacts,
+        }
+        if status in ('built', 'cached'):
+            self.recorded[stage.name] = {'key': key, 'artifacts': artifacts}
+        print(f"  [{status:>7}] {stage.name:<13} {duration:8.1f}s  {reason or ''}")
+
+    def run(self):
+        started = datetime.now(timezone.utc)
+        pending = dict(self.stages)
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            while pending or running:
+                for name, stage in list(pending.items()):
+                    dep_status = [self.results.get(d, {}).get('status') for d in stage.deps]
+                    if any(s in ('failed', 'blocked') for s in dep_status):
+                        del pending[name]
+                        self.finish(stage, None, 'blocked', 0.0, 'upstream did not build')
+                        continue
+                    if 'planned' in dep_status:
+                        del pending[name]
+                        self.finish(stage, None, 'planned', 0.0, 'upstream will rebuild')
+                        continue
+                    if any(s is None for s in dep_status):
+                        continue
+                    del pending[name]
+                    key, reason = self.plan(stage)
+                    if reason is None:
+                        self.finish(stage, key, 'cached', 0.0)
+                    elif self.dry_run:
+                        self.finish(stage, key, 'planned', 0.0, reason)
+                    else:
+                        self.clear_outputs(stage)
+                        fut = pool.submit(self.run_stage, stage)
+                        running[fut] = (stage, key, reason, time.perf_counter())
+
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    stage, key, reason, t0 = running.pop(fut)
+                    code = fut.result()
+                    status = 'built' if code == 0 else 'failed'
+                    self.finish(stage, key, status, time.perf_counter() - t0,
+                                reason if code == 0 else f"exit {code}, see logs/{stage.name}.log")
+
+        if not self.dry_run:
+            self.save(started)
+        return all(r['status'] in ('built', 'cached', 'planned') for r in self.results.values())
+
+    def save(self, started):
+        self.build_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.state_path, 'w') as f:
+            json.dump({'stages': self.recorded, 'files': self.hashes.entries}, f, indent=2)
+        manifest = {
+            'started': started.isoformat(),
+            'finished': datetime.now(timezone.utc).isoformat(),
+            'python': sys.version.split()[0],
+            'stages': self.results,
+        }
+        with open(self.build_dir / 'manifest.json', 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+
+# ============================================================================
+# Main
+# ============================================================================
+def main():
+    parser = argparse.ArgumentParser(description='Incremental build of zones.db and its exports')
+    parser.add_argument('--tif', default=str(SCRIPT_DIR / 'data' / 'vnl_average.tif.gz'),
+                        help='VNL average-masked TIF/GZ')
+    parser.add_argument('--build-dir', default=str(SCRIPT_DIR / 'data' / 'build'))
+    parser.add_argument('--engine', choices=['raster', 'h3'], default='raster')
+    parser.add_argument('--fraction', type=float, help='Skyglow scatter fraction (default: apply_skyglow.py)')
+    parser.add_argument('--scale-km', type=float, help='Skyglow decay length (default: apply_skyglow.py)')
+    parser.add_argument('--elevation', help='Elevation raster for per-pixel kernels')
+    parser.add_argument('--aod', help='Aerosol optical depth raster for per-pixel kernels')
+    parser.add_argument('--upload', action='store_true', help='Upload zones.db to R2 once validated')
+    parser.add_argument('--force', action='append', default=[], metavar='STAGE',
+                        help='Rebuild a stage even if its inputs are unchanged (repeatable)')
+    parser.add_argument('--jobs', type=int, default=2, help='Concurrent stages')
+    parser.add_argument('--dry-run', action='store_true', help='Print the plan without running')
+    args = parser.parse_args()
+
+    if not Path(args.tif).exists():
+        print(f"Error: TIF not found: {args.tif}")
+        sys.exit(1)
+
+    build_dir = Path(args.build_dir).resolve()
+    stages = declare_stages(args, build_dir)
+    unknown = set(args.force) - {s.name for s in stages}
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(sorted(unknown))}")
+
+    print(f"Build dir: {build_dir}")
+    pipeline = Pipeline(stages, build_dir, force=args.force, dry_run=args.dry_run, jobs=args.jobs)
+    ok = pipeline.run()
+    if not args.dry_run:
+        print(f"\nManifest: {build_dir / 'manifest.json'}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
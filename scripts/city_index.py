@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Precomputed sky quality for every city in assets/db/cities.json.
+
+cities.json is one flat list of (lat, lon, map Bortle) triples, most
+populous first (generate_city_db.dart). Every city is resolved against
+zones.db in one pass:
+  - the zone and SQM of its own res-8 cell
+  - the nearest cell at or below --max-zone, from the dark_distance.db
+    sidecar at the record index the zones.db search found (the city's cell
+    centre when it already qualifies)
+  - darkness within --radius-km (a drive out of town): the share of area per
+    zone, the area-weighted mean SQM and the darkest zone reached, summed
+    over res-5 parents (343 res-8 children) whose centre is in range
+
+Unstored cells count as implicit Zone 1 at 22.0, as everywhere else. The
+API loads the whole index into memory at startup and answers city lookups
+and rankings from it without touching zones.db.
+
+Usage:
+    python city_index.py
+    python city_index.py --zones ../assets/db/zones.db --distance ../assets/db/dark_distance.db \\
+        --cities ../assets/db/cities.json --out ../assets/db/city_index.db --radius-km 100
+
+Output: assets/db/city_index.db
+"""
+
+import sys, argparse, json, math, struct, hashlib, time
+from pathlib import Path
+
+import h3
+import numpy as np
+from tqdm import tqdm
+from h3.api import numpy_int as h3_np
+
+from apply_skyglow import H3_RESOLUTION, cells_to_parent
+from dark_distance import ZONES_DTYPE, haversine_km, DISTANCE_UNIT_KM, DISTANCE_UNKNOWN
+
+# ============================================================================
+# Configuration
+# ============================================================================
+RADIUS_RESOLUTION = 5       # ~250 km² parents for the drive-radius sums
+ZONES = 9
+CHUNK = 1_000_000
+IMPLICIT_SQM = 22.0
+EARTH_RADIUS_KM = 6371.0088
+
+# city_index.db layout (must match backend/api/city_index.py)
+#   Header (16 bytes): magic "ASTC", version u16, max zone u8, reserved u8, radius km f32, count u32
+#   Records (48 bytes), in cities.json order:
+#     lat f32, lon f32, map bortle u8, zone u8, sqm f32,
+#     dark lat f32, dark lon f32, dark km f32 (NaN when none is known),
+#     radius sqm f32, radius zone shares u16 × 9 (1/10000)
+CITY_MAGIC = b'ASTC'
+CITY_VERSION = 1
+SHARE_UNIT = 10000
+
+CITY_DTYPE = np.dtype([('lat', '<f4'), ('lon', '<f4'), ('map_bortle', 'u1'), ('zone', 'u1'), ('sqm', '<f4'),
+                       ('dark_lat', '<f4'), ('dark_lon', '<f4'), ('dark_km', '<f4'),
+                       ('radius_sqm', '<f4'), ('radius_shares', '<u2', (ZONES,))])
+
+
+def load_cities(path):
+    with open(path) as f:
+        return np.array(json.load(f), dtype=np.float64).reshape(-1, 3)
+
+
+def read_zones(path):
+    with open(path, 'rb') as f:
+        header = f.read(16)
+    if header[:4] != b'ASTR':
+        raise ValueError(f"{path} is not a zones.db file")
+    count = struct.unpack('<Q', header[8:16])[0]
+    if not count:
+        raise ValueError(f"{path} has no cells")
+    return np.memmap(path, dtype=ZONES_DTYPE, mode='r', offset=16, shape=(count,))
+
+
+def read_sidecar(path, count):
+    """(distance, bearing, thresholds) columns of dark_distance.db"""
+    with open(path, 'rb') as f:
+        header = f.read(16)
+    if header[:4] != b'ASTN':
+        raise ValueError(f"{path} is not a dark_distance.db file")
+    _, mask, n = struct.unpack('<HHQ', header[4:16])
+    if n != count:
+        raise ValueError(f"{path} has {n} records, zones.db has {count}")
+    thresholds = tuple(z for z in range(1, 10) if mask >> z & 1)
+    dtype = np.dtype([('distance', '<u2', (len(thresholds),)), ('bearing', 'u1', (len(thresholds),))])
+    side = np.memmap(path, dtype=dtype, mode='r', offset=16, shape=(n,))
+    return side['distance'], side['bearing'], thresholds
+
+
+def destination(lat, lon, bearing_deg, distance_km):
+    """Point distance_km from (lat, lon) along an initial bearing (vectorized)"""
+    phi, lam = np.radians(lat), np.radians(lon)
+    theta, delta = np.radians(bearing_deg), distance_km / EARTH_RADIUS_KM
+    phi2 = np.arcsin(np.sin(phi) * np.cos(delta) + np.cos(phi) * np.sin(delta) * np.cos(theta))
+    lam2 = lam + np.arctan2(np.sin(theta) * np.sin(delta) * np.cos(phi),
+                            np.cos(delta) - np.sin(phi) * np.sin(phi2))
+    return np.degrees(phi2), (np.degrees(lam2) + 540.0) % 360.0 - 180.0
+
+
+def parent_sums(cells, zones, sqm):
+    """Sorted res-5 parents with stored children per zone and their SQM sum"""
+    parents, hists, sums = [], [], []
+    for start in tqdm(range(0, len(cells), CHUNK), desc="Summing parents", unit="chunk"):
+        uniq, inverse = np.unique(cells_to_parent(cells[start:start + CHUNK], RADIUS_RESOLUTION),
+                                  return_inverse=True)
+        hist = np.zeros((len(uniq), ZONES), dtype=np.int64)
+        np.add.at(hist, (inverse, np.clip(zones[start:start + CHUNK].astype(np.intp), 1, ZONES) - 1), 1)
+        parents.append(uniq)
+        hists.append(hist)
+        sums.append(np.bincount(inverse, weights=sqm[start:start + CHUNK], minlength=len(uniq)))
+    # Only a parent on a chunk boundary appears twice
+    uniq, inverse = np.unique(np.concatenate(parents), return_inverse=True)
+    hist = np.zeros((len(uniq), ZONES), dtype=np.int64)
+    np.add.at(hist, inverse, np.concatenate(hists))
+    return uniq, hist, np.bincount(inverse, weights=np.concatenate(sums), minlength=len(uniq))
+
+
+def radius_stats(cities, parents, hist, sqm_sum, radius_km):
+    """(zone shares [n, 9], mean SQM) over the res-5 parents centred within radius_km of each city"""
+    spacing = math.sqrt(3) * h3.average_hexagon_edge_length(RADIUS_RESOLUTION, 'km')
+    rings = math.ceil(radius_km / spacing) + 1
+    disks = [np.asarray(h3_np.grid_disk(h3_np.latlng_to_cell(lat, lon, RADIUS_RESOLUTION), rings), dtype=np.uint64)
+             for lat, lon in tqdm(cities[:, :2].tolist(), desc="Drive-radius disks", unit="city")]
+    owner = np.repeat(np.arange(len(cities)), [len(d) for d in disks])
+    disk, inverse = np.unique(np.concatenate(disks), return_inverse=True)
+    centres = np.array([h3_np.cell_to_latlng(c) for c in disk.tolist()], dtype=np.float64).reshape(-1, 2)
+
+    near = haversine_km(cities[owner, 0], cities[owner, 1], centres[inverse, 0], centres[inverse, 1]) <= radius_km
+    owner, inverse = owner[near], inverse[near]
+    # Parents without stored children are all implicit Zone 1
+    children = 7 ** (H3_RESOLUTION - RADIUS_RESOLUTION)
+    at = np.minimum(np.searchsorted(parents, disk), len(parents) - 1)
+    stored = parents[at] == disk
+    disk_hist = np.where(stored[:, None], hist[at], 0)
+    disk_sqm = np.where(stored, sqm_sum[at], 0.0) + (children - disk_hist.sum(axis=1)) * IMPLICIT_SQM
+    disk_hist[:, 0] += children - disk_hist.sum(axis=1)
+
+    city_hist = np.zeros((len(cities), ZONES), dtype=np.int64)
+    np.add.at(city_hist, owner, disk_hist[inverse])
+    city_sqm = np.bincount(owner, weights=disk_sqm[inverse], minlength=len(cities))
+    # No parent centre in range (radius below a parent's size): the city's cell alone stands in
+    total = city_hist.sum(axis=1)
+    empty = total == 0
+    return city_hist / np.maximum(total, 1)[:, None], np.where(empty, np.nan, city_sqm / np.maximum(total, 1))
+
+
+def build_index(zones_path, distance_path, cities_path, radius_km, max_zone):
+    cities = load_cities(cities_path)
+    records = read_zones(zones_path)
+    cells, zones, sqm = records['h3'], records['zone'], records['sqm'].astype(np.float64)
+    distance, bearing, thresholds = read_sidecar(distance_path, len(cells))
+    if max_zone not in thresholds:
+        raise ValueError(f"dark_distance.db has thresholds {thresholds}, not {max_zone}")
+    print(f"  Cities: {len(cities):,}, zones.db cells: {len(cells):,}")
+
+    city_cells = np.fromiter((h3_np.latlng_to_cell(lat, lon, H3_RESOLUTION) for lat, lon in cities[:, :2].tolist()),
+                             dtype=np.uint64, count=len(cities))
+    at = np.minimum(np.searchsorted(cells, city_cells), len(cells) - 1)
+    found = cells[at] == city_cells
+
+    out = np.zeros(len(cities), dtype=CITY_DTYPE)
+    out['lat'], out['lon'] = cities[:, 0], cities[:, 1]
+    out['map_bortle'] = cities[:, 2]
+    out['zone'] = np.where(found, zones[at], 1)
+    out['sqm'] = np.where(found, sqm[at], IMPLICIT_SQM)
+
+    # Nearest dark cell: the sidecar's distance and bearing from the city's cell centre
+    t = thresholds.index(max_zone)
+    centres = np.array([h3_np.cell_to_latlng(c) for c in city_cells.tolist()], dtype=np.float64).reshape(-1, 2)
+    d = np.where(found, distance[at, t], 0).astype(np.float64)
+    b = np.where(found, bearing[at, t], 0) * 360.0 / 256
+    lit = out['zone'] > max_zone
+    known = ~lit | (d != DISTANCE_UNKNOWN)
+    km = np.where(lit, d * DISTANCE_UNIT_KM, 0.0)
+    dark_lat, dark_lon = destination(centres[:, 0], centres[:, 1], b, km)
+    out['dark_lat'] = np.where(known, dark_lat, np.nan)
+    out['dark_lon'] = np.where(known, dark_lon, np.nan)
+    out['dark_km'] = np.where(known, km, np.nan)
+
+    parents, hist, sqm_sum = parent_sums(cells, zones, sqm)
+    shares, mean_sqm = radius_stats(cities, parents, hist, sqm_sum, radius_km)
+    empty = np.isnan(mean_sqm)
+    shares[empty, out['zone'][empty] - 1] = 1.0
+    out['radius_shares'] = np.rint(shares * SHARE_UNIT).astype(np.uint16)
+    out['radius_sqm'] = np.where(empty, out['sqm'], mean_sqm)
+    return out
+
+
+def write_index(index, output_path, radius_km, max_zone):
+    with open(output_path, 'wb') as f:
+        f.write(CITY_MAGIC)
+        f.write(struct.pack('<HBBfI', CITY_VERSION, max_zone, 0, radius_km, len(index)))
+        index.tofile(f)
+
+    sha = hashlib.sha256()
+    with open(output_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(8192), b''): sha.update(chunk)
+    size_mb = output_path.stat().st_size / (1024**2)
+    dark = index['dark_km']
+    print(f"\n{'='*50}")
+    print("SUCCESS!")
+    print(f"  Cities: {len(index):,} ({radius_km:g} km radius, Bortle <= {max_zone})")
+    for z in range(1, ZONES + 1):
+        print(f"  zone {z}: {int(np.count_nonzero(index['zone'] == z)):,}")
+    if np.isfinite(dark).any():
+        print(f"  Median distance to Bortle <= {max_zone}: {np.nanmedian(dark):.1f} km, "
+              f"unknown for {int(np.count_nonzero(np.isnan(dark))):,}")
+    print(f"  Size: {size_mb:.2f} MB")
+    print(f"  SHA-256: {sha.hexdigest()}")
+    print(f"{'='*50}")
+
+
+# ============================================================================
+# Main
+# ============================================================================
+def main():
+    default_db = Path(__file__).parent.parent / 'assets' / 'db' / 'zones.db'
+
+    parser = argparse.ArgumentParser(description='Precomputed sky quality per city')
+    parser.add_argument('--zones', default=str(default_db))
+    parser.add_argument('--distance', default=str(default_db.parent / 'dark_distance.db'))
+    parser.add_argument('--cities', default=str(default_db.parent / 'cities.json'))
+    parser.add_argument('--out', default=str(default_db.parent / 'city_index.db'))
+    parser.add_argument('--radius-km', type=float, default=100.0, help='Drive radius for the darkness statistics')
+    parser.add_argument('--max-zone', type=int, default=3, help='Bortle class of a dark site')
+    args = parser.parse_args()
+
+    for name, path in (('zones.db', args.zones), ('dark_distance.db (dark_distance.py)', args.distance),
+                       ('cities.json', args.cities)):
+        if not Path(path).exists():
+            print(f"Error: {name} not found: {path}")
+            sys.exit(1)
+
+    print(f"Reading {args.zones}")
+    t0 = time.time()
+    index = build_index(args.zones, args.distance, args.cities, args.radius_km, args.max_zone)
+    print(f"  Computed in {time.time() - t0:.1f}s")
+    write_index(index, Path(args.out), args.radius_km, args.max_zone)
+
+
+if __name__ == '__main__':
+    main()
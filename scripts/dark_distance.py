@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+Distance and direction from every zones.db cell to the nearest darker sky.
+
+For each threshold in DARK_THRESHOLDS (Bortle 2, 3, 4), every stored cell
+gets the great-circle distance and initial bearing to the nearest res-8
+cell at or below that zone. Unstored cells are implicit Zone 1, so they
+seed every threshold.
+
+The search is a multi-source BFS over the H3 grid that carries the nearest
+source forward. Layer 0 is each lit cell with a dark neighbour, which takes
+the closest such neighbour as its source. Every later layer takes the
+closest of the sources already held by its resolved neighbours. Each layer
+is a handful of NumPy gathers over the frontier, CHUNK cells at a time.
+Only building the neighbour table touches H3 per cell, and that part is
+chunked across a process pool whose workers search the memory-mapped
+zones.db themselves.
+
+Working memory is about 60 bytes per lit cell (int32 neighbour indexes,
+float32 centres and sources) and the sidecar is written through a memory
+map, so a global zones.db never has to fit in memory as a whole table.
+
+Output is a sidecar aligned record-for-record with zones.db, so the API
+reads it at the index its zones.db search already found:
+  Header (16 bytes): magic "ASTN", version u16, threshold bitmask u16, count u64
+  Records (9 bytes): distance u16 × 3 (0.1 km, 0xFFFF unknown), bearing u8 × 3 (360/256°)
+
+Usage:
+    python dark_distance.py
+    python dark_distance.py --zones ../assets/db/zones.db --out ../assets/db/dark_distance.db --workers 8
+
+Output: assets/db/dark_distance.db
+"""
+
+import sys, argparse, struct, hashlib, time
+from multiprocessing import Pool
+from pathlib import Path
+
+import numpy as np
+from tqdm import tqdm
+
+from h3.api import numpy_int as h3_np
+
+# ============================================================================
+# Configuration
+# ============================================================================
+DARK_THRESHOLDS = (2, 3, 4)
+CHUNK = 200_000             # cells per worker task and per BFS step
+FENCE_STRIDE = 4096         # zones.db keys per fence block (as backend/api/zones_store.py)
+EARTH_RADIUS_KM = 6371.0088
+MAX_SWEEPS = 200            # label-correcting passes after the BFS
+
+# dark_distance.db layout (must match backend/api/zones_store.py)
+DARK_DISTANCE_MAGIC = b'ASTN'
+DARK_DISTANCE_VERSION = 1
+DISTANCE_UNIT_KM = 0.1
+DISTANCE_UNKNOWN = 0xFFFF
+
+ZONES_DTYPE = np.dtype([('h3', '<u8'), ('zone', 'u1'), ('radiance', '<f4'),
+                        ('sqm', '<f4'), ('reserved', 'V3')])
+SIDECAR_DTYPE = np.dtype([('distance', '<u2', (len(DARK_THRESHOLDS),)),
+                          ('bearing', 'u1', (len(DARK_THRESHOLDS),))])
+
+
+def open_zones(path):
+    """zones.db records, memory-mapped"""
+    with open(path, 'rb') as f:
+        header = f.read(16)
+    if header[:4] != b'ASTR':
+        raise ValueError(f"{path} is not a zones.db file")
+    count = struct.unpack('<Q', header[8:16])[0]
+    return np.memmap(path, dtype=ZONES_DTYPE, mode='r', offset=16, shape=(count,))
+
+
+def find_records(cells, fence, keys):
+    """
+    Record index per H3 key (-1 when not stored): binary search of the fence,
+    then a lock-step search inside each key's block of the memory map, as
+    ZonesStore.find_many does, so the key column is never copied.
+    """
+    out = np.full(len(keys), -1, dtype=np.int64)
+    if not len(cells) or not len(keys):
+        return out
+    block = np.searchsorted(fence, keys, side='right') - 1
+    lo = np.maximum(block, 0) * FENCE_STRIDE
+    hi = np.minimum(lo + FENCE_STRIDE, len(cells))
+    while True:
+        active = lo < hi
+        if not active.any():
+            break
+        mid = (lo + hi) // 2
+        go_right = active & (cells[np.minimum(mid, len(cells) - 1)] < keys)
+        lo = np.where(go_right, mid + 1, lo)
+        hi = np.where(active & ~go_right, mid, hi)
+    hit = (block >= 0) & (lo < len(cells))
+    hit[hit] = cells[lo[hit]] == keys[hit]
+    out[hit] = lo[hit]
+    return out
+
+
+# ============================================================================
+# Per-cell H3 work (process pool)
+# ============================================================================
+_cells = _zones = _fence = None
+
+
+def _init_worker(zones_path):
+    global _cells, _zones, _fence
+    records = open_zones(zones_path)
+    _cells, _zones = records['h3'], records['zone']
+    _fence = np.ascontiguousarray(_cells[::FENCE_STRIDE])
+
+
+def _neighbours(rec):
+    """
+    For a chunk of lit records: centre (lat, lon), record index of each lit
+    neighbour (-1 otherwise, or padding for pentagons) and the centre of the
+    closest neighbour that is dark at every threshold, i.e. unstored or stored
+    at or below min(DARK_THRESHOLDS) (NaN when there is none).
+    """
+    k = len(rec)
+    centres = np.empty((k, 2), dtype=np.float64)
+    rings = np.zeros((k, 6), dtype=np.uint64)
+    for i, c in enumerate(_cells[rec].tolist()):
+        centres[i] = h3_np.cell_to_latlng(c)
+        ring = h3_np.grid_ring(c, 1)
+        rings[i, :len(ring)] = ring
+
+    found = find_records(_cells, _fence, rings.ravel()).reshape(k, 6)
+    present = rings != 0
+    zone = _zones[np.maximum(found, 0)]
+    dark = present & ((found < 0) | (zone <= min(DARK_THRESHOLDS)))
+    nbr = np.where(present & ~dark, found, -1).astype(np.int32)
+
+    gap = np.full((k, 2), np.nan, dtype=np.float32)
+    rows, cols = np.nonzero(dark)
+    if len(rows):
+        shell, inverse = np.unique(rings[rows, cols], return_inverse=True)
+        pts = np.array([h3_np.cell_to_latlng(c) for c in shell.tolist()])[inverse.ravel()]
+        d = haversine_km(centres[rows, 0], centres[rows, 1], pts[:, 0], pts[:, 1])
+        # Keep the closest dark neighbour per row (rows are in order)
+        order = np.lexsort((d, rows))
+        first = np.r_[True, rows[order][1:] != rows[order][:-1]]
+        pick = order[first]
+        gap[rows[pick]] = pts[pick]
+    return centres.astype(np.float32), nbr, gap
+
+
+def chunks(n):
+    return [slice(i, min(i + CHUNK, n)) for i in range(0, n, CHUNK)]
+
+
+def nonzero32(mask):
+    """np.flatnonzero as int32, without an int64 copy of the whole result"""
+    parts = [np.flatnonzero(mask[s]).astype(np.int32) + np.int32(s.start) for s in chunks(len(mask))]
+    return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int32)
+
+
+# ============================================================================
+# Geometry
+# ============================================================================
+def haversine_km(lat1, lon1, lat2, lon2):
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    a = (np.sin((phi2 - phi1) / 2) ** 2 +
+         np.cos(phi1) * np.cos(phi2) * np.sin(np.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def bearing_deg(lat1, lon1, lat2, lon2):
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    dlon = np.radians(lon2 - lon1)
+    y = np.sin(dlon) * np.cos(phi2)
+    x = np.cos(phi1) * np.sin(phi2) - np.sin(phi1) * np.cos(phi2) * np.cos(dlon)
+    return np.degrees(np.arctan2(y, x)) % 360.0
+
+
+# ============================================================================
+# Neighbour table
+# ============================================================================
+def build_neighbours(zones_path, lit, workers):
+    """
+    Per lit cell (indexed by position in lit): float32 centre, int32 positions
+    of its lit neighbours (-1 otherwise) and float32 centre of its nearest
+    neighbour dark at every threshold (NaN when all are lit).
+    """
+    m = len(lit)
+    centres = np.empty((m, 2), dtype=np.float32)
+    nbr = np.empty((m, 6), dtype=np.int32)
+    gap = np.empty((m, 2), dtype=np.float32)
+    parts = chunks(m)
+    with Pool(workers, _init_worker, (str(zones_path),)) as pool:
+        results = pool.imap(_neighbours, (lit[s] for s in parts))
+        for s, (c, n, g) in tqdm(zip(parts, results), total=len(parts), desc="Neighbour table", unit="chunk"):
+            centres[s], gap[s] = c, g
+            # Record index -> position in lit (every neighbour left in n is lit)
+            nbr[s] = np.where(n >= 0, np.searchsorted(lit, n), -1)
+    print(f"  Lit cells with a dark neighbour: {int((~np.isnan(gap[:, 0])).sum()):,}")
+    return centres, nbr, gap
+
+
+# ============================================================================
+# Multi-source BFS
+# ============================================================================
+def nearest_dark(threshold, zone, nbr, gap, centres):
+    """
+    Source centre (lat, lon) of the nearest cell at or below threshold, per
+    lit cell, and whether one was found. Arrays are indexed by lit position.
+    """
+    m = len(zone)
+    active = zone > threshold
+    src = np.full((m, 2), np.nan, dtype=np.float32)
+    dist = np.full(m, np.inf, dtype=np.float32)
+    resolved = np.zeros(m, dtype=bool)
+    mark = np.zeros(m, dtype=bool)
+
+    def relax(targets, src_lat, src_lon, ok):
+        here = centres[targets]
+        d = np.where(ok, haversine_km(here[:, 0], here[:, 1], src_lat, src_lon), np.inf).astype(np.float32)
+        better = d < dist[targets]
+        t = targets[better]
+        dist[t] = d[better]
+        src[t, 0] = src_lat[better]
+        src[t, 1] = src_lon[better]
+
+    def seed(targets):
+        """Layer 0: neighbours dark at every threshold, and lit neighbours at or below this one"""
+        relax(targets, gap[targets, 0], gap[targets, 1], ~np.isnan(gap[targets, 0]))
+        for j in range(6):
+            n = nbr[targets, j]
+            ok = (n >= 0) & (zone[np.maximum(n, 0)] <= threshold)
+            c = centres[np.maximum(n, 0)]
+            relax(targets, c[:, 0], c[:, 1], ok)
+
+    def pull(targets):
+        """Offer each target the sources held by its resolved neighbours; returns the improved ones"""
+        improved = []
+        for s in chunks(len(targets)):
+            t = targets[s]
+            before = dist[t].copy()
+            for j in range(6):
+                n = nbr[t, j]
+                ok = (n >= 0) & resolved[np.maximum(n, 0)]
+                c = src[np.maximum(n, 0)]
+                relax(t, c[:, 0], c[:, 1], ok)
+            improved.append(t[dist[t] < before])
+        return np.concatenate(improved) if improved else targets[:0]
+
+    def neighbours_of(cells):
+        for s in chunks(len(cells)):
+            n = nbr[cells[s]].ravel()
+            mark[n[n >= 0]] = True
+        return mark
+
+    targets = nonzero32(active)
+    for s in chunks(len(targets)):
+        seed(targets[s])
+    resolved[targets[np.isfinite(dist[targets])]] = True
+    frontier = nonzero32(resolved)
+    del targets
+    layers = 1
+    while len(frontier):
+        mark = neighbours_of(frontier)
+        mark &= active
+        mark &= ~resolved
+        cand = nonzero32(mark)
+        mark[:] = False
+        if not len(cand):
+            break
+        pull(cand)
+        resolved[cand] = True
+        frontier = cand
+        layers += 1
+
+    # BFS settles a cell from whichever neighbours reached it first; a few
+    # label-correcting sweeps let better sources flow round the grid's
+    # hexagonal distortion until nothing improves.
+    sweeps = 0
+    changed = nonzero32(resolved)
+    while len(changed) and sweeps < MAX_SWEEPS:
+        mark = neighbours_of(changed)
+        mark &= resolved
+        cand = nonzero32(mark)
+        mark[:] = False
+        changed = pull(cand)
+        sweeps += 1
+
+    far = max((float(dist[s][active[s]].max()) for s in chunks(m) if active[s].any()), default=0.0)
+    print(f"  Bortle <= {threshold}: {int(active.sum()):,} cells above, {layers} BFS layers, {sweeps} sweeps, "
+          f"max {far:.1f} km")
+    return src, active & resolved
+
+
+def compute(zones_path, out, workers):
+    """Fill out (sidecar records aligned with zones.db, e.g. a memory map)"""
+    records = open_zones(zones_path)
+    if len(records) >= 2 ** 31:
+        raise ValueError(f"{zones_path} has {len(records):,} cells; int32 indexes hold 2^31")
+    lit = nonzero32(records['zone'] > min(DARK_THRESHOLDS))
+    print(f"  Cells: {len(records):,}, above Bortle {min(DARK_THRESHOLDS)}: {len(lit):,}")
+    out[:] = 0
+    if not len(lit):
+        return out
+
+    centres, nbr, gap = build_neighbours(zones_path, lit, workers)
+    zone = np.asarray(records['zone'][lit])
+    for t, threshold in enumerate(DARK_THRESHOLDS):
+        src, found = nearest_dark(threshold, zone, nbr, gap, centres)
+        for s in chunks(len(lit)):
+            above = zone[s] > threshold
+            here, there = centres[s][above], src[s][above]
+            d = haversine_km(here[:, 0], here[:, 1], there[:, 0], there[:, 1])
+            b = bearing_deg(here[:, 0], here[:, 1], there[:, 0], there[:, 1])
+            q = np.where(found[s][above],
+                         np.minimum(np.rint(np.nan_to_num(d) / DISTANCE_UNIT_KM), DISTANCE_UNKNOWN - 1),
+                         DISTANCE_UNKNOWN)
+            rec = lit[s][above]
+            out['distance'][rec, t] = q.astype(np.uint16)
+            out['bearing'][rec, t] = (np.rint(np.nan_to_num(b) * 256 / 360) % 256).astype(np.uint8)
+        del src, found
+    return out
+
+
+def open_sidecar(output_path, count):
+    """Write the header and return the records as a writable memory map"""
+    mask = sum(1 << t for t in DARK_THRESHOLDS)
+    with open(output_path, 'wb') as f:
+        f.write(DARK_DISTANCE_MAGIC)
+        f.write(struct.pack('<HHQ', DARK_DISTANCE_VERSION, mask, count))
+        f.truncate(16 + count * SIDECAR_DTYPE.itemsize)
+    if not count:
+        return np.zeros(0, dtype=SIDECAR_DTYPE)
+    return np.memmap(output_path, dtype=SIDECAR_DTYPE, mode='r+', offset=16, shape=(count,))
+
+
+def write_sidecar(out, output_path):
+    if isinstance(out, np.memmap):
+        out.flush()
+    sha = hashlib.sha256()
+    with open(output_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(8192), b''): sha.update(chunk)
+    size_mb = output_path.stat().st_size / (1024**2)
+    print(f"\n{'='*50}")
+    print("SUCCESS!")
+    print(f"  Records: {len(out):,} (Bortle {', '.join(map(str, DARK_THRESHOLDS))})")
+    print(f"  Size: {size_mb:.1f} MB")
+    print(f"  SHA-256: {sha.hexdigest()}")
+    print(f"{'='*50}")
+
+
+# ============================================================================
+# Main
+# ============================================================================
+def main():
+    default_db = Path(__file__).parent.parent / 'assets' / 'db' / 'zones.db'
+
+    parser = argparse.ArgumentParser(description='Distance to the nearest darker sky for every zones.db cell')
+    parser.add_argument('--zones', default=str(default_db))
+    parser.add_argument('--out', default=str(default_db.parent / 'dark_distance.db'))
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    if not Path(args.zones).exists():
+        print(f"Error: zones.db not found: {args.zones}")
+        sys.exit(1)
+
+    print(f"Reading {args.zones}")
+    t0 = time.time()
+    output_path = Path(args.out)
+    out = compute(args.zones, open_sidecar(output_path, len(open_zones(args.zones))), args.workers)
+    print(f"  Computed in {time.time() - t0:.1f}s")
+    write_sidecar(out, output_path)
+
+
+if __name__ == '__main__':
+    main()
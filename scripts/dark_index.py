@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Coarse dark-sky index for nearest-dark-site search.
+
+For every res-5 parent of a stored zones.db cell, records the lowest zone
+among its res-8 children and the number of children in each zone. Children
+that are not stored count as implicit Zone 1, so a parent absent from the
+index is entirely Zone 1. The API expands rings over coarse parents and
+only opens the res-8 children of parents whose minimum zone qualifies.
+
+Usage:
+    python dark_index.py
+    python dark_index.py --zones ../assets/db/zones.db --out ../assets/db/dark_index.db
+
+Output: assets/db/dark_index.db
+"""
+
+import sys, argparse, struct, hashlib
+from pathlib import Path
+
+import numpy as np
+from tqdm import tqdm
+
+from apply_skyglow import H3_RESOLUTION, cells_to_parent
+
+# ============================================================================
+# Configuration
+# ============================================================================
+INDEX_RESOLUTION = 5        # ~250 km² parents, 343 res-8 children each
+ZONES = 9
+CHUNK = 1_000_000
+
+# dark_index.db layout (must match backend/api/dark_sites.py)
+#   Header (16 bytes): magic "ASTD", version u16, resolution u8, child resolution u8, count u64
+#   Records: h3 u64, zone_min u8, counts u32 × 9 (children per zone 1..9), sorted by h3
+DARK_MAGIC = b'ASTD'
+DARK_VERSION = 1
+
+ZONES_DTYPE = np.dtype([('h3', '<u8'), ('zone', 'u1'), ('radiance', '<f4'),
+                        ('sqm', '<f4'), ('reserved', 'V3')])
+INDEX_DTYPE = np.dtype([('h3', '<u8'), ('zone_min', 'u1'), ('counts', '<u4', (ZONES,))])
+
+
+def build_index(zones_path):
+    """Per-parent zone minimum and zone histogram, sorted by parent."""
+    with open(zones_path, 'rb') as f:
+        header = f.read(16)
+    if header[:4] != b'ASTR':
+        raise ValueError(f"{zones_path} is not a zones.db file")
+    count = struct.unpack('<Q', header[8:16])[0]
+    records = np.memmap(zones_path, dtype=ZONES_DTYPE, mode='r', offset=16, shape=(count,))
+
+    parents, hists = [], []
+    for start in tqdm(range(0, count, CHUNK), desc="Indexing parents", unit="chunk"):
+        block = records[start:start + CHUNK]
+        # Children of a parent are contiguous in h3 order, so this chunk's
+        # parents are sorted; only the boundary parent can span two chunks.
+        uniq, inverse = np.unique(cells_to_parent(block['h3'], INDEX_RESOLUTION), return_inverse=True)
+        zone = np.clip(block['zone'].astype(np.intp), 1, ZONES) - 1
+        hist = np.zeros((len(uniq), ZONES), dtype=np.uint32)
+        np.add.at(hist, (inverse, zone), 1)
+        parents.append(uniq)
+        hists.append(hist)
+
+    out = np.zeros(0, dtype=INDEX_DTYPE)
+    if parents:
+        cells = np.concatenate(parents)
+        hist = np.concatenate(hists)
+        uniq, inverse = np.unique(cells, return_inverse=True)
+        hist = np.stack([np.bincount(inverse, weights=hist[:, z], minlength=len(uniq))
+                         for z in range(ZONES)], axis=1).astype(np.uint32)
+        children = 7 ** (H3_RESOLUTION - INDEX_RESOLUTION)
+        hist[:, 0] += (children - hist.sum(axis=1)).astype(np.uint32)
+
+        out = np.empty(len(uniq), dtype=INDEX_DTYPE)
+        out['h3'] = uniq
+        out['counts'] = hist
+        out['zone_min'] = np.argmax(hist > 0, axis=1) + 1
+    return out
+
+
+def write_index(index, output_path):
+    with open(output_path, 'wb') as f:
+        f.write(DARK_MAGIC)
+        f.write(struct.pack('<HBBQ', DARK_VERSION, INDEX_RESOLUTION, H3_RESOLUTION, len(index)))
+        index.tofile(f)
+
+    sha = hashlib.sha256()
+    with open(output_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(8192), b''): sha.update(chunk)
+    size_mb = output_path.stat().st_size / (1024**2)
+    print(f"\n{'='*50}")
+    print("SUCCESS!")
+    print(f"  Parents: {len(index):,} (res {INDEX_RESOLUTION})")
+    for z in range(1, ZONES + 1):
+        print(f"  zone_min {z}: {int(np.count_nonzero(index['zone_min'] == z)):,}")
+    print(f"  Size: {size_mb:.1f} MB")
+    print(f"  SHA-256: {sha.hexdigest()}")
+    print(f"{'='*50}")
+
+
+# ============================================================================
+# Main
+# ============================================================================
+def main():
+    default_db = Path(__file__).parent.parent / 'assets' / 'db' / 'zones.db'
+
+    parser = argparse.ArgumentParser(description='Coarse dark-sky index for nearest-site search')
+    parser.add_argument('--zones', default=str(default_db))
+    parser.add_argument('--out', default=str(default_db.parent / 'dark_index.db'))
+    args = parser.parse_args()
+
+    if not Path(args.zones).exists():
+        print(f"Error: zones.db not found: {args.zones}")
+        sys.exit(1)
+
+    print(f"Reading {args.zones}")
+    write_index(build_index(args.zones), Path(args.out))
+
+
+if __name__ == '__main__':
+    main()
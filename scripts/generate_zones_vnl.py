@@ -7,6 +7,9 @@ VERSION 4 — MEMORY-SAFE + RESUMABLE
   - Checkpoints progress so it can resume after interruption
   - Reopens the raster every N strips to flush GDAL vsigzip memory
   - Caps GDAL internal cache to 256 MB
+  - --fused: one decompression also writes the coarse grid and a sparse
+    lit-pixel store (sparse_store.py) so apply_skyglow.py --sparse never
+    has to read the raster again
 
 Data Source: Colorado School of Mines / Earth Observation Group
 URL: https://eogdata.mines.edu/products/vnl/
@@ -15,6 +18,7 @@ Usage:
     cd scripts && source .venv/bin/activate
     pip install rasterio h3 numpy tqdm
     python generate_zones_vnl.py --tif "../VNL NPP 2024 Global Configuration Data.tif.gz"
+    python generate_zones_vnl.py --tif "../VNL NPP 2024 Global Masked Data.tif.gz" --fused
 
 Output: assets/db/zones.db
 """
@@ -53,6 +57,8 @@ import h3
 import numpy as np
 from tqdm import tqdm
 
+import sparse_store
+
 
 # ============================================================================
 # Configuration
@@ -61,6 +67,10 @@ from tqdm import tqdm
 H3_RESOLUTION = 8
 STRIP_HEIGHT = 200
 
+# Fused mode: strips must cover whole coarse blocks
+DOWNSAMPLE = 12                     # must match apply_skyglow.py
+FUSED_STRIP_HEIGHT = DOWNSAMPLE * 20
+
 # How many strips to process before closing/reopening the raster file
 # to flush GDAL's vsigzip decompression buffers.
 REOPEN_INTERVAL = 25
@@ -103,6 +113,25 @@ def radiance_to_sqm(radiance: float) -> float:
     return max(16.0, min(22.0, sqm))
 
 
+# zones.db record: h3 u64, zone u8, radiance f32, sqm f32, 3 pad bytes
+RECORD_DTYPE = np.dtype([('h3', '<u8'), ('zone', 'u1'), ('radiance', '<f4'), ('sqm', '<f4'), ('pad', 'V3')])
+
+
+def zone_records(cells, radiance):
+    """radiance_to_zone / radiance_to_sqm over arrays: zones.db records of the Zone 2+ cells."""
+    zone = np.ones(len(radiance), dtype=np.uint8)
+    for threshold, z in reversed(ZONE_THRESHOLDS):
+        zone[radiance >= threshold] = z
+    keep = zone > 1
+    radiance = radiance[keep]
+    records = np.zeros(len(radiance), dtype=RECORD_DTYPE)
+    records['h3'] = cells[keep]
+    records['zone'] = zone[keep]
+    records['radiance'] = radiance
+    records['sqm'] = np.clip(22.0 - 1.7 * np.log10(1.0 + 2.0 * radiance), 16.0, 22.0)
+    return records
+
+
 # ============================================================================
 # SQLite Accumulator
 # ============================================================================
@@ -124,20 +153,26 @@ def init_accumulator(db_path: Path):
             strip_idx INTEGER PRIMARY KEY
         )
     ''')
+    # Fused strips are a different height, so they checkpoint separately
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS fused_progress (
+            strip_idx INTEGER PRIMARY KEY
+        )
+    ''')
     conn.commit()
     return conn
 
 
-def get_completed_strips(conn):
+def get_completed_strips(conn, table='progress'):
     """Return set of strip indices already processed."""
-    rows = conn.execute('SELECT strip_idx FROM progress').fetchall()
+    rows = conn.execute(f'SELECT strip_idx FROM {table}').fetchall()
     return set(r[0] for r in rows)
 
 
-def flush_batch(conn, batch, strip_idx):
+def flush_batch(conn, batch, strip_idx, table='progress'):
     """Write a batch of (h3_int, radiance) pairs to SQLite, keeping MAX radiance."""
     if not batch:
-        conn.execute('INSERT OR IGNORE INTO progress VALUES (?)', (strip_idx,))
+        conn.execute(f'INSERT OR IGNORE INTO {table} VALUES (?)', (strip_idx,))
         conn.commit()
         return
 
@@ -146,7 +181,7 @@ def flush_batch(conn, batch, strip_idx):
         INSERT INTO cells (h3, radiance) VALUES (?, ?)
         ON CONFLICT(h3) DO UPDATE SET radiance = MAX(radiance, excluded.radiance)
     ''', batch)
-    conn.execute('INSERT OR IGNORE INTO progress VALUES (?)', (strip_idx,))
+    conn.execute(f'INSERT OR IGNORE INTO {table} VALUES (?)', (strip_idx,))
     conn.commit()
 
 
@@ -192,12 +227,28 @@ def process_strip(data_strip, transform, start_row):
     return results, len(radiances)
 
 
+def process_strip_fused(data_strip, transform, start_row, strip_idx, sparse_dir):
+    """
+    Fused-mode strip: write the sparse chunk, then reduce its Zone 2+ pixels
+    to one (h3_int, max radiance) per cell using the cells the chunk stored.
+    """
+    cells, radiances = sparse_store.write_strip(
+        sparse_dir, strip_idx, start_row, data_strip, DOWNSAMPLE, transform, H3_RESOLUTION)
+    bright = radiances >= ZONE2_RADIANCE
+    keep = bright & (cells != 0)
+    cells, radiances = sparse_store.reduce_max(cells[keep], radiances[keep].astype(np.float64))
+    return list(zip(cells.tolist(), radiances.tolist())), int(bright.sum())
+
+
 # ============================================================================
 # Main processing
 # ============================================================================
 
-def process_vnl(tif_path: Path, output_path: Path):
-    """Process VNL GeoTIFF to zones.db using SQLite accumulator."""
+def process_vnl(tif_path: Path, output_path: Path, sparse_dir: Path = None):
+    """
+    Process VNL GeoTIFF to zones.db using SQLite accumulator.
+    With sparse_dir, each strip is also written to the sparse store (fused mode).
+    """
 
     raster_path = str(tif_path)
     if tif_path.suffix == '.gz':
@@ -207,8 +258,12 @@ def process_vnl(tif_path: Path, output_path: Path):
     # SQLite accumulator lives next to the script
     accum_path = tif_path.parent / 'zones_accumulator.db'
 
+    fused = sparse_dir is not None
+    strip_height = FUSED_STRIP_HEIGHT if fused else STRIP_HEIGHT
+    progress_table = 'fused_progress' if fused else 'progress'
+
     conn = init_accumulator(accum_path)
-    completed = get_completed_strips(conn)
+    completed = get_completed_strips(conn, progress_table)
 
     # Get raster dimensions
     with rasterio.open(raster_path) as src:
@@ -216,18 +271,25 @@ def process_vnl(tif_path: Path, output_path: Path):
         width = src.width
         transform = src.transform
 
-    num_strips = (height + STRIP_HEIGHT - 1) // STRIP_HEIGHT
+    if fused:
+        sparse_store.write_manifest(sparse_dir, height, width, transform, DOWNSAMPLE, strip_height)
+        # A strip counts as done only once its chunk is on disk too
+        completed = {i for i in completed if sparse_store.strip_path(sparse_dir, i).exists()}
+
+    num_strips = (height + strip_height - 1) // strip_height
     remaining = num_strips - len(completed)
 
     print(f"\nImage: {width}x{height} pixels")
     print(f"H3 Resolution: {H3_RESOLUTION} (~461m cells)")
-    print(f"Strip height: {STRIP_HEIGHT} rows (~{width * STRIP_HEIGHT * 4 / 1024**2:.0f} MB/strip)")
+    print(f"Strip height: {strip_height} rows (~{width * strip_height * 4 / 1024**2:.0f} MB/strip)")
     print(f"Total strips: {num_strips}")
     print(f"Already done: {len(completed)}")
     print(f"Remaining: {remaining}")
     print(f"GDAL cache: {os.environ.get('GDAL_CACHEMAX', 'default')} MB")
     print(f"Raster reopen interval: every {REOPEN_INTERVAL} strips")
     print(f"Accumulator: {accum_path}")
+    if fused:
+        print(f"Sparse store: {sparse_dir} (coarse grid ×{DOWNSAMPLE})")
 
     if remaining == 0:
         print("\nAll strips already processed! Skipping to write phase.")
@@ -250,8 +312,8 @@ def process_vnl(tif_path: Path, output_path: Path):
                 src = rasterio.open(raster_path)
                 strips_since_open = 0
 
-            start_row = strip_idx * STRIP_HEIGHT
-            end_row = min(start_row + STRIP_HEIGHT, height)
+            start_row = strip_idx * strip_height
+            end_row = min(start_row + strip_height, height)
 
             window = rasterio.windows.Window(
                 col_off=0, row_off=start_row,
@@ -259,12 +321,16 @@ def process_vnl(tif_path: Path, output_path: Path):
             )
 
             data = src.read(1, window=window)
-            results, px = process_strip(data, transform, start_row)
+            if fused:
+                data = np.maximum(data, 0)
+                results, px = process_strip_fused(data, transform, start_row, strip_idx, sparse_dir)
+            else:
+                results, px = process_strip(data, transform, start_row)
             total_pixels += px
             del data
 
             # Flush to SQLite
-            flush_batch(conn, results, strip_idx)
+            flush_batch(conn, results, strip_idx, progress_table)
             del results
 
             strips_since_open += 1
@@ -279,6 +345,10 @@ def process_vnl(tif_path: Path, output_path: Path):
         pbar.close()
         print(f"\nScanning complete. Lit pixels examined: {total_pixels:,}")
 
+    if fused:
+        coarse = sparse_store.write_coarse(sparse_dir)
+        print(f"Coarse grid: {coarse.shape[1]}×{coarse.shape[0]}, non-zero: {np.count_nonzero(coarse):,}")
+
     # ------------------------------------------------------------------
     # Count records
     # ------------------------------------------------------------------
@@ -308,20 +378,12 @@ def process_vnl(tif_path: Path, output_path: Path):
             if not rows:
                 break
 
-            for h3_int, radiance in rows:
-                zone = radiance_to_zone(radiance)
-                if zone <= 1:
-                    skipped_zone1 += 1
-                    continue
-
-                sqm = radiance_to_sqm(radiance)
-                record = struct.pack('<Q', h3_int)
-                record += struct.pack('B', zone)
-                record += struct.pack('<f', radiance)
-                record += struct.pack('<f', sqm)
-                record += b'\x00\x00\x00'
-                f.write(record)
-                written += 1
+            cells = np.fromiter((r[0] for r in rows), dtype=np.uint64, count=len(rows))
+            radiance = np.fromiter((r[1] for r in rows), dtype=np.float64, count=len(rows))
+            records = zone_records(cells, radiance)
+            records.tofile(f)
+            written += len(records)
+            skipped_zone1 += len(rows) - len(records)
 
         # Patch header with actual count
         f.seek(count_offset)
@@ -373,6 +435,8 @@ def process_vnl(tif_path: Path, output_path: Path):
     print("  (Delete it after verifying zones.db is correct)")
 
     print("\nNext steps:")
+    if fused:
+        print(f"  0. python apply_skyglow.py --sparse {sparse_dir}")
     print("  1. python validate_zones_db.py")
     print("  2. cd ../cloudflare && npx wrangler r2 object put astr-zones/zones.db --file ../assets/db/zones.db")
 
@@ -385,13 +449,18 @@ def main():
     parser.add_argument('--tif', type=str, help='Path to VNL TIF/TIF.GZ')
     parser.add_argument('--reset', action='store_true',
                         help='Delete accumulator and start fresh')
+    parser.add_argument('--fused', action='store_true',
+                        help='Also write the coarse grid and sparse lit-pixel store in the same pass')
+    parser.add_argument('--sparse-dir', type=str,
+                        help='Sparse store directory for --fused (default: <tif dir>/sparse)')
+    parser.add_argument('--output', type=str, help='zones.db to write (default: assets/db/zones.db)')
     args = parser.parse_args()
 
     script_dir = Path(__file__).parent
     data_dir = script_dir / 'data'
     data_dir.mkdir(exist_ok=True)
 
-    output_path = script_dir.parent / 'assets' / 'db' / 'zones.db'
+    output_path = Path(args.output) if args.output else script_dir.parent / 'assets' / 'db' / 'zones.db'
     output_path.parent.mkdir(parents=True, exist_ok=True)
 
     if args.tif:
@@ -407,7 +476,16 @@ def main():
         print("Please place the VNL data file in scripts/data/ or use --tif argument.")
         sys.exit(1)
 
+    sparse_dir = None
+    if args.fused:
+        sparse_dir = Path(args.sparse_dir) if args.sparse_dir else tif_path.parent / 'sparse'
+
     if args.reset:
+        if sparse_dir is not None and sparse_dir.exists():
+            for p in [*sparse_dir.glob('strip_*.npz'), sparse_dir / 'coarse.npy']:
+                if p.exists():
+                    os.remove(p)
+            print(f"Cleared sparse store: {sparse_dir}")
         accum = tif_path.parent / 'zones_accumulator.db'
         if accum.exists():
             os.remove(accum)
@@ -418,7 +496,7 @@ def main():
                 if p.exists():
                     os.remove(p)
 
-    process_vnl(tif_path, output_path)
+    process_vnl(tif_path, output_path, sparse_dir)
 
 
 if __name__ == '__main__':
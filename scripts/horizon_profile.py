@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Directional light-dome profiles: sky brightness per azimuth sector.
+
+Built on apply_skyglow's scatter model. Emitters are aggregated to the same
+coarse H3 resolution as the h3 skyglow engine; for a target cell every
+emitter within MAX_RADIUS_KM is weighted by scatter_weight(distance) and
+binned by the bearing from the observer towards it. The per-cell
+computation is fully vectorized over the neighbouring emitters and runs
+well under a millisecond.
+
+Modes:
+  --lat/--lon   Print the profile for one site (on-demand).
+  --precompute  Write horizon.db with compact profiles for the coarse parent
+                of every Zone 2+ cell in zones.db. The API serves lookups
+                from this file.
+
+Usage:
+    python horizon_profile.py --lat 32.7795 --lon 78.9641
+    python horizon_profile.py --precompute --workers 8
+
+Output (precompute): assets/db/horizon.db
+"""
+
+import sys, argparse, struct, hashlib, math, time, sqlite3
+from multiprocessing import Pool
+from pathlib import Path
+
+import numpy as np
+from tqdm import tqdm
+
+from h3.api import numpy_int as h3_np
+from apply_skyglow import (
+    H3_RESOLUTION, H3_COARSE_RESOLUTION, scatter_weight, h3_weight_scale,
+    max_ring, cells_to_parent, reduce_sum,
+)
+
+# ============================================================================
+# Configuration
+# ============================================================================
+AZIMUTH_BINS = 36           # 10° sectors, clockwise from north
+PROFILE_RESOLUTION = H3_COARSE_RESOLUTION  # profiles are stored per coarse parent
+CHUNK = 1_000_000
+
+# horizon.db layout (must match backend/api/horizon_profiles.py)
+#   Header (16 bytes): magic "ASTH", version u16, bins u8, resolution u8, count u64
+#   Records: h3 u64 + bins × u8 log-quantized radiance, sorted by h3
+HORIZON_MAGIC = b'ASTH'
+HORIZON_VERSION = 1
+LOG_MIN = -4.0              # q=1 ↔ 1e-4 nW/cm²/sr; q=0 ↔ below that
+LOG_STEP = 7.0 / 254        # q=255 ↔ 1e3 nW/cm²/sr
+
+ZONES_DTYPE = np.dtype([('h3', '<u8'), ('zone', 'u1'), ('radiance', '<f4'),
+                        ('sqm', '<f4'), ('reserved', 'V3')])
+
+
+def quantize(values):
+    """Log-quantize radiance to uint8 (≈6.5% steps)."""
+    v = np.asarray(values, dtype=np.float64)
+    q = np.zeros(v.shape, dtype=np.uint8)
+    lit = v >= 10 ** LOG_MIN
+    q[lit] = np.clip(np.rint((np.log10(v[lit]) - LOG_MIN) / LOG_STEP) + 1, 1, 255)
+    return q
+
+
+def dequantize(q):
+    q = np.asarray(q)
+    return np.where(q > 0, 10 ** (LOG_MIN + (q.astype(np.float64) - 1) * LOG_STEP), 0.0)
+
+
+# ============================================================================
+# Emitter field
+# ============================================================================
+def read_emitters(path):
+    """Load (h3, radiance) from zones.db or a generate_zones_vnl accumulator."""
+    path = Path(path)
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+    if magic == b'ASTR':
+        records = np.memmap(path, dtype=ZONES_DTYPE, mode='r', offset=16)
+        return records['h3'], records['radiance']
+
+    conn = sqlite3.connect(str(path))
+    cells, rads = [], []
+    cursor = conn.execute('SELECT h3, radiance FROM cells ORDER BY h3')
+    while True:
+        rows = cursor.fetchmany(CHUNK)
+        if not rows: break
+        cells.append(np.array([r[0] for r in rows], dtype=np.uint64))
+        rads.append(np.array([r[1] for r in rows], dtype=np.float32))
+    conn.close()
+    if not cells:
+        return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.float32)
+    return np.concatenate(cells), np.concatenate(rads)
+
+
+class EmitterField:
+    """Coarse emitters with precomputed centres, ready for per-site profiles."""
+
+    def __init__(self, cells, radiance):
+        children = 7 ** (H3_RESOLUTION - H3_COARSE_RESOLUTION)
+        parts_cells, parts_sums = [], []
+        for start in range(0, len(cells), CHUNK):
+            parents = cells_to_parent(cells[start:start + CHUNK], H3_COARSE_RESOLUTION)
+            pc, ps = reduce_sum(parents, np.asarray(radiance[start:start + CHUNK], dtype=np.float64))
+            parts_cells.append(pc); parts_sums.append(ps)
+        if parts_cells:
+            self.cells, sums = reduce_sum(np.concatenate(parts_cells), np.concatenate(parts_sums))
+        else:
+            self.cells, sums = np.zeros(0, dtype=np.uint64), np.zeros(0)
+        # Mean radiance of the coarse cell, already scaled to a per-cell weight
+        self.power = sums / children * h3_weight_scale()
+
+        centres = np.array([h3_np.cell_to_latlng(int(c)) for c in self.cells]).reshape(-1, 2)
+        self.lat = np.radians(centres[:, 0])
+        self.lon = np.radians(centres[:, 1])
+        self.k = max_ring()
+
+    def profile(self, lat, lon, bins=AZIMUTH_BINS):
+        """Scattered radiance (nW/cm²/sr) arriving from each azimuth sector at (lat, lon)."""
+        out = np.zeros(bins)
+        if len(self.cells) == 0:
+            return out
+        origin = h3_np.latlng_to_cell(lat, lon, H3_COARSE_RESOLUTION)
+        disk = h3_np.grid_disk(origin, self.k)
+        idx = np.minimum(np.searchsorted(self.cells, disk), len(self.cells) - 1)
+        idx = idx[self.cells[idx] == disk]
+        if len(idx) == 0:
+            return out
+
+        phi1, lam1 = math.radians(lat), math.radians(lon)
+        phi2, dlam = self.lat[idx], self.lon[idx] - lam1
+        sin_dphi = np.sin((phi2 - phi1) / 2)
+        a = sin_dphi**2 + math.cos(phi1) * np.cos(phi2) * np.sin(dlam / 2)**2
+        d_km = 2 * 6371.0088 * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+        bearing = np.degrees(np.arctan2(
+            np.sin(dlam) * np.cos(phi2),
+            math.cos(phi1) * np.sin(phi2) - math.sin(phi1) * np.cos(phi2) * np.cos(dlam))) % 360.0
+
+        sector = (bearing * bins / 360.0).astype(np.intp) % bins
+        return np.bincount(sector, weights=scatter_weight(d_km) * self.power[idx], minlength=bins)
+
+
+# ============================================================================
+# Precompute
+# ============================================================================
+_field = None
+
+
+def _init_worker(field):
+    global _field
+    _field = field
+
+
+def _profile_batch(cells):
+    rows = np.empty((len(cells), AZIMUTH_BINS), dtype=np.uint8)
+    for i, c in enumerate(cells.tolist()):
+        lat, lon = h3_np.cell_to_latlng(c)
+        rows[i] = quantize(_field.profile(lat, lon))
+    return rows
+
+
+def precompute(field, zones_path, output_path, workers):
+    records = np.memmap(zones_path, dtype=ZONES_DTYPE, mode='r', offset=16)
+    parts = []
+    for start in tqdm(range(0, len(records), CHUNK), desc="Collecting parents", unit="chunk"):
+        block = records[start:start + CHUNK]
+        lit = block['h3'][block['zone'] >= 2]
+        parts.append(np.unique(cells_to_parent(lit, PROFILE_RESOLUTION)))
+    targets = np.unique(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.uint64)
+    print(f"  Profiles to compute: {len(targets):,} (res {PROFILE_RESOLUTION} parents)")
+
+    batches = np.array_split(targets, max(1, len(targets) // 2000))
+    with Pool(workers, initializer=_init_worker, initargs=(field,)) as pool:
+        results = list(tqdm(pool.imap(_profile_batch, batches), total=len(batches),
+                            desc="Profiles", unit="batch"))
+    profiles = np.concatenate(results) if results else np.zeros((0, AZIMUTH_BINS), np.uint8)
+
+    out = np.empty(len(targets), dtype=np.dtype([('h3', '<u8'), ('bins', 'u1', (AZIMUTH_BINS,))]))
+    out['h3'] = targets
+    out['bins'] = profiles
+    with open(output_path, 'wb') as f:
+        f.write(HORIZON_MAGIC)
+        f.write(struct.pack('<HBBQ', HORIZON_VERSION, AZIMUTH_BINS, PROFILE_RESOLUTION, len(out)))
+        out.tofile(f)
+
+    sha = hashlib.sha256()
+    with open(output_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(8192), b''): sha.update(chunk)
+    size_mb = output_path.stat().st_size / (1024**2)
+    print(f"\n{'='*50}")
+    print("SUCCESS!")
+    print(f"  Profiles: {len(out):,} × {AZIMUTH_BINS} bins")
+    print(f"  Size: {size_mb:.1f} MB")
+    print(f"  SHA-256: {sha.hexdigest()}")
+    print(f"{'='*50}")
+
+
+def print_profile(field, lat, lon):
+    t0 = time.perf_counter()
+    prof = field.profile(lat, lon)
+    elapsed_us = (time.perf_counter() - t0) * 1e6
+    step = 360 // AZIMUTH_BINS
+    peak = float(prof.max()) or 1.0
+    print(f"\nLight dome at ({lat}, {lon}) — {elapsed_us:.0f} µs")
+    for i, v in enumerate(prof):
+        bar = '#' * int(round(40 * v / peak))
+        print(f"  {i * step:3d}°  {v:9.4f}  {bar}")
+    print(f"  Total scatter: {prof.sum():.4f} nW/cm²/sr")
+
+
+# ============================================================================
+# Main
+# ============================================================================
+def main():
+    default_db = Path(__file__).parent.parent / 'assets' / 'db' / 'zones.db'
+
+    parser = argparse.ArgumentParser(description='Directional horizon light-dome profiles')
+    parser.add_argument('--emitters', default=str(default_db),
+                        help='zones.db or zones_accumulator.db supplying emitter radiance')
+    parser.add_argument('--lat', type=float)
+    parser.add_argument('--lon', type=float)
+    parser.add_argument('--precompute', action='store_true',
+                        help='Write horizon.db for all Zone 2+ cells in --zones')
+    parser.add_argument('--zones', default=str(default_db), help='zones.db selecting cells to precompute')
+    parser.add_argument('--out', default=str(default_db.parent / 'horizon.db'))
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    if not args.precompute and (args.lat is None or args.lon is None):
+        parser.error('give --lat/--lon or --precompute')
+    if not Path(args.emitters).exists():
+        print(f"Error: emitter source not found: {args.emitters}")
+        sys.exit(1)
+
+    print(f"Loading emitters from {args.emitters}")
+    cells, radiance = read_emitters(args.emitters)
+    field = EmitterField(cells, radiance)
+    print(f"  Coarse emitters: {len(field.cells):,} (res {H3_COARSE_RESOLUTION}, {field.k} rings)")
+
+    if args.precompute:
+        precompute(field, args.zones, Path(args.out), args.workers)
+    else:
+        print_profile(field, args.lat, args.lon)
+
+
+if __name__ == '__main__':
+    main()
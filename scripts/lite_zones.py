@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Small lite dataset for serving while the main database warms up.
+
+For every res-6 parent (49 res-8 children) of a stored zones.db cell,
+records the zone and SQM of its median child by SQM. Children that are not
+stored count as implicit Zone 1 at 22.0, so only parents where at least
+half the area is lit are kept. The result is ~1/50 the size of zones.db
+and small enough to bundle with a serverless function; the API answers
+from it (marked approximate) until MongoDB is connected.
+
+Usage:
+    python lite_zones.py
+    python lite_zones.py --zones ../assets/db/zones.db --out ../assets/db/zones_lite.db
+
+Output: assets/db/zones_lite.db
+"""
+
+import sys, argparse, struct, hashlib
+from pathlib import Path
+
+import numpy as np
+from tqdm import tqdm
+
+from apply_skyglow import H3_RESOLUTION, cells_to_parent
+
+# ============================================================================
+# Configuration
+# ============================================================================
+LITE_RESOLUTION = 6         # ~36 km² parents, 49 res-8 children each
+CHUNK = 1_000_000
+IMPLICIT_SQM = 22.0
+
+# zones_lite.db layout (must match backend/api/zones_store.py)
+#   Header (16 bytes): magic "ASTL", version u16, resolution u8, child resolution u8, count u64
+#   Records (13 bytes): h3 u64, zone u8, sqm f32, sorted by h3
+LITE_MAGIC = b'ASTL'
+LITE_VERSION = 1
+
+ZONES_DTYPE = np.dtype([('h3', '<u8'), ('zone', 'u1'), ('radiance', '<f4'),
+                        ('sqm', '<f4'), ('reserved', 'V3')])
+LITE_DTYPE = np.dtype([('h3', '<u8'), ('zone', 'u1'), ('sqm', '<f4')])
+
+
+def median_children(block, parents, children):
+    """Median child (by SQM, implicit cells included) of each parent; Zone 1 parents dropped"""
+    order = np.lexsort((block['sqm'], parents))
+    zone, sqm = block['zone'][order], block['sqm'][order]
+    uniq, first, stored = np.unique(parents[order], return_index=True, return_counts=True)
+    # Stored cells are all brighter than implicit ones, so the median child
+    # is stored exactly when it falls within the parent's stored run
+    m = (children - 1) // 2
+    lit = m < stored
+    out = np.empty(int(np.count_nonzero(lit)), dtype=LITE_DTYPE)
+    pick = first[lit] + m
+    out['h3'] = uniq[lit]
+    out['zone'] = zone[pick]
+    out['sqm'] = sqm[pick]
+    return out[out['zone'] > 1]
+
+
+def build_lite(zones_path):
+    """Median-child records per parent, sorted by parent."""
+    with open(zones_path, 'rb') as f:
+        header = f.read(16)
+    if header[:4] != b'ASTR':
+        raise ValueError(f"{zones_path} is not a zones.db file")
+    count = struct.unpack('<Q', header[8:16])[0]
+    records = np.memmap(zones_path, dtype=ZONES_DTYPE, mode='r', offset=16, shape=(count,))
+    children = 7 ** (H3_RESOLUTION - LITE_RESOLUTION)
+
+    out, carry = [], None
+    for start in tqdm(range(0, count, CHUNK), desc="Summarizing parents", unit="chunk"):
+        block = np.asarray(records[start:start + CHUNK])
+        if carry is not None:
+            block = np.concatenate([carry, block])
+        parents = cells_to_parent(block['h3'], LITE_RESOLUTION)
+        # Children of a parent are contiguous in h3 order; hold back the last
+        # parent, which may continue in the next chunk
+        if start + CHUNK < count:
+            cut = int(np.searchsorted(parents, parents[-1]))
+            carry = block[cut:]
+            block, parents = block[:cut], parents[:cut]
+        if len(block):
+            out.append(median_children(block, parents, children))
+    return np.concatenate(out) if out else np.zeros(0, dtype=LITE_DTYPE)
+
+
+def write_lite(lite, output_path):
+    with open(output_path, 'wb') as f:
+        f.write(LITE_MAGIC)
+        f.write(struct.pack('<HBBQ', LITE_VERSION, LITE_RESOLUTION, H3_RESOLUTION, len(lite)))
+        lite.tofile(f)
+
+    sha = hashlib.sha256()
+    with open(output_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(8192), b''): sha.update(chunk)
+    size_mb = output_path.stat().st_size / (1024**2)
+    print(f"\n{'='*50}")
+    print("SUCCESS!")
+    print(f"  Parents: {len(lite):,} (res {LITE_RESOLUTION})")
+    for z in range(2, 10):
+        print(f"  Zone {z}: {int(np.count_nonzero(lite['zone'] == z)):,}")
+    print(f"  Size: {size_mb:.2f} MB")
+    print(f"  SHA-256: {sha.hexdigest()}")
+    print(f"{'='*50}")
+
+
+# ============================================================================
+# Main
+# ============================================================================
+def main():
+    default_db = Path(__file__).parent.parent / 'assets' / 'db' / 'zones.db'
+
+    parser = argparse.ArgumentParser(description='Lite per-parent zones for cold-start serving')
+    parser.add_argument('--zones', default=str(default_db))
+    parser.add_argument('--out', default=str(default_db.parent / 'zones_lite.db'))
+    args = parser.parse_args()
+
+    if not Path(args.zones).exists():
+        print(f"Error: zones.db not found: {args.zones}")
+        sys.exit(1)
+
+    print(f"Reading {args.zones}")
+    write_lite(build_lite(args.zones), Path(args.out))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+Sparse lit-pixel store for the fused pipeline.
+
+generate_zones_vnl.py --fused decompresses the VNL raster once and writes,
+per strip, every lit pixel (row, col, radiance, H3 cell) plus the strip's
+block-mean coarse rows as a compressed NumPy chunk. apply_skyglow.py --sparse
+reads these chunks instead of decompressing the 11 GB raster twice more, and
+reuses the stored cells instead of re-indexing lit pixels.
+
+The masked VNL product is exactly zero outside lit areas, so with
+SPARSE_MIN_RADIANCE = 0 the store is lossless. Only Zone 2+ pixels (at or
+above SPARSE_INDEX_RADIANCE, the same set the unfused pipeline indexes) get
+a cell in the fused pass; dimmer ones store cell 0 and are indexed by
+apply_skyglow.py only where scatter lifts them into Zone 2.
+
+Layout:
+  <dir>/manifest.json       raster shape, transform, downsample, strip height
+  <dir>/strip_00000.npz     rows u4, cols u4, radiance f4, cells u8, coarse f4 (ny × cw)
+  <dir>/coarse.npy          full coarse grid, assembled after the last strip
+"""
+
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import rasterio.transform
+from h3.api import numpy_int as h3_int
+
+SPARSE_MIN_RADIANCE = 0.0     # keep pixels strictly above this
+SPARSE_INDEX_RADIANCE = 0.25  # index pixels at or above this (ZONE2_RADIANCE)
+
+
+def write_manifest(store_dir, height, width, transform, downsample, strip_height):
+    store_dir = Path(store_dir)
+    store_dir.mkdir(parents=True, exist_ok=True)
+    manifest = {
+        'height': height, 'width': width,
+        'transform': list(transform)[:6],
+        'downsample': downsample, 'strip_height': strip_height,
+        'min_radiance': SPARSE_MIN_RADIANCE,
+        'index_radiance': SPARSE_INDEX_RADIANCE,
+    }
+    with open(store_dir / 'manifest.json', 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+
+def read_manifest(store_dir):
+    with open(Path(store_dir) / 'manifest.json') as f:
+        return json.load(f)
+
+
+def strip_path(store_dir, strip_idx):
+    return Path(store_dir) / f'strip_{strip_idx:05d}.npz'
+
+
+def block_mean(data, downsample):
+    """Block-mean a strip to coarse rows, dropping partial blocks (as downsample_raster does)."""
+    ny, nx = data.shape[0] // downsample, data.shape[1] // downsample
+    block = data[:ny * downsample, :nx * downsample].reshape(ny, downsample, nx, downsample)
+    return block.mean(axis=(1, 3)).astype(np.float32)
+
+
+def pixel_cells(rows, cols, transform, resolution):
+    """H3 cell (as int) of each pixel centre; 0 where the centre is outside ±85° lat."""
+    cells = np.zeros(len(rows), dtype=np.uint64)
+    if len(rows) == 0:
+        return cells
+    xs, ys = rasterio.transform.xy(transform, rows, cols)
+    lons, lats = np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64)
+    inside = np.flatnonzero((np.abs(lats) <= 85) & (np.abs(lons) <= 180))
+    cells[inside] = np.fromiter((h3_int.latlng_to_cell(lat, lon, resolution)
+                                 for lat, lon in zip(lats[inside].tolist(), lons[inside].tolist())),
+                                dtype=np.uint64, count=len(inside))
+    return cells
+
+
+def write_strip(store_dir, strip_idx, start_row, data, downsample, transform, resolution):
+    """
+    Write one strip's lit pixels and coarse rows. Atomic, so a crash never
+    leaves half a chunk. Returns (cells, radiance) of the lit pixels; cells
+    is 0 below SPARSE_INDEX_RADIANCE.
+    """
+    rows, cols = np.nonzero(data > SPARSE_MIN_RADIANCE)
+    rows = (rows + start_row).astype(np.uint32)
+    cols = cols.astype(np.uint32)
+    radiance = data[rows - start_row, cols].astype(np.float32)
+    cells = np.zeros(len(rows), dtype=np.uint64)
+    indexed = np.flatnonzero(radiance >= SPARSE_INDEX_RADIANCE)
+    cells[indexed] = pixel_cells(rows[indexed], cols[indexed], transform, resolution)
+
+    final = strip_path(store_dir, strip_idx)
+    tmp = final.with_name(final.stem + '.tmp.npz')
+    np.savez_compressed(tmp, rows=rows, cols=cols, radiance=radiance, cells=cells,
+                        coarse=block_mean(data, downsample))
+    os.replace(tmp, final)
+    return cells, radiance
+
+
+def iter_strips(store_dir):
+    """Yield (strip_idx, start_row, rows, cols, radiance, cells) in raster order."""
+    manifest = read_manifest(store_dir)
+    strip_height = manifest['strip_height']
+    num_strips = (manifest['height'] + strip_height - 1) // strip_height
+    for strip_idx in range(num_strips):
+        with np.load(strip_path(store_dir, strip_idx)) as chunk:
+            yield (strip_idx, strip_idx * strip_height, chunk['rows'], chunk['cols'],
+                   chunk['radiance'], chunk['cells'])
+
+
+def assemble_coarse(store_dir):
+    """Assemble the full coarse grid from the per-strip coarse rows."""
+    manifest = read_manifest(store_dir)
+    ds, strip_height = manifest['downsample'], manifest['strip_height']
+    coarse = np.zeros((manifest['height'] // ds, manifest['width'] // ds), dtype=np.float32)
+    num_strips = (manifest['height'] + strip_height - 1) // strip_height
+    for strip_idx in range(num_strips):
+        with np.load(strip_path(store_dir, strip_idx)) as chunk:
+            block = chunk['coarse']
+        cy = strip_idx * strip_height // ds
+        coarse[cy:cy + block.shape[0], :] = block
+    return coarse
+
+
+def write_coarse(store_dir):
+    coarse = assemble_coarse(store_dir)
+    np.save(Path(store_dir) / 'coarse.npy', coarse)
+    return coarse
+
+
+def load_coarse(store_dir):
+    path = Path(store_dir) / 'coarse.npy'
+    return np.load(path) if path.exists() else assemble_coarse(store_dir)
+
+
+def reduce_max(cells, values):
+    """Collapse duplicate cells keeping the max value. Returns sorted (cells, values)."""
+    if len(cells) == 0:
+        return cells, values
+    order = np.argsort(cells, kind='stable')
+    cells, values = cells[order], values[order]
+    starts = np.flatnonzero(np.r_[True, cells[1:] != cells[:-1]])
+    return cells[starts], np.maximum.reduceat(values, starts)
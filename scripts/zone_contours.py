@@ -0,0 +1,565 @@
+#!/usr/bin/env python3
+"""
+Dissolved Bortle zone polygons and vector tiles from zones.db.
+
+Adjacent res-8 cells with the same zone are merged into polygons (with
+holes) the way H3's cells-to-multipolygon does it: every cell contributes
+its boundary edges between H3 vertex indexes, edges shared by two cells of
+the same zone cancel, and what is left chains into rings. Vertex indexes
+are identical from both sides of an edge, so the chunks below stitch
+exactly, with no seams along chunk borders.
+
+Memory stays bounded for country-sized regions: zones.db is cut into
+tasks that never span a base cell (a base cell with more than CHUNK cells
+is split along res-2 parents). The tasks run in parallel, and each one
+returns only the edges on the perimeter of its own cells. Perimeters are
+cancelled per base cell and then globally, so no step holds more than one
+chunk of cells plus the zone outlines.
+
+Outputs (in --out):
+  contours.geojson  full-detail polygons, one feature per polygon, {"zone": n}
+  contours.fgb      same as FlatGeobuf (needs pyogrio; skipped without it)
+  tiles/z/x/y.mvt   Mapbox Vector Tiles, layer "bortle", one multipolygon per zone,
+                    simplified per zoom to half a pixel (Douglas-Peucker)
+  tiles/metadata.json
+
+Zone 1 (dark sky, including every unstored cell) is the background and has
+no polygons.
+
+Usage:
+    python zone_contours.py
+    python zone_contours.py --zones ../assets/db/zones.db --out data/build/contours --max-zoom 10 --workers 8
+"""
+
+import sys, argparse, struct, json, math, time, shutil
+from multiprocessing import Pool
+from pathlib import Path
+
+import numpy as np
+from tqdm import tqdm
+
+from h3.api import numpy_int as h3_np
+from apply_skyglow import cells_to_parent
+
+try:
+    import pyogrio
+except ImportError:
+    pyogrio = None
+
+# ============================================================================
+# Configuration
+# ============================================================================
+CHUNK = 500_000             # max cells per task
+SPLIT_RESOLUTION = 2        # oversized base cells split along these parents
+MIN_ZOOM = 0
+MAX_ZOOM = 10
+TILE_EXTENT = 4096
+TILE_BUFFER = 64            # extent units drawn past each tile edge
+TILE_PIXELS = 256
+SIMPLIFY_PX = 0.5           # tolerance per zoom, in 256-px tile pixels
+LAYER = 'bortle'
+
+ZONES_DTYPE = np.dtype([('h3', '<u8'), ('zone', 'u1'), ('radiance', '<f4'),
+                        ('sqm', '<f4'), ('reserved', 'V3')])
+BASE_CELLS = 122
+
+
+def open_zones(path):
+    with open(path, 'rb') as f:
+        header = f.read(16)
+    if header[:4] != b'ASTR':
+        raise ValueError(f"{path} is not a zones.db file")
+    count = struct.unpack('<Q', header[8:16])[0]
+    return np.memmap(path, dtype=ZONES_DTYPE, mode='r', offset=16, shape=(count,))
+
+
+# ============================================================================
+# Tasks: base-cell aligned slices of zones.db
+# ============================================================================
+def plan_tasks(records):
+    """(base cell, start, stop) slices; a base cell over CHUNK cells splits on res-2 parents."""
+    cells = records['h3']
+    tasks = []
+    if not len(cells):
+        return tasks
+    # Mode and resolution bits are the same for every cell, so h3 order is
+    # base cell order and each base cell is one contiguous run.
+    prefix = int(cells[0]) & ~((1 << 52) - 1)
+    keys = np.array([prefix | (base << 45) for base in range(BASE_CELLS + 1)], dtype=np.uint64)
+    bounds = np.searchsorted(cells, keys)
+
+    for base in range(BASE_CELLS):
+        start, stop = int(bounds[base]), int(bounds[base + 1])
+        if stop - start <= CHUNK:
+            if stop > start:
+                tasks.append((base, start, stop))
+            continue
+        parents = cells_to_parent(cells[start:stop], SPLIT_RESOLUTION)
+        splits = np.r_[0, np.flatnonzero(parents[1:] != parents[:-1]) + 1]
+        lo = 0
+        for s in splits.tolist()[1:]:
+            if s - lo > CHUNK // 2:
+                tasks.append((base, start + lo, start + s))
+                lo = s
+        tasks.append((base, start + lo, stop))
+    return tasks
+
+
+# ============================================================================
+# Edge cancellation
+# ============================================================================
+def cancel_shared(a, b, zone):
+    """Drop edges that appear twice (once per side) within the same zone."""
+    lo, hi = np.minimum(a, b), np.maximum(a, b)
+    order = np.lexsort((hi, lo, zone))
+    lo, hi, z = lo[order], hi[order], zone[order]
+    same = (lo[1:] == lo[:-1]) & (hi[1:] == hi[:-1]) & (z[1:] == z[:-1])
+    paired = np.zeros(len(order), dtype=bool)
+    paired[1:] |= same
+    paired[:-1] |= same
+    keep = np.sort(order[~paired])
+    return a[keep], b[keep], zone[keep]
+
+
+_records = None
+
+
+def _init_worker(zones_path):
+    global _records
+    _records = open_zones(zones_path)
+
+
+def _task_edges(task):
+    """Perimeter edges (vertex a -> vertex b, counter-clockwise) of a task's Zone 2+ cells."""
+    _, start, stop = task
+    block = _records[start:stop]
+    keep = block['zone'] > 1
+    cells, zones = np.array(block['h3'][keep]), np.array(block['zone'][keep])
+    verts = np.zeros((len(cells), 6), dtype=np.uint64)
+    for i, c in enumerate(cells.tolist()):
+        v = h3_np.cell_to_vertexes(c)
+        verts[i, :len(v)] = v
+    nxt = np.roll(verts, -1, axis=1)
+    pentagon = verts[:, 5] == 0
+    nxt[pentagon, 4] = verts[pentagon, 0]
+    valid = verts != 0
+    a, b = verts[valid], nxt[valid]
+    z = np.broadcast_to(zones[:, None], verts.shape)[valid]
+    return cancel_shared(a, b, z)
+
+
+def dissolve_edges(zones_path, workers):
+    """Perimeter edges of every Zone 2+ region in zones.db."""
+    records = open_zones(zones_path)
+    tasks = plan_tasks(records)
+    print(f"  Cells: {len(records):,} in {len(tasks)} tasks")
+    parts, base_parts, current = [], [], None
+    with Pool(workers, initializer=_init_worker, initargs=(zones_path,)) as pool:
+        for task, edges in tqdm(zip(tasks, pool.imap(_task_edges, tasks)), total=len(tasks),
+                                desc="Dissolving", unit="task"):
+            if task[0] != current and base_parts:
+                parts.append(cancel_shared(*map(np.concatenate, zip(*base_parts))))
+                base_parts = []
+            current = task[0]
+            base_parts.append(edges)
+    if base_parts:
+        parts.append(cancel_shared(*map(np.concatenate, zip(*base_parts))))
+    if not parts:
+        empty = np.zeros(0, dtype=np.uint64)
+        return empty, empty, np.zeros(0, dtype=np.uint8)
+    return cancel_shared(*map(np.concatenate, zip(*parts)))
+
+
+# ============================================================================
+# Rings and polygons
+# ============================================================================
+def _vertex_latlng(vertices):
+    out = np.empty((len(vertices), 2), dtype=np.float64)
+    for i, v in enumerate(vertices.tolist()):
+        out[i] = h3_np.vertex_to_latlng(v)
+    return out
+
+
+def chain_rings(a, b, zone):
+    """Follow edges end-to-start into closed rings: list of (zone, vertex id array)."""
+    # A hex-grid vertex touches three cells, so each boundary vertex has exactly
+    # one outgoing edge per zone and the successor of every edge is unique.
+    order = np.lexsort((a, zone))
+    a, b, zone = a[order], b[order], zone[order]
+    nxt = np.empty(len(a), dtype=np.int64)
+    for z in np.unique(zone).tolist():
+        lo, hi = np.searchsorted(zone, [z, z + 1])
+        nxt[lo:hi] = lo + np.searchsorted(a[lo:hi], b[lo:hi])
+
+    rings = []
+    seen = bytearray(len(a))
+    nxt_list = nxt.tolist()
+    for start in range(len(a)):
+        if seen[start]:
+            continue
+        ring = []
+        i = start
+        while not seen[i]:
+            seen[i] = True
+            ring.append(i)
+            i = nxt_list[i]
+        rings.append((int(zone[start]), a[ring]))
+    return rings
+
+
+def signed_area(lon, lat):
+    return 0.5 * float(np.sum(lon * np.roll(lat, -1) - np.roll(lon, -1) * lat))
+
+
+def point_in_ring(lon, lat, ring_lon, ring_lat):
+    """Even-odd ray cast of one point against a closed ring."""
+    x1, y1 = ring_lon, ring_lat
+    x2, y2 = np.roll(ring_lon, -1), np.roll(ring_lat, -1)
+    crosses = (y1 > lat) != (y2 > lat)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_at = x1 + (lat - y1) * (x2 - x1) / (y2 - y1)
+    return bool(np.count_nonzero(crosses & (lon < x_at)) % 2)
+
+
+def build_polygons(rings, coords):
+    """
+    Group rings into polygons: list of (zone, [outer, hole, ...]) with each
+    ring an (n, 2) lon/lat array. Outer rings are counter-clockwise, holes
+    clockwise. Longitudes are unwrapped along the ring, so a polygon across
+    the antimeridian runs past ±180.
+    """
+    outers, holes = [], []
+    for zone, verts in rings:
+        ll = coords[verts]
+        lon = np.degrees(np.unwrap(np.radians(ll[:, 1])))
+        if lon.min() < -180:
+            lon += 360
+        ring = np.column_stack([lon, ll[:, 0]])
+        area = signed_area(ring[:, 0], ring[:, 1])
+        (outers if area > 0 else holes).append((zone, ring, abs(area)))
+
+    polygons = [(zone, [ring]) for zone, ring, _ in outers]
+    # 1° buckets of each outer's bounding box, to find candidates for a hole
+    buckets = {}
+    for i, (zone, ring, _) in enumerate(outers):
+        (x0, y0), (x1, y1) = np.floor(ring.min(axis=0)), np.floor(ring.max(axis=0))
+        for x in range(int(x0), int(x1) + 1):
+            for y in range(int(y0), int(y1) + 1):
+                buckets.setdefault((zone, x, y), []).append(i)
+
+    orphans = 0
+    for zone, ring, _ in holes:
+        lon, lat = ring[0]
+        best = None
+        for i in buckets.get((zone, math.floor(lon), math.floor(lat)), ()):
+            outer = outers[i][1]
+            if best is not None and outers[i][2] >= outers[best][2]:
+                continue
+            if point_in_ring(lon, lat, outer[:, 0], outer[:, 1]):
+                best = i
+        if best is None:
+            orphans += 1
+            continue
+        polygons[best][1].append(ring)
+    if orphans:
+        print(f"  Warning: {orphans} holes without an enclosing ring")
+    return polygons
+
+
+# ============================================================================
+# GeoJSON / FlatGeobuf
+# ============================================================================
+def _closed(ring):
+    return [[round(x, 6), round(y, 6)] for x, y in np.vstack([ring, ring[:1]]).tolist()]
+
+
+def write_geojson(polygons, path):
+    with open(path, 'w') as f:
+        f.write('{"type":"FeatureCollection","features":[\n')
+        for i, (zone, rings) in enumerate(polygons):
+            feature = {"type": "Feature", "properties": {"zone": zone},
+                       "geometry": {"type": "Polygon", "coordinates": [_closed(r) for r in rings]}}
+            f.write((',\n' if i else '') + json.dumps(feature, separators=(',', ':')))
+        f.write('\n]}\n')
+
+
+def polygon_wkb(rings):
+    parts = [struct.pack('<BII', 1, 3, len(rings))]
+    for ring in rings:
+        closed = np.vstack([ring, ring[:1]])
+        parts.append(struct.pack('<I', len(closed)))
+        parts.append(closed.astype('<f8').tobytes())
+    return b''.join(parts)
+
+
+def write_flatgeobuf(polygons, path):
+    geometry = np.array([polygon_wkb(rings) for _, rings in polygons], dtype=object)
+    zones = np.array([zone for zone, _ in polygons], dtype=np.int32)
+    pyogrio.raw.write(str(path), geometry, [zones], ['zone'], driver='FlatGeobuf',
+                      geometry_type='Polygon', crs='EPSG:4326')
+
+
+# ============================================================================
+# Vector tiles
+# ============================================================================
+def to_world(ring):
+    """Web Mercator world coordinates in [0, 1) (x may run past 1 across the antimeridian)."""
+    lat = np.clip(ring[:, 1], -85.05112878, 85.05112878)
+    x = (ring[:, 0] + 180.0) / 360.0
+    y = (1 - np.arcsinh(np.tan(np.radians(lat))) / math.pi) / 2
+    return np.column_stack([x, y])
+
+
+def simplify(ring, tolerance):
+    """
+    Douglas-Peucker on a closed ring, anchored at its first point and the
+    point farthest from it. Every pass splits all open segments at once.
+    """
+    pts = np.vstack([ring, ring[:1]])
+    m = len(pts)
+    idx = np.arange(m)
+    keep = np.zeros(m, dtype=bool)
+    keep[[0, int(np.argmax(np.sum((ring - ring[0]) ** 2, axis=1))), m - 1]] = True
+    while True:
+        cand = np.flatnonzero(~keep)
+        if not len(cand):
+            break
+        prev = np.maximum.accumulate(np.where(keep, idx, 0))[cand]
+        nxt = np.minimum.accumulate(np.where(keep, idx, m - 1)[::-1])[::-1][cand]
+        seg = pts[nxt] - pts[prev]
+        rel = pts[cand] - pts[prev]
+        norm = np.hypot(seg[:, 0], seg[:, 1])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            d = np.where(norm > 0, np.abs(rel[:, 0] * seg[:, 1] - rel[:, 1] * seg[:, 0]) / norm,
+                         np.hypot(rel[:, 0], rel[:, 1]))
+        over = d > tolerance
+        if not over.any():
+            break
+        cand, prev, d = cand[over], prev[over], d[over]
+        order = np.lexsort((-d, prev))
+        first = np.r_[True, prev[order][1:] != prev[order][:-1]]
+        keep[cand[order][first]] = True
+    return pts[:-1][keep[:-1]]
+
+
+def clip_axis(ring, axis, lo, hi):
+    """Sutherland-Hodgman clip of a ring to lo <= coordinate <= hi along one axis."""
+    for bound, keep_above in ((lo, True), (hi, False)):
+        if not len(ring):
+            break
+        inside = ring[:, axis] >= bound if keep_above else ring[:, axis] <= bound
+        if inside.all():
+            continue
+        nxt = np.roll(ring, -1, axis=0)
+        crosses = inside != np.roll(inside, -1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = (bound - ring[:, axis]) / (nxt[:, axis] - ring[:, axis])
+            cut = ring + t[:, None] * (nxt - ring)
+        cut[:, axis] = bound
+        out = np.stack([ring, cut], axis=1)
+        ring = out[np.column_stack([inside, crosses])]
+    return ring
+
+
+def _zigzag(n):
+    return (n << 1) ^ (n >> 31)
+
+
+def _varint(n):
+    out = bytearray()
+    while True:
+        byte = n & 0x7f
+        n >>= 7
+        if n:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _field(number, wire, payload):
+    if wire == 0:
+        return _varint(number << 3) + _varint(payload)
+    return _varint(number << 3 | 2) + _varint(len(payload)) + payload
+
+
+def _packed(values):
+    """Packed repeated varints, encoded for the whole array at once."""
+    v = np.asarray(values, dtype=np.uint64)
+    groups = (v[:, None] >> (7 * np.arange(5, dtype=np.uint64))) & np.uint64(0x7f)
+    length = 1 + np.count_nonzero(v[:, None] >> (7 * np.arange(1, 5, dtype=np.uint64)), axis=1)
+    used = np.arange(5) < length[:, None]
+    more = np.arange(5) < (length - 1)[:, None]
+    return (groups | (more * 0x80).astype(np.uint64)).astype(np.uint8)[used].tobytes()
+
+
+def ring_commands(ring, cursor, exterior):
+    """MoveTo/LineTo/ClosePath integers for one quantized ring (None if degenerate)."""
+    keep = np.r_[True, np.any(ring[1:] != ring[:-1], axis=1)]
+    ring = ring[keep]
+    if len(ring) > 1 and (ring[0] == ring[-1]).all():
+        ring = ring[:-1]
+    if len(ring) < 3:
+        return None, cursor
+    x, y = ring[:, 0], ring[:, 1]
+    area = int(np.sum(x * np.roll(y, -1) - np.roll(x, -1) * y))
+    if area == 0:
+        return None, cursor
+    if (area > 0) != exterior:  # exterior rings are clockwise in tile space (y down)
+        ring = ring[::-1]
+    deltas = np.diff(np.vstack([cursor, ring]), axis=0).tolist()
+    cmds = [1 | (1 << 3), _zigzag(deltas[0][0]), _zigzag(deltas[0][1]), 2 | ((len(ring) - 1) << 3)]
+    for dx, dy in deltas[1:]:
+        cmds += [_zigzag(dx), _zigzag(dy)]
+    cmds.append(7 | (1 << 3))
+    return cmds, ring[-1]
+
+
+def encode_tile(features):
+    """One-layer MVT from {zone: [(exterior, [holes...]), ...]} in tile coordinates."""
+    zones = sorted(features)
+    layer = [_field(15, 0, 2), _field(1, 2, LAYER.encode())]
+    for i, zone in enumerate(zones):
+        cursor = np.zeros(2, dtype=np.int64)
+        geometry = []
+        for exterior, holes in features[zone]:
+            cmds, cursor_after = ring_commands(exterior, cursor, True)
+            if cmds is None:
+                continue
+            geometry += cmds
+            cursor = cursor_after
+            for hole in holes:
+                cmds, cursor_after = ring_commands(hole, cursor, False)
+                if cmds is not None:
+                    geometry += cmds
+                    cursor = cursor_after
+        if geometry:
+            layer.append(_field(2, 2, _field(1, 0, zone) + _field(2, 2, _packed([0, i])) +
+                                _field(3, 0, 3) + _field(4, 2, _packed(geometry))))
+    if len(layer) == 2:
+        return None
+    layer.append(_field(3, 2, b'zone'))
+    for zone in zones:
+        layer.append(_field(4, 2, _field(5, 0, zone)))
+    layer.append(_field(5, 0, TILE_EXTENT))
+    return _field(3, 2, b''.join(layer))
+
+
+_polygons = None
+
+
+def _render_zoom(args):
+    """Write every non-empty tile of one zoom; returns (zoom, tiles, bytes)."""
+    z, tiles_dir = args
+    n = 2 ** z
+    tolerance = SIMPLIFY_PX / (TILE_PIXELS * n)
+    buffer = TILE_BUFFER / TILE_EXTENT
+    tiles = {}
+    for zone, rings in _polygons:
+        world = [to_world(r) for r in rings]
+        (x0, y0), (x1, y1) = world[0].min(axis=0), world[0].max(axis=0)
+        if max(x1 - x0, y1 - y0) < tolerance:
+            continue  # smaller than half a pixel at this zoom
+        world = [simplify(r, tolerance) for r in world]
+        world = [world[0]] + [h for h in world[1:]
+                              if np.ptp(h, axis=0).max() >= tolerance and len(h) >= 3]
+        if len(world[0]) < 3:
+            continue
+        # Clip to a column of tiles first, then each tile in it
+        grid = [r * n for r in world]
+        for tx in range(math.floor((x0 - buffer) * n), math.floor((x1 + buffer) * n) + 1):
+            column = [clip_axis(r, 0, tx - buffer, tx + 1 + buffer) for r in grid]
+            if len(column[0]) < 3:
+                continue
+            column = [column[0]] + [h for h in column[1:] if len(h) >= 3]
+            c0, c1 = column[0][:, 1].min(), column[0][:, 1].max()
+            for ty in range(max(0, math.floor(c0 - buffer)), min(n - 1, math.floor(c1 + buffer)) + 1):
+                cell = [clip_axis(r, 1, ty - buffer, ty + 1 + buffer) for r in column]
+                if len(cell[0]) < 3:
+                    continue
+                entry = (np.rint((cell[0] - (tx, ty)) * TILE_EXTENT).astype(np.int64),
+                         [np.rint((h - (tx, ty)) * TILE_EXTENT).astype(np.int64) for h in cell[1:] if len(h) >= 3])
+                tiles.setdefault((tx % n, ty), {}).setdefault(zone, []).append(entry)
+
+    written = 0
+    for (tx, ty), features in tiles.items():
+        data = encode_tile(features)
+        if data is None:
+            continue
+        path = tiles_dir / str(z) / str(tx) / f"{ty}.mvt"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        written += len(data)
+    return z, len(tiles), written
+
+
+def write_tiles(polygons, tiles_dir, min_zoom, max_zoom, workers):
+    global _polygons
+    _polygons = polygons  # inherited by the forked workers
+    zooms = [(z, tiles_dir) for z in range(min_zoom, max_zoom + 1)]
+    with Pool(workers) as pool:
+        for z, count, size in pool.imap_unordered(_render_zoom, zooms[::-1]):
+            print(f"  z{z:<2} {count:>8,} tiles {size / 1024**2:8.1f} MB")
+    metadata = {
+        "tilejson": "3.0.0", "name": "bortle", "format": "pbf",
+        "minzoom": min_zoom, "maxzoom": max_zoom,
+        "tiles": ["{z}/{x}/{y}.mvt"],
+        "vector_layers": [{"id": LAYER, "fields": {"zone": "Number"},
+                           "minzoom": min_zoom, "maxzoom": max_zoom}],
+    }
+    with open(tiles_dir / 'metadata.json', 'w') as f:
+        json.dump(metadata, f, indent=2)
+
+
+# ============================================================================
+# Main
+# ============================================================================
+def main():
+    default_db = Path(__file__).parent.parent / 'assets' / 'db' / 'zones.db'
+
+    parser = argparse.ArgumentParser(description='Dissolved Bortle zone polygons and vector tiles')
+    parser.add_argument('--zones', default=str(default_db))
+    parser.add_argument('--out', default=str(Path(__file__).parent / 'data' / 'build' / 'contours'))
+    parser.add_argument('--min-zoom', type=int, default=MIN_ZOOM)
+    parser.add_argument('--max-zoom', type=int, default=MAX_ZOOM)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    if not Path(args.zones).exists():
+        print(f"Error: zones.db not found: {args.zones}")
+        sys.exit(1)
+
+    out = Path(args.out)
+    if out.exists():
+        shutil.rmtree(out)
+    (out / 'tiles').mkdir(parents=True)
+
+    print(f"Reading {args.zones}")
+    t0 = time.time()
+    a, b, zone = dissolve_edges(args.zones, args.workers)
+    rings = chain_rings(a, b, zone)
+    vertices = np.unique(a)
+    coords_table = _vertex_latlng(vertices)
+    polygons = build_polygons([(z, np.searchsorted(vertices, v)) for z, v in rings], coords_table)
+    print(f"  Boundary edges: {len(a):,}, rings: {len(rings):,}, polygons: {len(polygons):,} "
+          f"({time.time() - t0:.1f}s)")
+
+    write_geojson(polygons, out / 'contours.geojson')
+    if pyogrio is not None:
+        write_flatgeobuf(polygons, out / 'contours.fgb')
+    else:
+        print("  pyogrio not installed, skipping contours.fgb (pip install pyogrio)")
+    write_tiles(polygons, out / 'tiles', args.min_zoom, args.max_zoom, args.workers)
+
+    print(f"\n{'='*50}")
+    print("SUCCESS!")
+    for z in range(2, 10):
+        print(f"  Zone {z}: {sum(1 for pz, _ in polygons if pz == z):,} polygons")
+    size_mb = sum(p.stat().st_size for p in out.rglob('*') if p.is_file()) / (1024**2)
+    print(f"  Size: {size_mb:.1f} MB")
+    print(f"  Output: {out}")
+    print(f"{'='*50}")
+
+
+if __name__ == '__main__':
+    main()